@@ -0,0 +1,86 @@
+"""
+Benchmark HTML parser backends for the webpage enricher.
+
+Compares parse time and peak RSS for html.parser vs lxml, in full and
+metadata-only (SoupStrainer) modes. Each measurement runs in a fresh
+process so RSS numbers are not polluted by earlier runs.
+
+Usage:
+    python benchmarks/bench_html_parsers.py                 # synthetic pages
+    python benchmarks/bench_html_parsers.py page1.html ...  # real pages
+"""
+
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+REPEATS = 5
+
+
+def synthetic_page(paragraphs: int) -> str:
+    """Build an article-like page with a realistic head and a long body."""
+    head = """<head><title>Benchmark Article | Example</title>
+<meta property="og:title" content="Benchmark Article">
+<meta name="author" content="Jane Developer">
+<meta property="article:published_time" content="2024-12-15T10:00:00Z">
+<script type="application/ld+json">{"@type": "Article", "headline": "Benchmark Article"}</script>
+<link rel="stylesheet" href="/style.css"></head>"""
+    body = ''.join(
+        f'<div class="post-body"><p>Paragraph {i} with <a href="/link/{i}">a link</a> and '
+        f'<em>some</em> emphasis text that goes on for a while.</p>'
+        f'<pre><code class="language-python">x = {i}</code></pre></div>'
+        for i in range(paragraphs)
+    )
+    return f"<!DOCTYPE html><html>{head}<body><article><h1>Benchmark</h1>{body}</article></body></html>"
+
+
+def _measure(html: str, backend: str, mode: str, queue):
+    from shared.html_utils import parse_html
+
+    # Warm up imports so they are not counted as parse memory
+    parse_html('<html></html>', mode=mode, parser=backend)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        soup = parse_html(html, mode=mode, parser=backend)
+        timings.append(time.perf_counter() - start)
+        del soup
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((min(timings), max(0, rss_after - rss_before)))
+
+
+def run(pages):
+    ctx = multiprocessing.get_context('spawn')
+    backends = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        backends.append('lxml')
+    except ImportError:
+        print("lxml not installed - only html.parser will be measured\n")
+
+    print(f"{'page':<24}{'size':>10}  {'backend':<12}{'mode':<10}{'parse ms':>10}{'peak RSS KB':>13}")
+    for name, html in pages:
+        for backend in backends:
+            for mode in ('full', 'metadata'):
+                queue = ctx.Queue()
+                proc = ctx.Process(target=_measure, args=(html, backend, mode, queue))
+                proc.start()
+                seconds, rss_kb = queue.get()
+                proc.join()
+                print(f"{name:<24}{len(html):>10}  {backend:<12}{mode:<10}{seconds * 1000:>10.1f}{rss_kb:>13}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        pages = []
+        for path in sys.argv[1:]:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                pages.append((os.path.basename(path)[:23], f.read()))
+    else:
+        pages = [(f"synthetic-{n}p", synthetic_page(n)) for n in (100, 1000, 5000)]
+    run(pages)
@@ -13,13 +13,168 @@ from .title_utils import (
 from .analysis_utils import (
     SECTION_ICONS,
     REQUIRED_ANALYSIS_SECTIONS,
+    SECTION_FIELDS,
     get_section_icon,
     parse_gemini_analysis,
+    analysis_response_schema,
+    parse_structured_analysis,
+    incomplete_sections,
+    format_analysis_sections,
     validate_analysis_sections,
     validate_transcription,
     validate_video_enrichment,
 )
 
+from .singleflight import (
+    SingleFlight,
+    GCSLease,
+    coalesce_key,
+    credential_tag,
+)
+
+from .batch import run_per_host
+
+from .process_pool import WarmProcessPool
+
+from .url_utils import (
+    TRACKING_PARAMS,
+    SHORT_LINK_HOSTS,
+    is_short_link,
+    resolve_short_link,
+    parse_canonical,
+    canonicalize_url,
+    canonical_key,
+)
+
+from .cache_store import (
+    MemoryStore,
+    FileStore,
+    GCSStore,
+    StoreConflict,
+    get_cache_store,
+    update_entry,
+    shared_store_configured,
+)
+
+from .redirect_cache import (
+    RedirectCache,
+    create_pooled_session,
+    get_redirect_cache,
+)
+
+from .http_cache import (
+    HttpCache,
+    get_http_cache,
+)
+
+from .ai_memo import (
+    MemoCache,
+    normalize_content,
+    content_fingerprint,
+    get_ai_memo,
+)
+
+from .long_document import (
+    estimate_tokens,
+    split_sentences,
+    chunk_text,
+    map_chunks,
+)
+
+from .content_selector import (
+    CONTENT_TOKEN_BUDGET,
+    split_spans,
+    score_spans,
+    select_content,
+)
+
+from .gemini_batch import (
+    LocalBatchBackend,
+    GeminiBatchBackend,
+    GeminiBatchQueue,
+    BatchQueueUnavailable,
+    text_part,
+    file_part,
+    get_gemini_batch_queue,
+)
+
+from .gemini_files import (
+    GeminiFileError,
+    GeminiFileRegistry,
+    file_digest,
+    get_gemini_file_registry,
+)
+
+from .video_segments import (
+    format_timestamp,
+    chapter_starts,
+    detect_scene_changes,
+    plan_segments,
+    cut_segment,
+    analyze_segments,
+    merge_segment_sections,
+)
+
+from .keyframes import (
+    sample_times,
+    extract_frame_jpeg,
+    sample_keyframes,
+    probe_dimensions,
+    decode_frames,
+    frame_differences,
+    select_keyframes,
+    tile_frames,
+    encode_jpeg,
+    build_contact_sheet,
+)
+
+from .audio_utils import (
+    decode_audio,
+    probe_duration,
+    frame_features,
+    detect_speech,
+    speech_summary,
+    detect_speech_in_file,
+    pack_speech_audio,
+    map_to_original,
+    remap_words,
+    write_flac,
+)
+
+from .chunked_transcription import (
+    ChunkTranscriptionError,
+    plan_chunks,
+    stitch_chunks,
+    transcribe_in_chunks,
+)
+
+from .html_utils import (
+    normalize_encoding,
+    detect_encoding,
+    decode_html,
+    get_parser_backend,
+    parse_html,
+)
+
+from .html_index import (
+    CLASS_PATTERNS,
+    PageIndex,
+    build_index,
+)
+
+from .url_rules import (
+    UrlRuleEngine,
+    load_rules,
+    get_url_rules,
+    classify_url,
+)
+
+from .structured_data import (
+    extract_structured_data,
+    parse_price,
+    detect_currency,
+)
+
 __all__ = [
     # Title utilities
     'MAX_TITLE_LENGTH',
@@ -32,9 +187,124 @@ __all__ = [
     # Analysis utilities
     'SECTION_ICONS',
     'REQUIRED_ANALYSIS_SECTIONS',
+    'SECTION_FIELDS',
     'get_section_icon',
     'parse_gemini_analysis',
+    'analysis_response_schema',
+    'parse_structured_analysis',
+    'incomplete_sections',
+    'format_analysis_sections',
     'validate_analysis_sections',
     'validate_transcription',
     'validate_video_enrichment',
+    # Request coalescing
+    'SingleFlight',
+    'GCSLease',
+    'coalesce_key',
+    'credential_tag',
+    'run_per_host',
+    # Process pool
+    'WarmProcessPool',
+    # URL canonicalization
+    'TRACKING_PARAMS',
+    'SHORT_LINK_HOSTS',
+    'is_short_link',
+    'resolve_short_link',
+    'parse_canonical',
+    'canonicalize_url',
+    'canonical_key',
+    # Persistent caches
+    'MemoryStore',
+    'FileStore',
+    'GCSStore',
+    'StoreConflict',
+    'get_cache_store',
+    'update_entry',
+    'shared_store_configured',
+    'RedirectCache',
+    'create_pooled_session',
+    'get_redirect_cache',
+    'HttpCache',
+    'get_http_cache',
+    'MemoCache',
+    'normalize_content',
+    'content_fingerprint',
+    'get_ai_memo',
+    # Long-document summarization
+    'estimate_tokens',
+    'split_sentences',
+    'chunk_text',
+    'map_chunks',
+    # Content selection
+    'CONTENT_TOKEN_BUDGET',
+    'split_spans',
+    'score_spans',
+    'select_content',
+    # Gemini batch mode
+    'LocalBatchBackend',
+    'GeminiBatchBackend',
+    'GeminiBatchQueue',
+    'BatchQueueUnavailable',
+    'text_part',
+    'file_part',
+    'get_gemini_batch_queue',
+    # Gemini file reuse
+    'GeminiFileError',
+    'GeminiFileRegistry',
+    'file_digest',
+    'get_gemini_file_registry',
+    # Video segments
+    'format_timestamp',
+    'chapter_starts',
+    'detect_scene_changes',
+    'plan_segments',
+    'cut_segment',
+    'analyze_segments',
+    'merge_segment_sections',
+    # Keyframes
+    'sample_times',
+    'extract_frame_jpeg',
+    'sample_keyframes',
+    'probe_dimensions',
+    'decode_frames',
+    'frame_differences',
+    'select_keyframes',
+    'tile_frames',
+    'encode_jpeg',
+    'build_contact_sheet',
+    # Audio / speech detection
+    'decode_audio',
+    'probe_duration',
+    'frame_features',
+    'detect_speech',
+    'speech_summary',
+    'detect_speech_in_file',
+    'pack_speech_audio',
+    'map_to_original',
+    'remap_words',
+    'write_flac',
+    # Chunked transcription
+    'ChunkTranscriptionError',
+    'plan_chunks',
+    'stitch_chunks',
+    'transcribe_in_chunks',
+    # HTML utilities
+    'normalize_encoding',
+    'detect_encoding',
+    'decode_html',
+    'get_parser_backend',
+    'parse_html',
+    # HTML index
+    'CLASS_PATTERNS',
+    'PageIndex',
+    'build_index',
+    # URL classification rules
+    'UrlRuleEngine',
+    'load_rules',
+    'get_url_rules',
+    'classify_url',
+    # Structured data
+    'extract_structured_data',
+    'parse_price',
+    'detect_currency',
 ]
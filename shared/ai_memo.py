@@ -0,0 +1,126 @@
+"""
+Content-hash memoization for LLM calls.
+
+The same article reaches the enricher under different URLs (syndicated
+copies, canonical vs AMP pages) and unchanged pages are re-run during
+backlog reprocessing. Keying LLM results on a hash of what the model
+actually sees - normalized content, content type, prompt version and model
+name - means identical input never pays for a second call.
+
+MemoCache has two tiers:
+
+- an in-process LRU (bounded, so a long-lived instance cannot grow without limit)
+- a persistent store from shared.cache_store (GCS or local files)
+
+Bump the prompt version whenever a prompt changes so old results are not
+served for the new prompt.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .cache_store import get_cache_store
+
+AI_MEMO_TTL = int(os.environ.get('AI_MEMO_TTL', 90 * 24 * 3600))  # Seconds to keep a memoized result
+AI_MEMO_MAX_ENTRIES = int(os.environ.get('AI_MEMO_MAX_ENTRIES', 512))  # In-process LRU size
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_content(content: str) -> str:
+    """Normalize text so trivially different copies hash the same (NFKC, case, whitespace)."""
+    if not content:
+        return ''
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', content)).strip().casefold()
+
+
+def content_fingerprint(content: str, *parts: Any) -> str:
+    """
+    Memo key for content plus whatever else shapes the LLM output.
+
+    Args:
+        content: Text sent to the model
+        *parts: Content type, prompt version, model name, ...
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    digest.update(normalize_content(content).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MemoCache:
+    """
+    In-process LRU in front of a persistent store.
+
+    Args:
+        store: Persistent store (see shared.cache_store); defaults to the
+            configured 'ai_memo' store
+        max_entries: In-process LRU capacity
+        ttl: Seconds a result is kept in the persistent store
+    """
+
+    def __init__(self, store=None, max_entries: int = AI_MEMO_MAX_ENTRIES, ttl: int = AI_MEMO_TTL):
+        self.store = store if store is not None else get_cache_store('ai_memo')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, value: Any):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the memoized value for key, or None."""
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            print(f"AI memo read error: {e}")
+            return None
+
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: Any):
+        """Memoize value under key in both tiers."""
+        self._remember(key, value)
+        try:
+            self.store.set(key, value, ttl=self.ttl)
+        except Exception as e:
+            print(f"AI memo write error: {e}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._lru)
+
+
+_default_memo = None
+_default_memo_lock = threading.Lock()
+
+
+def get_ai_memo() -> MemoCache:
+    """Get the process-wide MemoCache (created on first use)."""
+    global _default_memo
+    with _default_memo_lock:
+        if _default_memo is None:
+            _default_memo = MemoCache()
+        return _default_memo
@@ -5,6 +5,7 @@ Parses and validates the structured analysis from Gemini video analysis.
 All required sections must be present and non-empty.
 """
 
+import json
 import re
 from typing import Dict, List, Optional, Tuple
 
@@ -30,6 +31,17 @@ REQUIRED_ANALYSIS_SECTIONS = [
 ]
 
 
+# JSON keys for structured (response-schema) analysis, one per required section
+SECTION_FIELDS = {
+    'Visual Content': 'visual_content',
+    'Audio Content': 'audio_content',
+    'Style & Production': 'style_and_production',
+    'Mood & Tone': 'mood_and_tone',
+    'Key Messages': 'key_messages',
+    'Content Category': 'content_category',
+}
+
+
 def get_section_icon(section_name: str) -> str:
     """Get the icon for a section name."""
     return SECTION_ICONS.get(section_name, '📌')
@@ -121,6 +133,95 @@ def parse_gemini_analysis(analysis_text: str) -> Dict[str, str]:
     return sections
 
 
+def analysis_response_schema(sections: List[str] = None) -> Dict:
+    """
+    Gemini response schema for a structured analysis.
+
+    Args:
+        sections: Section names to request (defaults to REQUIRED_ANALYSIS_SECTIONS)
+
+    Returns:
+        Schema dict for generation_config's response_schema: an object with
+        one required string field per section (see SECTION_FIELDS)
+    """
+    sections = sections or REQUIRED_ANALYSIS_SECTIONS
+    fields = [SECTION_FIELDS[name] for name in sections]
+    return {
+        'type': 'OBJECT',
+        'properties': {field: {'type': 'STRING'} for field in fields},
+        'required': fields,
+    }
+
+
+def parse_structured_analysis(response_text: str) -> Dict[str, str]:
+    """
+    Parse a structured (JSON) analysis into section names and content.
+
+    Falls back to parse_gemini_analysis for markdown answers, so a model
+    that ignores the schema still yields whatever sections it wrote.
+
+    Args:
+        response_text: Raw response text from Gemini
+
+    Returns:
+        Dict mapping section names to their content
+    """
+    if not response_text:
+        return {}
+
+    text = response_text.strip()
+    # Tolerate a ```json fence around the object
+    fenced = re.match(r'^```(?:json)?\s*(.*?)\s*```$', text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return parse_gemini_analysis(response_text)
+    if not isinstance(data, dict):
+        return {}
+
+    sections = {}
+    for name, field in SECTION_FIELDS.items():
+        value = data.get(field)
+        if isinstance(value, list):
+            value = '\n'.join(f"- {item}" for item in value)
+        if value is not None:
+            sections[name] = str(value).strip()
+    return sections
+
+
+def incomplete_sections(sections: Dict[str, str], required_sections: List[str] = None) -> List[str]:
+    """Required section names that are missing or empty in sections."""
+    required_sections = required_sections or REQUIRED_ANALYSIS_SECTIONS
+    return [name for name in required_sections if not (sections.get(name) or '').strip()]
+
+
+def format_analysis_sections(sections: Dict[str, str], required_sections: List[str] = None) -> str:
+    """
+    Render sections in the numbered markdown format the n8n workflow reads.
+
+    Produces the same text parse_gemini_analysis accepts:
+    1. **👁️ Visual Content**
+    content...
+
+    Args:
+        sections: Section names to content
+        required_sections: Order of sections (defaults to REQUIRED_ANALYSIS_SECTIONS)
+
+    Returns:
+        Markdown analysis text (sections without content are left out)
+    """
+    required_sections = required_sections or REQUIRED_ANALYSIS_SECTIONS
+    blocks = []
+    for number, name in enumerate(required_sections, 1):
+        content = (sections.get(name) or '').strip()
+        if content:
+            blocks.append(f"{number}. **{get_section_icon(name)} {name}**\n{content}")
+    return '\n\n'.join(blocks)
+
+
 def validate_analysis_sections(
     analysis_text: str,
     required_sections: List[str] = None,
@@ -203,6 +304,9 @@ def validate_transcription(transcription_result: Optional[Dict]) -> Dict:
     """
     Validate that transcription result contains required fields.
 
+    A clip skipped because local speech detection found no speech
+    (skipped='no_speech') is valid with empty text.
+
     Args:
         transcription_result: Result from transcribe_audio function
 
@@ -226,6 +330,9 @@ def validate_transcription(transcription_result: Optional[Dict]) -> Dict:
         result['errors'].append(f"Transcription error: {transcription_result['error']}")
         return result
 
+    if transcription_result.get('skipped') == 'no_speech':
+        return result
+
     text = transcription_result.get('text')
     if not text or not text.strip():
         result['valid'] = False
@@ -260,9 +367,9 @@ def validate_video_enrichment(response: Dict) -> Dict:
         'transcription_validation': None
     }
 
-    # Validate Gemini analysis
+    # Validate Gemini analysis (a deferred analysis is validated when it is collected)
     gemini_result = response.get('gemini_analysis', {})
-    if gemini_result:
+    if gemini_result and not gemini_result.get('deferred'):
         analysis_text = gemini_result.get('analysis', '')
         if gemini_result.get('error'):
             result['valid'] = False
@@ -0,0 +1,344 @@
+"""
+Local speech detection for audio before it is sent for transcription.
+
+Many clips carry only music. Uploading them to AssemblyAI costs a job and a
+wait, only to get back an empty transcript. detect_speech_in_file decodes the
+audio once to 16 kHz mono through an ffmpeg pipe and runs a small
+voice-activity detector over it in NumPy:
+
+1. 30 ms frames every 10 ms (a strided view, no copies)
+2. per frame: energy in dBFS, and spectral flatness over the 300-4000 Hz
+   speech band (voiced speech is harmonic, so flatness stays low; noise
+   and hiss are flat)
+3. a frame is speech when it is well above the clip's noise floor and not
+   flat; decisions are median-smoothed, then merged into spans
+4. spans whose energy barely moves are dropped: speech rises and falls with
+   syllables, while sustained music stays level
+
+The result says whether a clip has speech, and where.
+
+Transcription is billed per second of audio, silence included. When speech
+covers much less than the whole clip, pack_speech_audio concatenates just
+the speech spans (with a short pause between them) into a compact FLAC,
+and its offset map sends timestamps on the packed audio back to the
+original media (map_to_original / remap_words).
+"""
+
+import bisect
+import json
+import os
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+HOP_MS = 10
+
+VAD_ENERGY_MARGIN_DB = float(os.environ.get('VAD_ENERGY_MARGIN_DB', 12.0))  # dB above the noise floor
+VAD_MIN_ENERGY_DB = float(os.environ.get('VAD_MIN_ENERGY_DB', -50.0))  # dBFS below which a frame is silence
+VAD_MAX_FLATNESS = float(os.environ.get('VAD_MAX_FLATNESS', 0.35))  # Spectral flatness above which a frame is noise
+VAD_MIN_MODULATION_DB = float(os.environ.get('VAD_MIN_MODULATION_DB', 5.0))  # Energy spread a span needs to count as speech
+MIN_SPEECH_SECONDS = float(os.environ.get('MIN_SPEECH_SECONDS', 1.0))  # Less total speech counts as none
+
+TRIM_MIN_SAVING = float(os.environ.get('TRIM_MIN_SAVING', 0.1))  # Pack only if it cuts at least this share of audio
+PACK_GAP_SECONDS = 0.3  # Pause kept between packed spans
+
+SPEECH_BAND_HZ = (300, 4000)
+SMOOTHING_FRAMES = 9  # Median filter width (~90 ms)
+MAX_GAP_SECONDS = 0.3  # Shorter pauses join neighbouring spans
+MIN_SPAN_SECONDS = 0.25  # Shorter spans are dropped
+SPAN_PADDING_SECONDS = 0.1  # Added to both ends of each span
+FEATURE_BLOCK_FRAMES = 6000  # Frames per feature block (~1 minute)
+
+DECODE_BLOCK_BYTES = 1 << 20  # PCM read from ffmpeg at a time
+DECODE_INITIAL_SECONDS = 600  # Buffer size when the length is not known
+PROBE_TIMEOUT_SECONDS = 30
+
+_EPS = 1e-10
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Duration in seconds of a local file or URL, from ffprobe (container headers only)."""
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', path
+        ], check=True, capture_output=True, text=True, timeout=PROBE_TIMEOUT_SECONDS)
+        return float(json.loads(result.stdout)['format']['duration'])
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError,
+            ValueError, KeyError, TypeError) as e:
+        print(f"ffprobe failed: {e}")
+        return None
+
+
+def decode_audio(path: str, sample_rate: int = SAMPLE_RATE,
+                 duration: Optional[float] = None) -> Optional[np.ndarray]:
+    """
+    Decode any audio/video file to mono float32 samples via an ffmpeg pipe.
+
+    The 16-bit PCM is read in blocks and converted straight into one float32
+    buffer, so an hour of audio peaks at about its samples (~230 MB at
+    16 kHz) rather than the PCM plus two full-length copies.
+
+    Args:
+        path: Local file or URL
+        sample_rate: Output rate in Hz
+        duration: Expected length in seconds, to size the buffer up front
+            (optional; it grows as needed)
+
+    Returns:
+        Samples in [-1, 1], or None if ffmpeg fails
+    """
+    try:
+        process = subprocess.Popen([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', path,
+            '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-'
+        ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print(f"Audio decoding failed: {e}")
+        return None
+
+    samples = np.empty(int((duration or DECODE_INITIAL_SECONDS) * sample_rate) + sample_rate, dtype=np.float32)
+    filled = 0
+    carry = b''
+    with process:
+        while True:
+            block = process.stdout.read(DECODE_BLOCK_BYTES)
+            if not block:
+                break
+            block = carry + block
+            usable = len(block) - len(block) % 2
+            carry = block[usable:]
+            pcm = np.frombuffer(block, dtype='<i2', count=usable // 2)
+            if filled + len(pcm) > len(samples):
+                grown = np.empty(max(filled + len(pcm), len(samples) * 3 // 2), dtype=np.float32)
+                grown[:filled] = samples[:filled]
+                samples = grown
+            samples[filled:filled + len(pcm)] = pcm
+            samples[filled:filled + len(pcm)] *= 1.0 / 32768.0
+            filled += len(pcm)
+        returncode = process.wait()
+
+    if returncode != 0:
+        print(f"Audio decoding failed: ffmpeg exited with status {returncode}")
+        return None
+    samples.resize(filled, refcheck=False)  # In place: returns the unused tail
+    return samples
+
+
+def frame_features(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-frame energy (dBFS) and speech-band spectral flatness.
+
+    Returns:
+        Tuple of (energy_db, flatness) arrays, one value per hop
+    """
+    frame_len = sample_rate * FRAME_MS // 1000
+    hop = sample_rate * HOP_MS // 1000
+    if len(samples) < frame_len:
+        return np.zeros(0), np.zeros(0)
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame_len)[::hop]
+    window = np.hanning(frame_len).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_len, 1.0 / sample_rate)
+    in_band = (freqs >= SPEECH_BAND_HZ[0]) & (freqs <= SPEECH_BAND_HZ[1])
+
+    # Blocks of frames keep the (frames x samples) temporaries small for hour-long audio
+    energy_db, flatness = [], []
+    for first in range(0, len(frames), FEATURE_BLOCK_FRAMES):
+        block = frames[first:first + FEATURE_BLOCK_FRAMES]
+        energy_db.append(10.0 * np.log10(np.mean(block ** 2, axis=1) + _EPS))
+        band = np.abs(np.fft.rfft(block * window, axis=1)[:, in_band]) ** 2 + _EPS
+        flatness.append(np.exp(np.mean(np.log(band), axis=1)) / np.mean(band, axis=1))
+    return np.concatenate(energy_db), np.concatenate(flatness)
+
+
+def _median_smooth(flags: np.ndarray, width: int = SMOOTHING_FRAMES) -> np.ndarray:
+    if len(flags) < width:
+        return flags
+    padded = np.pad(flags.astype(np.uint8), width // 2, mode='edge')
+    return np.median(np.lib.stride_tricks.sliding_window_view(padded, width), axis=1) > 0.5
+
+
+def _runs(flags: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) frame index pairs of consecutive True values."""
+    edges = np.diff(np.concatenate([[0], flags.astype(np.int8), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def detect_speech(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> List[Tuple[float, float]]:
+    """
+    Find speech spans in mono samples.
+
+    Args:
+        samples: Mono float samples in [-1, 1]
+        sample_rate: Sample rate of samples
+
+    Returns:
+        List of (start, end) times in seconds, sorted and non-overlapping
+    """
+    energy_db, flatness = frame_features(samples, sample_rate)
+    if len(energy_db) == 0:
+        return []
+
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(noise_floor + VAD_ENERGY_MARGIN_DB, VAD_MIN_ENERGY_DB)
+    voiced = _median_smooth((energy_db > threshold) & (flatness < VAD_MAX_FLATNESS))
+
+    hop_seconds = HOP_MS / 1000.0
+    frame_seconds = FRAME_MS / 1000.0
+    duration = len(samples) / sample_rate
+
+    spans = []
+    for start, end in _runs(voiced):
+        begin, finish = start * hop_seconds, (end - 1) * hop_seconds + frame_seconds
+        if spans and begin - spans[-1][1] < MAX_GAP_SECONDS:
+            spans[-1][1] = finish
+            spans[-1][3] = end
+        else:
+            spans.append([begin, finish, start, end])
+
+    result = []
+    for begin, finish, start, end in spans:
+        if finish - begin < MIN_SPAN_SECONDS:
+            continue
+        # Level, sustained energy across the span is music or drone, not speech
+        if np.std(energy_db[start:end]) < VAD_MIN_MODULATION_DB:
+            continue
+        begin, finish = max(0.0, begin - SPAN_PADDING_SECONDS), min(duration, finish + SPAN_PADDING_SECONDS)
+        if result and begin <= result[-1][1]:
+            result[-1] = (result[-1][0], float(finish))
+        else:
+            result.append((float(begin), float(finish)))
+    return result
+
+
+def speech_summary(spans: List[Tuple[float, float]], duration: float) -> Dict:
+    """
+    Summarize speech spans for a clip.
+
+    Returns:
+        Dict with:
+            has_speech: bool - at least MIN_SPEECH_SECONDS of speech
+            speech_seconds: float
+            duration_seconds: float
+            spans: list - [start, end] pairs in seconds
+    """
+    speech_seconds = float(sum(end - start for start, end in spans))
+    return {
+        'has_speech': speech_seconds >= MIN_SPEECH_SECONDS,
+        'speech_seconds': round(speech_seconds, 2),
+        'duration_seconds': round(float(duration), 2),
+        'spans': [[round(start, 2), round(end, 2)] for start, end in spans],
+    }
+
+
+def detect_speech_in_file(path: str) -> Optional[Dict]:
+    """
+    Decode a media file to 16 kHz mono and detect speech in it.
+
+    Returns:
+        speech_summary dict, or None if the audio could not be decoded
+        (speech unknown - transcribe as usual)
+    """
+    samples = decode_audio(path)
+    if samples is None:
+        return None
+    return speech_summary(detect_speech(samples), len(samples) / SAMPLE_RATE)
+
+
+def write_flac(samples: np.ndarray, output_path: str, sample_rate: int = SAMPLE_RATE) -> str:
+    """Encode mono float samples to a FLAC file by piping PCM through ffmpeg."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', '-',
+        '-c:a', 'flac', '-y', output_path
+    ], input=pcm.tobytes(), check=True, capture_output=True)
+    return output_path
+
+
+def pack_speech_audio(samples: np.ndarray, spans: List[Tuple[float, float]], output_path: str,
+                      sample_rate: int = SAMPLE_RATE, gap_seconds: float = PACK_GAP_SECONDS,
+                      min_saving: float = TRIM_MIN_SAVING) -> Optional[Dict]:
+    """
+    Write only the speech spans of samples to output_path (FLAC).
+
+    Args:
+        samples: Mono float samples of the whole clip
+        spans: Speech spans (start, end) in seconds, from detect_speech
+        output_path: Packed audio file to write
+        sample_rate: Sample rate of samples
+        gap_seconds: Silence inserted between spans
+        min_saving: Skip packing unless it removes at least this share of
+            the audio
+
+    Returns:
+        Dict with path, offset_map, original_seconds and packed_seconds;
+        None if packing would not save enough (or there is no speech)
+    """
+    original_seconds = len(samples) / sample_rate
+    gap = np.zeros(int(gap_seconds * sample_rate), dtype=np.float32)
+
+    pieces, offset_map = [], []
+    packed = 0
+    for start, end in spans:
+        piece = samples[int(start * sample_rate):int(end * sample_rate)]
+        if len(piece) == 0:
+            continue
+        if pieces:
+            pieces.append(gap)
+            packed += len(gap)
+        offset_map.append([packed / sample_rate, (packed + len(piece)) / sample_rate, start])
+        pieces.append(piece)
+        packed += len(piece)
+
+    packed_seconds = packed / sample_rate
+    if not pieces or packed_seconds > original_seconds * (1 - min_saving):
+        return None
+
+    write_flac(np.concatenate(pieces), output_path, sample_rate)
+    return {
+        'path': output_path,
+        'offset_map': offset_map,
+        'original_seconds': round(original_seconds, 2),
+        'packed_seconds': round(packed_seconds, 2),
+    }
+
+
+def map_to_original(seconds: float, offset_map: List[List[float]]) -> float:
+    """
+    Map a time on packed audio back to the original media.
+
+    Args:
+        seconds: Time on the packed audio
+        offset_map: [packed_start, packed_end, original_start] per span
+
+    Returns:
+        Time in the original media (times in an inserted pause map to the
+        end of the span before it)
+    """
+    if not offset_map:
+        return seconds
+    i = max(0, bisect.bisect_right([entry[0] for entry in offset_map], seconds) - 1)
+    packed_start, packed_end, original_start = offset_map[i]
+    return original_start + min(max(seconds, packed_start), packed_end) - packed_start
+
+
+def remap_words(words: List[Dict], offset_map: List[List[float]]) -> List[Dict]:
+    """Remap word start/end (milliseconds on packed audio) to the original media."""
+    if not offset_map:
+        return words
+    starts = np.array([entry[0] for entry in offset_map])
+    ends = np.array([entry[1] for entry in offset_map])
+    originals = np.array([entry[2] for entry in offset_map])
+
+    def remap(ms):
+        t = np.asarray(ms, dtype=np.float64) / 1000.0
+        i = np.clip(np.searchsorted(starts, t, side='right') - 1, 0, len(starts) - 1)
+        return np.rint((originals[i] + np.clip(t, starts[i], ends[i]) - starts[i]) * 1000).astype(int)
+
+    new_starts = remap([w['start'] for w in words])
+    new_ends = remap([w['end'] for w in words])
+    return [{**w, 'start': int(a), 'end': int(b)} for w, a, b in zip(words, new_starts, new_ends)]
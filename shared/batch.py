@@ -0,0 +1,97 @@
+"""
+Concurrent batch runner with per-host politeness limits.
+
+Batch enrichment fetches many URLs at once, but a backlog is often
+dominated by a few domains. run_per_host schedules work on a thread pool
+under three limits:
+
+- max_workers: total tasks in flight
+- per_host: tasks in flight against any one host
+- min_interval: minimum seconds between task starts on the same host
+
+Tasks for a busy host wait in their own queue instead of occupying a
+worker, so other hosts keep moving. Results are yielded as tasks finish,
+not in input order.
+"""
+
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+
+def run_per_host(items: Iterable[Any], fn: Callable[[Any], Any], host_fn: Callable[[Any], str],
+                 max_workers: int = 8, per_host: int = 2, min_interval: float = 0.0,
+                 executor: Optional[ThreadPoolExecutor] = None) -> Iterator[Tuple[int, Any, Optional[Exception]]]:
+    """
+    Run fn over items concurrently, yielding results as they complete.
+
+    Args:
+        items: Work items (e.g. URLs)
+        fn: Callable run on each item in a worker thread
+        host_fn: Callable mapping an item to its host key
+        max_workers: Global concurrency limit
+        per_host: Concurrency limit per host
+        min_interval: Minimum seconds between starts on one host
+        executor: Thread pool to use (a private one is created by default)
+
+    Yields:
+        Tuple of (item index, result, error) - error is the exception fn
+        raised, in which case result is None
+    """
+    queues: "OrderedDict[str, deque]" = OrderedDict()
+    total = 0
+    for index, item in enumerate(items):
+        queues.setdefault(host_fn(item), deque()).append((index, item))
+        total += 1
+    if not total:
+        return
+
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+    active = {host: 0 for host in queues}
+    last_start = {}
+    running = {}
+
+    def start_ready() -> Optional[float]:
+        """Start every task the limits allow; return seconds until the next one could start."""
+        next_wait = None
+        now = time.monotonic()
+        for host in list(queues):
+            if len(running) >= max_workers:
+                break
+            queue = queues[host]
+            while queue and active[host] < per_host and len(running) < max_workers:
+                remaining = min_interval - (now - last_start.get(host, float('-inf')))
+                if remaining > 0:
+                    next_wait = remaining if next_wait is None else min(next_wait, remaining)
+                    break
+                index, item = queue.popleft()
+                active[host] += 1
+                last_start[host] = now
+                running[executor.submit(fn, item)] = (index, host)
+            if not queue:
+                del queues[host]
+            else:
+                # Round robin: a host that just started work goes to the back
+                queues.move_to_end(host)
+        return next_wait
+
+    try:
+        finished = 0
+        while finished < total:
+            next_wait = start_ready()
+            if not running:
+                time.sleep(next_wait or 0)
+                continue
+
+            done, _ = wait(list(running), timeout=next_wait, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, host = running.pop(future)
+                active[host] -= 1
+                finished += 1
+                error = future.exception()
+                yield index, (None if error else future.result()), error
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,382 @@
+"""
+Persistent key/value stores for Bookmark Knowledge Base caches.
+
+Cloud Function instances are short-lived, so caches that should survive a
+cold start write through to one of these stores:
+
+- FileStore: JSON files under a local directory (default: the temp dir)
+- GCSStore: JSON blobs in a Cloud Storage bucket, shared by all instances
+- MemoryStore: process-local dict, used in tests
+
+All stores take an optional TTL per entry; expired entries read as missing.
+
+Entries shared by writers on several instances (e.g. the Gemini batch queue)
+are changed with update_entry(): a read-modify-write that only commits if
+the entry is still the version it read (GCS generation preconditions) and
+retries otherwise, so concurrent writers never drop each other's changes.
+Work items that many writers add (e.g. queued batch requests) go one entry
+each into a child() store instead, which scan() lists.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+CACHE_BUCKET = os.environ.get('CACHE_BUCKET')  # Optional: share caches across instances
+CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'bookmark-kb-cache')
+
+UPDATE_ATTEMPTS = 10  # Conditional writes tried before update_entry gives up
+
+
+class StoreConflict(Exception):
+    """A conditional write found the entry changed since it was read."""
+
+
+def _hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _wrap(value: Any, ttl: Optional[float]) -> Dict:
+    return {
+        'expires_at': time.time() + ttl if ttl else None,
+        'value': value,
+    }
+
+
+def _unwrap(entry: Optional[Dict]) -> Any:
+    if not entry:
+        return None
+    expires_at = entry.get('expires_at')
+    if expires_at and expires_at < time.time():
+        return None
+    return entry.get('value')
+
+
+class MemoryStore:
+    """Process-local store (tests and fallback)."""
+
+    def __init__(self):
+        self._data: Dict[str, Dict] = {}
+        self._versions: Dict[str, int] = {}
+        self._children: Dict[str, 'MemoryStore'] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            return _unwrap(self._data.get(key))
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = _wrap(value, ttl)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            self._versions.pop(key, None)
+
+    def get_versioned(self, key: str) -> Tuple[Any, int]:
+        """Value and version of key (version 0 if missing)."""
+        with self._lock:
+            return _unwrap(self._data.get(key)), self._versions.get(key, 0)
+
+    def set_if_version(self, key: str, value: Any, version: int, ttl: Optional[float] = None):
+        """Set key only if it is still at version (0: still missing); else raise StoreConflict."""
+        with self._lock:
+            current = self._versions.get(key, 0)
+            if current != version:
+                raise StoreConflict(key)
+            self._data[key] = _wrap(value, ttl)
+            self._versions[key] = current + 1
+
+    def delete_if_version(self, key: str, version: int):
+        """Delete key only if it is still at version; else raise StoreConflict."""
+        with self._lock:
+            if key not in self._data or self._versions.get(key) != version:
+                raise StoreConflict(key)
+            del self._data[key]
+            del self._versions[key]
+
+    def scan(self, limit: Optional[int] = None) -> List[Tuple[Any, int]]:
+        """(value, version) of up to limit live entries."""
+        with self._lock:
+            live = [(_unwrap(entry), self._versions[key]) for key, entry in self._data.items()]
+        live = [(value, version) for value, version in live if value is not None]
+        return live[:limit] if limit else live
+
+    def child(self, name: str) -> 'MemoryStore':
+        """Separate store for one kind of entry (same object on every call)."""
+        with self._lock:
+            if name not in self._children:
+                self._children[name] = type(self)()
+            return self._children[name]
+
+
+class FileStore:
+    """JSON files on local disk, one per key."""
+
+    # One lock for all FileStores: conditional writes only need to be atomic
+    # within this process (the directory is local to the instance).
+    # Versions are a counter stored in the entry.
+    _write_lock = threading.Lock()
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        digest = _hash_key(key)
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    def get(self, key: str) -> Any:
+        return _unwrap(self._read(key))
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._write(key, _wrap(value, ttl))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _read(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key: str, entry: Dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file then rename, so readers never see partial JSON
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_versioned(self, key: str) -> Tuple[Any, int]:
+        """Value and version of key (0 if missing)."""
+        with self._write_lock:
+            entry = self._read(key)
+        if entry is None:
+            return None, 0
+        return _unwrap(entry), entry.get('version', 1)
+
+    def set_if_version(self, key: str, value: Any, version: int, ttl: Optional[float] = None):
+        """Set key only if it is still at version (0: still missing); else raise StoreConflict."""
+        with self._write_lock:
+            entry = self._read(key)
+            current = 0 if entry is None else entry.get('version', 1)
+            if current != version:
+                raise StoreConflict(key)
+            self._write(key, dict(_wrap(value, ttl), version=current + 1))
+
+    def delete_if_version(self, key: str, version: int):
+        """Delete key only if it is still at version; else raise StoreConflict."""
+        with self._write_lock:
+            entry = self._read(key)
+            if entry is None or entry.get('version', 1) != version:
+                raise StoreConflict(key)
+            self.delete(key)
+
+    def scan(self, limit: Optional[int] = None) -> List[Tuple[Any, int]]:
+        """(value, version) of up to limit live entries."""
+        live = []
+        try:
+            shards = sorted(d for d in os.listdir(self.root) if len(d) == 2)
+        except OSError:
+            return live
+        for shard in shards:
+            for name in sorted(os.listdir(os.path.join(self.root, shard))):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.root, shard, name), 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                value = _unwrap(entry)
+                if value is not None:
+                    live.append((value, entry.get('version', 1)))
+                    if limit and len(live) >= limit:
+                        return live
+        return live
+
+    def child(self, name: str) -> 'FileStore':
+        """Separate store for one kind of entry, in a subdirectory."""
+        return FileStore(os.path.join(self.root, name))
+
+
+class GCSStore:
+    """JSON blobs in a Cloud Storage bucket, shared across instances."""
+
+    def __init__(self, bucket_name: str, prefix: str, client_factory: Callable):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.client_factory = client_factory
+        self._bucket = None
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            self._bucket = self.client_factory().bucket(self.bucket_name)
+        return self._bucket
+
+    def _blob_name(self, key: str) -> str:
+        return f"{self.prefix}{_hash_key(key)}.json"
+
+    def _blob(self, key: str):
+        return self._get_bucket().blob(self._blob_name(key))
+
+    def get(self, key: str) -> Any:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return _unwrap(json.loads(self._blob(key).download_as_bytes()))
+        except (NotFound, ValueError):
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._blob(key).upload_from_string(
+            json.dumps(_wrap(value, ttl)),
+            content_type='application/json',
+        )
+
+    def delete(self, key: str):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self._blob(key).delete()
+        except NotFound:
+            pass
+
+    def get_versioned(self, key: str) -> Tuple[Any, int]:
+        """Value and GCS generation of key (0 if missing)."""
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        blob = self._get_bucket().get_blob(self._blob_name(key))
+        if blob is None:
+            return None, 0
+        try:
+            data = blob.download_as_bytes(if_generation_match=blob.generation)
+        except (NotFound, PreconditionFailed):
+            # Replaced or deleted since get_blob
+            raise StoreConflict(key)
+        try:
+            return _unwrap(json.loads(data)), blob.generation
+        except ValueError:
+            return None, blob.generation
+
+    def set_if_version(self, key: str, value: Any, version: int, ttl: Optional[float] = None):
+        """Set key only if its generation is still version (0: still missing); else raise StoreConflict."""
+        from google.api_core.exceptions import PreconditionFailed
+
+        try:
+            self._blob(key).upload_from_string(
+                json.dumps(_wrap(value, ttl)),
+                content_type='application/json',
+                if_generation_match=version,
+            )
+        except PreconditionFailed:
+            raise StoreConflict(key)
+
+    def delete_if_version(self, key: str, version: int):
+        """Delete key only if its generation is still version; else raise StoreConflict."""
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        try:
+            self._blob(key).delete(if_generation_match=version)
+        except (NotFound, PreconditionFailed):
+            raise StoreConflict(key)
+
+    def scan(self, limit: Optional[int] = None) -> List[Tuple[Any, int]]:
+        """(value, generation) of up to limit live entries (not those of child stores)."""
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        live = []
+        for blob in self._get_bucket().list_blobs(prefix=self.prefix, delimiter='/'):
+            try:
+                value = _unwrap(json.loads(blob.download_as_bytes(if_generation_match=blob.generation)))
+            except (NotFound, PreconditionFailed, ValueError):
+                continue  # changed or deleted since listed
+            if value is not None:
+                live.append((value, blob.generation))
+                if limit and len(live) >= limit:
+                    break
+        return live
+
+    def child(self, name: str) -> 'GCSStore':
+        """Separate store for one kind of entry, under a sub-prefix."""
+        store = GCSStore(self.bucket_name, f"{self.prefix}{name}/", self.client_factory)
+        store._bucket = self._bucket
+        return store
+
+
+def update_entry(store, key: str, update: Callable[[Any], Any], ttl: Optional[float] = None,
+                 attempts: int = UPDATE_ATTEMPTS) -> Any:
+    """
+    Atomically replace key's value with update(current value).
+
+    update may run several times (once per conflicting writer), so it must
+    not have side effects.
+
+    Args:
+        store: Store with get_versioned / set_if_version
+        key: Entry to change
+        update: Callable(current value or None) -> new value
+        ttl: TTL for the new value
+        attempts: Conditional writes tried before giving up
+
+    Returns:
+        The value written
+
+    Raises:
+        StoreConflict: every attempt lost to another writer
+    """
+    for attempt in range(attempts):
+        try:
+            current, version = store.get_versioned(key)
+            # A copy, so a lost race cannot leave update's edits in a MemoryStore value
+            value = update(copy.deepcopy(current))
+            store.set_if_version(key, value, version, ttl)
+            return value
+        except StoreConflict:
+            # Jittered backoff so racing writers do not collide again
+            time.sleep(random.uniform(0, 0.02 * 2 ** min(attempt, 5)))
+    raise StoreConflict(f"{key}: {attempts} conflicting writes")
+
+
+def shared_store_configured() -> bool:
+    """True if stores are shared by all instances (CACHE_BUCKET is set)."""
+    return bool(CACHE_BUCKET)
+
+
+def _default_storage_client():
+    from google.cloud import storage
+    return storage.Client()
+
+
+def get_cache_store(namespace: str, client_factory: Optional[Callable] = None):
+    """
+    Get the configured persistent store for a cache namespace.
+
+    Uses GCS when CACHE_BUCKET is set, otherwise files under CACHE_DIR.
+
+    Args:
+        namespace: Cache name, e.g. 'redirects'
+        client_factory: Callable returning a storage.Client (GCS only)
+    """
+    if CACHE_BUCKET:
+        return GCSStore(CACHE_BUCKET, f"cache/{namespace}/", client_factory or _default_storage_client)
+    return FileStore(os.path.join(CACHE_DIR, namespace))
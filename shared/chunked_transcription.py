@@ -0,0 +1,194 @@
+"""
+Chunked, parallel transcription for long audio.
+
+One AssemblyAI job for an hour-long episode takes roughly as long as the
+episode's transcription queue does for one file; nothing runs in parallel.
+Long audio is instead:
+
+1. split into chunks of about CHUNK_TARGET_SECONDS, with every boundary in
+   a pause between speech spans (shared/audio_utils.py), so no word is cut
+2. cut with CHUNK_OVERLAP_SECONDS of extra audio either side, in case a
+   boundary pause is shorter than it looked
+3. transcribed at most CHUNK_CONCURRENCY at a time, each chunk retried on
+   its own up to CHUNK_RETRIES times
+4. stitched in order: word times are shifted to the original audio, and a
+   word in an overlap is kept only by the chunk whose range holds its
+   midpoint, so edge words appear once
+
+Latency then grows with chunks / concurrency rather than with duration.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .audio_utils import SAMPLE_RATE, write_flac
+from .video_segments import plan_segments
+
+CHUNKED_TRANSCRIPTION_MIN_SECONDS = int(os.environ.get('CHUNKED_TRANSCRIPTION_MIN_SECONDS', 900))  # Shorter audio is one job
+CHUNK_TARGET_SECONDS = int(os.environ.get('CHUNK_TARGET_SECONDS', 300))  # Preferred chunk length
+CHUNK_MAX_COUNT = int(os.environ.get('CHUNK_MAX_COUNT', 16))  # Longer audio gets longer chunks
+CHUNK_CONCURRENCY = int(os.environ.get('CHUNK_CONCURRENCY', 4))  # Chunk transcriptions in flight
+CHUNK_RETRIES = int(os.environ.get('CHUNK_RETRIES', 2))  # Extra attempts per failed chunk
+
+CHUNK_OVERLAP_SECONDS = 0.5  # Extra audio on each side of a chunk
+CHUNK_RETRY_BACKOFF_SECONDS = 2.0  # Doubled after every failed attempt
+
+
+class ChunkTranscriptionError(Exception):
+    """A chunk still failed after all its retries."""
+
+
+def silence_cut_points(spans: Sequence[Tuple[float, float]]) -> List[float]:
+    """Midpoints of the pauses between consecutive speech spans."""
+    return [(end + next_start) / 2 for (_, end), (next_start, _) in zip(spans, spans[1:])]
+
+
+def plan_chunks(duration: float, spans: Sequence[Tuple[float, float]],
+                target_seconds: float = CHUNK_TARGET_SECONDS,
+                max_chunks: int = CHUNK_MAX_COUNT) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into chunks that start and end in pauses.
+
+    Args:
+        duration: Audio duration in seconds
+        spans: Speech spans (start, end) from detect_speech
+        target_seconds: Preferred chunk length
+        max_chunks: Upper bound on the chunk count
+
+    Returns:
+        List of (start, end) tuples covering the whole audio
+    """
+    return plan_segments(duration, silence_cut_points(spans), target_seconds, max_chunks)
+
+
+def transcribe_with_retry(transcribe: Callable[[str], Dict], path: str, retries: int = CHUNK_RETRIES,
+                          backoff: float = CHUNK_RETRY_BACKOFF_SECONDS) -> Dict:
+    """
+    Call transcribe(path) until it succeeds, at most 1 + retries times.
+
+    transcribe returns a dict with text, words, confidence and language, or
+    with error set; raising counts as a failure too.
+
+    Raises:
+        ChunkTranscriptionError: the last attempt failed
+    """
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            result = transcribe(path)
+            if not result.get('error'):
+                return result
+            error = result['error']
+        except Exception as e:
+            error = str(e)
+        print(f"Chunk transcription attempt {attempt + 1} failed for {path}: {error}")
+    raise ChunkTranscriptionError(error)
+
+
+def stitch_chunks(chunk_results: Sequence[Dict]) -> Dict:
+    """
+    Join per-chunk transcripts into one.
+
+    Args:
+        chunk_results: In chunk order, dicts with start and end (the range
+            the chunk owns, seconds), offset (where its audio was cut,
+            seconds) and result (text, words with start/end in ms relative
+            to the chunk, confidence, language)
+
+    Returns:
+        Dict with text, words (ms of the original audio), confidence
+        (word-weighted) and language (of the longest chunk)
+    """
+    words, text_parts = [], []
+    weighted, weight = 0.0, 0
+    language, language_words = None, -1
+    last = len(chunk_results) - 1
+    for i, chunk in enumerate(chunk_results):
+        result = chunk['result']
+        offset_ms = chunk['offset'] * 1000
+        own_start, own_end = chunk['start'] * 1000, chunk['end'] * 1000
+
+        kept = []
+        for word in result.get('words') or []:
+            start, end = word['start'] + offset_ms, word['end'] + offset_ms
+            middle = (start + end) / 2
+            if middle < own_start or (middle >= own_end and i < last):
+                continue
+            # The same word heard at the very end of the previous chunk
+            if words and word['text'] == words[-1]['text'] and start < words[-1]['end']:
+                continue
+            kept.append({**word, 'start': int(round(start)), 'end': int(round(end))})
+
+        if kept:
+            text_parts.append(' '.join(word['text'] for word in kept))
+        elif not result.get('words') and (result.get('text') or '').strip():
+            text_parts.append(result['text'].strip())
+        words.extend(kept)
+
+        if result.get('confidence') is not None:
+            weighted += result['confidence'] * max(1, len(kept))
+            weight += max(1, len(kept))
+        if result.get('language') and len(kept) > language_words:
+            language, language_words = result['language'], len(kept)
+
+    return {
+        'text': ' '.join(text_parts),
+        'words': words,
+        'confidence': weighted / weight if weight else None,
+        'language': language,
+    }
+
+
+def transcribe_in_chunks(samples: np.ndarray, spans: Sequence[Tuple[float, float]],
+                         transcribe: Callable[[str], Dict], workdir: str,
+                         sample_rate: int = SAMPLE_RATE, target_seconds: float = CHUNK_TARGET_SECONDS,
+                         max_workers: int = CHUNK_CONCURRENCY, retries: int = CHUNK_RETRIES,
+                         overlap: float = CHUNK_OVERLAP_SECONDS) -> Dict:
+    """
+    Transcribe long audio as parallel chunks split at pauses.
+
+    Args:
+        samples: Mono float samples of the whole audio
+        spans: Speech spans (start, end) from detect_speech
+        transcribe: Callable transcribing one audio file (see transcribe_with_retry)
+        workdir: Directory for the chunk files
+        sample_rate: Sample rate of samples
+        target_seconds: Preferred chunk length
+        max_workers: Chunk transcriptions in flight
+        retries: Extra attempts per failed chunk
+        overlap: Extra audio on each side of a chunk, in seconds
+
+    Returns:
+        stitch_chunks dict plus chunks (the number of chunks)
+
+    Raises:
+        ChunkTranscriptionError: a chunk failed after all its retries
+    """
+    duration = len(samples) / sample_rate
+    chunks = plan_chunks(duration, spans, target_seconds)
+    print(f"Transcribing {duration:.0f}s of audio in {len(chunks)} chunks")
+
+    def run(item):
+        index, (start, end) = item
+        cut_start, cut_end = max(0.0, start - overlap), min(duration, end + overlap)
+        path = write_flac(samples[int(cut_start * sample_rate):int(cut_end * sample_rate)],
+                          os.path.join(workdir, f"chunk_{index:03d}.flac"), sample_rate)
+        try:
+            result = transcribe_with_retry(transcribe, path, retries)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        return {'start': start, 'end': end, 'offset': cut_start, 'result': result}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        chunk_results = list(executor.map(run, enumerate(chunks)))
+
+    stitched = stitch_chunks(chunk_results)
+    stitched['chunks'] = len(chunks)
+    return stitched
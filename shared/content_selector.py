@@ -0,0 +1,181 @@
+"""
+Token-budgeted content selection for LLM prompts.
+
+Cutting page text at a fixed character count spends the prompt on whatever
+comes first (leftover navigation, share buttons, cookie notices) and drops
+the conclusion. select_content instead:
+
+1. splits the text into short spans of whole sentences
+2. scores every span, vectorized with NumPy:
+   - topicality: cosine similarity of its TF-IDF vector to the document centroid
+   - density: average IDF of its distinct terms (boilerplate repeats common words)
+   - position: intros and conclusions rank above the middle
+3. fills the token budget with the best spans and returns them in
+   document order, marking gaps between them with " [...] "
+
+Text that already fits the budget is returned unchanged.
+"""
+
+import os
+import re
+from typing import List
+
+import numpy as np
+
+from .ai_memo import normalize_content
+from .long_document import CHARS_PER_TOKEN, estimate_tokens, split_sentences
+
+CONTENT_TOKEN_BUDGET = int(os.environ.get('CONTENT_TOKEN_BUDGET', 2500))  # Tokens of page text per prompt
+SPAN_TOKENS = 80  # Target span size
+
+# Score weights (sum to 1)
+TOPICALITY_WEIGHT = 0.45
+DENSITY_WEIGHT = 0.25
+POSITION_WEIGHT = 0.3
+
+GAP_MARKER = ' [...] '
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from
+further had has have having he her here hers him his how i if in into is it its itself
+just me more most my no nor not now of off on once only or other our ours out over own
+same she should so some such than that the their theirs them then there these they this
+those through to too under until up very was we were what when where which while who whom
+why will with would you your yours
+""".split())
+
+_TERM = re.compile(r'\w+')
+
+
+def split_spans(text: str, span_tokens: int = SPAN_TOKENS) -> List[str]:
+    """
+    Group consecutive sentences into spans of about span_tokens.
+
+    Repeated sentences (share bars, newsletter prompts) are kept only at
+    their first occurrence.
+    """
+    spans = []
+    current: List[str] = []
+    current_tokens = 0
+    seen = set()
+    for sentence in split_sentences(text):
+        key = normalize_content(sentence)
+        if key in seen:
+            continue
+        seen.add(key)
+        tokens = estimate_tokens(sentence) + 1
+        if current and current_tokens + tokens > span_tokens:
+            spans.append(' '.join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        spans.append(' '.join(current))
+    return spans
+
+
+def _terms(span: str) -> List[str]:
+    return [t for t in _TERM.findall(span.lower()) if len(t) > 2 and t not in STOPWORDS]
+
+
+def _scale(values: np.ndarray) -> np.ndarray:
+    top = values.max() if values.size else 0.0
+    return values / top if top > 0 else np.zeros_like(values)
+
+
+def score_spans(spans: List[str]) -> np.ndarray:
+    """
+    Score spans by topicality, information density and position.
+
+    Args:
+        spans: Span texts in document order
+
+    Returns:
+        Array of scores in [0, 1], one per span
+    """
+    n = len(spans)
+    if n == 0:
+        return np.zeros(0)
+
+    # Sparse (span, term) pairs as flat arrays - no dense span x vocabulary matrix
+    vocabulary = {}
+    rows, cols = [], []
+    for row, span in enumerate(spans):
+        for term in _terms(span):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+
+    position = np.linspace(0.0, 1.0, n) if n > 1 else np.zeros(1)
+    position = np.maximum(position, 1.0 - position) ** 4
+
+    if not vocabulary:
+        return position * POSITION_WEIGHT
+
+    vocab_size = len(vocabulary)
+    pairs, counts = np.unique(np.asarray(rows) * vocab_size + np.asarray(cols), return_counts=True)
+    rows, cols = pairs // vocab_size, pairs % vocab_size
+    term_counts = np.bincount(rows, weights=counts, minlength=n)
+
+    # TF-IDF with sublinear term frequency
+    df = np.bincount(cols, minlength=vocab_size)
+    idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+    weights = np.log1p(counts) * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n))
+    unit = weights / norms[rows]
+
+    # Topicality: cosine similarity to the document centroid
+    centroid = np.bincount(cols, weights=unit, minlength=vocab_size) / n
+    centroid_norm = np.linalg.norm(centroid)
+    topicality = np.bincount(rows, weights=unit * centroid[cols], minlength=n)
+    topicality = topicality / centroid_norm if centroid_norm > 0 else topicality
+
+    # Density: IDF mass of distinct terms per term occurrence
+    idf_mass = np.bincount(rows, weights=idf[cols], minlength=n)
+    density = np.divide(idf_mass, term_counts, out=np.zeros(n), where=term_counts > 0)
+
+    return (
+        TOPICALITY_WEIGHT * _scale(topicality)
+        + DENSITY_WEIGHT * _scale(density)
+        + POSITION_WEIGHT * position
+    )
+
+
+def select_content(text: str, token_budget: int = CONTENT_TOKEN_BUDGET) -> str:
+    """
+    Pick the highest-value spans of text that fit in token_budget.
+
+    Args:
+        text: Page text
+        token_budget: Estimated tokens the selection may use
+
+    Returns:
+        Selected spans in document order, with GAP_MARKER between spans that
+        were not adjacent (text itself if it already fits)
+    """
+    if not text or estimate_tokens(text) <= token_budget:
+        return text or ''
+
+    spans = split_spans(text)
+    scores = score_spans(spans)
+    costs = np.array([estimate_tokens(span) + estimate_tokens(GAP_MARKER) for span in spans])
+
+    chosen = np.zeros(len(spans), dtype=bool)
+    remaining = token_budget
+    for i in np.argsort(-scores, kind='stable'):
+        if costs[i] <= remaining:
+            chosen[i] = True
+            remaining -= costs[i]
+
+    if not chosen.any():
+        # A single span larger than the budget: keep its start
+        return spans[0][:token_budget * CHARS_PER_TOKEN]
+
+    parts = []
+    previous = None
+    for i in np.flatnonzero(chosen):
+        if previous is not None:
+            parts.append(' ' if i == previous + 1 else GAP_MARKER)
+        parts.append(spans[i])
+        previous = i
+    return ''.join(parts)
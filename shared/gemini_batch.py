@@ -0,0 +1,338 @@
+"""
+Deferred Gemini calls through the Gemini Batch API.
+
+Backlog enrichment does not need answers within seconds, but per-item
+synchronous calls pay full price and count against interactive quotas.
+GeminiBatchQueue lets an enricher queue a prompt instead of sending it:
+
+1. enqueue(key, contents, context) - at enrichment time, per bookmark
+2. submit() - one batch job for everything queued (batch pricing/quotas)
+3. collect(finalize) - once the job has finished, each response goes
+   through finalize (which turns it into the bookmark's record) and is
+   stored under its key for result(key)
+
+Contents are JSON-serializable parts: {'text': ...} or {'file_uri': ...,
+'mime_type': ...} for files already uploaded to the Gemini File API. The
+queue, job bookkeeping and results live in a cache store. Each queued
+request is its own entry in the store's 'pending' child, so enqueueing
+never rewrites other requests and concurrent enqueues do not contend;
+submit lists them and claims each with a conditional delete. The short
+'jobs' list is changed by conditional read-modify-write
+(cache_store.update_entry). Instances enqueueing, submitting or
+collecting at the same time therefore never drop each other's entries. Only a shared
+store (CACHE_BUCKET) lets any instance submit or collect what another
+queued, so get_gemini_batch_queue refuses to build a queue without one.
+
+Backends:
+
+- GeminiBatchBackend: the real Batch API (google-genai, imported lazily)
+- LocalBatchBackend: in-process stand-in that answers with a callable;
+  used in tests and local runs
+"""
+
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from .cache_store import StoreConflict, get_cache_store, shared_store_configured, update_entry
+
+GEMINI_BATCH_MODEL = os.environ.get('GEMINI_BATCH_MODEL', 'gemini-2.0-flash')
+GEMINI_BATCH_MAX_REQUESTS = int(os.environ.get('GEMINI_BATCH_MAX_REQUESTS', 500))  # Requests per batch job
+GEMINI_BATCH_TTL = int(os.environ.get('GEMINI_BATCH_TTL', 7 * 24 * 3600))  # Seconds to keep queue, jobs and results
+
+JOB_SUCCEEDED = 'JOB_STATE_SUCCEEDED'
+JOB_FINAL_STATES = frozenset([JOB_SUCCEEDED, 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'])
+
+
+class BatchQueueUnavailable(Exception):
+    """Deferred calls need a store shared by all instances (CACHE_BUCKET)."""
+
+
+def text_part(text: str) -> Dict:
+    """Queue part for prompt text."""
+    return {'text': text}
+
+
+def file_part(file_uri: str, mime_type: str) -> Dict:
+    """Queue part for a file uploaded to the Gemini File API."""
+    return {'file_uri': file_uri, 'mime_type': mime_type}
+
+
+class LocalBatchBackend:
+    """
+    In-process stand-in for the Gemini Batch API.
+
+    Args:
+        respond: Callable(contents) -> response text; may raise to simulate
+            a per-request error (default: empty response)
+        polls_until_done: Polls that report JOB_STATE_RUNNING before a job
+            completes
+    """
+
+    def __init__(self, respond: Callable[[List[Dict]], str] = None, polls_until_done: int = 0):
+        self.respond = respond or (lambda contents: '')
+        self.polls_until_done = polls_until_done
+        self.jobs: Dict[str, Dict] = {}
+
+    def submit(self, model: str, requests: List[Dict]) -> str:
+        name = f"batches/local-{uuid.uuid4().hex[:12]}"
+        self.jobs[name] = {'model': model, 'requests': requests, 'polls': 0}
+        return name
+
+    def poll(self, name: str) -> Dict:
+        job = self.jobs.get(name)
+        if job is None:
+            return {'state': 'JOB_STATE_FAILED', 'error': f'Unknown batch job: {name}', 'responses': None}
+        job['polls'] += 1
+        if job['polls'] <= self.polls_until_done:
+            return {'state': 'JOB_STATE_RUNNING', 'error': None, 'responses': None}
+
+        responses = []
+        for request in job['requests']:
+            try:
+                responses.append({'text': self.respond(request['contents']), 'error': None})
+            except Exception as e:
+                responses.append({'text': None, 'error': str(e)})
+        return {'state': JOB_SUCCEEDED, 'error': None, 'responses': responses}
+
+
+class GeminiBatchBackend:
+    """
+    Gemini Batch API with inline requests (requires the google-genai package).
+
+    Args:
+        api_key: Gemini API key (files referenced by requests must have been
+            uploaded with the same key)
+    """
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key or os.environ.get('GEMINI_API_KEY')
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            try:
+                from google import genai as genai_sdk
+            except ImportError as e:
+                raise RuntimeError('Gemini batch mode requires the google-genai package') from e
+            self._client = genai_sdk.Client(api_key=self.api_key)
+        return self._client
+
+    @staticmethod
+    def _api_part(part: Dict) -> Dict:
+        if 'file_uri' in part:
+            return {'file_data': {'file_uri': part['file_uri'], 'mime_type': part['mime_type']}}
+        return {'text': part['text']}
+
+    def submit(self, model: str, requests: List[Dict]) -> str:
+        src = []
+        for request in requests:
+            item = {'contents': [{'role': 'user', 'parts': [self._api_part(p) for p in request['contents']]}]}
+            if request.get('config'):
+                item['config'] = request['config']
+            src.append(item)
+        job = self._get_client().batches.create(
+            model=model,
+            src=src,
+            config={'display_name': f"bookmark-kb-{int(time.time())}"},
+        )
+        return job.name
+
+    def poll(self, name: str) -> Dict:
+        job = self._get_client().batches.get(name=name)
+        state = getattr(job.state, 'name', str(job.state))
+        if state != JOB_SUCCEEDED:
+            error = getattr(job, 'error', None)
+            return {'state': state, 'error': str(error) if error else None, 'responses': None}
+
+        # Inline responses come back in request order
+        responses = []
+        for item in job.dest.inlined_responses:
+            if getattr(item, 'error', None):
+                responses.append({'text': None, 'error': str(item.error)})
+            else:
+                responses.append({'text': item.response.text, 'error': None})
+        return {'state': state, 'error': None, 'responses': responses}
+
+
+class GeminiBatchQueue:
+    """
+    Persistent queue of deferred Gemini requests and their results.
+
+    Args:
+        namespace: Cache namespace (one queue per enricher)
+        backend: Batch backend (default: GeminiBatchBackend)
+        store: Persistent store (default: the configured store for namespace)
+        model: Model every queued request runs on
+        ttl: Seconds queue entries, job records and results are kept
+    """
+
+    def __init__(self, namespace: str, backend=None, store=None, model: str = GEMINI_BATCH_MODEL,
+                 ttl: int = GEMINI_BATCH_TTL):
+        self.backend = backend if backend is not None else GeminiBatchBackend()
+        self.store = store if store is not None else get_cache_store(namespace)
+        self.pending_store = self.store.child('pending')
+        self.model = model
+        self.ttl = ttl
+
+    def _get_list(self, key: str) -> List:
+        return self.store.get(key) or []
+
+    def _update_list(self, key: str, update: Callable[[List], List]) -> List:
+        return update_entry(self.store, key, lambda current: update(current or []), ttl=self.ttl)
+
+    def _scan_pending(self, limit: Optional[int] = None) -> List:
+        entries = self.pending_store.scan(limit)
+        return sorted(entries, key=lambda entry: entry[0]['queued_at'])
+
+    def pending(self) -> List[Dict]:
+        """Requests queued but not yet submitted, oldest first."""
+        return [request for request, _ in self._scan_pending()]
+
+    def open_jobs(self) -> List[str]:
+        """Names of submitted jobs not yet collected."""
+        return self._get_list('jobs')
+
+    def enqueue(self, key: str, contents: List[Dict], context: Optional[Dict] = None,
+                config: Optional[Dict] = None) -> Dict:
+        """
+        Queue one request (re-queueing a key replaces the earlier request).
+
+        Args:
+            key: Record key the result is stored under (e.g. canonical URL)
+            contents: Prompt parts (see text_part / file_part)
+            context: JSON-serializable data passed to finalize on collect
+            config: Optional generation config (e.g. response_mime_type and
+                response_schema for structured output)
+
+        Returns:
+            Dict with batch_key
+        """
+        request = {'key': key, 'contents': contents, 'context': context or {}, 'config': config,
+                   'queued_at': time.time()}
+        # Conditional, so a submit claiming the previous request by version cannot delete this one
+        update_entry(self.pending_store, key, lambda current: request, ttl=self.ttl)
+        return {'batch_key': key}
+
+    def submit(self) -> List[str]:
+        """
+        Submit every pending request, GEMINI_BATCH_MAX_REQUESTS per job.
+
+        Requests are claimed (their entry deleted if it is still the version
+        listed) before their job is created, so two instances submitting at
+        once never send the same request twice; if creating the job fails
+        they are put back.
+
+        Returns:
+            Names of the submitted jobs (empty if nothing was pending)
+        """
+        jobs = []
+        while True:
+            listed = self._scan_pending(GEMINI_BATCH_MAX_REQUESTS)
+            if not listed:
+                return jobs
+            claimed = []
+            for request, version in listed:
+                try:
+                    self.pending_store.delete_if_version(request['key'], version)
+                except StoreConflict:
+                    continue  # claimed by another instance, or re-queued since listed
+                claimed.append(request)
+            if not claimed:
+                continue
+
+            try:
+                name = self.backend.submit(self.model, claimed)
+            except Exception:
+                for request in claimed:
+                    try:
+                        self.pending_store.set_if_version(request['key'], request, 0, ttl=self.ttl)
+                    except StoreConflict:
+                        pass  # re-queued meanwhile; the newer request wins
+                raise
+
+            self.store.set(f"job:{name}", {
+                'name': name,
+                'requests': [{'key': r['key'], 'context': r['context']} for r in claimed],
+                'submitted_at': time.time(),
+            }, ttl=self.ttl)
+            self._update_list('jobs', lambda current: current + [name])
+            jobs.append(name)
+
+    def collect(self, finalize: Callable[[Dict, Dict], Any]) -> Dict:
+        """
+        Poll open jobs and fan finished responses out to per-key results.
+
+        A finished job is claimed (taken off the open list) before its
+        responses are finalized, so concurrent collectors finalize each job
+        once; if finalizing fails the job is reopened.
+
+        Args:
+            finalize: Callable(response, request) -> record, where response is
+                {'text', 'error'} and request is {'key', 'context'}
+
+        Returns:
+            Dict with:
+                jobs: dict - job name -> state
+                results: list - {'key', 'result'} for every request finalized now
+        """
+        summary = {'jobs': {}, 'results': []}
+        for name in self.open_jobs():
+            status = self.backend.poll(name)
+            summary['jobs'][name] = status['state']
+            if status['state'] not in JOB_FINAL_STATES:
+                continue
+
+            claimed = []
+
+            def claim(current, name=name):
+                claimed[:] = [j for j in current if j == name]
+                return [j for j in current if j != name]
+
+            self._update_list('jobs', claim)
+            if not claimed:
+                continue  # another instance is collecting this job
+
+            job = self.store.get(f"job:{name}") or {'requests': []}
+            responses = status['responses'] or []
+            try:
+                for i, request in enumerate(job['requests']):
+                    if i < len(responses):
+                        response = responses[i]
+                    else:
+                        response = {'text': None,
+                                    'error': status.get('error') or f"Batch job ended: {status['state']}"}
+                    record = finalize(response, request)
+                    self.store.set(f"result:{request['key']}", record, ttl=self.ttl)
+                    summary['results'].append({'key': request['key'], 'result': record})
+            except Exception:
+                self._update_list('jobs', lambda current, name=name: current + [name])
+                raise
+            self.store.delete(f"job:{name}")
+        return summary
+
+    def result(self, key: str) -> Optional[Any]:
+        """Finalized record for key, or None if not collected yet."""
+        return self.store.get(f"result:{key}")
+
+
+_queues: Dict[str, GeminiBatchQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def get_gemini_batch_queue(namespace: str) -> GeminiBatchQueue:
+    """
+    Get the process-wide queue for a namespace (created on first use).
+
+    Raises:
+        BatchQueueUnavailable: CACHE_BUCKET is not set, so queued requests
+            would only be visible to this instance
+    """
+    if not shared_store_configured():
+        raise BatchQueueUnavailable('Deferred Gemini calls require CACHE_BUCKET (a store shared by all instances)')
+    with _queues_lock:
+        if namespace not in _queues:
+            _queues[namespace] = GeminiBatchQueue(namespace)
+        return _queues[namespace]
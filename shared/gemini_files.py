@@ -0,0 +1,330 @@
+"""
+Registry of files uploaded to the Gemini File API, keyed by content hash.
+
+Uploading a video and waiting for Gemini to process it costs more than the
+prompt that follows, and uploaded files stay usable for 48 hours. Rather
+than upload-analyze-delete on every request, GeminiFileRegistry.acquire():
+
+1. hashes the local file (SHA-256 of its bytes)
+2. returns the registered remote file if it is still ACTIVE and not close
+   to expiring - no upload, no processing wait
+3. otherwise uploads, waits for processing and registers the remote name,
+   uri and expiry under the hash
+
+Re-analysis, a follow-up prompt or the same video bookmarked twice reuse
+one upload. Entries are evicted once expired or when more than
+GEMINI_FILE_REGISTRY_MAX_FILES are registered (least recently used first);
+evicting an entry deletes its remote file. Records live in a cache store,
+so every instance shares the registry.
+
+A deferred (batch) request refers to its file until the batch job has run,
+possibly hours later. acquire(..., pin=holder) pins the file for it:
+pinned files are skipped by least-recently-used eviction, and an entry
+evicted for another reason is only unregistered, with the remote file
+deleted once the last holder calls release(). Pinned acquisitions also ask
+for min_ttl seconds of remaining lifetime, so a batch request never gets
+an upload that expires before its job runs.
+
+Uploads that will never be reused (e.g. segments cut from a long video)
+bypass the registry: upload() then delete() once the prompt has run, so
+they do not push reusable files out of it.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from .cache_store import get_cache_store, update_entry
+from .singleflight import SingleFlight
+
+GEMINI_FILE_TTL = int(os.environ.get('GEMINI_FILE_TTL', 48 * 3600))  # Lifetime of an uploaded file on Gemini's side
+GEMINI_FILE_EXPIRY_MARGIN = int(os.environ.get('GEMINI_FILE_EXPIRY_MARGIN', 3600))  # Skip files expiring sooner
+GEMINI_FILE_PROCESSING_TIMEOUT = int(os.environ.get('GEMINI_FILE_PROCESSING_TIMEOUT', 120))  # Seconds to wait for ACTIVE
+GEMINI_FILE_REGISTRY_MAX_FILES = int(os.environ.get('GEMINI_FILE_REGISTRY_MAX_FILES', 100))  # Remote files kept
+GEMINI_FILE_DEFERRED_MIN_TTL = int(os.environ.get('GEMINI_FILE_DEFERRED_MIN_TTL', 36 * 3600))  # Lifetime a deferred request needs
+
+GEMINI_FILE_POLL_INTERVAL = 5  # Seconds between processing checks
+
+
+class GeminiFileError(Exception):
+    """Upload or processing of a Gemini file failed."""
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a local file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _expires_at(remote_file: Any, now: float) -> float:
+    expiration = getattr(remote_file, 'expiration_time', None)
+    if isinstance(expiration, datetime):
+        return expiration.timestamp()
+    return now + GEMINI_FILE_TTL
+
+
+def _default_client():
+    import google.generativeai as genai
+    return genai
+
+
+class GeminiFileRegistry:
+    """
+    Content-addressed reuse of Gemini File API uploads.
+
+    Args:
+        client: Object with upload_file / get_file / delete_file, i.e. the
+            configured google.generativeai module (default: imported lazily)
+        store: Persistent store (default: the 'gemini_files' cache store)
+        max_files: Registered files kept before least recently used are evicted
+        processing_timeout: Seconds to wait for an upload to become ACTIVE
+        poll_interval: Seconds between processing checks
+    """
+
+    def __init__(self, client=None, store=None, max_files: int = GEMINI_FILE_REGISTRY_MAX_FILES,
+                 processing_timeout: int = GEMINI_FILE_PROCESSING_TIMEOUT,
+                 poll_interval: float = GEMINI_FILE_POLL_INTERVAL):
+        self._client = client
+        self.store = store if store is not None else get_cache_store('gemini_files')
+        self.max_files = max_files
+        self.processing_timeout = processing_timeout
+        self.poll_interval = poll_interval
+        self._flight = SingleFlight()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = _default_client()
+        return self._client
+
+    @staticmethod
+    def registry_key(digest: str, owner: str = '') -> str:
+        """Registry key for a content digest; owner scopes it to one API key's project."""
+        if not owner:
+            return digest
+        return f"{digest}:{hashlib.sha256(owner.encode('utf-8')).hexdigest()[:16]}"
+
+    def _index(self) -> Dict[str, Dict]:
+        return self.store.get('index') or {}
+
+    def lookup(self, key: str, min_ttl: float = 0) -> Optional[Dict]:
+        """Registered record for key if it stays valid for min_ttl more seconds (plus the margin), else None."""
+        record = self.store.get(f"file:{key}")
+        if record is None or record['expires_at'] - GEMINI_FILE_EXPIRY_MARGIN - min_ttl <= time.time():
+            return None
+        return record
+
+    def acquire(self, path: str, owner: str = '', pin: Optional[str] = None,
+                min_ttl: float = 0) -> Tuple[Any, bool]:
+        """
+        Get an ACTIVE remote file with the contents of path.
+
+        Concurrent calls for the same contents in this instance share one
+        upload.
+
+        Args:
+            path: Local file to upload if no valid remote copy is registered
+            owner: API key (or other project identifier) the client uses
+            pin: Holder (e.g. a batch request key) that keeps the file from
+                being deleted until release(pin) is called
+            min_ttl: Seconds the file must stay valid (a registered file
+                expiring sooner is replaced by a fresh upload)
+
+        Returns:
+            Tuple of (remote file, reused) where reused is True if no upload
+            was needed
+
+        Raises:
+            GeminiFileError: processing failed or did not finish in time
+        """
+        key = self.registry_key(file_digest(path), owner)
+        result, _ = self._flight.do(f"{key}:{min_ttl}", lambda: self._acquire(path, key, min_ttl))
+        if pin:
+            self.pin(result[0].name, pin, key)
+        return result
+
+    def _acquire(self, path: str, key: str, min_ttl: float = 0) -> Tuple[Any, bool]:
+        record = self.lookup(key)
+        if record is not None and self.lookup(key, min_ttl) is None:
+            # Still fine for other callers, too close to expiry for this one:
+            # replace the registration and let Gemini expire the old file
+            print(f"Gemini file {record['name']} expires too soon; uploading a fresh copy")
+            self.evict(key, delete_remote=False)
+        elif record is not None:
+            try:
+                remote_file = self.client.get_file(record['name'])
+                if remote_file.state.name == 'ACTIVE':
+                    self._touch(key, record['expires_at'], record['name'])
+                    print(f"Reusing Gemini file {record['name']}")
+                    return remote_file, True
+            except Exception as e:
+                print(f"Registered Gemini file {record['name']} unavailable: {e}")
+            self.evict(key)
+
+        remote_file = self._upload(path)
+        expires_at = _expires_at(remote_file, time.time())
+        self.store.set(f"file:{key}", {
+            'name': remote_file.name,
+            'uri': getattr(remote_file, 'uri', None),
+            'mime_type': getattr(remote_file, 'mime_type', None),
+            'expires_at': expires_at,
+        }, ttl=max(0, expires_at - time.time()))
+        self._touch(key, expires_at, remote_file.name)
+        self.evict_stale()
+        return remote_file, False
+
+    def _upload(self, path: str):
+        print("Uploading file to Gemini File API...")
+        remote_file = self.client.upload_file(path=path)
+        print(f"Upload complete. File name: {remote_file.name}")
+
+        waited = 0
+        while remote_file.state.name == 'PROCESSING' and waited < self.processing_timeout:
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+            remote_file = self.client.get_file(remote_file.name)
+            print(f"Processing... ({waited}s)")
+
+        if remote_file.state.name != 'ACTIVE':
+            self._delete_remote(remote_file.name)
+            if remote_file.state.name == 'FAILED':
+                raise GeminiFileError(f'Gemini file processing failed: {remote_file.state.name}')
+            raise GeminiFileError(f'Gemini file not ready after {self.processing_timeout}s: {remote_file.state.name}')
+        return remote_file
+
+    def _touch(self, key: str, expires_at: float, name: str):
+        def touch(index):
+            index = index or {}
+            index[key] = {'expires_at': expires_at, 'used_at': time.time(), 'name': name}
+            return index
+
+        update_entry(self.store, 'index', touch)
+
+    def upload(self, path: str):
+        """
+        Upload and wait for processing without registering the file.
+
+        The caller deletes it with delete() when done.
+
+        Raises:
+            GeminiFileError: Processing failed or timed out
+        """
+        return self._upload(path)
+
+    def delete(self, name: str):
+        """Delete an unregistered remote file (failures are logged, not raised)."""
+        self._delete_remote(name)
+
+    def _delete_remote(self, name: str):
+        try:
+            self.client.delete_file(name)
+        except Exception as e:
+            print(f"Warning: Failed to delete Gemini file {name}: {e}")
+
+    def _pins(self) -> Dict[str, Dict]:
+        return self.store.get('pins') or {}
+
+    def pin(self, name: str, holder: str, key: str = ''):
+        """
+        Keep remote file name from being deleted until holder releases it.
+
+        A holder pins one file at a time: pinning another file releases the
+        previous one (e.g. a re-queued batch request).
+        """
+        for previous, entry in list(self._pins().items()):
+            if previous != name and holder in entry['holders']:
+                self.release(holder, previous)
+
+        def add(pins):
+            pins = pins or {}
+            entry = pins.setdefault(name, {'key': key, 'holders': []})
+            if holder not in entry['holders']:
+                entry['holders'].append(holder)
+            return pins
+
+        update_entry(self.store, 'pins', add, ttl=GEMINI_FILE_TTL)
+
+    def release(self, holder: str, name: str):
+        """
+        Drop holder's pin on remote file name.
+
+        A file that was unregistered while pinned is deleted once its last
+        holder releases it.
+        """
+        released = {}
+
+        def remove(pins):
+            pins = pins or {}
+            released.clear()
+            entry = pins.get(name)
+            if entry and holder in entry['holders']:
+                entry['holders'].remove(holder)
+                if not entry['holders']:
+                    released.update(pins.pop(name))
+            return pins
+
+        update_entry(self.store, 'pins', remove, ttl=GEMINI_FILE_TTL)
+        if released:
+            record = self.store.get(f"file:{released['key']}") if released['key'] else None
+            if record is None or record['name'] != name:
+                self._delete_remote(name)
+
+    def is_pinned(self, name: str) -> bool:
+        """True if some holder still needs remote file name."""
+        return name in self._pins()
+
+    def evict(self, key: str, delete_remote: bool = True):
+        """Unregister key and delete its remote file (kept while pinned, see release)."""
+        record = self.store.get(f"file:{key}")
+        if record is not None and delete_remote:
+            if self.is_pinned(record['name']):
+                print(f"Gemini file {record['name']} is pinned; unregistering only")
+            else:
+                self._delete_remote(record['name'])
+        self.store.delete(f"file:{key}")
+
+        def remove(index):
+            index = index or {}
+            index.pop(key, None)
+            return index
+
+        update_entry(self.store, 'index', remove)
+
+    def evict_stale(self) -> int:
+        """
+        Evict expired entries, then least recently used ones over max_files
+        (pinned files are neither evicted nor counted).
+
+        Returns:
+            Number of entries evicted
+        """
+        now = time.time()
+        index = self._index()
+        stale = [key for key, entry in index.items() if entry['expires_at'] <= now]
+        # Files a queued batch request still refers to cannot be evicted, so they do not count
+        pinned = self._pins()
+        live = sorted((key for key in index if key not in stale and index[key].get('name') not in pinned),
+                      key=lambda k: index[k]['used_at'])
+        stale += live[:max(0, len(live) - self.max_files)]
+        for key in stale:
+            self.evict(key)
+        return len(stale)
+
+
+_registry: Optional[GeminiFileRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_gemini_file_registry(client=None) -> GeminiFileRegistry:
+    """Get the process-wide file registry (created on first use)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = GeminiFileRegistry(client=client)
+        return _registry
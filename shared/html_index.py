@@ -0,0 +1,262 @@
+"""
+Single-pass DOM index for the webpage enricher.
+
+extract_metadata, detect_content_type, extract_price, extract_code_snippets
+and extract_main_content used to run about fifteen separate soup.find /
+find_all scans over the tree. PageIndex walks the tree once and records
+everything those extractors ask for:
+
+- <meta> tags by property and by name
+- elements by tag name
+- elements whose class matches one of CLASS_PATTERNS
+- elements by itemprop, elements carrying data-price, <a rel="author">
+- code blocks (<pre>/<code>) in document order
+- product signal candidates: forms, buttons, JSON-LD scripts, microdata
+
+Product detection reads only the candidate regions, stops at the first
+signal and caps how much of each region it reads, so its cost does not
+grow with the length of an article.
+
+Lookups return elements in document order and skip elements that were
+decomposed after indexing (extract_main_content strips boilerplate), so
+results match what a fresh soup.find would return.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# Class regexes the extractors query, compiled once
+CLASS_PATTERNS = {
+    'author': re.compile(r'author|byline', re.I),
+    'price': re.compile(r'price', re.I),
+    'product_signal': re.compile(r'price|cost|amount', re.I),
+    'content': re.compile(r'content|post|article|entry', re.I),
+}
+
+PURCHASE_TEXT = re.compile(r'add to cart|buy now|purchase', re.I)
+
+CODE_TAGS = ('pre', 'code')
+
+# Product detection budget: regions checked per kind and characters read per region
+MAX_SIGNAL_CANDIDATES = 50
+MAX_CANDIDATE_TEXT = 500
+MAX_JSON_LD_CHARS = 64 * 1024
+
+PRODUCT_OG_TYPES = ('product', 'product.item', 'og:product')
+PRODUCT_SCHEMA = re.compile(r'schema\.org/(?:Product|Offer|AggregateOffer)\b', re.I)
+PRODUCT_ITEMPROPS = ('price', 'pricecurrency', 'offers')
+JSON_LD_PRODUCT = re.compile(r'"@type"\s*:\s*(?:\[[^\]]*?)?"(?:Product|Offer|AggregateOffer)"')
+
+
+class PageIndex:
+    """
+    Index of a parsed page built in one O(n) traversal.
+
+    Args:
+        soup: BeautifulSoup object (None builds an empty index)
+    """
+
+    def __init__(self, soup):
+        self.meta_by_property: Dict[str, object] = {}
+        self.meta_by_name: Dict[str, object] = {}
+        self.by_tag: Dict[str, List] = {}
+        self.by_class: Dict[str, List] = {name: [] for name in CLASS_PATTERNS}
+        self.by_itemprop: Dict[str, List] = {}
+        self.data_price: List = []
+        self.rel_author: List = []
+        self.code_blocks: List = []
+        self.itemtypes: List = []
+        self.buttons: List = []
+
+        if soup is not None:
+            self._build(soup)
+
+    def _build(self, soup):
+        from bs4 import Tag
+
+        for node in soup.descendants:
+            if isinstance(node, Tag):
+                self._index_tag(node)
+
+    def _index_tag(self, tag):
+        name = tag.name
+        attrs = tag.attrs
+        self.by_tag.setdefault(name, []).append(tag)
+
+        if name == 'meta':
+            prop = attrs.get('property')
+            if isinstance(prop, str):
+                self.meta_by_property.setdefault(prop.lower(), tag)
+            meta_name = attrs.get('name')
+            if isinstance(meta_name, str):
+                self.meta_by_name.setdefault(meta_name.lower(), tag)
+        elif name in CODE_TAGS:
+            self.code_blocks.append(tag)
+        elif name == 'a' and 'author' in (attrs.get('rel') or ()):
+            self.rel_author.append(tag)
+
+        if name == 'button' or attrs.get('role') == 'button' or (
+                name == 'input' and str(attrs.get('type', '')).lower() in ('submit', 'button')):
+            self.buttons.append(tag)
+
+        if 'itemtype' in attrs:
+            self.itemtypes.append(tag)
+
+        classes = attrs.get('class')
+        if classes:
+            class_str = ' '.join(classes) if isinstance(classes, list) else classes
+            for key, pattern in CLASS_PATTERNS.items():
+                if pattern.search(class_str):
+                    self.by_class[key].append(tag)
+
+        itemprop = attrs.get('itemprop')
+        if itemprop:
+            for prop in (itemprop if isinstance(itemprop, list) else itemprop.split()):
+                self.by_itemprop.setdefault(prop.lower(), []).append(tag)
+
+        if 'data-price' in attrs:
+            self.data_price.append(tag)
+
+    @staticmethod
+    def _live(elements: List) -> List:
+        return [el for el in elements if not getattr(el, 'decomposed', False)]
+
+    @staticmethod
+    def _first_live(elements: List):
+        for el in elements:
+            if not getattr(el, 'decomposed', False):
+                return el
+        return None
+
+    def meta_property(self, prop: str):
+        """First <meta property=...> tag, or None."""
+        tag = self.meta_by_property.get(prop.lower())
+        return None if tag is None or getattr(tag, 'decomposed', False) else tag
+
+    def meta_name(self, name: str):
+        """First <meta name=...> tag, or None."""
+        tag = self.meta_by_name.get(name.lower())
+        return None if tag is None or getattr(tag, 'decomposed', False) else tag
+
+    def meta_content(self, *keys: str) -> Optional[str]:
+        """Content of the first matching meta tag, trying property then name per key."""
+        for key in keys:
+            tag = self.meta_property(key) or self.meta_name(key)
+            if tag is not None:
+                return tag.get('content')
+        return None
+
+    def first(self, tag_name: str, with_attr: Optional[str] = None):
+        """First element with tag_name (optionally carrying with_attr), or None."""
+        for el in self.by_tag.get(tag_name, ()):
+            if getattr(el, 'decomposed', False):
+                continue
+            if with_attr is None or el.has_attr(with_attr):
+                return el
+        return None
+
+    def all(self, tag_name: str) -> List:
+        """All elements with tag_name, in document order."""
+        return self._live(self.by_tag.get(tag_name, []))
+
+    def first_class(self, pattern_name: str):
+        """First element whose class matches CLASS_PATTERNS[pattern_name]."""
+        return self._first_live(self.by_class[pattern_name])
+
+    def has_class(self, pattern_name: str) -> bool:
+        return self.first_class(pattern_name) is not None
+
+    def first_itemprop(self, prop: str):
+        """First element with itemprop=prop, or None."""
+        return self._first_live(self.by_itemprop.get(prop.lower(), []))
+
+    def first_data_price(self):
+        """First element carrying a data-price attribute, or None."""
+        return self._first_live(self.data_price)
+
+    def first_rel_author(self):
+        """First <a rel="author">, or None."""
+        return self._first_live(self.rel_author)
+
+    def live_code_blocks(self) -> List:
+        """<pre>/<code> elements in document order."""
+        return self._live(self.code_blocks)
+
+    def has_code_blocks(self, min_count: int) -> bool:
+        """True once min_count live code blocks are seen (stops counting there)."""
+        count = 0
+        for el in self.code_blocks:
+            if not getattr(el, 'decomposed', False):
+                count += 1
+                if count >= min_count:
+                    return True
+        return False
+
+    def _candidates(self, elements: List) -> List:
+        return self._live(elements[:MAX_SIGNAL_CANDIDATES])
+
+    def json_ld_scripts(self) -> List:
+        """<script type="application/ld+json"> elements (bounded candidate list)."""
+        scripts = [
+            el for el in self.by_tag.get('script', ())
+            if str(el.get('type', '')).lower() == 'application/ld+json'
+        ]
+        return self._candidates(scripts)
+
+    def has_purchase_text(self) -> bool:
+        """True if a button or form reads like 'add to cart' / 'buy now'."""
+        for el in self._candidates(self.buttons):
+            text = el.get('value') if el.name == 'input' else _text_prefix(el, MAX_CANDIDATE_TEXT)
+            if text and PURCHASE_TEXT.search(text):
+                return True
+        for el in self._candidates(self.by_tag.get('form', [])):
+            if PURCHASE_TEXT.search(_text_prefix(el, MAX_CANDIDATE_TEXT)):
+                return True
+        return False
+
+    def product_signal(self) -> Optional[str]:
+        """
+        Find the first product signal, checking the cheapest regions first.
+
+        Returns:
+            One of 'og:type', 'microdata', 'json-ld', 'price-class',
+            'purchase-text', or None if the page shows no product signal
+        """
+        og_type = self.meta_property('og:type')
+        if og_type and str(og_type.get('content', '')).strip().lower() in PRODUCT_OG_TYPES:
+            return 'og:type'
+
+        for el in self._candidates(self.itemtypes):
+            if PRODUCT_SCHEMA.search(str(el.get('itemtype', ''))):
+                return 'microdata'
+        if any(self.first_itemprop(prop) is not None for prop in PRODUCT_ITEMPROPS):
+            return 'microdata'
+
+        for el in self.json_ld_scripts():
+            if JSON_LD_PRODUCT.search((el.string or '')[:MAX_JSON_LD_CHARS]):
+                return 'json-ld'
+
+        if self.has_class('product_signal'):
+            return 'price-class'
+
+        if self.has_purchase_text():
+            return 'purchase-text'
+
+        return None
+
+
+def _text_prefix(element, limit: int) -> str:
+    """Up to limit characters of an element's text, without joining the whole subtree."""
+    parts = []
+    remaining = limit
+    for text in element.strings:
+        parts.append(text[:remaining])
+        remaining -= len(text)
+        if remaining <= 0:
+            break
+    return ' '.join(parts)
+
+
+def build_index(soup) -> PageIndex:
+    """Build a PageIndex for soup (empty index for None)."""
+    return PageIndex(soup)
@@ -0,0 +1,203 @@
+"""
+HTML decoding and parsing utilities for Bookmark Knowledge Base.
+
+Decoding a fetched page with requests' `response.text` either guesses
+ISO-8859-1 for any text/* response without a charset, or runs charset
+detection over the whole body. decode_html follows the cheap signals a
+browser uses first and only runs detection on a bounded sample:
+
+1. Byte order mark
+2. charset in the HTTP Content-Type header
+3. <meta charset> / <meta http-equiv="Content-Type"> in the first few KB
+4. Strict UTF-8 (C-speed, and what most unlabeled pages are)
+5. Detection on the first DETECTION_SAMPLE_BYTES only
+
+parse_html builds BeautifulSoup trees with lxml when it is installed
+(several times faster than html.parser) and can restrict a metadata-only
+parse to <head>-level tags and structured data through a SoupStrainer.
+"""
+
+import codecs
+import os
+import re
+from typing import Optional, Tuple
+
+META_PRESCAN_BYTES = 4096
+DETECTION_SAMPLE_BYTES = 64 * 1024
+
+# BOM-aware codecs strip the mark themselves; UTF-32 LE must be checked before UTF-16 LE
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+_HEADER_CHARSET = re.compile(r'charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+_META_CHARSET = re.compile(rb'<meta[^>]{0,512}?charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+
+# WHATWG encoding label overrides: Latin-1 and ASCII labels mean windows-1252
+_ENCODING_ALIASES = {
+    'iso8859-1': 'cp1252',
+    'ascii': 'cp1252',
+}
+
+
+def normalize_encoding(label: Optional[str]) -> Optional[str]:
+    """
+    Normalize an encoding label to a Python codec name.
+
+    Returns:
+        Codec name, or None if the label is unknown
+    """
+    if not label:
+        return None
+    try:
+        name = codecs.lookup(label.strip().strip('"\'')).name
+    except LookupError:
+        return None
+    return _ENCODING_ALIASES.get(name, name)
+
+
+def _charset_from_header(content_type: Optional[str]) -> Optional[str]:
+    if not content_type:
+        return None
+    match = _HEADER_CHARSET.search(content_type)
+    return normalize_encoding(match.group(1)) if match else None
+
+
+def _charset_from_meta(content: bytes) -> Optional[str]:
+    match = _META_CHARSET.search(content[:META_PRESCAN_BYTES])
+    if not match:
+        return None
+    encoding = normalize_encoding(match.group(1).decode('ascii', 'ignore'))
+    # A meta tag we could read as ASCII cannot be describing UTF-16/32
+    if encoding and encoding.startswith(('utf-16', 'utf-32')):
+        return 'utf-8'
+    return encoding
+
+
+def _is_utf8(content: bytes) -> bool:
+    """Strict UTF-8 check that tolerates a sequence cut off at the end."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        decoder.decode(content, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(content: bytes, content_type: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Work out the encoding of an HTML body.
+
+    Args:
+        content: Raw body bytes
+        content_type: HTTP Content-Type header value, if any
+
+    Returns:
+        Tuple of (encoding, source) where source is one of
+        'bom', 'header', 'meta', 'utf-8', 'detected', 'default'
+    """
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            return encoding, 'bom'
+
+    encoding = _charset_from_header(content_type)
+    if encoding:
+        return encoding, 'header'
+
+    encoding = _charset_from_meta(content)
+    if encoding:
+        return encoding, 'meta'
+
+    if _is_utf8(content):
+        return 'utf-8', 'utf-8'
+
+    try:
+        import charset_normalizer
+        detected = charset_normalizer.detect(content[:DETECTION_SAMPLE_BYTES]).get('encoding')
+    except ImportError:
+        detected = None
+
+    encoding = normalize_encoding(detected)
+    if encoding:
+        return encoding, 'detected'
+    return 'cp1252', 'default'
+
+
+def decode_html(content: bytes, content_type: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Decode an HTML body using the cheapest reliable charset signal.
+
+    Args:
+        content: Raw body bytes
+        content_type: HTTP Content-Type header value, if any
+
+    Returns:
+        Tuple of (text, encoding)
+    """
+    if not content:
+        return '', 'utf-8'
+
+    encoding, source = detect_encoding(content, content_type)
+    return content.decode(encoding, errors='replace'), encoding
+
+
+# Tags a metadata-only parse keeps: everything extract_metadata reads from
+# <head>, JSON-LD scripts, and the cheap body fallbacks (h1, time)
+METADATA_TAGS = ['title', 'meta', 'link', 'script', 'h1', 'time']
+
+HTML_PARSER = os.environ.get('HTML_PARSER')  # Optional: force 'lxml' or 'html.parser'
+
+_lxml_available = None
+
+
+def get_parser_backend(preferred: Optional[str] = None) -> str:
+    """
+    Choose the BeautifulSoup parser backend.
+
+    Args:
+        preferred: Backend to use if available (defaults to HTML_PARSER env)
+
+    Returns:
+        'lxml' when installed (unless another backend is requested),
+        otherwise 'html.parser'
+    """
+    global _lxml_available
+
+    preferred = preferred or HTML_PARSER
+    if preferred and preferred != 'lxml':
+        return preferred
+
+    if _lxml_available is None:
+        try:
+            import lxml  # noqa: F401
+            _lxml_available = True
+        except ImportError:
+            _lxml_available = False
+
+    return 'lxml' if _lxml_available else 'html.parser'
+
+
+def parse_html(html, mode: str = 'full', parser: Optional[str] = None):
+    """
+    Parse HTML with the fastest available backend.
+
+    Args:
+        html: HTML text (or bytes)
+        mode: 'full' for the whole tree, 'metadata' for METADATA_TAGS only
+        parser: Force a backend ('lxml' or 'html.parser')
+
+    Returns:
+        BeautifulSoup object
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    backend = get_parser_backend(parser)
+    if mode == 'metadata':
+        return BeautifulSoup(html, backend, parse_only=SoupStrainer(METADATA_TAGS))
+    if mode != 'full':
+        raise ValueError(f"Unknown parse mode: {mode}")
+    return BeautifulSoup(html, backend)
@@ -0,0 +1,141 @@
+"""
+HTTP conditional-request cache for fetched webpages.
+
+Re-enriching a bookmark used to refetch, reparse and re-analyze the page
+every time. HttpCache keeps, per canonical URL:
+
+- the validators the server sent (ETag, Last-Modified)
+- the raw body (zlib-compressed) and its Content-Type header
+- the enrichment results already built from that body, one per set of
+  request options
+
+The next fetch sends If-None-Match / If-Modified-Since. On a 304 the stored
+result is returned as-is (no parsing, no Gemini call); if only the body is
+stored it is reparsed without downloading it again. Pages without
+validators are not cached, since they cannot be revalidated.
+"""
+
+import base64
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+from .cache_store import get_cache_store
+
+HTTP_CACHE_TTL = int(os.environ.get('HTTP_CACHE_TTL', 30 * 24 * 3600))  # Seconds to keep a page
+
+
+def _pack_body(body: bytes) -> str:
+    return base64.b64encode(zlib.compress(body)).decode('ascii')
+
+
+def _unpack_body(packed: str) -> Optional[bytes]:
+    try:
+        return zlib.decompress(base64.b64decode(packed))
+    except (ValueError, zlib.error):
+        return None
+
+
+class HttpCache:
+    """
+    Validators, bodies and extracted results for fetched pages.
+
+    Args:
+        store: Persistent store (see shared.cache_store); defaults to the
+            configured 'http' store
+        ttl: Seconds an entry is kept
+    """
+
+    def __init__(self, store=None, ttl: int = HTTP_CACHE_TTL):
+        self.store = store if store is not None else get_cache_store('http')
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """Return the cached entry for url, or None."""
+        try:
+            return self.store.get(url)
+        except Exception as e:
+            print(f"HTTP cache read error: {e}")
+            return None
+
+    def _write(self, url: str, entry: Dict):
+        try:
+            self.store.set(url, entry, ttl=self.ttl)
+        except Exception as e:
+            print(f"HTTP cache write error: {e}")
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict]) -> Dict:
+        """Request headers that revalidate entry (empty dict for no entry)."""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store_page(self, url: str, body: bytes, etag: Optional[str] = None,
+                   last_modified: Optional[str] = None, content_type: Optional[str] = None,
+                   final_url: Optional[str] = None, truncated: bool = False) -> Optional[Dict]:
+        """
+        Store a freshly fetched page, replacing any previous entry and results.
+
+        Returns:
+            The new entry, or None if the response had no validators
+        """
+        if not etag and not last_modified:
+            return None
+        entry = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_type': content_type,
+            'final_url': final_url or url,
+            'truncated': truncated,
+            'body': _pack_body(body or b''),
+            'results': {},
+            'stored_at': time.time(),
+        }
+        self._write(url, entry)
+        return entry
+
+    @staticmethod
+    def cached_body(entry: Optional[Dict], allow_truncated: bool = False) -> Optional[bytes]:
+        """Raw body of entry (None if missing, or truncated and not allowed)."""
+        if not entry or not entry.get('body'):
+            return None
+        if entry.get('truncated') and not allow_truncated:
+            return None
+        return _unpack_body(entry['body'])
+
+    @staticmethod
+    def cached_result(entry: Optional[Dict], variant: str) -> Optional[Dict]:
+        """Result previously stored for this options variant, or None."""
+        if not entry:
+            return None
+        return (entry.get('results') or {}).get(variant)
+
+    def store_result(self, url: str, variant: str, result: Dict):
+        """Attach an extracted result to the current entry for url."""
+        with self._lock:
+            entry = self.lookup(url)
+            if not entry:
+                return
+            entry.setdefault('results', {})[variant] = result
+            self._write(url, entry)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpCache:
+    """Get the process-wide HttpCache (created on first use)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HttpCache()
+        return _default_cache
@@ -0,0 +1,239 @@
+"""
+Keyframe sampling for video analyses that do not upload the whole video.
+
+Transcript-first analysis sends Gemini the transcript plus a handful of
+still frames: a few small JPEGs in place of the full video upload and the
+processing wait. Frames are grabbed with ffmpeg using input seeking (-ss
+before -i), so each costs one short decode near its timestamp rather than
+a pass over the whole file, and are returned as JPEG bytes on a pipe.
+
+For short visual clips, build_contact_sheet goes further and picks the
+frames itself:
+
+1. ffmpeg decodes the clip at a low frame rate, downscaled, as raw RGB on
+   a pipe (one process, no temporary files)
+2. consecutive-frame differences are scored in NumPy over the whole
+   (frames, height, width) array at once
+3. the first frame and the strongest changes (kept apart by a minimum
+   spacing) become the tiles of one grid image, encoded back through ffmpeg
+"""
+
+import json
+import math
+import os
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+KEYFRAME_COUNT = int(os.environ.get('KEYFRAME_COUNT', 6))  # Frames sent with a transcript
+KEYFRAME_WIDTH = int(os.environ.get('KEYFRAME_WIDTH', 512))  # Pixels; height keeps the aspect ratio
+CONTACT_SHEET_FRAMES = int(os.environ.get('CONTACT_SHEET_FRAMES', 12))  # Tiles per contact sheet
+CONTACT_SHEET_TILE_WIDTH = int(os.environ.get('CONTACT_SHEET_TILE_WIDTH', 240))  # Pixels per tile
+
+SCAN_FPS = 2  # Frames per second decoded for scoring
+SCAN_MAX_FRAMES = 240  # Longer clips are scanned at a lower rate
+TILE_GAP = 4  # Pixels between tiles
+
+
+def sample_times(duration: float, count: int = KEYFRAME_COUNT) -> List[float]:
+    """Midpoints of count equal slices of [0, duration]."""
+    if duration <= 0 or count <= 0:
+        return []
+    step = duration / count
+    return [step * (i + 0.5) for i in range(count)]
+
+
+def extract_frame_jpeg(video_path: str, at: float, width: int = KEYFRAME_WIDTH) -> Optional[bytes]:
+    """
+    Grab one downscaled frame as JPEG bytes.
+
+    Args:
+        video_path: Local video file
+        at: Time in seconds
+        width: Output width in pixels
+
+    Returns:
+        JPEG bytes, or None if ffmpeg fails or the time is past the end
+    """
+    try:
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-ss', f"{at:.3f}", '-i', video_path,
+            '-frames:v', '1', '-vf', f"scale={width}:-2",
+            '-f', 'image2pipe', '-vcodec', 'mjpeg', '-q:v', '4', '-'
+        ], check=True, capture_output=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Frame extraction failed at {at:.1f}s: {e}")
+        return None
+    return result.stdout or None
+
+
+def sample_keyframes(video_path: str, duration: float, count: int = KEYFRAME_COUNT,
+                     width: int = KEYFRAME_WIDTH) -> List[Dict]:
+    """
+    Grab count frames spread evenly across a video.
+
+    Returns:
+        List of dicts with time, mime_type ('image/jpeg') and data (bytes);
+        frames ffmpeg could not extract are left out
+    """
+    frames = []
+    for at in sample_times(duration, count):
+        data = extract_frame_jpeg(video_path, at, width)
+        if data:
+            frames.append({'time': at, 'mime_type': 'image/jpeg', 'data': data})
+    return frames
+
+
+def probe_dimensions(video_path: str) -> Optional[Tuple[int, int]]:
+    """(width, height) of the first video stream, from ffprobe."""
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height', '-of', 'json', video_path
+        ], check=True, capture_output=True, text=True)
+        stream = json.loads(result.stdout)['streams'][0]
+        return int(stream['width']), int(stream['height'])
+    except (subprocess.CalledProcessError, OSError, ValueError, KeyError, IndexError) as e:
+        print(f"ffprobe failed: {e}")
+        return None
+
+
+def decode_frames(video_path: str, width: int, height: int, fps: float = SCAN_FPS) -> np.ndarray:
+    """
+    Decode a video at fps, scaled to width x height, through an ffmpeg pipe.
+
+    Returns:
+        uint8 array of shape (frames, height, width, 3); empty if ffmpeg fails
+    """
+    try:
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', video_path,
+            '-an', '-vf', f"fps={fps},scale={width}:{height}",
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'
+        ], check=True, capture_output=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Frame decoding failed: {e}")
+        return np.zeros((0, height, width, 3), dtype=np.uint8)
+    frame_bytes = width * height * 3
+    count = len(result.stdout) // frame_bytes
+    return np.frombuffer(result.stdout[:count * frame_bytes], dtype=np.uint8).reshape(count, height, width, 3)
+
+
+def frame_differences(frames: np.ndarray) -> np.ndarray:
+    """
+    Change score of every frame against the previous one.
+
+    Frames are reduced to luma on a 4x-subsampled grid; the score is the
+    mean absolute luma difference, in [0, 1].
+
+    Returns:
+        Array of len(frames) scores (the first frame scores 0)
+    """
+    if len(frames) < 2:
+        return np.zeros(len(frames))
+    luma = frames[:, ::4, ::4].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    diffs = np.abs(np.diff(luma, axis=0)).mean(axis=(1, 2)) / 255.0
+    return np.concatenate([[0.0], diffs])
+
+
+def select_keyframes(scores: np.ndarray, count: int = CONTACT_SHEET_FRAMES) -> List[int]:
+    """
+    Pick count frame indices: the first frame, then the biggest changes.
+
+    Picks are kept at least len(scores) / (2 * count) frames apart so one
+    busy moment cannot fill the sheet; slots left over (a static clip) are
+    filled evenly across the clip.
+
+    Returns:
+        Sorted frame indices
+    """
+    n = len(scores)
+    if n == 0:
+        return []
+    if n <= count:
+        return list(range(n))
+
+    spacing = max(1, n // (2 * count))
+    chosen = [0]
+    for i in np.argsort(-scores, kind='stable'):
+        if len(chosen) == count or scores[i] <= 0:
+            break
+        if all(abs(int(i) - j) >= spacing for j in chosen):
+            chosen.append(int(i))
+    for i in np.linspace(0, n - 1, count).astype(int):
+        if len(chosen) == count:
+            break
+        if int(i) not in chosen:
+            chosen.append(int(i))
+    return sorted(chosen)
+
+
+def tile_frames(frames: np.ndarray, columns: int, gap: int = TILE_GAP) -> np.ndarray:
+    """Arrange frames (n, h, w, 3) in a grid with gap-pixel black borders."""
+    n, h, w, _ = frames.shape
+    rows = math.ceil(n / columns)
+    sheet = np.zeros((rows * (h + gap) + gap, columns * (w + gap) + gap, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        row, col = divmod(i, columns)
+        top, left = gap + row * (h + gap), gap + col * (w + gap)
+        sheet[top:top + h, left:left + w] = frame
+    return sheet
+
+
+def encode_jpeg(image: np.ndarray) -> Optional[bytes]:
+    """Encode an RGB uint8 array as JPEG by piping it through ffmpeg; None if ffmpeg fails."""
+    height, width, _ = image.shape
+    try:
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{width}x{height}", '-i', '-',
+            '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'mjpeg', '-q:v', '3', '-'
+        ], input=np.ascontiguousarray(image).tobytes(), check=True, capture_output=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        stderr = getattr(e, 'stderr', None) or b''
+        print(f"JPEG encode failed: {e} {stderr.decode(errors='replace').strip()}")
+        return None
+    return result.stdout or None
+
+
+def build_contact_sheet(video_path: str, duration: float, count: int = CONTACT_SHEET_FRAMES,
+                        tile_width: int = CONTACT_SHEET_TILE_WIDTH) -> Optional[Dict]:
+    """
+    One grid image of a clip's most representative frames.
+
+    Args:
+        video_path: Local video file
+        duration: Duration in seconds
+        count: Tiles on the sheet
+        tile_width: Width of each tile in pixels
+
+    Returns:
+        Dict with data (JPEG bytes), mime_type, times (seconds of each tile,
+        in reading order), columns and rows; None if the clip could not be
+        decoded or the sheet could not be encoded
+    """
+    dimensions = probe_dimensions(video_path)
+    if not dimensions:
+        return None
+    width, height = dimensions
+    tile_height = max(2, round(tile_width * height / width / 2) * 2)
+    fps = min(SCAN_FPS, SCAN_MAX_FRAMES / duration) if duration > 0 else SCAN_FPS
+
+    frames = decode_frames(video_path, tile_width, tile_height, fps)
+    if len(frames) == 0:
+        return None
+    indices = select_keyframes(frame_differences(frames), count)
+    # Portrait tiles (TikTok) fit more per row
+    columns = min(len(indices), 6 if tile_height > tile_width else 4)
+    data = encode_jpeg(tile_frames(frames[indices], columns))
+    if not data:
+        return None
+    return {
+        'data': data,
+        'mime_type': 'image/jpeg',
+        'times': [i / fps for i in indices],
+        'columns': columns,
+        'rows': math.ceil(len(indices) / columns),
+    }
@@ -0,0 +1,144 @@
+"""
+Map-reduce summarization helpers for long documents.
+
+A single Gemini prompt only sees the first few thousand words of an
+article. For long-form content the text is instead:
+
+1. split into token-budgeted chunks at sentence boundaries
+2. summarized chunk by chunk, concurrently (map)
+3. combined by one final call over the chunk summaries (reduce)
+
+Chunk boundaries are content-defined: a chunk ends at a sentence whose hash
+hits a fixed pattern (within min/max token bounds), not at a fixed offset.
+An edit therefore shifts only the boundaries near it, and chunk summaries
+memoized by chunk hash stay valid for every untouched section.
+"""
+
+import math
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+from .ai_memo import content_fingerprint, normalize_content
+
+LONG_DOCUMENT_CHUNK_TOKENS = int(os.environ.get('LONG_DOCUMENT_CHUNK_TOKENS', 3000))  # Max tokens per chunk
+LONG_DOCUMENT_CONCURRENCY = int(os.environ.get('LONG_DOCUMENT_CONCURRENCY', 4))  # Chunk calls in flight
+
+CHARS_PER_TOKEN = 4  # Rough average for English prose
+AVG_SENTENCE_TOKENS = 30
+
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for text (~4 characters per token)."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences (text without punctuation stays one piece)."""
+    if not text:
+        return []
+    return [s for s in (part.strip() for part in _SENTENCE_END.split(text)) if s]
+
+
+def _split_oversized(sentence: str, max_tokens: int) -> List[str]:
+    """Cut a run-on "sentence" longer than the budget at word boundaries."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    while len(sentence) > max_chars:
+        cut = sentence.rfind(' ', 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        pieces.append(sentence[:cut].strip())
+        sentence = sentence[cut:].strip()
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def _is_anchor(sentence: str, divisor: int) -> bool:
+    # crc32, not hash(): boundaries must match across processes and restarts
+    return zlib.crc32(normalize_content(sentence).encode('utf-8')) % divisor == 0
+
+
+def chunk_text(text: str, max_tokens: int = LONG_DOCUMENT_CHUNK_TOKENS) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens, at sentence boundaries.
+
+    A chunk closes once it holds at least half the budget and reaches an
+    anchor sentence (content-defined), or when the next sentence would
+    exceed the budget.
+
+    Args:
+        text: Document text
+        max_tokens: Token budget per chunk
+
+    Returns:
+        List of chunk strings (empty for empty text)
+    """
+    if not text or not text.strip():
+        return []
+    if estimate_tokens(text) <= max_tokens:
+        return [text.strip()]
+
+    min_tokens = max_tokens // 2
+    divisor = max(2, (max_tokens - min_tokens) // (2 * AVG_SENTENCE_TOKENS))
+
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for sentence in split_sentences(text):
+        for piece in _split_oversized(sentence, max_tokens):
+            tokens = estimate_tokens(piece) + 1
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(' '.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+            if current_tokens >= min_tokens and _is_anchor(piece, divisor):
+                chunks.append(' '.join(current))
+                current, current_tokens = [], 0
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+def map_chunks(chunks: Sequence[str], summarize: Callable[[str], Any], memo=None,
+               key_parts: Sequence[Any] = (), max_workers: int = LONG_DOCUMENT_CONCURRENCY) -> List[Any]:
+    """
+    Summarize chunks concurrently, reusing memoized chunk summaries.
+
+    Args:
+        chunks: Chunk texts
+        summarize: Callable returning the summary of one chunk (raise on failure)
+        memo: Optional MemoCache for chunk summaries, keyed by chunk hash
+        key_parts: Prompt version, model name, ... - part of every chunk key
+        max_workers: Concurrent summarize calls
+
+    Returns:
+        Summaries in chunk order
+
+    Raises:
+        The first exception raised by summarize (summaries that succeeded
+        are still memoized, so a retry only redoes the failed chunks)
+    """
+    keys = [content_fingerprint(chunk, 'chunk', *key_parts) for chunk in chunks]
+    summaries: List[Optional[Any]] = [memo.get(key) if memo is not None else None for key in keys]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if not missing:
+        return summaries
+
+    def run(i):
+        summary = summarize(chunks[i])
+        if memo is not None:
+            memo.set(keys[i], summary)
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as executor:
+        for i, summary in zip(missing, executor.map(run, missing)):
+            summaries[i] = summary
+    return summaries
@@ -0,0 +1,100 @@
+"""
+Warm process pool for CPU-bound work inside a Cloud Function instance.
+
+HTML parsing and extraction are pure Python CPU work. Run on request
+threads, they serialize on the GIL, so one instance uses one vCPU no matter
+how many requests it serves. WarmProcessPool runs such jobs in worker
+processes instead:
+
+- warm(), called at import time before any thread starts, forks the
+  workers from the loaded module, so they start with bs4/lxml already
+  imported
+- a pool created later (lazily, or to replace a broken one) uses a
+  forkserver (spawn where unavailable) context: by then HTTP/GCS clients
+  may be running threads, and forking a threaded process is unsafe
+- jobs must be module-level functions taking and returning picklable,
+  compact values (bytes in, small dicts out)
+- with one worker configured, or where no start method works, jobs run inline
+- a crashed worker (BrokenProcessPool) is replaced and the job retried inline
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+
+def _noop() -> None:
+    return None
+
+
+# Start method for pools created once threads may be running
+LATE_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class WarmProcessPool:
+    """
+    Lazily created process pool with an inline fallback.
+
+    Args:
+        workers: Worker processes (0 or 1 runs jobs inline)
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._unavailable = workers <= 1
+
+    @property
+    def enabled(self) -> bool:
+        return not self._unavailable
+
+    def _get_executor(self, start_method: str = LATE_START_METHOD) -> Optional[ProcessPoolExecutor]:
+        if self._unavailable:
+            return None
+        with self._lock:
+            if self._executor is None:
+                try:
+                    context = multiprocessing.get_context(start_method)
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                except (ValueError, OSError) as e:
+                    print(f"Process pool unavailable, running jobs inline: {e}")
+                    self._unavailable = True
+            return self._executor
+
+    def warm(self):
+        """
+        Start the worker processes now instead of on the first job.
+
+        Forks them from the current process, so call it at import time,
+        before any thread starts.
+        """
+        start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else LATE_START_METHOD
+        executor = self._get_executor(start_method)
+        if executor is not None:
+            # Pools start every worker on the first submit
+            executor.submit(_noop).result()
+
+    def run(self, fn: Callable, *args: Any) -> Any:
+        """Run fn(*args) in a worker process and return its result."""
+        executor = self._get_executor()
+        if executor is None:
+            return fn(*args)
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool as e:
+            print(f"Process pool broken, restarting: {e}")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            return fn(*args)
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,141 @@
+"""
+Redirect-resolution cache for short links.
+
+Resolving `vm.tiktok.com`, `t.co`, `bit.ly` and similar links costs extra
+round trips on every request. RedirectCache maps each short URL to its final
+URL in a persistent store so repeat links go straight to the final host.
+
+- Lookups check an in-process dict first, then the persistent store
+- Misses are resolved with HEAD requests over a pooled session
+  (falling back to a streamed GET for servers that reject HEAD)
+- Failures are cached for a short negative TTL so a dead link is not
+  retried on every request
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache_store import get_cache_store
+
+# Short links almost never change target; failures may be transient
+REDIRECT_TTL = 30 * 24 * 3600
+NEGATIVE_TTL = 3600
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+def create_pooled_session(pool_size: int = 20) -> requests.Session:
+    """Create a requests Session with a connection pool sized for concurrent use."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+class RedirectCache:
+    """
+    Persistent short URL -> final URL map.
+
+    Args:
+        store: Persistent store (see shared.cache_store); defaults to the
+            configured 'redirects' store
+        session: requests Session used for resolution (pooled by default)
+        ttl: Seconds a successful resolution is kept
+        negative_ttl: Seconds a failed resolution is kept
+        timeout: Request timeout in seconds
+    """
+
+    def __init__(self, store=None, session: Optional[requests.Session] = None,
+                 ttl: int = REDIRECT_TTL, negative_ttl: int = NEGATIVE_TTL, timeout: int = 10):
+        self.store = store if store is not None else get_cache_store('redirects')
+        self.session = session or create_pooled_session()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self._memory: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """
+        Return the cached entry for url without any network access.
+
+        Returns:
+            Dict with final_url (None for a cached failure) and expires_at,
+            or None on a cache miss
+        """
+        with self._lock:
+            entry = self._memory.get(url)
+        if entry and entry['expires_at'] >= time.time():
+            return entry
+
+        try:
+            entry = self.store.get(url)
+        except Exception as e:
+            print(f"Redirect cache read error: {e}")
+            entry = None
+
+        if entry:
+            with self._lock:
+                self._memory[url] = entry
+        return entry
+
+    def record(self, url: str, final_url: Optional[str]):
+        """Cache a resolution (final_url=None records a failure)."""
+        ttl = self.ttl if final_url else self.negative_ttl
+        entry = {'final_url': final_url, 'expires_at': time.time() + ttl}
+        with self._lock:
+            self._memory[url] = entry
+        try:
+            self.store.set(url, entry, ttl=ttl)
+        except Exception as e:
+            print(f"Redirect cache write error: {e}")
+
+    def resolve(self, url: str) -> str:
+        """
+        Return the final URL for url, resolving and caching on a miss.
+
+        Returns the input URL unchanged if it cannot be resolved.
+        """
+        entry = self.lookup(url)
+        if entry is not None:
+            return entry['final_url'] or url
+
+        final_url = self._fetch_final_url(url)
+        self.record(url, final_url)
+        return final_url or url
+
+    def _fetch_final_url(self, url: str) -> Optional[str]:
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            if response.status_code in (403, 405, 501) and not response.history:
+                # Some shorteners reject HEAD; a streamed GET stops after headers
+                response = self.session.get(url, allow_redirects=True, timeout=self.timeout, stream=True)
+                response.close()
+            if response.history:
+                # The target is known even if the final host blocks us
+                return response.url
+            if response.status_code >= 400:
+                print(f"Redirect resolution got HTTP {response.status_code} for {url}")
+                return None
+            return response.url
+        except requests.exceptions.RequestException as e:
+            print(f"Redirect resolution failed for {url}: {e}")
+            return None
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_redirect_cache() -> RedirectCache:
+    """Get the process-wide RedirectCache (created on first use)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RedirectCache()
+        return _default_cache
@@ -0,0 +1,287 @@
+"""
+Request coalescing (single-flight) for Bookmark Knowledge Base.
+
+A Notion automation can fire twice for the same page, and backlog runs
+overlap with live bookmarks. Without coalescing the same URL goes through
+two full enrichments at once.
+
+SingleFlight lets concurrent callers with the same key attach to one running
+computation and share its result. Coalescing is always done within the
+instance; an optional lease (e.g. GCSLease) extends it across instances.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def coalesce_key(*parts: Any) -> str:
+    """
+    Build a stable coalescing key from request parts.
+
+    Parts are JSON-encoded with sorted keys, so dicts of options produce the
+    same key regardless of insertion order.
+
+    Returns:
+        Hex SHA-256 digest of the encoded parts
+    """
+    encoded = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def credential_tag(secret: Optional[str]) -> str:
+    """
+    Short stand-in for a per-request API key in a coalescing key.
+
+    Requests that bring their own key are billed to it, so they must not
+    share a flight with requests on another key (or on the default one).
+
+    Returns:
+        First 16 hex digits of the key's SHA-256, or '' when no key is given
+    """
+    if not secret:
+        return ''
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()[:16]
+
+
+class _Call:
+    """One in-flight computation and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running block and receive the same result, or the
+    same exception. Nothing is cached once the call completes.
+
+    Args:
+        lease: Optional distributed lease (see GCSLease) for coalescing
+            across instances. Results must be JSON-serializable when set.
+    """
+
+    def __init__(self, lease=None):
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once per in-flight key.
+
+        Returns:
+            Tuple of (result, shared) where shared is True if the result was
+            produced by another caller's computation
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            call.result, shared = self._run(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result, shared
+
+    def in_flight(self, key: str) -> bool:
+        """Check whether a computation for key is currently running."""
+        with self._lock:
+            return key in self._calls
+
+    def _run(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn, coordinating with other instances when a lease is set."""
+        if self.lease is None:
+            return fn(), False
+
+        try:
+            acquired = self.lease.acquire(key)
+        except Exception as e:
+            # Lease backend problems must never block enrichment
+            print(f"Single-flight lease error, running locally: {e}")
+            return fn(), False
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    self.lease.publish(key, result)
+                except Exception as e:
+                    print(f"Single-flight publish error: {e}")
+                return result, False
+            finally:
+                try:
+                    self.lease.release(key)
+                except Exception as e:
+                    print(f"Single-flight release error: {e}")
+
+        # Another instance holds the lease - wait for its result
+        try:
+            found, result = self.lease.wait(key)
+        except Exception as e:
+            print(f"Single-flight wait error, running locally: {e}")
+            found, result = False, None
+
+        if found:
+            return result, True
+
+        # Leader failed or timed out - compute it ourselves
+        return fn(), False
+
+
+class GCSLease:
+    """
+    Cross-instance lease backed by Cloud Storage preconditions.
+
+    The leader creates `{prefix}{key}.lock` with if_generation_match=0, which
+    succeeds for exactly one writer. When done it writes `{prefix}{key}.json`
+    with the result and deletes the lock. Other instances poll for the result
+    until the lock disappears or wait_timeout passes.
+
+    Args:
+        bucket_name: GCS bucket for lease and result objects
+        client_factory: Callable returning a storage.Client
+        prefix: Object name prefix
+        ttl: Seconds after which an abandoned lock is considered stale
+        wait_timeout: Maximum seconds a follower waits for the leader
+        poll_interval: Seconds between follower polls
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        client_factory: Callable,
+        prefix: str = 'singleflight/',
+        ttl: int = 900,
+        wait_timeout: int = 300,
+        poll_interval: float = 2.0,
+    ):
+        self.bucket_name = bucket_name
+        self.client_factory = client_factory
+        self.prefix = prefix
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._bucket = None
+        self._attempted_at: Dict[str, float] = {}
+
+    def _get_bucket(self):
+        if self._bucket is None:
+            self._bucket = self.client_factory().bucket(self.bucket_name)
+        return self._bucket
+
+    def _lock_blob(self, key: str):
+        return self._get_bucket().blob(f"{self.prefix}{key}.lock")
+
+    def _result_blob(self, key: str):
+        return self._get_bucket().blob(f"{self.prefix}{key}.json")
+
+    def acquire(self, key: str) -> bool:
+        """Try to become the leader for key."""
+        from google.api_core.exceptions import PreconditionFailed
+
+        self._attempted_at[key] = time.time()
+        blob = self._lock_blob(key)
+        payload = json.dumps({'expires_at': time.time() + self.ttl})
+
+        try:
+            blob.upload_from_string(payload, content_type='application/json', if_generation_match=0)
+            return True
+        except PreconditionFailed:
+            pass
+
+        # Take over a lock whose holder died without releasing it
+        lock = self._read_json(blob)
+        if lock is not None and lock.get('expires_at', 0) < time.time():
+            try:
+                blob.upload_from_string(
+                    payload,
+                    content_type='application/json',
+                    if_generation_match=blob.generation,
+                )
+                return True
+            except PreconditionFailed:
+                return False
+        return False
+
+    def publish(self, key: str, result: Any):
+        """Make the leader's result available to waiting instances."""
+        self._result_blob(key).upload_from_string(
+            json.dumps({'published_at': time.time(), 'result': result}),
+            content_type='application/json',
+        )
+
+    def release(self, key: str):
+        """Delete the lock so followers stop waiting."""
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self._lock_blob(key).delete()
+        except NotFound:
+            pass
+
+    def wait(self, key: str) -> Tuple[bool, Any]:
+        """
+        Wait for the leader's result.
+
+        Only results published after this instance tried to acquire the lease
+        are accepted, so an old result is never mistaken for a fresh one.
+
+        Returns:
+            Tuple of (found, result)
+        """
+        since = self._attempted_at.pop(key, time.time()) - 5  # allow clock skew
+        deadline = time.time() + self.wait_timeout
+
+        while time.time() < deadline:
+            published = self._read_json(self._result_blob(key))
+            if published and published.get('published_at', 0) >= since:
+                return True, published.get('result')
+
+            if not self._lock_blob(key).exists():
+                # Lock released - give the result one last read
+                published = self._read_json(self._result_blob(key))
+                if published and published.get('published_at', 0) >= since:
+                    return True, published.get('result')
+                return False, None
+
+            time.sleep(self.poll_interval)
+
+        return False, None
+
+    @staticmethod
+    def _read_json(blob) -> Optional[Dict]:
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        try:
+            blob.reload()
+            return json.loads(blob.download_as_bytes(if_generation_match=blob.generation))
+        except (NotFound, PreconditionFailed, ValueError):
+            return None
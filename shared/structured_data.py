@@ -0,0 +1,332 @@
+"""
+Structured-data extraction (JSON-LD, microdata, OpenGraph) for webpages.
+
+Most article and product pages describe themselves in machine-readable
+form: `application/ld+json` blocks, schema.org microdata and OpenGraph
+meta tags. extract_structured_data reads all three once from a PageIndex
+and returns the metadata and price fields they provide. The webpage
+enricher fills its fields from this first and only runs its DOM
+heuristics for fields left empty.
+
+parse_price handles thousand separators in both conventions
+("$1,299.99", "1.299,99 €", "1 299"), which the old heuristic regex
+truncated.
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+from .html_index import MAX_JSON_LD_CHARS, PageIndex
+
+FIELDS = ('title', 'author', 'published_date', 'main_image', 'description', 'price', 'currency')
+
+# Which source wins per field: OpenGraph titles/images are written for
+# sharing, JSON-LD is the more reliable source for people, dates and offers
+FIELD_SOURCES = {
+    'title': ('opengraph', 'json_ld', 'microdata'),
+    'author': ('json_ld', 'microdata', 'opengraph'),
+    'published_date': ('json_ld', 'microdata', 'opengraph'),
+    'main_image': ('opengraph', 'json_ld', 'microdata'),
+    'description': ('opengraph', 'json_ld', 'microdata'),
+    'price': ('json_ld', 'microdata', 'opengraph'),
+    'currency': ('json_ld', 'microdata', 'opengraph'),
+}
+
+CURRENCY_SYMBOLS = {
+    '$': 'USD',
+    '£': 'GBP',
+    '€': 'EUR',
+    '¥': 'JPY',
+    '₹': 'INR',
+    '₪': 'ILS',
+}
+
+# Either digits with grouped thousands ("1,299.99", "1 299") or a plain number ("29.99")
+_PRICE_NUMBER = re.compile(
+    r"\d{1,3}(?:[,.\s'](?=\d{3}(?:\D|$))\d{3})+(?:[.,]\d{1,2}(?!\d))?"
+    r"|\d+(?:[.,]\d+)?"
+)
+# JSON-LD nodes that describe the site or page furniture, not the content
+_NON_CONTENT_TYPES = frozenset([
+    'Organization', 'Person', 'WebSite', 'BreadcrumbList', 'ListItem',
+    'ImageObject', 'SearchAction', 'SiteNavigationElement', 'ItemList',
+])
+
+_CURRENCY_CODE = re.compile(r'\b(USD|EUR|GBP|JPY|INR|ILS|CAD|AUD|CHF|SEK|NOK|DKK|PLN|CZK)\b')
+_JSON_LD_COMMENTS = re.compile(r'^\s*(?:<!--|//\s*<!\[CDATA\[)|(?://\s*\]\]>|-->)\s*$')
+
+
+def parse_price(text) -> Optional[float]:
+    """
+    Parse a price from text or a number.
+
+    Handles both separator conventions: "1,299.99" and "1.299,99" are
+    1299.99, "1,299" and "1.299" are 1299, "29,99" is 29.99.
+
+    Returns:
+        Price as float, or None if no number is found
+    """
+    if text is None or isinstance(text, bool):
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+
+    match = _PRICE_NUMBER.search(str(text))
+    if not match:
+        return None
+    number = re.sub(r"[\s']", '', match.group(0))
+
+    if ',' in number and '.' in number:
+        # Whichever separator comes last is the decimal point
+        if number.rfind(',') > number.rfind('.'):
+            number = number.replace('.', '').replace(',', '.')
+        else:
+            number = number.replace(',', '')
+    elif ',' in number or '.' in number:
+        sep = ',' if ',' in number else '.'
+        head, _, tail = number.rpartition(sep)
+        if number.count(sep) == 1 and (len(tail) != 3 or head.strip('0') == ''):
+            number = f"{head}.{tail}"
+        else:
+            # Groups of three after the separator: thousands
+            number = number.replace(sep, '')
+
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def detect_currency(text) -> Optional[str]:
+    """Detect an ISO currency code from a symbol or code in text."""
+    if not text:
+        return None
+    text = str(text)
+    match = _CURRENCY_CODE.search(text.upper())
+    if match:
+        return match.group(1)
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            return code
+    return None
+
+
+def _load_json_ld(raw: str) -> Any:
+    raw = raw[:MAX_JSON_LD_CHARS].strip()
+    if not raw:
+        return None
+    try:
+        return json.loads(raw, strict=False)
+    except ValueError:
+        pass
+    # Some CMSes wrap the block in HTML comments or CDATA markers
+    lines = [line for line in raw.splitlines() if not _JSON_LD_COMMENTS.match(line)]
+    try:
+        return json.loads('\n'.join(lines), strict=False)
+    except ValueError:
+        return None
+
+
+def _walk_json_ld(data: Any) -> Iterator[Dict]:
+    if isinstance(data, list):
+        for item in data:
+            yield from _walk_json_ld(item)
+    elif isinstance(data, dict):
+        yield data
+        if '@graph' in data:
+            yield from _walk_json_ld(data['@graph'])
+
+
+def _types(node: Dict) -> List[str]:
+    value = node.get('@type') or []
+    return [value] if isinstance(value, str) else [t for t in value if isinstance(t, str)]
+
+
+def _first(value: Any) -> Any:
+    while isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+
+def _resolve(value: Any, by_id: Dict[str, Dict]) -> Any:
+    """Replace a JSON-LD reference ({'@id': ...} only) with the node it names, if present."""
+    value = _first(value)
+    if isinstance(value, dict) and set(value) <= {'@id', '@type'} and value.get('@id') in by_id:
+        return by_id[value['@id']]
+    return value
+
+
+def _text(value: Any, key: str = 'name') -> Optional[str]:
+    """Text of a JSON-LD value that may be a string, an object or a list."""
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get(key)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+
+def _image_url(value: Any) -> Optional[str]:
+    """URL of a JSON-LD image (a URL string or an ImageObject; never its @id)."""
+    value = _first(value)
+    if isinstance(value, dict):
+        return _text(value, key='url') or _text(value, key='contentUrl')
+    return _text(value)
+
+
+def _names(value: Any, by_id: Dict[str, Dict]) -> Optional[str]:
+    """Comma-joined names for a JSON-LD author field."""
+    items = value if isinstance(value, list) else [value]
+    names = [_text(_resolve(item, by_id)) for item in items]
+    names = [name for name in names if name and not name.startswith(('http://', 'https://'))]
+    return ', '.join(names) if names else None
+
+
+def _offer_fields(offers: Any) -> Dict:
+    result = {}
+    for offer in (offers if isinstance(offers, list) else [offers]):
+        if not isinstance(offer, dict):
+            continue
+        price = offer.get('price', offer.get('lowPrice'))
+        if price is None and isinstance(offer.get('priceSpecification'), dict):
+            price = offer['priceSpecification'].get('price')
+        price = parse_price(_first(price))
+        if price is not None:
+            result['price'] = price
+            currency = offer.get('priceCurrency') or (offer.get('priceSpecification') or {}).get('priceCurrency')
+            if isinstance(currency, str) and currency.strip():
+                result['currency'] = currency.strip().upper()
+            break
+    return result
+
+
+def _from_json_ld(index: PageIndex) -> Dict:
+    nodes = []
+    for script in index.json_ld_scripts():
+        nodes.extend(_walk_json_ld(_load_json_ld(script.string or '')))
+    if not nodes:
+        return {}
+    # Graphs refer to shared nodes (image, author) by @id
+    by_id = {n['@id']: n for n in nodes if isinstance(n.get('@id'), str)}
+
+    result = {}
+    # Products carry the offer; the first typed node describes the page
+    for node in nodes:
+        if {'Product', 'Offer', 'AggregateOffer'} & set(_types(node)) or 'offers' in node:
+            offer = _offer_fields(node.get('offers') if 'offers' in node else node)
+            if offer:
+                result.update(offer)
+                break
+
+    main = next((n for n in nodes if n.get('headline') or n.get('datePublished')), None)
+    main = main or next(
+        (n for n in nodes if _types(n) and not set(_types(n)) & _NON_CONTENT_TYPES),
+        None,
+    )
+    if main is None:
+        return result
+    result['title'] = _text(main.get('headline')) or _text(main.get('name'))
+    result['author'] = _names(main.get('author') or main.get('creator'), by_id)
+    date = _text(main.get('datePublished') or main.get('uploadDate'))
+    result['published_date'] = date[:10] if date else None
+    result['main_image'] = _image_url(_resolve(main.get('image') or main.get('thumbnailUrl'), by_id))
+    result['description'] = _text(main.get('description'))
+    return result
+
+
+def _microdata_value(element) -> Optional[str]:
+    for attr in ('content', 'datetime'):
+        if element.get(attr):
+            return str(element[attr]).strip()
+    if element.name in ('img', 'audio', 'video', 'source') and element.get('src'):
+        return element['src']
+    if element.name in ('a', 'link') and element.get('href'):
+        return element['href']
+    nested_name = element.find(attrs={'itemprop': 'name'}) if element.has_attr('itemscope') else None
+    text = (nested_name or element).get_text(' ', strip=True)
+    return text or None
+
+
+def _from_microdata(index: PageIndex) -> Dict:
+    def value(prop):
+        element = index.first_itemprop(prop)
+        return _microdata_value(element) if element is not None else None
+
+    result = {}
+    price_text = value('price') or value('lowPrice')
+    price = parse_price(price_text)
+    if price is not None:
+        result['price'] = price
+        result['currency'] = (value('priceCurrency') or detect_currency(price_text) or '').upper() or None
+
+    date = value('datePublished')
+    result.update({
+        'title': value('headline'),
+        'author': value('author'),
+        'published_date': date[:10] if date else None,
+        'main_image': value('image'),
+        'description': value('description'),
+    })
+    return result
+
+
+def _from_opengraph(index: PageIndex) -> Dict:
+    def content(*keys):
+        value = index.meta_content(*keys)
+        return value.strip() if isinstance(value, str) and value.strip() else None
+
+    date = content('article:published_time')
+    author = content('article:author')
+    result = {
+        'title': content('og:title'),
+        'author': author if author and not author.startswith(('http://', 'https://')) else None,
+        'published_date': date[:10] if date else None,
+        'main_image': content('og:image', 'og:image:url', 'og:image:secure_url'),
+        'description': content('og:description'),
+    }
+    price = parse_price(content('product:price:amount', 'og:price:amount'))
+    if price is not None:
+        result['price'] = price
+        currency = content('product:price:currency', 'og:price:currency')
+        result['currency'] = currency.upper() if currency else None
+    return result
+
+
+def extract_structured_data(index: PageIndex) -> Dict:
+    """
+    Read JSON-LD, microdata and OpenGraph fields from an indexed page.
+
+    Args:
+        index: PageIndex of the page
+
+    Returns:
+        Dict with every key in FIELDS (None where no source provides it)
+    """
+    sources = {
+        'json_ld': _from_json_ld(index),
+        'microdata': _from_microdata(index),
+        'opengraph': _from_opengraph(index),
+    }
+
+    result = {}
+    for field in FIELDS:
+        result[field] = None
+        for source in FIELD_SOURCES[field]:
+            value = sources[source].get(field)
+            if value not in (None, ''):
+                result[field] = value
+                break
+
+    # A currency only makes sense next to the price it came with
+    if result['price'] is not None:
+        for source in FIELD_SOURCES['price']:
+            if sources[source].get('price') == result['price']:
+                result['currency'] = sources[source].get('currency')
+                break
+    else:
+        result['currency'] = None
+
+    return result
@@ -0,0 +1,257 @@
+"""
+Compiled host/path rules for classifying bookmark URLs.
+
+The content-type rules (video, podcast, social, code, product) live in one
+file, shared/url_rules.json, used by both enrichers and by the n8n
+`Detect URL Type` node. Rules are compiled once into a suffix trie over
+reversed host labels, so classifying a URL is a single walk over its host
+labels instead of a substring scan per pattern.
+
+Rule syntax:
+
+- `example.com` matches example.com and any subdomain (never `boxexample.com`)
+- `example.com/path` additionally requires the path to be /path or below it
+- `brand.*` matches a `brand` label under any suffix (amazon.com, amazon.co.uk)
+
+When several rules match, the type listed first in `priority` wins.
+
+The n8n Code node cannot import Python, so the workflow carries a generated
+copy of the rules and matcher. After editing url_rules.json run:
+
+    python -m shared.url_rules --sync workflows/Bookmark_Processor.json
+"""
+
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'url_rules.json')
+
+# Markers around the generated block inside the n8n Code node
+JS_BEGIN_MARKER = '// BEGIN URL RULES'
+JS_END_MARKER = '// END URL RULES'
+WORKFLOW_NODE_NAME = 'Detect URL Type'
+
+
+def load_rules(path: Optional[str] = None) -> Dict:
+    """Load the rule file (defaults to shared/url_rules.json)."""
+    with open(path or RULES_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _split_pattern(pattern: str) -> Tuple[str, str]:
+    host, slash, path = pattern.lower().partition('/')
+    return host, (slash + path).rstrip('/')
+
+
+class UrlRuleEngine:
+    """
+    Suffix-trie matcher compiled from a rule dict.
+
+    Args:
+        rules: Dict with 'priority' (list of types, highest first) and
+            'rules' (type -> list of patterns)
+    """
+
+    def __init__(self, rules: Dict):
+        self.types: List[str] = list(rules['priority'])
+        self._trie: Dict = {}
+        self._brands: Dict[str, List[Tuple[int, str, str]]] = {}
+
+        for rank, content_type in enumerate(self.types):
+            for pattern in rules['rules'].get(content_type, []):
+                host, path = _split_pattern(pattern)
+                rule = (rank, content_type, path)
+                if host.endswith('.*'):
+                    self._brands.setdefault(host[:-2], []).append(rule)
+                    continue
+                node = self._trie
+                for label in reversed(host.split('.')):
+                    node = node.setdefault(label, {})
+                node.setdefault(None, []).append(rule)
+
+    def _candidates(self, host: str):
+        labels = host.split('.')
+        node = self._trie
+        for label in reversed(labels):
+            node = node.get(label)
+            if node is None:
+                break
+            yield from node.get(None, ())
+        for label in labels[:-1]:
+            yield from self._brands.get(label, ())
+
+    def classify(self, url: str) -> Optional[str]:
+        """
+        Classify a URL by its host and path.
+
+        Args:
+            url: Absolute URL (a bare host/path is treated as https)
+
+        Returns:
+            Matched content type, or None if no rule matches
+        """
+        if not url:
+            return None
+        url = url.strip()
+        parts = urlsplit(url if '://' in url else f"https://{url}")
+        host = (parts.hostname or '').rstrip('.')
+        if not host:
+            return None
+        path = parts.path.lower()
+
+        best = None
+        for rule in self._candidates(host):
+            rule_path = rule[2]
+            if rule_path and path != rule_path and not path.startswith(rule_path + '/'):
+                continue
+            if best is None or rule[0] < best[0]:
+                best = rule
+        return best[1] if best else None
+
+
+_default_engine = None
+
+
+def get_url_rules() -> UrlRuleEngine:
+    """Get the engine compiled from shared/url_rules.json (compiled on first use)."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = UrlRuleEngine(load_rules())
+    return _default_engine
+
+
+def classify_url(url: str) -> Optional[str]:
+    """Classify a URL with the shared rules (see UrlRuleEngine.classify)."""
+    return get_url_rules().classify(url)
+
+
+_JS_MATCHER = """\
+function compileUrlRules(rules) {
+  const trie = { children: new Map(), rules: [] };
+  const brands = new Map();
+  rules.priority.forEach((type, rank) => {
+    for (const pattern of rules.rules[type] || []) {
+      const lowered = pattern.toLowerCase();
+      const slash = lowered.indexOf('/');
+      const host = slash === -1 ? lowered : lowered.slice(0, slash);
+      const path = slash === -1 ? '' : lowered.slice(slash).replace(/\\/+$/, '');
+      const rule = { rank, type, path };
+      if (host.endsWith('.*')) {
+        const brand = host.slice(0, -2);
+        if (!brands.has(brand)) brands.set(brand, []);
+        brands.get(brand).push(rule);
+        continue;
+      }
+      let node = trie;
+      for (const label of host.split('.').reverse()) {
+        if (!node.children.has(label)) node.children.set(label, { children: new Map(), rules: [] });
+        node = node.children.get(label);
+      }
+      node.rules.push(rule);
+    }
+  });
+  return { trie, brands };
+}
+
+function classifyUrl(url, compiled) {
+  let parsed;
+  try {
+    parsed = new URL(url.includes('://') ? url.trim() : 'https://' + url.trim());
+  } catch (e) {
+    return null;
+  }
+  const host = parsed.hostname.toLowerCase().replace(/\\.$/, '');
+  const path = parsed.pathname.toLowerCase();
+  const labels = host.split('.');
+  const candidates = [];
+  let node = compiled.trie;
+  for (let i = labels.length - 1; i >= 0; i--) {
+    node = node.children.get(labels[i]);
+    if (!node) break;
+    candidates.push(...node.rules);
+  }
+  for (const label of labels.slice(0, -1)) {
+    candidates.push(...(compiled.brands.get(label) || []));
+  }
+  let best = null;
+  for (const rule of candidates) {
+    if (rule.path && path !== rule.path && !path.startsWith(rule.path + '/')) continue;
+    if (!best || rule.rank < best.rank) best = rule;
+  }
+  return best ? best.type : null;
+}
+"""
+
+
+def render_workflow_js(rules: Optional[Dict] = None) -> str:
+    """
+    Render the rules and matcher as the JavaScript block embedded in n8n.
+
+    Returns:
+        Code between (and including) JS_BEGIN_MARKER and JS_END_MARKER
+    """
+    rules = rules if rules is not None else load_rules()
+    return (
+        f"{JS_BEGIN_MARKER} - generated from shared/url_rules.json, do not edit by hand\n"
+        f"// Regenerate with: python -m shared.url_rules --sync workflows/Bookmark_Processor.json\n"
+        f"const URL_RULES = {json.dumps(rules, ensure_ascii=False)};\n\n"
+        f"{_JS_MATCHER}"
+        f"{JS_END_MARKER}"
+    )
+
+
+def extract_workflow_js(js_code: str) -> Optional[str]:
+    """Return the generated rules block inside a Code node, or None if absent."""
+    start = js_code.find(JS_BEGIN_MARKER)
+    end = js_code.find(JS_END_MARKER)
+    if start == -1 or end == -1:
+        return None
+    return js_code[start:end + len(JS_END_MARKER)]
+
+
+def _workflow_nodes(workflow: Dict) -> List[Dict]:
+    nodes = list(workflow.get('nodes', []))
+    nodes.extend((workflow.get('activeVersion') or {}).get('nodes', []))
+    return [node for node in nodes if node.get('name') == WORKFLOW_NODE_NAME]
+
+
+def sync_workflow(path: str, rules: Optional[Dict] = None) -> int:
+    """
+    Rewrite the generated rules block in a workflow's Detect URL Type nodes.
+
+    Args:
+        path: Workflow JSON file
+        rules: Rule dict (defaults to shared/url_rules.json)
+
+    Returns:
+        Number of nodes updated
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        workflow = json.load(f)
+
+    block = render_workflow_js(rules)
+    updated = 0
+    for node in _workflow_nodes(workflow):
+        js_code = node['parameters']['jsCode']
+        current = extract_workflow_js(js_code)
+        if current is None:
+            raise ValueError(f"{WORKFLOW_NODE_NAME} node in {path} has no {JS_BEGIN_MARKER} block")
+        if current != block:
+            node['parameters']['jsCode'] = js_code.replace(current, block)
+            updated += 1
+
+    if updated:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(workflow, indent=2, ensure_ascii=False) + '\n')
+    return updated
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != '--sync':
+        print("Usage: python -m shared.url_rules --sync <workflow.json> [...]")
+        sys.exit(2)
+    for workflow_path in sys.argv[2:]:
+        print(f"{workflow_path}: updated {sync_workflow(workflow_path)} node(s)")
@@ -0,0 +1,205 @@
+"""
+URL canonicalization utilities for Bookmark Knowledge Base.
+
+The same resource arrives under many URLs: `vm.tiktok.com` short links,
+`youtu.be` vs `youtube.com/watch`, `m.` hosts, `si=` and `utm_` tracking
+parameters. Every cache, dedup and coalescing layer should key on the
+canonical form produced here instead of the raw URL string.
+
+Platform rules are compiled once at import time. Short links are only
+resolved when asked to (it costs a network round trip) and resolutions are
+cached by shared.redirect_cache.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that never identify a resource
+TRACKING_PARAMS = frozenset([
+    'si', 'feature', 'fbclid', 'gclid', 'dclid', 'msclkid', 'igshid', 'igsh',
+    'mc_cid', 'mc_eid', 'ref_src', 'ref_url', '_hsenc', '_hsmi', 'mkt_tok',
+    'is_from_webapp', 'sender_device', 'sender_web_id', 'share_app_id',
+    'share_item_id', 'share_link_id', 'social_sharing', 'ref',
+])
+TRACKING_PREFIXES = ('utm_', '_branch', 'share_')
+
+# Hosts whose links are redirects to the real resource
+SHORT_LINK_HOSTS = frozenset([
+    'vm.tiktok.com', 'vt.tiktok.com', 't.co', 'bit.ly', 'tinyurl.com',
+    'goo.gl', 'ow.ly', 'buff.ly', 'lnkd.in', 'amzn.to', 'a.co', 'spoti.fi',
+    'spotify.link', 'dlvr.it', 'is.gd', 'rb.gy',
+    'shorturl.at', 'cutt.ly', 'tiny.cc', 'trib.al', 'fb.me', 'pin.it',
+])
+
+# Host prefixes that are aliases of the main site
+_HOST_ALIAS_PREFIX = re.compile(r'^(?:www|m|mobile|open|music)\.')
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _rule(platform: str, hosts: List[str], path: str, builder: Callable) -> Tuple:
+    host_pattern = re.compile('^(?:' + '|'.join(re.escape(h) for h in hosts) + ')$')
+    return (platform, host_pattern, re.compile(path), builder)
+
+
+# (platform, host regex on alias-stripped host, path regex, builder(match, query) -> (url, resource_id))
+PLATFORM_RULES = [
+    _rule('youtube', ['youtube.com', 'youtube-nocookie.com'],
+          r'^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})',
+          lambda m, q: (f"https://www.youtube.com/watch?v={m.group(1)}", m.group(1))),
+    _rule('youtube', ['youtube.com'], r'^/watch/?$',
+          lambda m, q: (f"https://www.youtube.com/watch?v={q['v']}", q['v']) if q.get('v') else None),
+    _rule('youtube', ['youtu.be'], r'^/([A-Za-z0-9_-]{11})',
+          lambda m, q: (f"https://www.youtube.com/watch?v={m.group(1)}", m.group(1))),
+    _rule('tiktok', ['tiktok.com'], r'^/@([^/]+)/(video|photo)/(\d+)',
+          lambda m, q: (f"https://www.tiktok.com/@{m.group(1)}/{m.group(2)}/{m.group(3)}", m.group(3))),
+    _rule('tiktok', ['tiktok.com'], r'^/v/(\d+)(?:\.html)?',
+          lambda m, q: (f"https://www.tiktok.com/@/video/{m.group(1)}", m.group(1))),
+    _rule('spotify', ['spotify.com'], r'^/(?:intl-[a-z-]+/)?(episode|show|track|album|playlist)/([A-Za-z0-9]+)',
+          lambda m, q: (f"https://open.spotify.com/{m.group(1)}/{m.group(2)}", f"{m.group(1)}/{m.group(2)}")),
+    _rule('twitter', ['twitter.com', 'x.com'], r'^/i/(?:web/)?status/(\d+)',
+          lambda m, q: (f"https://x.com/i/status/{m.group(1)}", m.group(1))),
+    _rule('twitter', ['twitter.com', 'x.com'], r'^/([^/]+)/status(?:es)?/(\d+)',
+          lambda m, q: (f"https://x.com/{m.group(1)}/status/{m.group(2)}", m.group(2))),
+    _rule('instagram', ['instagram.com'], r'^/(?:[^/]+/)?(p|reel|reels|tv)/([A-Za-z0-9_-]+)',
+          lambda m, q: (f"https://www.instagram.com/{'reel' if m.group(1) == 'reels' else m.group(1)}/{m.group(2)}/",
+                        m.group(2))),
+    # Unlisted videos need their hash (path segment or player h=) to play
+    _rule('vimeo', ['vimeo.com', 'player.vimeo.com'], r'^/(?:video/)?(\d+)(?:/([0-9a-f]+))?',
+          lambda m, q: (f"https://vimeo.com/{m.group(1)}" +
+                        (f"/{m.group(2) or q['h']}" if m.group(2) or q.get('h') else ''),
+                        m.group(1))),
+    _rule('apple_podcasts', ['podcasts.apple.com'], r'^/(?:[a-z]{2}/)?podcast/[^/]*/?(id\d+)',
+          lambda m, q: (f"https://podcasts.apple.com/podcast/{m.group(1)}" +
+                        (f"?i={q['i']}" if q.get('i') else ''),
+                        m.group(1) + (f":{q['i']}" if q.get('i') else ''))),
+]
+
+
+def _strip_alias(host: str) -> str:
+    """Strip www./m./mobile. style prefixes used by platforms for the same site."""
+    while True:
+        stripped = _HOST_ALIAS_PREFIX.sub('', host, count=1)
+        if stripped == host or '.' not in stripped:
+            return host
+        host = stripped
+
+
+def _is_tracking_param(name: str) -> bool:
+    lowered = name.lower()
+    return lowered in TRACKING_PARAMS or lowered.startswith(TRACKING_PREFIXES)
+
+
+def is_short_link(url: str) -> bool:
+    """Check if URL is on a known link shortener or share-link host."""
+    if not url:
+        return False
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if host in SHORT_LINK_HOSTS:
+        return True
+    # tiktok.com/t/XXXX share links redirect like vm.tiktok.com
+    return host.endswith('tiktok.com') and parts.path.startswith('/t/')
+
+
+def resolve_short_link(url: str) -> str:
+    """
+    Follow a short link's redirects to its final URL.
+
+    Resolutions go through the persistent RedirectCache, so a repeat short
+    link costs no network round trip. Returns the input URL unchanged if
+    resolution fails.
+    """
+    from .redirect_cache import get_redirect_cache
+
+    return get_redirect_cache().resolve(url)
+
+
+def parse_canonical(url: str, resolve: bool = False, resolver: Optional[Callable[[str], str]] = None) -> Dict:
+    """
+    Canonicalize a URL and identify the resource it points to.
+
+    Args:
+        url: Raw URL as bookmarked
+        resolve: If True, follow short-link redirects before canonicalizing
+        resolver: Callable mapping a short URL to its final URL
+            (defaults to resolve_short_link)
+
+    Returns:
+        Dict with:
+            url: str - Canonical URL (fetchable)
+            key: str - Stable cache/dedup key, e.g. 'youtube:dQw4w9WgXcQ'
+            platform: str or None - Matched platform rule
+            resource_id: str or None - Platform resource ID
+            resolved: bool - True if a short link was followed
+    """
+    result = {'url': url, 'key': f"url:{url}", 'platform': None, 'resource_id': None, 'resolved': False}
+    if not url or not url.strip():
+        return result
+
+    url = url.strip()
+    if resolve and is_short_link(url):
+        final_url = (resolver or resolve_short_link)(url)
+        if final_url and final_url != url:
+            url = final_url
+            result['resolved'] = True
+
+    parts = urlsplit(url)
+    scheme = (parts.scheme or '').lower()
+    host = (parts.hostname or '').lower()
+    if not scheme or not host:
+        # Not an absolute URL - nothing to canonicalize
+        result['url'] = url
+        result['key'] = f"url:{url}"
+        return result
+
+    query = {}
+    kept_params = []
+    for name, value in parse_qsl(parts.query, keep_blank_values=True):
+        query.setdefault(name, value)
+        if not _is_tracking_param(name):
+            kept_params.append((name, value))
+
+    match_host = _strip_alias(host)
+    for platform, host_pattern, path_pattern, builder in PLATFORM_RULES:
+        if not host_pattern.match(match_host):
+            continue
+        match = path_pattern.match(parts.path)
+        if not match:
+            continue
+        built = builder(match, query)
+        if built:
+            canonical_url, resource_id = built
+            result.update({
+                'url': canonical_url,
+                'key': f"{platform}:{resource_id}",
+                'platform': platform,
+                'resource_id': resource_id,
+            })
+            return result
+
+    # Generic canonicalization: lowercase host, drop default port, www.,
+    # fragment, trailing slash and tracking params; sort remaining params
+    netloc = host[4:] if host.startswith('www.') else host
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parts.port}"
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+    canonical_url = urlunsplit((scheme, netloc, path, urlencode(sorted(kept_params)), ''))
+
+    result['url'] = canonical_url
+    result['key'] = f"url:{canonical_url.split('://', 1)[1]}"
+    return result
+
+
+def canonicalize_url(url: str, resolve: bool = False, resolver: Optional[Callable[[str], str]] = None) -> str:
+    """Return the canonical URL for url (see parse_canonical)."""
+    return parse_canonical(url, resolve=resolve, resolver=resolver)['url']
+
+
+def canonical_key(url: str, resolve: bool = False, resolver: Optional[Callable[[str], str]] = None) -> str:
+    """Return the stable cache/dedup key for url (see parse_canonical)."""
+    return parse_canonical(url, resolve=resolve, resolver=resolver)['key']
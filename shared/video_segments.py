@@ -0,0 +1,172 @@
+"""
+Segmented analysis helpers for long videos.
+
+A long video sent to Gemini as one file hits the File API processing cap
+and the model's context limit, and its latency grows with its duration.
+Long media is instead:
+
+1. split at natural boundaries - yt-dlp chapters when the uploader set
+   them, otherwise ffmpeg scene changes, otherwise fixed intervals
+2. cut into segment files (stream copy, no re-encode)
+3. analyzed segment by segment, at most SEGMENT_CONCURRENCY at a time
+4. merged back into the required analysis sections, each segment's text
+   labelled with its time range
+
+Latency then grows with segments / concurrency rather than with duration.
+"""
+
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .analysis_utils import REQUIRED_ANALYSIS_SECTIONS
+from .ai_memo import normalize_content
+
+SEGMENT_TARGET_SECONDS = int(os.environ.get('SEGMENT_TARGET_SECONDS', 180))  # Preferred segment length
+SEGMENT_MAX_COUNT = int(os.environ.get('SEGMENT_MAX_COUNT', 12))  # Longer videos get longer segments
+SEGMENT_CONCURRENCY = int(os.environ.get('SEGMENT_CONCURRENCY', 4))  # Segment analyses in flight
+SCENE_THRESHOLD = float(os.environ.get('SCENE_THRESHOLD', 0.3))  # ffmpeg scene score for a cut
+
+# Sections whose per-segment answers are alternatives, not a timeline
+UNLABELLED_SECTIONS = frozenset(['Content Category'])
+
+_PTS_TIME = re.compile(r'pts_time:(\d+(?:\.\d+)?)')
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format seconds as m:ss (or h:mm:ss)."""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def chapter_starts(chapters: Optional[Sequence[Dict]]) -> List[float]:
+    """Start times of yt-dlp chapters (info['chapters']), excluding 0."""
+    return sorted({float(c['start_time']) for c in chapters or [] if c.get('start_time')})
+
+
+def detect_scene_changes(video_path: str, threshold: float = SCENE_THRESHOLD) -> List[float]:
+    """
+    Times of scene changes in a video, from ffmpeg's scene filter.
+
+    Frames are decimated and downscaled before scoring, so detection costs a
+    fraction of a full decode.
+
+    Args:
+        video_path: Local video file
+        threshold: Scene score (0-1) above which a frame starts a new scene
+
+    Returns:
+        Sorted cut times in seconds (empty if ffmpeg fails)
+    """
+    try:
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-i', video_path,
+            '-an', '-vf', f"fps=2,scale=160:-2,select='gt(scene,{threshold})',showinfo",
+            '-f', 'null', '-'
+        ], check=True, capture_output=True, text=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Scene detection failed: {e}")
+        return []
+    return sorted(float(t) for t in _PTS_TIME.findall(result.stderr))
+
+
+def plan_segments(duration: float, cut_points: Sequence[float] = (),
+                  target_seconds: float = SEGMENT_TARGET_SECONDS,
+                  max_segments: int = SEGMENT_MAX_COUNT) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into segments of about target_seconds.
+
+    Each boundary is the cut point nearest to one target length past the
+    previous boundary, within half a target either way; with no cut point
+    in range the segment is cut at exactly the target length.
+
+    Args:
+        duration: Video duration in seconds
+        cut_points: Preferred boundaries (chapter starts or scene changes)
+        target_seconds: Preferred segment length
+        max_segments: Upper bound on the segment count (raises the target)
+
+    Returns:
+        List of (start, end) tuples covering the whole video
+    """
+    if duration <= 0:
+        return []
+    target = max(float(target_seconds), duration / max(1, max_segments))
+    cuts = sorted(t for t in cut_points if 0 < t < duration)
+
+    segments = []
+    start = 0.0
+    while duration - start > target * 1.5:
+        want = start + target
+        candidates = [t for t in cuts if start + target / 2 <= t <= start + target * 1.5]
+        end = min(candidates, key=lambda t: abs(t - want)) if candidates else want
+        segments.append((start, end))
+        start = end
+    segments.append((start, float(duration)))
+    return segments
+
+
+def cut_segment(video_path: str, start: float, end: float, output_path: str) -> str:
+    """Copy [start, end] of a video into output_path without re-encoding."""
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-ss', f"{start:.3f}", '-i', video_path,
+        '-t', f"{end - start:.3f}", '-c', 'copy', '-avoid_negative_ts', 'make_zero',
+        '-y', output_path
+    ], check=True, capture_output=True)
+    return output_path
+
+
+def analyze_segments(segments: Sequence[Tuple[float, float]], analyze: Callable[[int, float, float], Any],
+                     max_workers: int = SEGMENT_CONCURRENCY) -> List[Any]:
+    """
+    Run analyze(index, start, end) for every segment, at most max_workers at once.
+
+    Returns:
+        Results in segment order
+    """
+    if not segments:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(segments)))) as executor:
+        return list(executor.map(lambda item: analyze(item[0], *item[1]), enumerate(segments)))
+
+
+def merge_segment_sections(segment_results: Sequence[Dict],
+                           required_sections: List[str] = None) -> Dict[str, str]:
+    """
+    Merge per-segment analysis sections into one set of sections.
+
+    Args:
+        segment_results: Dicts with start, end and sections (name -> content)
+            in segment order; segments without sections are skipped
+        required_sections: Sections to merge (defaults to REQUIRED_ANALYSIS_SECTIONS)
+
+    Returns:
+        Dict mapping section names to merged content: a "[m:ss-m:ss] ..."
+        paragraph per segment, or distinct answers for UNLABELLED_SECTIONS
+    """
+    required_sections = required_sections or REQUIRED_ANALYSIS_SECTIONS
+    merged = {}
+    for name in required_sections:
+        parts = []
+        seen = set()
+        for result in segment_results:
+            content = ((result.get('sections') or {}).get(name) or '').strip()
+            if not content:
+                continue
+            if name in UNLABELLED_SECTIONS:
+                key = normalize_content(content)
+                if key not in seen:
+                    seen.add(key)
+                    parts.append(content)
+            else:
+                label = f"[{format_timestamp(result['start'])}-{format_timestamp(result['end'])}]"
+                parts.append(f"{label} {content}")
+        if parts:
+            merged[name] = '\n\n'.join(parts)
+    return merged
@@ -3,6 +3,7 @@ Shared pytest fixtures for Bookmark Knowledge Base tests.
 """
 
 import pytest
+import os
 import sys
 import importlib.util
 from pathlib import Path
@@ -21,6 +22,9 @@ def _load_module_from_path(module_name: str, file_path: Path):
     return module
 
 
+# Parse webpages on the test thread (mocks and patches do not cross into workers)
+os.environ.setdefault('PARSE_POOL_WORKERS', '0')
+
 # Load Cloud Function modules with unique names at module load time
 _webpage_enricher_module = _load_module_from_path(
     'webpage_enricher_main',
@@ -67,6 +71,12 @@ def extract_price():
     return _webpage_enricher_module.extract_price
 
 
+@pytest.fixture
+def generate_ai_analysis():
+    """Returns generate_ai_analysis function from webpage-enricher."""
+    return _webpage_enricher_module.generate_ai_analysis
+
+
 @pytest.fixture
 def extract_code_snippets():
     """Returns extract_code_snippets function from webpage-enricher."""
@@ -83,6 +93,12 @@ def is_spotify_podcast():
     return _video_enricher_module.is_spotify_podcast
 
 
+@pytest.fixture
+def download_video():
+    """Returns download_video function from video-enricher."""
+    return _video_enricher_module.download_video
+
+
 @pytest.fixture
 def generate_smart_filename():
     """Returns generate_smart_filename function from video-enricher."""
@@ -205,12 +221,81 @@ def spotify_api_response():
 # Integration Test Fixtures (HTTP functions)
 # ============================================================================
 
+@pytest.fixture(autouse=True)
+def isolated_http_cache(monkeypatch):
+    """Give each test its own in-memory HTTP cache for webpage fetches."""
+    from shared.cache_store import MemoryStore
+    from shared.http_cache import HttpCache
+
+    cache = HttpCache(store=MemoryStore())
+    monkeypatch.setattr(_webpage_enricher_module, 'get_http_cache', lambda: cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_ai_memo(monkeypatch):
+    """Give each test its own in-memory AI analysis memo."""
+    from shared.cache_store import MemoryStore
+    from shared.ai_memo import MemoCache
+
+    memo = MemoCache(store=MemoryStore())
+    monkeypatch.setattr(_webpage_enricher_module, 'get_ai_memo', lambda: memo)
+    return memo
+
+
+@pytest.fixture(autouse=True)
+def isolated_gemini_files(monkeypatch):
+    """Give each test its own in-memory Gemini file registry (no sleeping while processing)."""
+    from shared.cache_store import MemoryStore
+    from shared.gemini_files import GeminiFileRegistry
+
+    registry = GeminiFileRegistry(client=_video_enricher_module.genai, store=MemoryStore(), poll_interval=0)
+    monkeypatch.setattr(_video_enricher_module, 'get_gemini_file_registry', lambda client=None: registry)
+    return registry
+
+
+@pytest.fixture
+def local_gemini_batch(monkeypatch):
+    """Route deferred Gemini requests to in-memory queues and a LocalBatchBackend.
+
+    Returns the backend; set backend.respond to choose the batch answers.
+    """
+    from shared.cache_store import MemoryStore
+    from shared.gemini_batch import GeminiBatchQueue, LocalBatchBackend
+
+    backend = LocalBatchBackend()
+    queues = {}
+
+    def get_queue(namespace):
+        if namespace not in queues:
+            queues[namespace] = GeminiBatchQueue(namespace, backend=backend, store=MemoryStore())
+        return queues[namespace]
+
+    monkeypatch.setattr(_webpage_enricher_module, 'get_gemini_batch_queue', get_queue)
+    monkeypatch.setattr(_video_enricher_module, 'get_gemini_batch_queue', get_queue)
+    monkeypatch.setattr(_webpage_enricher_module, 'shared_store_configured', lambda: True)
+    monkeypatch.setattr(_video_enricher_module, 'shared_store_configured', lambda: True)
+    return backend
+
+
 @pytest.fixture
 def fetch_webpage():
     """Returns fetch_webpage function from webpage-enricher."""
     return _webpage_enricher_module.fetch_webpage
 
 
+@pytest.fixture
+def fetch_webpage_stream():
+    """Returns fetch_webpage_stream function from webpage-enricher."""
+    return _webpage_enricher_module.fetch_webpage_stream
+
+
+@pytest.fixture
+def extract_page_job():
+    """Returns extract_page_job function from webpage-enricher."""
+    return _webpage_enricher_module.extract_page_job
+
+
 @pytest.fixture
 def get_spotify_access_token():
     """Returns get_spotify_access_token function from webpage-enricher."""
@@ -229,6 +314,66 @@ def enrich_webpage():
     return _webpage_enricher_module.enrich_webpage
 
 
+@pytest.fixture
+def enrich_webpages_batch():
+    """Returns batch entry point from webpage-enricher."""
+    return _webpage_enricher_module.enrich_webpages_batch
+
+
+@pytest.fixture
+def webpage_ai_batch():
+    """Returns Gemini batch entry point from webpage-enricher."""
+    return _webpage_enricher_module.webpage_ai_batch
+
+
+@pytest.fixture
+def transcribe_audio_url():
+    """Returns transcribe_audio_url function from webpage-enricher."""
+    return _webpage_enricher_module.transcribe_audio_url
+
+
+@pytest.fixture
+def transcribe_audio():
+    """Returns transcribe_audio function from video-enricher."""
+    return _video_enricher_module.transcribe_audio
+
+
+@pytest.fixture
+def analyze_video_with_gemini():
+    """Returns analyze_video_with_gemini function from video-enricher."""
+    return _video_enricher_module.analyze_video_with_gemini
+
+
+@pytest.fixture
+def analyze_transcript_with_gemini():
+    """Returns analyze_transcript_with_gemini function from video-enricher."""
+    return _video_enricher_module.analyze_transcript_with_gemini
+
+
+@pytest.fixture
+def analyze_keyframes_with_gemini():
+    """Returns analyze_keyframes_with_gemini function from video-enricher."""
+    return _video_enricher_module.analyze_keyframes_with_gemini
+
+
+@pytest.fixture
+def analyze_video_segmented():
+    """Returns analyze_video_segmented function from video-enricher."""
+    return _video_enricher_module.analyze_video_segmented
+
+
+@pytest.fixture
+def choose_analysis_mode():
+    """Returns choose_analysis_mode function from video-enricher."""
+    return _video_enricher_module.choose_analysis_mode
+
+
+@pytest.fixture
+def video_ai_batch():
+    """Returns Gemini batch entry point from video-enricher."""
+    return _video_enricher_module.video_ai_batch
+
+
 @pytest.fixture
 def enrich_video():
     """Returns main entry point from video-enricher."""
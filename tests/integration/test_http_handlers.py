@@ -95,6 +95,66 @@ class TestFetchWebpage:
         assert error is not None
 
 
+class TestFetchWebpageStream:
+    """Tests for fetch_webpage_stream() byte caps and early termination."""
+
+    @responses.activate
+    def test_small_page_not_truncated(self, fetch_webpage_stream):
+        responses.add(responses.GET, "https://example.com/small",
+                      body="<html><body>hi</body></html>", status=200, content_type="text/html")
+
+        result = fetch_webpage_stream("https://example.com/small")
+        assert result['error'] is None
+        assert result['truncated'] is False
+        assert result['html'] == "<html><body>hi</body></html>"
+
+    @responses.activate
+    def test_byte_cap_truncates(self, fetch_webpage_stream):
+        body = "<html><body>" + "x" * 500000 + "</body></html>"
+        responses.add(responses.GET, "https://example.com/big",
+                      body=body, status=200, content_type="text/html")
+
+        result = fetch_webpage_stream("https://example.com/big", max_bytes=100000)
+        assert result['truncated'] is True
+        assert result['bytes_read'] == 100000
+        assert len(result['html']) == 100000
+
+    @responses.activate
+    def test_stop_after_head(self, fetch_webpage_stream):
+        head = "<html><head><title>T</title></head>"
+        body = head + "<body>" + "y" * 1000000 + "</body></html>"
+        responses.add(responses.GET, "https://example.com/long",
+                      body=body, status=200, content_type="text/html")
+
+        result = fetch_webpage_stream("https://example.com/long", stop_after_head=True, body_bytes=1000)
+        assert result['truncated'] is True
+        assert result['bytes_read'] == len(head) + 1000
+        assert "</head>" in result['html']
+
+    @responses.activate
+    def test_unlabeled_utf8_page_decoded_as_utf8(self, fetch_webpage_stream):
+        """text/html without charset is not decoded as ISO-8859-1."""
+        responses.add(responses.GET, "https://example.com/utf8",
+                      body="<p>café – naïve</p>".encode("utf-8"), status=200,
+                      headers={"Content-Type": "text/html"})
+
+        result = fetch_webpage_stream("https://example.com/utf8")
+        assert result['html'] == "<p>café – naïve</p>"
+        assert result['encoding'] == 'utf-8'
+
+    @responses.activate
+    def test_decompression_bomb_rejected(self, fetch_webpage_stream):
+        import gzip
+        payload = gzip.compress(b"\0" * (8 * 1024 * 1024))
+        responses.add(responses.GET, "https://example.com/bomb",
+                      body=payload, status=200, content_type="text/html",
+                      headers={"Content-Encoding": "gzip"})
+
+        result = fetch_webpage_stream("https://example.com/bomb", max_bytes=16 * 1024 * 1024)
+        assert result['html'] is None
+        assert 'ratio' in result['error']
+
+
 class TestGetSpotifyAccessToken:
     """Tests for get_spotify_access_token() with mocked Spotify auth."""
 
@@ -254,3 +314,217 @@ class TestFetchSpotifyEpisode:
         result = fetch_spotify_episode(episode_url)
         # Should get some result from oEmbed fallback
         assert 'title' in result or 'error' in result
+
+
+class TestEnrichWebpageCoalescing:
+    """Tests for request coalescing in enrich_webpage()."""
+
+    def test_concurrent_requests_fetch_once(self, mock_flask_request, enrich_webpage):
+        """Concurrent requests for the same URL share one enrichment."""
+        import threading
+        import time
+
+        calls = []
+
+        def slow_fetch(url, **kwargs):
+            calls.append(url)
+            time.sleep(0.2)
+            return {'html': None, 'content': None, 'content_type': None, 'error': 'HTTP error: 503',
+                    'truncated': False, 'not_modified': False}
+
+        from tests.conftest import _webpage_enricher_module
+        results = []
+
+        def worker():
+            request = mock_flask_request(json_data={'url': 'https://example.com/dup'})
+            results.append(enrich_webpage(request))
+
+        with patch.object(_webpage_enricher_module, 'fetch_webpage_stream', side_effect=slow_fetch):
+            threads = [threading.Thread(target=worker) for _ in range(3)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(5)
+
+        assert len(calls) == 1
+        assert len(results) == 3
+        assert len({body for body, _, _ in results}) == 1
+        assert sum(1 for _, _, h in results if h.get('X-Coalesced')) == 2
+
+
+class TestEnrichWebpageMetadataOnly:
+    """Tests for the metadata_only option of enrich_webpage()."""
+
+    @responses.activate
+    def test_metadata_only_skips_body_work(self, mock_flask_request, enrich_webpage):
+        import json
+        html = """<html><head><title>Meta Page</title>
+        <meta name="author" content="Jane"></head>
+        <body><article><p>""" + "word " * 500 + """</p></article></body></html>"""
+        responses.add(responses.GET, "https://example.com/meta-only",
+                      body=html, status=200, content_type="text/html")
+
+        request = mock_flask_request(json_data={
+            'url': 'https://example.com/meta-only',
+            'options': {'metadata_only': True},
+        })
+        body, status, _ = enrich_webpage(request)
+        data = json.loads(body)
+
+        assert status == 200
+        assert data['title'] == 'Meta Page'
+        assert data['author'] == 'Jane'
+        assert data['reading_time'] is None
+        assert data['ai_summary'] is None
+
+    @responses.activate
+    def test_fetches_saved_url_not_canonical_form(self, mock_flask_request, enrich_webpage):
+        import json
+        saved = "https://example.com/docs/?ref=sidebar"
+        responses.add(responses.GET, saved, body="<html><head><title>Sidebar</title></head></html>",
+                      status=200, content_type="text/html",
+                      match=[responses.matchers.query_param_matcher({'ref': 'sidebar'})])
+
+        request = mock_flask_request(json_data={'url': saved, 'options': {'metadata_only': True}})
+        body, status, _ = enrich_webpage(request)
+        data = json.loads(body)
+
+        assert status == 200
+        assert data['title'] == 'Sidebar'
+        assert responses.calls[0].request.url == saved
+        assert data['canonical_url'] == 'https://example.com/docs'
+
+
+class TestEnrichWebpageConditionalCache:
+    """Tests for conditional GETs through the HTTP cache in enrich_webpage()."""
+
+    URL = "https://example.com/cached-article"
+    HTML = "<html><head><title>Cached Page</title></head><body><article><p>Hello</p></article></body></html>"
+
+    def _enrich(self, mock_flask_request, enrich_webpage, options=None):
+        import json
+        request = mock_flask_request(json_data={'url': self.URL, 'options': options or {'skip_ai': True}})
+        body, status, _ = enrich_webpage(request)
+        return json.loads(body)
+
+    @responses.activate
+    def test_not_modified_reuses_result(self, mock_flask_request, enrich_webpage):
+        responses.add(responses.GET, self.URL, body=self.HTML, status=200,
+                      content_type="text/html", headers={'ETag': '"v1"'})
+        responses.add(responses.GET, self.URL, status=304,
+                      match=[responses.matchers.header_matcher({'If-None-Match': '"v1"'})])
+
+        from tests.conftest import _webpage_enricher_module
+
+        first = self._enrich(mock_flask_request, enrich_webpage)
+        with patch.object(_webpage_enricher_module, 'parse_html') as parse:
+            second = self._enrich(mock_flask_request, enrich_webpage)
+
+        parse.assert_not_called()
+        assert first['title'] == second['title'] == 'Cached Page'
+        assert 'from_cache' not in first
+        assert second['from_cache'] is True
+        assert second['url'] == self.URL
+
+    @responses.activate
+    def test_not_modified_reparses_body_for_new_options(self, mock_flask_request, enrich_webpage):
+        responses.add(responses.GET, self.URL, body=self.HTML, status=200,
+                      content_type="text/html", headers={'Last-Modified': 'Wed, 01 May 2024 00:00:00 GMT'})
+        responses.add(responses.GET, self.URL, status=304)
+
+        self._enrich(mock_flask_request, enrich_webpage, {'skip_ai': True})
+        second = self._enrich(mock_flask_request, enrich_webpage, {'skip_ai': True, 'extract_code': False})
+
+        assert second['title'] == 'Cached Page'
+        assert 'from_cache' not in second
+        assert responses.calls[1].request.headers['If-Modified-Since'] == 'Wed, 01 May 2024 00:00:00 GMT'
+
+    @responses.activate
+    def test_use_cache_false_sends_unconditional_get(self, mock_flask_request, enrich_webpage):
+        responses.add(responses.GET, self.URL, body=self.HTML, status=200,
+                      content_type="text/html", headers={'ETag': '"v1"'})
+
+        self._enrich(mock_flask_request, enrich_webpage)
+        self._enrich(mock_flask_request, enrich_webpage, {'skip_ai': True, 'use_cache': False})
+
+        assert 'If-None-Match' not in responses.calls[1].request.headers
+
+
+class TestEnrichWebpagesBatch:
+    """Tests for the enrich_webpages_batch() streaming endpoint."""
+
+    def _lines(self, response):
+        import json
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    @responses.activate
+    def test_streams_one_line_per_url(self, mock_flask_request, enrich_webpages_batch):
+        from tests.conftest import _webpage_enricher_module
+
+        for path in ('a', 'b'):
+            responses.add(responses.GET, f"https://example.com/{path}", status=200, content_type="text/html",
+                          body=f"<html><head><title>Page {path}</title></head><body></body></html>")
+        responses.add(responses.GET, "https://other.org/c", status=404)
+
+        request = mock_flask_request(json_data={
+            'urls': ['https://example.com/a', 'https://example.com/b', 'https://other.org/c'],
+            'options': {'skip_ai': True},
+        })
+        with patch.object(_webpage_enricher_module, 'BATCH_HOST_INTERVAL', 0):
+            response = enrich_webpages_batch(request)
+            lines = self._lines(response)
+
+        assert response.mimetype == 'application/x-ndjson'
+        assert lines[-1]['done'] is True
+        assert lines[-1]['count'] == 3
+
+        by_index = {line['index']: line for line in lines[:-1]}
+        assert by_index[0]['result']['title'] == 'Page a'
+        assert by_index[1]['result']['title'] == 'Page b'
+        assert by_index[2]['result']['error']['stage'] == 'fetch'
+        assert all(line['status'] == 200 for line in by_index.values())
+
+    @responses.activate
+    def test_only_batch_parses_in_worker_pool(self, mock_flask_request, enrich_webpage, enrich_webpages_batch):
+        from tests.conftest import _webpage_enricher_module
+
+        responses.add(responses.GET, "https://example.com/a", status=200, content_type="text/html",
+                      body="<html><head><title>Page a</title></head><body></body></html>")
+        pool = MagicMock()
+        pool.run.side_effect = lambda fn, *args: fn(*args)
+        with patch.object(_webpage_enricher_module, '_parse_pool', pool), \
+                patch.object(_webpage_enricher_module, 'BATCH_HOST_INTERVAL', 0):
+            enrich_webpage(mock_flask_request(json_data={
+                'url': 'https://example.com/a', 'options': {'skip_ai': True, 'use_cache': False},
+            }))
+            pool.run.assert_not_called()
+
+            response = enrich_webpages_batch(mock_flask_request(json_data={
+                'urls': ['https://example.com/a'], 'options': {'skip_ai': True, 'use_cache': False},
+            }))
+            assert self._lines(response)[0]['result']['title'] == 'Page a'
+        pool.run.assert_called_once()
+
+    def test_missing_urls_returns_400(self, mock_flask_request, enrich_webpages_batch):
+        body, status, _ = enrich_webpages_batch(mock_flask_request(json_data={'urls': []}))
+        assert status == 400
+
+    def test_too_many_urls_returns_400(self, mock_flask_request, enrich_webpages_batch):
+        from tests.conftest import _webpage_enricher_module
+
+        with patch.object(_webpage_enricher_module, 'BATCH_MAX_URLS', 2):
+            body, status, _ = enrich_webpages_batch(mock_flask_request(json_data={
+                'urls': ['https://a.com', 'https://b.com', 'https://c.com'],
+            }))
+        assert status == 400
+
+    @pytest.mark.parametrize('field,value', [
+        ('concurrency', 'abc'), ('concurrency', None), ('per_host', 0), ('per_host', 1.5), ('per_host', True),
+    ])
+    def test_invalid_limits_return_400(self, mock_flask_request, enrich_webpages_batch, field, value):
+        import json
+        body, status, _ = enrich_webpages_batch(mock_flask_request(json_data={
+            'urls': ['https://a.com'], field: value,
+        }))
+        assert status == 400
+        assert field in json.loads(body)['error']
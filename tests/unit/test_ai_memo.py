@@ -0,0 +1,88 @@
+"""
+Unit tests for shared/ai_memo.py content-hash memoization.
+"""
+
+from unittest.mock import MagicMock, patch
+
+from shared.ai_memo import MemoCache, content_fingerprint, normalize_content
+from shared.cache_store import MemoryStore
+
+ARTICLE = "Python tips. " * 20
+
+
+class TestContentFingerprint:
+    """Tests for normalize_content() and content_fingerprint()"""
+
+    def test_whitespace_and_case_insensitive(self):
+        assert normalize_content("  Hello\n\tWORLD ") == "hello world"
+        assert content_fingerprint("Hello  World", 'article') == content_fingerprint("hello world", 'article')
+
+    def test_parts_change_key(self):
+        base = content_fingerprint(ARTICLE, 'article', 'v1', 'model-a')
+        assert base != content_fingerprint(ARTICLE, 'product', 'v1', 'model-a')
+        assert base != content_fingerprint(ARTICLE, 'article', 'v2', 'model-a')
+        assert base != content_fingerprint(ARTICLE, 'article', 'v1', 'model-b')
+
+
+class TestMemoCache:
+    """Tests for MemoCache tiers and LRU eviction."""
+
+    def test_lru_evicts_oldest(self):
+        memo = MemoCache(store=MemoryStore(), max_entries=2)
+        memo.set('a', 1)
+        memo.set('b', 2)
+        memo.get('a')
+        memo.set('c', 3)
+        assert len(memo) == 2
+        assert set(memo._lru) == {'a', 'c'}
+
+    def test_persistent_tier_survives_new_instance(self):
+        store = MemoryStore()
+        MemoCache(store=store).set('k', {'summary': 's'})
+        fresh = MemoCache(store=store)
+        assert fresh.get('k') == {'summary': 's'}
+        assert len(fresh) == 1
+
+    def test_store_errors_are_not_fatal(self):
+        store = MagicMock()
+        store.get.side_effect = RuntimeError('down')
+        store.set.side_effect = RuntimeError('down')
+        memo = MemoCache(store=store)
+        memo.set('k', 1)
+        assert memo.get('k') == 1
+        assert memo.get('missing') is None
+
+
+class TestGenerateAiAnalysisMemo:
+    """generate_ai_analysis() should call Gemini once per distinct content."""
+
+    def test_identical_content_calls_gemini_once(self, generate_ai_analysis):
+        from tests.conftest import _webpage_enricher_module
+
+        model = MagicMock()
+        model.generate_content.return_value.text = '{"title": "Tips", "summary": "S", "analysis": "A"}'
+        with patch.object(_webpage_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module.genai, 'configure'), \
+                patch.object(_webpage_enricher_module.genai, 'GenerativeModel', return_value=model):
+            first = generate_ai_analysis("https://a.com/post", "Tips | A", ARTICLE, 'article')
+            second = generate_ai_analysis("https://b.com/copy", "Tips | B", "  " + ARTICLE.upper(), 'article')
+            other_type = generate_ai_analysis("https://a.com/post", "Tips", ARTICLE, 'product')
+
+        assert first == second
+        assert first['summary'] == 'S'
+        assert other_type['summary'] == 'S'
+        assert model.generate_content.call_count == 2
+
+    def test_errors_are_not_memoized(self, generate_ai_analysis):
+        from tests.conftest import _webpage_enricher_module
+
+        model = MagicMock()
+        model.generate_content.side_effect = [RuntimeError('quota'), MagicMock(text='{"summary": "ok"}')]
+        with patch.object(_webpage_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module.genai, 'configure'), \
+                patch.object(_webpage_enricher_module.genai, 'GenerativeModel', return_value=model):
+            failed = generate_ai_analysis("https://a.com", "T", ARTICLE, 'article')
+            retried = generate_ai_analysis("https://a.com", "T", ARTICLE, 'article')
+
+        assert failed['error'] == 'quota'
+        assert retried['summary'] == 'ok'
@@ -0,0 +1,187 @@
+"""
+Unit tests for shared/audio_utils.py local speech detection.
+"""
+
+import io
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from shared.audio_utils import (
+    SAMPLE_RATE, decode_audio, detect_speech, detect_speech_in_file, speech_summary,
+    pack_speech_audio, map_to_original, remap_words, probe_duration
+)
+
+RNG = np.random.default_rng(0)
+
+
+def seconds(duration):
+    return np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+
+
+def noise(duration, level=0.003):
+    return level * RNG.standard_normal(int(duration * SAMPLE_RATE))
+
+
+def speech_like(duration, f0=140):
+    """Voiced harmonics switched on and off at a syllable rate (4 Hz)."""
+    t = seconds(duration)
+    voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 20))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 1.5
+    return 0.3 * voiced * syllables / np.abs(voiced).max()
+
+
+def music(duration):
+    """A sustained chord at constant level."""
+    t = seconds(duration)
+    return 0.04 * sum(np.sin(2 * np.pi * f * t) for f in (220, 277, 330, 440, 554))
+
+
+class TestDetectSpeech:
+    """Tests for detect_speech() on synthetic signals."""
+
+    def test_silence_and_noise_have_no_speech(self):
+        assert detect_speech(np.zeros(3 * SAMPLE_RATE, dtype=np.float32)) == []
+        assert detect_speech(noise(3).astype(np.float32)) == []
+        assert detect_speech(noise(3, level=0.3).astype(np.float32)) == []
+
+    def test_sustained_music_has_no_speech(self):
+        assert detect_speech((music(5) + noise(5)).astype(np.float32)) == []
+
+    def test_speech_span_located(self):
+        samples = np.concatenate([noise(2), speech_like(3) + noise(3), noise(2)]).astype(np.float32)
+        spans = detect_speech(samples)
+
+        assert len(spans) == 1
+        start, end = spans[0]
+        assert 1.7 <= start <= 2.2 and 4.8 <= end <= 5.2
+
+    def test_speech_over_music_detected(self):
+        samples = (speech_like(3) + 0.3 * music(3)).astype(np.float32)
+        assert speech_summary(detect_speech(samples), 3)['has_speech'] is True
+
+    def test_summary(self):
+        summary = speech_summary([(0.5, 1.0), (2.0, 2.3)], 10)
+        assert summary == {'has_speech': False, 'speech_seconds': 0.8, 'duration_seconds': 10.0,
+                           'spans': [[0.5, 1.0], [2.0, 2.3]]}
+
+
+class TestDecodeAudio:
+    """Tests for decode_audio() / detect_speech_in_file() (ffmpeg mocked)."""
+
+    def ffmpeg(self, pcm, returncode=0):
+        process = MagicMock(returncode=returncode)
+        process.__enter__.return_value = process
+        process.stdout = io.BytesIO(pcm)
+        process.wait.return_value = returncode
+        return process
+
+    def test_decodes_pcm_from_pipe(self):
+        pcm = np.array([0, 16384, -32768], dtype='<i2').tobytes()
+        with patch('shared.audio_utils.subprocess.Popen', return_value=self.ffmpeg(pcm)) as popen:
+            samples = decode_audio('/tmp/a.mp3')
+
+        assert samples.dtype == np.float32 and samples.tolist() == [0.0, 0.5, -1.0]
+        args = popen.call_args.args[0]
+        assert args[args.index('-ar') + 1] == '16000' and args[args.index('-ac') + 1] == '1'
+
+    def test_blocks_split_mid_sample_and_buffer_grows(self):
+        pcm = np.arange(-5000, 5000, dtype='<i2')
+        with patch('shared.audio_utils.DECODE_BLOCK_BYTES', 7), \
+                patch('shared.audio_utils.subprocess.Popen', return_value=self.ffmpeg(pcm.tobytes())):
+            samples = decode_audio('/tmp/a.mp3', sample_rate=100, duration=1)
+
+        np.testing.assert_array_equal(samples, pcm.astype(np.float32) / 32768.0)
+
+    def test_undecodable_file_is_unknown(self):
+        with patch('shared.audio_utils.subprocess.Popen', return_value=self.ffmpeg(b'', returncode=1)):
+            assert detect_speech_in_file('/tmp/a.mp3') is None
+        with patch('shared.audio_utils.subprocess.Popen', side_effect=OSError('ffmpeg missing')):
+            assert decode_audio('/tmp/a.mp3') is None
+
+    def test_probe_duration(self):
+        with patch('shared.audio_utils.subprocess.run',
+                   return_value=MagicMock(stdout='{"format": {"duration": "3600.5"}}')):
+            assert probe_duration('https://cdn/ep.mp3') == 3600.5
+        with patch('shared.audio_utils.subprocess.run', side_effect=subprocess.CalledProcessError(1, 'ffprobe')):
+            assert probe_duration('https://cdn/ep.mp3') is None
+
+
+class TestPackSpeech:
+    """Tests for pack_speech_audio() and the offset map."""
+
+    def test_packs_spans_with_gaps(self):
+        samples = np.arange(20 * SAMPLE_RATE, dtype=np.float32) / (40 * SAMPLE_RATE)
+        with patch('shared.audio_utils.subprocess.run') as run:
+            packed = pack_speech_audio(samples, [(2.0, 4.0), (10.0, 11.0)], '/tmp/p.flac', gap_seconds=0.5)
+
+        assert packed['packed_seconds'] == 3.5 and packed['original_seconds'] == 20.0
+        assert packed['offset_map'] == [[0.0, 2.0, 2.0], [2.5, 3.5, 10.0]]
+        pcm = np.frombuffer(run.call_args.kwargs['input'], dtype='<i2')
+        assert len(pcm) == int(3.5 * SAMPLE_RATE)
+        assert pcm[int(2.25 * SAMPLE_RATE)] == 0  # inserted pause
+
+    def test_not_worth_packing(self):
+        samples = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+        with patch('shared.audio_utils.subprocess.run') as run:
+            assert pack_speech_audio(samples, [(0.2, 9.8)], '/tmp/p.flac') is None
+            assert pack_speech_audio(samples, [], '/tmp/p.flac') is None
+        run.assert_not_called()
+
+    def test_times_map_back(self):
+        offset_map = [[0.0, 2.0, 2.0], [2.5, 3.5, 10.0]]
+        assert map_to_original(1.0, offset_map) == 3.0
+        assert map_to_original(3.0, offset_map) == 10.5
+        assert map_to_original(2.2, offset_map) == 4.0  # in the pause
+        assert map_to_original(7.0, []) == 7.0
+
+        words = remap_words([{'text': 'a', 'start': 500, 'end': 900}, {'text': 'b', 'start': 2600, 'end': 3100}],
+                            offset_map)
+        assert [(w['start'], w['end']) for w in words] == [(2500, 2900), (10100, 10600)]
+
+
+class TestTranscribeAudioSkipsMusic:
+    """transcribe_audio() does not upload clips without speech."""
+
+    def test_no_speech_skips_assemblyai(self, transcribe_audio):
+        from tests.conftest import _video_enricher_module
+
+        with patch.object(_video_enricher_module, 'decode_audio', return_value=np.zeros(15 * SAMPLE_RATE)), \
+                patch.object(_video_enricher_module.aai, 'Transcriber') as transcriber:
+            result = transcribe_audio('/tmp/a.mp3', api_key='key')
+
+        transcriber.assert_not_called()
+        assert result['skipped'] == 'no_speech'
+        assert result['text'] == '' and result['error'] is None
+
+    def test_speech_is_transcribed_with_spans(self, transcribe_audio):
+        from tests.conftest import _video_enricher_module
+
+        transcript = MagicMock(text='Hello there.', words=[], status='completed')
+        with patch.object(_video_enricher_module, 'decode_audio', return_value=np.zeros(15 * SAMPLE_RATE)), \
+                patch.object(_video_enricher_module, 'find_speech_spans', return_value=[(2.0, 10.0)]), \
+                patch.object(_video_enricher_module.aai, 'Transcriber') as transcriber:
+            transcriber.return_value.transcribe.return_value = transcript
+            result = transcribe_audio('/tmp/a.mp3', api_key='key', trim_silence=False)
+
+        assert result['text'] == 'Hello there.'
+        assert result['speech']['spans'] == [[2.0, 10.0]]
+
+    def test_silence_trimmed_and_words_remapped(self, transcribe_audio, tmp_path):
+        from tests.conftest import _video_enricher_module
+
+        word = MagicMock(text='Hello', start=1000, end=1400)
+        transcript = MagicMock(text='Hello', words=[word], status='completed', audio_duration=8)
+        audio_path = str(tmp_path / 'a.mp3')
+        with patch.object(_video_enricher_module, 'decode_audio', return_value=np.zeros(60 * SAMPLE_RATE)), \
+                patch.object(_video_enricher_module, 'find_speech_spans', return_value=[(20.0, 28.0)]), \
+                patch('shared.audio_utils.subprocess.run'), \
+                patch.object(_video_enricher_module.aai, 'Transcriber') as transcriber:
+            transcriber.return_value.transcribe.return_value = transcript
+            result = transcribe_audio(audio_path, api_key='key', include_words=True)
+
+        transcriber.return_value.transcribe.assert_called_once_with(str(tmp_path / 'a_speech.flac'))
+        assert result['words'] == [{'text': 'Hello', 'start': 21000, 'end': 21400}]
+        assert result['duration_seconds'] == 60.0
+        assert result['trimmed'] == {'original_seconds': 60.0, 'packed_seconds': 8.0}
@@ -0,0 +1,79 @@
+"""
+Unit tests for shared/batch.py per-host batch scheduling.
+"""
+
+import threading
+import time
+
+import pytest
+
+from shared.batch import run_per_host
+
+
+def tracking_fn(delay=0.05):
+    """Work function recording peak concurrency overall and per host."""
+    state = {'active': 0, 'peak': 0, 'per_host': {}, 'peak_per_host': {}, 'starts': {}}
+    lock = threading.Lock()
+
+    def fn(item):
+        host = item.split('/')[0]
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            state['per_host'][host] = state['per_host'].get(host, 0) + 1
+            state['peak_per_host'][host] = max(state['peak_per_host'].get(host, 0), state['per_host'][host])
+            state['starts'].setdefault(host, []).append(time.monotonic())
+        time.sleep(delay)
+        with lock:
+            state['active'] -= 1
+            state['per_host'][host] -= 1
+        return item.upper()
+
+    return fn, state
+
+
+def host_of(item):
+    return item.split('/')[0]
+
+
+class TestRunPerHost:
+    """Tests for run_per_host() limits and result streaming."""
+
+    def test_all_results_returned_with_indexes(self):
+        items = ['a/1', 'b/1', 'a/2', 'c/1']
+        results = {index: result for index, result, error in run_per_host(items, str.upper, host_of)}
+        assert results == {0: 'A/1', 1: 'B/1', 2: 'A/2', 3: 'C/1'}
+
+    def test_global_and_per_host_limits(self):
+        fn, state = tracking_fn()
+        items = [f'busy/{i}' for i in range(6)] + [f'other{i}/x' for i in range(6)]
+        list(run_per_host(items, fn, host_of, max_workers=4, per_host=2))
+        assert state['peak'] <= 4
+        assert state['peak_per_host']['busy'] == 2
+
+    def test_busy_host_does_not_block_others(self):
+        fn, state = tracking_fn(delay=0.1)
+        items = [f'busy/{i}' for i in range(4)] + ['quick/1']
+        order = [index for index, _, _ in run_per_host(items, fn, host_of, max_workers=4, per_host=1)]
+        # quick/1 starts alongside the first busy item instead of after all four
+        assert order.index(4) <= 1
+
+    def test_min_interval_between_starts(self):
+        fn, state = tracking_fn(delay=0)
+        list(run_per_host(['h/1', 'h/2', 'h/3'], fn, host_of, per_host=3, min_interval=0.05))
+        starts = state['starts']['h']
+        assert all(b - a >= 0.045 for a, b in zip(starts, starts[1:]))
+
+    def test_errors_are_yielded(self):
+        def fn(item):
+            if item == 'bad/1':
+                raise ValueError('boom')
+            return item
+
+        outcomes = {index: (result, error) for index, result, error in run_per_host(['ok/1', 'bad/1'], fn, host_of)}
+        assert outcomes[0] == ('ok/1', None)
+        assert outcomes[1][0] is None
+        assert isinstance(outcomes[1][1], ValueError)
+
+    def test_empty_items(self):
+        assert list(run_per_host([], str.upper, host_of)) == []
@@ -0,0 +1,185 @@
+"""
+Unit tests for shared/chunked_transcription.py parallel chunked transcription.
+"""
+
+import threading
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from shared.audio_utils import SAMPLE_RATE
+from shared.chunked_transcription import (
+    ChunkTranscriptionError, plan_chunks, silence_cut_points, stitch_chunks,
+    transcribe_in_chunks, transcribe_with_retry
+)
+
+
+def words(*items):
+    return [{'text': text, 'start': start, 'end': end} for text, start, end in items]
+
+
+class TestPlanChunks:
+    """Tests for plan_chunks() boundaries."""
+
+    def test_cut_points_are_pause_midpoints(self):
+        assert silence_cut_points([(0.0, 4.0), (5.0, 9.0), (9.5, 12.0)]) == [4.5, 9.25]
+
+    def test_boundaries_fall_in_pauses(self):
+        spans = [(i * 10.0, i * 10.0 + 9.0) for i in range(100)]  # a 1 s pause every 10 s
+        chunks = plan_chunks(1000, spans, target_seconds=300)
+
+        assert chunks[0][0] == 0 and chunks[-1][1] == 1000
+        for _, end in chunks[:-1]:
+            assert end % 10 == 9.5
+
+
+class TestStitchChunks:
+    """Tests for stitch_chunks() ordering and edge dedupe."""
+
+    def test_words_shifted_and_overlap_deduped(self):
+        chunks = [
+            {'start': 0.0, 'end': 10.0, 'offset': 0.0,
+             'result': {'text': 'one two three', 'confidence': 0.9, 'language': 'en',
+                        'words': words(('one', 1000, 1400), ('two', 9000, 9600), ('three', 10100, 10400))}},
+            {'start': 10.0, 'end': 20.0, 'offset': 9.5,
+             'result': {'text': 'two three four', 'confidence': 0.7, 'language': 'en',
+                        'words': words(('two', 0, 100), ('three', 600, 900), ('four', 5000, 5400))}},
+        ]
+        stitched = stitch_chunks(chunks)
+
+        assert stitched['text'] == 'one two three four'
+        assert [(w['text'], w['start']) for w in stitched['words']] == [
+            ('one', 1000), ('two', 9000), ('three', 10100), ('four', 14500)]
+        assert stitched['confidence'] == pytest.approx((0.9 * 2 + 0.7 * 2) / 4)
+        assert stitched['language'] == 'en'
+
+    def test_repeated_edge_word_dropped(self):
+        chunks = [
+            {'start': 0.0, 'end': 10.0, 'offset': 0.0,
+             'result': {'words': words(('okay', 9700, 10050))}},
+            {'start': 10.0, 'end': 20.0, 'offset': 9.5,
+             'result': {'words': words(('okay', 500, 700), ('so', 1000, 1200))}},
+        ]
+        assert stitch_chunks(chunks)['text'] == 'okay so'
+
+
+class TestTranscribeWithRetry:
+    """Tests for per-chunk retry."""
+
+    def test_retries_until_success(self):
+        transcribe = MagicMock(side_effect=[RuntimeError('timeout'), {'error': 'busy'}, {'text': 'ok', 'error': None}])
+        with patch('shared.chunked_transcription.time.sleep') as sleep:
+            assert transcribe_with_retry(transcribe, 'c.flac', retries=2)['text'] == 'ok'
+        assert transcribe.call_count == 3
+        assert [c.args[0] for c in sleep.call_args_list] == [2.0, 4.0]
+
+    def test_gives_up_after_retries(self):
+        transcribe = MagicMock(return_value={'error': 'bad audio'})
+        with patch('shared.chunked_transcription.time.sleep'), pytest.raises(ChunkTranscriptionError, match='bad audio'):
+            transcribe_with_retry(transcribe, 'c.flac', retries=1)
+        assert transcribe.call_count == 2
+
+
+class TestTranscribeInChunks:
+    """Tests for transcribe_in_chunks() end to end (ffmpeg mocked)."""
+
+    def test_chunks_run_concurrently_and_stitch_in_order(self, tmp_path):
+        samples = np.zeros(40 * SAMPLE_RATE, dtype=np.float32)
+        spans = [(i * 5.0, i * 5.0 + 4.5) for i in range(8)]
+        in_flight, peak, lock = [0], [0], threading.Lock()
+        failed_once = set()
+
+        def transcribe(path):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            threading.Event().wait(0.05)  # time.sleep is patched below
+            try:
+                index = int(path[-8:-5])
+                if index == 1 and index not in failed_once:
+                    failed_once.add(index)
+                    raise RuntimeError('upload failed')
+                return {'text': f"part{index}", 'words': words((f"part{index}", 1000, 1500)), 'error': None}
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        with patch('shared.chunked_transcription.write_flac', side_effect=lambda s, path, sr: path), \
+                patch('shared.chunked_transcription.time.sleep'):
+            result = transcribe_in_chunks(samples, spans, transcribe, str(tmp_path), target_seconds=10)
+
+        assert result['chunks'] == 4
+        assert result['text'] == 'part0 part1 part2 part3'
+        assert [w['start'] for w in result['words']] == [1000, 10250, 20250, 30250]
+        assert failed_once == {1}
+        assert peak[0] > 1
+
+
+class TestTranscribeAudioUrl:
+    """transcribe_audio_url() picks one job or chunks by duration."""
+
+    def test_short_episode_is_one_job(self, transcribe_audio_url):
+        from tests.conftest import _webpage_enricher_module
+
+        single = {'text': 'hi', 'words': [], 'confidence': 0.9, 'audio_duration_seconds': 60, 'error': None}
+        with patch.object(_webpage_enricher_module, 'ASSEMBLYAI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module, 'decode_audio') as decode, \
+                patch.object(_webpage_enricher_module, 'assemblyai_transcribe', return_value=single) as job:
+            result = transcribe_audio_url('https://cdn/ep.mp3', duration_seconds=60)
+
+        decode.assert_not_called()
+        job.assert_called_once_with('https://cdn/ep.mp3')
+        assert result['success'] is True and result['text'] == 'hi'
+        assert result['word_count'] == 0 and 'words' not in result
+
+    def test_unknown_length_probed_before_decoding(self, transcribe_audio_url):
+        from tests.conftest import _webpage_enricher_module
+
+        single = {'text': 'hi', 'words': [], 'confidence': 0.9, 'audio_duration_seconds': 300, 'error': None}
+        with patch.object(_webpage_enricher_module, 'ASSEMBLYAI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module, 'probe_duration', return_value=300.0) as probe, \
+                patch.object(_webpage_enricher_module, 'decode_audio') as decode, \
+                patch.object(_webpage_enricher_module, 'assemblyai_transcribe', return_value=single) as job:
+            result = transcribe_audio_url('https://cdn/ep.mp3')
+
+        probe.assert_called_once_with('https://cdn/ep.mp3')
+        decode.assert_not_called()
+        job.assert_called_once_with('https://cdn/ep.mp3')
+        assert result['success'] is True
+
+    def test_long_episode_is_chunked(self, transcribe_audio_url):
+        from tests.conftest import _webpage_enricher_module
+
+        stitched = {'text': 'long talk', 'words': [], 'confidence': 0.8, 'language': 'en', 'chunks': 4}
+        samples = np.zeros(1200 * SAMPLE_RATE, dtype=np.int8)
+        with patch.object(_webpage_enricher_module, 'ASSEMBLYAI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module, 'decode_audio', return_value=samples), \
+                patch.object(_webpage_enricher_module, 'detect_speech', return_value=[]), \
+                patch.object(_webpage_enricher_module, 'transcribe_in_chunks', return_value=stitched) as chunked:
+            result = transcribe_audio_url('https://cdn/ep.mp3', duration_seconds=1200)
+
+        chunked.assert_called_once()
+        assert result['success'] is True
+        assert result['chunks'] == 4 and result['audio_duration_seconds'] == 1200.0
+
+
+class TestTranscribeAudioChunked:
+    """transcribe_audio() chunks long audio instead of packing it."""
+
+    def test_long_audio_is_chunked(self, transcribe_audio):
+        from tests.conftest import _video_enricher_module
+
+        stitched = {'text': 'a b', 'words': words(('a', 0, 100), ('b', 900000, 900100)),
+                    'confidence': 0.9, 'language': 'en', 'chunks': 3}
+        with patch.object(_video_enricher_module, 'decode_audio', return_value=np.zeros(1000 * SAMPLE_RATE)), \
+                patch.object(_video_enricher_module, 'find_speech_spans', return_value=[(0.0, 500.0), (600.0, 1000.0)]), \
+                patch.object(_video_enricher_module, 'pack_speech_audio') as pack, \
+                patch.object(_video_enricher_module, 'transcribe_in_chunks', return_value=stitched):
+            result = transcribe_audio('/tmp/a.mp3', api_key='key')
+
+        pack.assert_not_called()
+        assert result['text'] == 'a b' and result['chunks'] == 3
+        assert result['word_count'] == 2 and result['duration_seconds'] == 1000.0
+        assert result['error'] is None
+        assert 'words' not in result  # kept internal unless include_words
@@ -0,0 +1,72 @@
+"""
+Unit tests for shared/content_selector.py token-budgeted content selection.
+"""
+
+import random
+
+from shared.content_selector import GAP_MARKER, score_spans, select_content, split_spans
+from shared.long_document import estimate_tokens
+
+TOPIC = 'rust borrow checker lifetimes ownership references mutable shared compiler memory safety traits'.split()
+SPAM = "Celebrity chef opens bakery in Paris. Ten best beaches for summer holidays. Stock markets rally on earnings."
+
+
+def article(sentences=200, seed=5):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(TOPIC) for _ in range(10)).capitalize() + '.' for _ in range(sentences)]
+
+
+class TestSplitSpans:
+    """Tests for split_spans()"""
+
+    def test_spans_group_whole_sentences(self):
+        spans = split_spans(' '.join(article(50)), span_tokens=40)
+        assert len(spans) > 5
+        assert all(span.endswith('.') for span in spans)
+
+    def test_repeated_sentences_kept_once(self):
+        spans = split_spans("Share this post. Real content here. Share this post. More content.")
+        assert ' '.join(spans) == "Share this post. Real content here. More content."
+
+
+class TestScoreSpans:
+    """Tests for score_spans()"""
+
+    def test_position_breaks_ties_toward_ends(self):
+        scores = score_spans(['alpha beta gamma.'] * 5)
+        assert scores[0] == scores[-1] > scores[1] > scores[2]
+
+    def test_off_topic_span_scores_lowest(self):
+        sentences = article(60)
+        spans = split_spans(' '.join(sentences[:30] + [SPAM] + sentences[30:]))
+        scores = score_spans(spans)
+        spam_index = next(i for i, span in enumerate(spans) if 'Celebrity' in span)
+        assert scores[spam_index] == scores.min()
+
+    def test_empty(self):
+        assert score_spans([]).size == 0
+
+
+class TestSelectContent:
+    """Tests for select_content()"""
+
+    def test_text_within_budget_unchanged(self):
+        text = "A short page. Nothing to cut."
+        assert select_content(text, token_budget=100) == text
+        assert select_content('', token_budget=100) == ''
+
+    def test_fills_budget_in_document_order(self):
+        sentences = article()
+        text = ' '.join(sentences[:100] + [SPAM] + sentences[100:])
+        selected = select_content(text, token_budget=600)
+
+        assert estimate_tokens(selected) <= 600
+        assert estimate_tokens(selected) > 400
+        assert 'Celebrity' not in selected
+        pieces = selected.split(GAP_MARKER)
+        positions = [text.index(piece) for piece in pieces]
+        assert positions == sorted(positions)
+
+    def test_single_oversized_span_is_cut(self):
+        text = 'word ' * 5000
+        assert estimate_tokens(select_content(text, token_budget=50)) <= 50
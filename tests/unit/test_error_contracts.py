@@ -1260,6 +1260,22 @@ class TestTranscriptionValidation:
         assert result['valid'] is False
         assert any('error' in err.lower() for err in result['errors'])
 
+    def test_skipped_no_speech_passes(self):
+        """A clip skipped by local speech detection is valid with empty text."""
+        from shared.analysis_utils import validate_transcription
+
+        transcription = {
+            'text': '',
+            'skipped': 'no_speech',
+            'speech': {'has_speech': False, 'speech_seconds': 0.0, 'duration_seconds': 15.0, 'spans': []},
+            'error': None
+        }
+
+        result = validate_transcription(transcription)
+
+        assert result['valid'] is True
+        assert len(result['errors']) == 0
+
 
 class TestVideoEnrichmentValidation:
     """Tests for complete video enrichment validation."""
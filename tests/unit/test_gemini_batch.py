@@ -0,0 +1,343 @@
+"""
+Unit tests for shared/gemini_batch.py deferred Gemini batch mode.
+"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import responses
+
+from shared.cache_store import MemoryStore, StoreConflict
+from shared.gemini_batch import (
+    BatchQueueUnavailable,
+    GeminiBatchQueue,
+    LocalBatchBackend,
+    file_part,
+    get_gemini_batch_queue,
+    text_part,
+)
+
+ARTICLE = "Python tips for writing faster loops and cleaner code. " * 10
+
+
+def make_queue(**backend_kwargs):
+    backend = LocalBatchBackend(**backend_kwargs)
+    return GeminiBatchQueue('test', backend=backend, store=MemoryStore()), backend
+
+
+class InterleavingStore(MemoryStore):
+    """MemoryStore that runs another instance's work just before the next conditional write."""
+
+    def __init__(self):
+        super().__init__()
+        self.before_write = None
+
+    def _run_hook(self):
+        hook, self.before_write = self.before_write, None
+        if hook:
+            hook()
+
+    def set_if_version(self, key, value, version, ttl=None):
+        self._run_hook()
+        super().set_if_version(key, value, version, ttl)
+
+    def delete_if_version(self, key, version):
+        self._run_hook()
+        super().delete_if_version(key, version)
+
+
+def echo_finalize(response, request):
+    return {'text': response['text'], 'error': response['error'], 'context': request['context']}
+
+
+class TestGeminiBatchQueue:
+    """Tests for GeminiBatchQueue enqueue / submit / collect."""
+
+    def test_enqueue_replaces_same_key(self):
+        queue, _ = make_queue()
+        queue.enqueue('a', [text_part('first')])
+        queue.enqueue('b', [text_part('other')])
+        result = queue.enqueue('a', [text_part('second')])
+
+        assert result == {'batch_key': 'a'}
+        assert [(r['key'], r['contents'][0]['text']) for r in queue.pending()] == [('b', 'other'), ('a', 'second')]
+
+    def test_submit_sends_one_job_and_clears_queue(self):
+        queue, backend = make_queue()
+        queue.enqueue('a', [file_part('files/1', 'video/mp4'), text_part('describe')])
+        queue.enqueue('b', [text_part('summarize')])
+
+        jobs = queue.submit()
+
+        assert len(jobs) == 1
+        assert len(backend.jobs[jobs[0]]['requests']) == 2
+        assert queue.pending() == []
+        assert queue.open_jobs() == jobs
+        assert queue.submit() == []
+
+    def test_submit_splits_large_queues(self):
+        queue, backend = make_queue()
+        for i in range(5):
+            queue.enqueue(f"k{i}", [text_part(str(i))])
+        with patch('shared.gemini_batch.GEMINI_BATCH_MAX_REQUESTS', 2):
+            jobs = queue.submit()
+        assert [len(backend.jobs[j]['requests']) for j in jobs] == [2, 2, 1]
+
+    def test_collect_waits_for_running_jobs(self):
+        queue, _ = make_queue(respond=lambda contents: contents[0]['text'].upper(), polls_until_done=1)
+        queue.enqueue('a', [text_part('hello')], context={'id': 1})
+        job = queue.submit()[0]
+
+        first = queue.collect(echo_finalize)
+        assert first == {'jobs': {job: 'JOB_STATE_RUNNING'}, 'results': []}
+        assert queue.result('a') is None
+
+        second = queue.collect(echo_finalize)
+        assert second['jobs'] == {job: 'JOB_STATE_SUCCEEDED'}
+        assert second['results'] == [{'key': 'a', 'result': {'text': 'HELLO', 'error': None, 'context': {'id': 1}}}]
+        assert queue.result('a')['text'] == 'HELLO'
+        assert queue.open_jobs() == []
+
+    def test_per_request_errors_fan_out(self):
+        def respond(contents):
+            if contents[0]['text'] == 'bad':
+                raise RuntimeError('blocked')
+            return 'ok'
+
+        queue, _ = make_queue(respond=respond)
+        queue.enqueue('good', [text_part('fine')])
+        queue.enqueue('bad', [text_part('bad')])
+        queue.submit()
+        results = {r['key']: r['result'] for r in queue.collect(echo_finalize)['results']}
+
+        assert results['good']['text'] == 'ok'
+        assert results['bad']['error'] == 'blocked'
+
+    def test_failed_job_reports_error_for_every_request(self):
+        queue, backend = make_queue()
+        queue.enqueue('a', [text_part('x')])
+        queue.submit()
+        backend.jobs.clear()  # the backend no longer knows the job
+
+        results = queue.collect(echo_finalize)['results']
+        assert results[0]['key'] == 'a'
+        assert 'Unknown batch job' in results[0]['result']['error']
+
+
+class TestGeminiBatchQueueAcrossInstances:
+    """Queues on different instances sharing one store never lose each other's writes."""
+
+    def make_pair(self, **backend_kwargs):
+        store = InterleavingStore()
+        backend = LocalBatchBackend(**backend_kwargs)
+        return (GeminiBatchQueue('test', backend=backend, store=store),
+                GeminiBatchQueue('test', backend=backend, store=store), store, backend)
+
+    def test_concurrent_enqueue_keeps_both(self):
+        one, other, store, _ = self.make_pair()
+        store.child('pending').before_write = lambda: other.enqueue('b', [text_part('b')])
+        one.enqueue('a', [text_part('a')])
+
+        assert sorted(r['key'] for r in one.pending()) == ['a', 'b']
+
+    def test_requests_are_separate_entries(self):
+        queue, _ = make_queue()
+        queue.enqueue('a', [text_part('a' * 1000)])
+        queue.enqueue('b', [text_part('b')])
+
+        # Enqueueing never rewrites another request's entry, however long the backlog
+        assert queue.store.get('pending') is None
+        assert len(queue.pending_store.scan()) == 2
+
+    def test_requeue_during_submit_keeps_newer_request(self):
+        one, other, store, backend = self.make_pair()
+        one.enqueue('a', [text_part('old')])
+        store.child('pending').before_write = lambda: other.enqueue('a', [text_part('new')])
+
+        jobs = one.submit()
+
+        submitted = [r['contents'][0]['text'] for job in jobs for r in backend.jobs[job]['requests']]
+        assert submitted == ['new']
+        assert one.pending() == []
+
+    def test_enqueue_during_submit_is_not_dropped(self):
+        one, other, store, backend = self.make_pair()
+        one.enqueue('a', [text_part('a')])
+        store.before_write = lambda: other.enqueue('b', [text_part('b')])
+
+        jobs = one.submit()
+
+        submitted = [r['key'] for job in jobs for r in backend.jobs[job]['requests']]
+        assert sorted(submitted) == ['a', 'b']
+        assert one.pending() == []
+        assert len(one.open_jobs()) == len(jobs)
+
+    def test_failed_submit_puts_requests_back(self):
+        queue, backend = make_queue()
+        queue.enqueue('a', [text_part('a')])
+        backend.submit = MagicMock(side_effect=RuntimeError('quota'))
+
+        with pytest.raises(RuntimeError):
+            queue.submit()
+        assert [r['key'] for r in queue.pending()] == ['a']
+        assert queue.open_jobs() == []
+
+    def test_job_finalized_once_by_concurrent_collectors(self):
+        one, other, store, _ = self.make_pair(respond=lambda contents: 'ok')
+        one.enqueue('a', [text_part('a')])
+        one.submit()
+        finalized = []
+
+        def finalize(response, request):
+            finalized.append(request['key'])
+            return echo_finalize(response, request)
+
+        store.before_write = lambda: other.collect(finalize)
+        one.collect(finalize)
+
+        assert finalized == ['a']
+        assert one.open_jobs() == []
+
+    def test_queue_requires_shared_store(self):
+        with patch('shared.gemini_batch.shared_store_configured', return_value=False), \
+                pytest.raises(BatchQueueUnavailable):
+            get_gemini_batch_queue('test')
+
+
+class TestDeferredWebpageAnalysis:
+    """generate_ai_analysis(defer=True) and the webpage_ai_batch endpoint."""
+
+    def test_deferred_analysis_round_trip(self, generate_ai_analysis, webpage_ai_batch,
+                                          mock_flask_request, local_gemini_batch):
+        from tests.conftest import _webpage_enricher_module
+
+        local_gemini_batch.respond = lambda contents: '{"title": "Tips", "summary": "S", "analysis": "A"}'
+        model = MagicMock()
+        with patch.object(_webpage_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module.genai, 'configure'), \
+                patch.object(_webpage_enricher_module.genai, 'GenerativeModel', return_value=model):
+            deferred = generate_ai_analysis("https://a.com/post", "Tips | A", ARTICLE, 'article', defer=True)
+
+            assert deferred['deferred'] is True
+            assert deferred['batch_key'] == "https://a.com/post"
+            assert deferred['error'] is None
+            model.generate_content.assert_not_called()
+
+            body, status, _ = webpage_ai_batch(mock_flask_request(json_data={'action': 'submit'}))
+            assert status == 200
+            assert len(json.loads(body)['submitted_jobs']) == 1
+
+            body, _, _ = webpage_ai_batch(mock_flask_request(json_data={'action': 'collect'}))
+            collected = json.loads(body)
+            assert collected['results'][0]['key'] == "https://a.com/post"
+            assert collected['results'][0]['result']['summary'] == 'S'
+            assert collected['pending'] == 0 and collected['open_jobs'] == []
+
+            # The batch answer is memoized: a later synchronous call makes no Gemini call
+            again = generate_ai_analysis("https://a.com/post", "Tips | A", ARTICLE, 'article')
+            model.generate_content.assert_not_called()
+            assert again['summary'] == 'S'
+
+    @responses.activate
+    def test_defer_ai_option_marks_response_deferred(self, enrich_webpage, mock_flask_request, local_gemini_batch):
+        from tests.conftest import _webpage_enricher_module
+
+        url = "https://example.com/deferred"
+        responses.add(responses.GET, url, status=200, content_type="text/html",
+                      body=f"<html><head><title>Deferred</title></head><body><article><p>{ARTICLE}</p></article></body></html>")
+        request = mock_flask_request(json_data={'url': url, 'options': {'defer_ai': True}})
+        with patch.object(_webpage_enricher_module, 'GEMINI_API_KEY', 'key'):
+            body, status, _ = enrich_webpage(request)
+
+        result = json.loads(body)
+        assert status == 200
+        assert result['ai_status'] == 'deferred'
+        assert result['ai_batch_key'] == url
+        assert 'error' not in result
+
+    def test_failed_enqueue_is_reported_not_raised(self, generate_ai_analysis, local_gemini_batch):
+        from tests.conftest import _webpage_enricher_module
+
+        queue = MagicMock()
+        queue.enqueue.side_effect = StoreConflict('pending: 10 conflicting writes')
+        with patch.object(_webpage_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module, 'get_gemini_batch_queue', return_value=queue):
+            result = generate_ai_analysis("https://a.com/post", "Tips", ARTICLE, 'article', defer=True)
+
+        assert 'Could not queue AI analysis' in result['error']
+        assert 'deferred' not in result
+
+    def test_unknown_action_returns_400(self, webpage_ai_batch, mock_flask_request, local_gemini_batch):
+        _, status, _ = webpage_ai_batch(mock_flask_request(json_data={'action': 'explode'}))
+        assert status == 400
+
+    def test_defer_ai_without_shared_store_returns_400(self, enrich_webpage, webpage_ai_batch, mock_flask_request):
+        body, status, _ = enrich_webpage(mock_flask_request(json_data={
+            'url': 'https://example.com/a', 'options': {'defer_ai': True},
+        }))
+        assert status == 400
+        assert 'CACHE_BUCKET' in json.loads(body)['error']
+
+        _, status, _ = webpage_ai_batch(mock_flask_request(json_data={'action': 'status'}))
+        assert status == 400
+
+
+class TestDeferredVideoAnalysis:
+    """analyze_video_with_gemini(defer=True) and the video_ai_batch endpoint."""
+
+    def test_deferred_video_round_trip(self, analyze_video_with_gemini, video_ai_batch,
+                                       mock_flask_request, local_gemini_batch, tmp_path):
+        from tests.conftest import _video_enricher_module
+
+        video = tmp_path / 'v.mp4'
+        video.write_bytes(b'video bytes')
+
+        uploaded = MagicMock(uri='https://files/abc', mime_type='video/mp4')
+        uploaded.name = 'files/abc'
+        uploaded.state.name = 'ACTIVE'
+        analysis = '\n'.join(f"{i}. **{name}**\nText." for i, name in enumerate(
+            _video_enricher_module.REQUIRED_ANALYSIS_SECTIONS, 1))
+        local_gemini_batch.respond = lambda contents: analysis
+
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_video_enricher_module.genai, 'configure'), \
+                patch.object(_video_enricher_module.genai, 'upload_file', return_value=uploaded), \
+                patch.object(_video_enricher_module.genai, 'delete_file') as delete_file, \
+                patch.object(_video_enricher_module.genai, 'GenerativeModel') as model:
+            result = analyze_video_with_gemini(str(video), defer=True, batch_key='https://tiktok.com/@a/video/1')
+
+            assert result['deferred'] is True
+            assert result['analysis'] is None
+            model.assert_not_called()
+            delete_file.assert_not_called()
+
+            video_ai_batch(mock_flask_request(json_data={'action': 'submit'}))
+            job = next(iter(local_gemini_batch.jobs.values()))
+            assert job['requests'][0]['config']['response_mime_type'] == 'application/json'
+            body, status, _ = video_ai_batch(mock_flask_request(json_data={'action': 'collect'}))
+
+        record = body['results'][0]['result']
+        assert status == 200
+        assert record['video_key'] == 'https://tiktok.com/@a/video/1'
+        assert record['validation']['valid'] is True
+        assert local_gemini_batch.jobs
+        delete_file.assert_not_called()  # the file registry owns the upload
+
+    def test_deferred_analysis_is_not_a_validation_error(self):
+        from shared.analysis_utils import validate_video_enrichment
+
+        result = validate_video_enrichment({'gemini_analysis': {'analysis': None, 'deferred': True, 'error': None}})
+        assert result['valid'] is True
+
+    def test_defer_analysis_without_shared_store_returns_400(self, mock_flask_request):
+        from tests.conftest import _video_enricher_module
+
+        with patch.object(_video_enricher_module, 'process_video') as process:
+            body, status, _ = _video_enricher_module.download_and_store(mock_flask_request(json_data={
+                'video_url': 'https://www.tiktok.com/@a/video/1', 'defer_analysis': True,
+            }))
+
+        assert status == 400
+        assert 'CACHE_BUCKET' in body['error']
+        process.assert_not_called()
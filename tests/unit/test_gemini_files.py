@@ -0,0 +1,238 @@
+"""
+Unit tests for shared/gemini_files.py content-addressed Gemini file reuse.
+"""
+
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from shared.cache_store import MemoryStore
+from shared.gemini_files import GeminiFileError, GeminiFileRegistry
+
+
+def remote(name, state='ACTIVE'):
+    f = MagicMock(uri=f"https://files/{name}", mime_type='video/mp4')
+    f.name = name
+    f.state.name = state
+    return f
+
+
+class FakeClient:
+    """Stand-in for google.generativeai's File API functions."""
+
+    def __init__(self, processing_polls=0, final_state='ACTIVE'):
+        self.files = {}
+        self.uploads = 0
+        self.deleted = []
+        self.processing_polls = processing_polls
+        self.final_state = final_state
+
+    def upload_file(self, path):
+        self.uploads += 1
+        name = f"files/{self.uploads}"
+        self.files[name] = {'polls': 0}
+        return remote(name, 'PROCESSING' if self.processing_polls else self.final_state)
+
+    def get_file(self, name):
+        if name not in self.files:
+            raise LookupError(f"{name} not found")
+        entry = self.files[name]
+        entry['polls'] += 1
+        return remote(name, 'PROCESSING' if entry['polls'] < self.processing_polls else self.final_state)
+
+    def delete_file(self, name):
+        self.deleted.append(name)
+        self.files.pop(name, None)
+
+
+def make_file(tmp_path, name='v.mp4', data=b'video bytes'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def make_registry(client, **kwargs):
+    return GeminiFileRegistry(client=client, store=MemoryStore(), poll_interval=0, **kwargs)
+
+
+class TestGeminiFileRegistry:
+    """Tests for GeminiFileRegistry acquire / evict."""
+
+    def test_same_bytes_uploaded_once(self, tmp_path):
+        client = FakeClient(processing_polls=2)
+        registry = make_registry(client)
+
+        first, reused_first = registry.acquire(make_file(tmp_path, 'a.mp4'))
+        second, reused_second = registry.acquire(make_file(tmp_path, 'copy.mp4'))
+
+        assert client.uploads == 1
+        assert (reused_first, reused_second) == (False, True)
+        assert second.name == first.name
+
+    def test_different_bytes_or_owner_upload_again(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client)
+
+        registry.acquire(make_file(tmp_path, 'a.mp4', b'one'))
+        registry.acquire(make_file(tmp_path, 'b.mp4', b'two'))
+        registry.acquire(make_file(tmp_path, 'a.mp4', b'one'), owner='other-key')
+        assert client.uploads == 3
+
+    def test_expiring_file_is_replaced(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client)
+        path = make_file(tmp_path)
+        registry.acquire(path)
+
+        with patch('shared.gemini_files.time.time', return_value=time.time() + 47.5 * 3600):
+            _, reused = registry.acquire(path)
+
+        assert reused is False
+        assert client.uploads == 2
+
+    def test_vanished_remote_file_is_reuploaded(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client)
+        path = make_file(tmp_path)
+        registry.acquire(path)
+        client.files.clear()  # deleted on Gemini's side
+
+        _, reused = registry.acquire(path)
+        assert reused is False
+        assert client.uploads == 2
+
+    def test_evict_deletes_remote_file(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client)
+        path = make_file(tmp_path)
+        uploaded, _ = registry.acquire(path)
+
+        registry.evict(next(iter(registry._index())))
+
+        assert client.deleted == [uploaded.name]
+        assert registry._index() == {}
+
+    def test_least_recently_used_evicted_over_limit(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client, max_files=2)
+        a = make_file(tmp_path, 'a.mp4', b'a')
+        registry.acquire(a)
+        registry.acquire(make_file(tmp_path, 'b.mp4', b'b'))
+        registry.acquire(a)  # a is now more recently used than b
+        registry.acquire(make_file(tmp_path, 'c.mp4', b'c'))
+
+        assert client.deleted == ['files/2']
+        assert len(registry._index()) == 2
+
+    def test_failed_processing_raises_and_cleans_up(self, tmp_path):
+        client = FakeClient(final_state='FAILED')
+        registry = make_registry(client)
+
+        with pytest.raises(GeminiFileError):
+            registry.acquire(make_file(tmp_path))
+        assert client.deleted == ['files/1']
+        assert registry._index() == {}
+
+
+class TestPinnedFiles:
+    """Files referenced by queued batch requests survive eviction until released."""
+
+    def test_pinned_file_skipped_by_lru_eviction(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client, max_files=1)
+        pinned, _ = registry.acquire(make_file(tmp_path, 'a.mp4', b'a'), pin='batch:a')
+        other, _ = registry.acquire(make_file(tmp_path, 'b.mp4', b'b'))
+        registry.acquire(make_file(tmp_path, 'c.mp4', b'c'))
+
+        assert pinned.name not in client.deleted
+        assert client.deleted == [other.name]
+
+        registry.release('batch:a', pinned.name)
+        registry.acquire(make_file(tmp_path, 'd.mp4', b'd'))
+        assert pinned.name in client.deleted
+
+    def test_evicted_pinned_file_deleted_on_last_release(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client)
+        path = make_file(tmp_path)
+        uploaded, _ = registry.acquire(path, pin='batch:1')
+        registry.acquire(path, pin='batch:2')
+
+        registry.evict(next(iter(registry._index())))
+        assert client.deleted == []
+
+        registry.release('batch:1', uploaded.name)
+        assert client.deleted == []
+        registry.release('batch:2', uploaded.name)
+        assert client.deleted == [uploaded.name]
+
+    def test_release_of_stale_pin_is_ignored(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client)
+        first, _ = registry.acquire(make_file(tmp_path, 'a.mp4', b'a'), pin='batch:a')
+        second, _ = registry.acquire(make_file(tmp_path, 'b.mp4', b'b'), pin='batch:a')  # re-queued
+
+        registry.release('batch:a', first.name)  # the old job finishing
+        assert registry.is_pinned(second.name)
+        assert not registry.is_pinned(first.name)
+
+    def test_deferred_request_gets_fresh_upload_near_expiry(self, tmp_path):
+        client = FakeClient()
+        registry = make_registry(client)
+        path = make_file(tmp_path)
+        first, _ = registry.acquire(path)
+
+        with patch('shared.gemini_files.time.time', return_value=time.time() + 20 * 3600):
+            again, reused = registry.acquire(path)
+            assert reused is True
+            fresh, reused = registry.acquire(path, pin='batch:1', min_ttl=36 * 3600)
+
+        assert reused is False
+        assert fresh.name != first.name
+        assert client.deleted == []  # the old upload expires on its own
+
+
+class TestAnalyzeVideoReusesUpload:
+    """analyze_video_with_gemini() goes through the file registry."""
+
+    def test_second_analysis_skips_upload(self, analyze_video_with_gemini, tmp_path):
+        from tests.conftest import _video_enricher_module
+
+        client = FakeClient()
+        path = make_file(tmp_path)
+        model = MagicMock()
+        model.generate_content.return_value = MagicMock(text='{}')
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_video_enricher_module.genai, 'configure'), \
+                patch.object(_video_enricher_module.genai, 'upload_file', side_effect=client.upload_file), \
+                patch.object(_video_enricher_module.genai, 'get_file', side_effect=client.get_file), \
+                patch.object(_video_enricher_module.genai, 'delete_file', side_effect=client.delete_file), \
+                patch.object(_video_enricher_module.genai, 'GenerativeModel', return_value=model):
+            first = analyze_video_with_gemini(path)
+            second = analyze_video_with_gemini(path)
+
+        assert client.uploads == 1
+        assert (first['file_reused'], second['file_reused']) == (False, True)
+        assert client.deleted == []
+
+    def test_unregistered_upload_deleted_after_analysis(self, analyze_video_with_gemini, tmp_path,
+                                                        isolated_gemini_files):
+        from tests.conftest import _video_enricher_module
+
+        client = FakeClient()
+        model, failing = MagicMock(), MagicMock()
+        model.generate_content.return_value = MagicMock(text='{}')
+        failing.generate_content.side_effect = RuntimeError('quota')
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_video_enricher_module.genai, 'configure'), \
+                patch.object(_video_enricher_module.genai, 'upload_file', side_effect=client.upload_file), \
+                patch.object(_video_enricher_module.genai, 'get_file', side_effect=client.get_file), \
+                patch.object(_video_enricher_module.genai, 'delete_file', side_effect=client.delete_file), \
+                patch.object(_video_enricher_module.genai, 'GenerativeModel', side_effect=[model, failing]):
+            ok = analyze_video_with_gemini(make_file(tmp_path, 'a.mp4', b'a'), register=False)
+            failed = analyze_video_with_gemini(make_file(tmp_path, 'b.mp4', b'b'), register=False)
+
+        assert ok['error'] is None and failed['error'] == 'quota'
+        assert client.deleted == ['files/1', 'files/2']
+        assert isolated_gemini_files.store.get('index') is None
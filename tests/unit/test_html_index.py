@@ -0,0 +1,136 @@
+"""
+Unit tests for shared/html_index.py single-pass DOM index.
+"""
+
+from bs4 import BeautifulSoup
+
+from shared.html_index import PageIndex, build_index
+
+
+PAGE = """
+<html><head>
+<title>Page Title</title>
+<meta property="OG:Title" content="OG Title">
+<meta property="og:title" content="Second OG Title">
+<meta name="author" content="Jane Doe">
+</head><body>
+<nav class="site-nav"><a rel="author" href="/jane">Nav Jane</a></nav>
+<article class="post-body">
+  <h1>Heading</h1>
+  <time datetime="2024-01-02">Jan 2</time>
+  <span class="product-price" data-price="10">$10.00</span>
+  <span itemprop="price offers">9.99</span>
+  <pre class="language-python">print('hello world from a block')</pre>
+  <p>Read about why people buy now and pay later.</p>
+  <form action="/cart"><button type="submit"><span>Add to cart</span></button></form>
+</article>
+</body></html>
+"""
+
+
+def make_index(html=PAGE):
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup, PageIndex(soup)
+
+
+class TestPageIndex:
+    """Tests for PageIndex lookups."""
+
+    def test_meta_first_wins_case_insensitive(self):
+        _, index = make_index()
+        assert index.meta_property('og:title')['content'] == 'OG Title'
+        assert index.meta_name('AUTHOR')['content'] == 'Jane Doe'
+        assert index.meta_property('og:image') is None
+
+    def test_meta_content_tries_property_then_name(self):
+        _, index = make_index()
+        assert index.meta_content('og:description', 'author') == 'Jane Doe'
+
+    def test_first_by_tag(self):
+        soup, index = make_index()
+        assert index.first('h1') is soup.find('h1')
+        assert index.first('time', with_attr='datetime')['datetime'] == '2024-01-02'
+
+    def test_class_patterns(self):
+        _, index = make_index()
+        assert index.first_class('content')['class'] == ['post-body']
+        assert index.has_class('product_signal')
+        assert index.first_class('price').get_text() == '$10.00'
+        assert not index.has_class('author')
+
+    def test_itemprop_data_price_rel_author(self):
+        _, index = make_index()
+        assert index.first_itemprop('price').get_text() == '9.99'
+        assert index.first_itemprop('offers') is not None
+        assert index.first_data_price()['data-price'] == '10'
+        assert index.first_rel_author().get_text() == 'Nav Jane'
+
+    def test_code_blocks_and_purchase_text(self):
+        _, index = make_index()
+        assert len(index.live_code_blocks()) == 1
+        assert index.has_code_blocks(1)
+        assert not index.has_code_blocks(2)
+        assert index.has_purchase_text()
+
+    def test_decomposed_elements_are_skipped(self):
+        _, index = make_index()
+        for nav in index.all('nav'):
+            nav.decompose()
+        assert index.all('nav') == []
+        assert index.first_rel_author() is None
+
+    def test_none_soup_builds_empty_index(self):
+        index = build_index(None)
+        assert index.first('title') is None
+        assert not index.has_purchase_text()
+        assert index.live_code_blocks() == []
+
+
+class TestProductSignal:
+    """Tests for PageIndex.product_signal() candidate-region detection."""
+
+    def _signal(self, body, head=''):
+        soup = BeautifulSoup(f"<html><head>{head}</head><body>{body}</body></html>", 'html.parser')
+        return PageIndex(soup).product_signal()
+
+    def test_og_type(self):
+        assert self._signal('', '<meta property="og:type" content="product">') == 'og:type'
+
+    def test_microdata_itemtype(self):
+        assert self._signal('<div itemscope itemtype="https://schema.org/Product"></div>') == 'microdata'
+
+    def test_json_ld(self):
+        script = '<script type="application/ld+json">{"@context": "https://schema.org", "@type": ["Product"]}</script>'
+        assert self._signal('', script) == 'json-ld'
+
+    def test_json_ld_article_is_not_product(self):
+        script = '<script type="application/ld+json">{"@type": "NewsArticle"}</script>'
+        assert self._signal('<p>text</p>', script) is None
+
+    def test_purchase_button(self):
+        assert self._signal('<button>Buy now</button>') == 'purchase-text'
+        assert self._signal('<input type="submit" value="Add to Cart">') == 'purchase-text'
+
+    def test_purchase_text_in_prose_is_ignored(self):
+        assert self._signal('<article><p>Should you buy now or wait? Add to cart later.</p></article>') is None
+
+    def test_candidate_budget(self):
+        # Buttons past MAX_SIGNAL_CANDIDATES are never read
+        body = '<button>Share</button>' * 60 + '<button>Buy now</button>'
+        assert self._signal(body) is None
+
+
+class TestExtractorsShareIndex:
+    """The webpage extractors should not rescan the tree when given an index."""
+
+    def test_extractors_use_index(self, extract_metadata, extract_price, extract_code_snippets,
+                                  detect_content_type):
+        soup, index = make_index()
+        # An index over a different page proves the extractors read the index, not the soup
+        other = BeautifulSoup('<html><head><title>Other</title></head><body></body></html>', 'html.parser')
+
+        assert extract_metadata('https://example.com', soup, index)['title'] == 'OG Title'
+        assert extract_metadata('https://example.com', soup, PageIndex(other))['title'] == 'Other'
+        assert extract_price(soup, index)['price'] == 9.99  # itemprop price beats the price class
+        assert len(extract_code_snippets(soup, index)) == 1
+        assert detect_content_type('https://example.com/page', soup, index) == 'product'
@@ -0,0 +1,114 @@
+"""
+Unit tests for shared/html_utils.py charset detection and decoding.
+"""
+
+import codecs
+
+import pytest
+
+from shared.html_utils import decode_html, detect_encoding, get_parser_backend, normalize_encoding, parse_html
+
+
+class TestNormalizeEncoding:
+    """Tests for normalize_encoding()"""
+
+    def test_latin1_means_windows_1252(self):
+        assert normalize_encoding('ISO-8859-1') == 'cp1252'
+
+    def test_utf8_variants(self):
+        assert normalize_encoding('UTF8') == 'utf-8'
+        assert normalize_encoding('"utf-8"') == 'utf-8'
+
+    def test_unknown_label(self):
+        assert normalize_encoding('not-a-charset') is None
+
+
+class TestDetectEncoding:
+    """Tests for detect_encoding() signal order."""
+
+    def test_bom_wins_over_header(self):
+        content = codecs.BOM_UTF8 + '<p>é</p>'.encode('utf-8')
+        assert detect_encoding(content, 'text/html; charset=iso-8859-1') == ('utf-8-sig', 'bom')
+
+    def test_header_charset(self):
+        assert detect_encoding(b'<p>x</p>', 'text/html; charset=Shift_JIS') == ('shift_jis', 'header')
+
+    def test_meta_charset(self):
+        content = b'<html><head><meta charset="windows-1251"></head>'
+        assert detect_encoding(content, 'text/html') == ('cp1251', 'meta')
+
+    def test_meta_http_equiv(self):
+        content = b'<meta http-equiv="Content-Type" content="text/html; charset=euc-kr">'
+        assert detect_encoding(content) == ('euc_kr', 'meta')
+
+    def test_meta_beyond_prescan_is_ignored(self):
+        content = b' ' * 5000 + b'<meta charset="koi8-r">' + 'é'.encode('utf-8')
+        assert detect_encoding(content) == ('utf-8', 'utf-8')
+
+    def test_unlabeled_utf8(self):
+        assert detect_encoding('<p>naïve café</p>'.encode('utf-8')) == ('utf-8', 'utf-8')
+
+    def test_truncated_utf8_sequence_still_utf8(self):
+        content = '<p>café</p>€'.encode('utf-8')[:-1]
+        assert detect_encoding(content)[0] == 'utf-8'
+
+    def test_unlabeled_legacy_falls_back_to_detection(self):
+        content = ('<p>' + 'Größe und Übermaß sind schön. ' * 20 + '</p>').encode('cp1252')
+        encoding, source = detect_encoding(content)
+        assert source in ('detected', 'default')
+        assert content.decode(encoding) == content.decode('cp1252')
+
+
+class TestDecodeHtml:
+    """Tests for decode_html()"""
+
+    def test_empty(self):
+        assert decode_html(b'') == ('', 'utf-8')
+
+    def test_utf16_with_bom(self):
+        text, encoding = decode_html('<p>héllo</p>'.encode('utf-16'))
+        assert text == '<p>héllo</p>'
+
+    def test_legacy_page_with_meta(self):
+        html = '<meta charset="iso-8859-1"><p>Café “quoted”</p>'
+        text, encoding = decode_html(html.encode('cp1252'), 'text/html')
+        assert encoding == 'cp1252'
+        assert 'Café “quoted”' in text
+
+
+class TestParseHtml:
+    """Tests for parse_html() backends and modes."""
+
+    PAGE = """<html><head><title>T</title>
+    <meta property="og:title" content="OG">
+    <script type="application/ld+json">{"headline": "H"}</script></head>
+    <body><h1>Heading</h1><p>Body text</p><pre><code>x = 1</code></pre></body></html>"""
+
+    def test_prefers_lxml_when_installed(self):
+        pytest.importorskip('lxml')
+        assert get_parser_backend() == 'lxml'
+
+    def test_explicit_backend(self):
+        assert get_parser_backend('html.parser') == 'html.parser'
+
+    @pytest.mark.parametrize('parser', ['html.parser', None])
+    def test_full_mode_keeps_body(self, parser):
+        soup = parse_html(self.PAGE, parser=parser)
+        assert soup.find('p').get_text() == 'Body text'
+        assert soup.find('code') is not None
+
+    def test_metadata_mode_keeps_head_and_structured_data(self):
+        soup = parse_html(self.PAGE, mode='metadata')
+        assert soup.find('title').get_text() == 'T'
+        assert soup.find('meta', property='og:title')['content'] == 'OG'
+        assert soup.find('script', type='application/ld+json') is not None
+        assert soup.find('h1').get_text() == 'Heading'
+
+    def test_metadata_mode_drops_body_content(self):
+        soup = parse_html(self.PAGE, mode='metadata')
+        assert soup.find('p') is None
+        assert soup.find('code') is None
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            parse_html(self.PAGE, mode='partial')
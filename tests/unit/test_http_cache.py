@@ -0,0 +1,61 @@
+"""
+Unit tests for shared/http_cache.py conditional-request cache.
+"""
+
+from shared.cache_store import MemoryStore
+from shared.http_cache import HttpCache
+
+
+def make_cache():
+    return HttpCache(store=MemoryStore())
+
+
+class TestHttpCache:
+    """Tests for HttpCache entries, validators and results."""
+
+    def test_page_without_validators_is_not_stored(self):
+        cache = make_cache()
+        assert cache.store_page('https://example.com', b'<html></html>') is None
+        assert cache.lookup('https://example.com') is None
+
+    def test_conditional_headers(self):
+        cache = make_cache()
+        entry = cache.store_page('https://example.com', b'<p>x</p>', etag='"abc"',
+                                 last_modified='Wed, 01 May 2024 00:00:00 GMT')
+        assert HttpCache.conditional_headers(entry) == {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Wed, 01 May 2024 00:00:00 GMT',
+        }
+        assert HttpCache.conditional_headers(None) == {}
+
+    def test_body_round_trip(self):
+        cache = make_cache()
+        body = '<p>café</p>'.encode('utf-8') * 1000
+        cache.store_page('https://example.com', body, etag='"1"', content_type='text/html; charset=utf-8')
+        entry = cache.lookup('https://example.com')
+        assert HttpCache.cached_body(entry) == body
+        assert entry['content_type'] == 'text/html; charset=utf-8'
+
+    def test_truncated_body_only_when_allowed(self):
+        cache = make_cache()
+        entry = cache.store_page('https://example.com', b'<head></head>', etag='"1"', truncated=True)
+        assert HttpCache.cached_body(entry) is None
+        assert HttpCache.cached_body(entry, allow_truncated=True) == b'<head></head>'
+
+    def test_results_per_variant_and_reset_on_new_page(self):
+        cache = make_cache()
+        url = 'https://example.com'
+        cache.store_page(url, b'<p>v1</p>', etag='"1"')
+        cache.store_result(url, 'full', {'title': 'One'})
+
+        entry = cache.lookup(url)
+        assert HttpCache.cached_result(entry, 'full') == {'title': 'One'}
+        assert HttpCache.cached_result(entry, 'metadata') is None
+
+        cache.store_page(url, b'<p>v2</p>', etag='"2"')
+        assert HttpCache.cached_result(cache.lookup(url), 'full') is None
+
+    def test_store_result_without_entry_is_ignored(self):
+        cache = make_cache()
+        cache.store_result('https://example.com', 'full', {'title': 'x'})
+        assert cache.lookup('https://example.com') is None
@@ -0,0 +1,113 @@
+"""
+Unit tests for shared/keyframes.py frame sampling (ffmpeg mocked).
+"""
+
+import json
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from shared.keyframes import (
+    build_contact_sheet,
+    extract_frame_jpeg,
+    frame_differences,
+    sample_keyframes,
+    sample_times,
+    select_keyframes,
+    tile_frames,
+)
+
+
+def scenes(*lengths, height=16, width=12):
+    """Frames of flat colour: one scene per length, each a different grey."""
+    levels = np.concatenate([np.full(n, 40 * (i + 1)) for i, n in enumerate(lengths)])
+    return np.broadcast_to(levels[:, None, None, None], (len(levels), height, width, 3)).astype(np.uint8)
+
+
+def sheet_bytes(tiles, height, width, gap=4):
+    return (gap + height + gap) * (gap + tiles * (width + gap)) * 3
+
+
+class TestSampleKeyframes:
+    """Tests for sample_times(), extract_frame_jpeg() and sample_keyframes()"""
+
+    def test_sample_times_are_slice_midpoints(self):
+        assert sample_times(60, 3) == [10.0, 30.0, 50.0]
+        assert sample_times(0, 3) == []
+
+    def test_extract_frame_seeks_before_input(self):
+        with patch('shared.keyframes.subprocess.run', return_value=MagicMock(stdout=b'\xff\xd8jpeg')) as run:
+            assert extract_frame_jpeg('/tmp/v.mp4', 12.5, width=320) == b'\xff\xd8jpeg'
+
+        args = run.call_args.args[0]
+        assert args.index('-ss') < args.index('-i')
+        assert 'scale=320:-2' in args and args[-1] == '-'
+
+    def test_failed_frames_are_skipped(self):
+        outputs = [MagicMock(stdout=b'a'), subprocess.CalledProcessError(1, 'ffmpeg'), MagicMock(stdout=b'c')]
+        with patch('shared.keyframes.subprocess.run', side_effect=outputs):
+            frames = sample_keyframes('/tmp/v.mp4', 90, count=3)
+
+        assert [(f['time'], f['data']) for f in frames] == [(15.0, b'a'), (75.0, b'c')]
+        assert frames[0]['mime_type'] == 'image/jpeg'
+
+
+class TestContactSheet:
+    """Tests for NumPy frame scoring, selection and tiling."""
+
+    def test_differences_peak_at_cuts(self):
+        scores = frame_differences(scenes(5, 5, 5))
+        assert np.flatnonzero(scores > 0).tolist() == [5, 10]
+        assert scores[5] == pytest.approx(scores[10]) and scores[5] > 0.15
+
+    def test_select_first_frame_and_cuts(self):
+        scores = frame_differences(scenes(10, 10, 10, 10))
+        assert select_keyframes(scores, count=4) == [0, 10, 20, 30]
+
+    def test_static_clip_filled_evenly(self):
+        assert select_keyframes(np.zeros(100), count=4) == [0, 33, 66, 99]
+        assert select_keyframes(np.zeros(3), count=4) == [0, 1, 2]
+
+    def test_nearby_changes_are_spaced(self):
+        scores = np.zeros(100)
+        scores[50:54] = [0.9, 0.8, 0.7, 0.6]
+        scores[80] = 0.5
+        assert select_keyframes(scores, count=3) == [0, 50, 80]
+
+    def test_tile_grid_shape(self):
+        sheet = tile_frames(scenes(5), columns=2, gap=4)
+        assert sheet.shape == (3 * (16 + 4) + 4, 2 * (12 + 4) + 4, 3)
+        assert sheet[4, 4, 0] == 40 and sheet[0, 0, 0] == 0
+
+    def test_build_contact_sheet_pipes_through_ffmpeg(self):
+        frames = scenes(6, 6, height=18, width=10)  # portrait: 1080x1920 scaled to 10 px wide
+        outputs = [
+            MagicMock(stdout=json.dumps({'streams': [{'width': 1080, 'height': 1920}]})),  # ffprobe
+            MagicMock(stdout=frames.tobytes()),  # raw RGB decode
+            MagicMock(stdout=b'jpeg-sheet'),  # sheet encode
+        ]
+        with patch('shared.keyframes.subprocess.run', side_effect=outputs) as run:
+            sheet = build_contact_sheet('/tmp/v.mp4', duration=6, count=4, tile_width=10)
+
+        decode_args, encode_call = run.call_args_list[1].args[0], run.call_args_list[2]
+        assert 'fps=2,scale=10:18' in decode_args and 'rawvideo' in decode_args
+        assert len(encode_call.kwargs['input']) == sheet_bytes(4, 18, 10)
+        assert sheet['data'] == b'jpeg-sheet'
+        assert sheet['times'][0] == 0.0 and 3.0 in sheet['times']  # first frame and the cut
+        assert sheet['columns'] == 4 and sheet['rows'] == 1
+
+    def test_undecodable_clip_returns_none(self):
+        with patch('shared.keyframes.subprocess.run', side_effect=OSError('ffprobe missing')):
+            assert build_contact_sheet('/tmp/v.mp4', duration=6) is None
+
+    def test_failed_encode_returns_none(self):
+        frames = scenes(6, 6, height=18, width=10)
+        outputs = [
+            MagicMock(stdout=json.dumps({'streams': [{'width': 1080, 'height': 1920}]})),
+            MagicMock(stdout=frames.tobytes()),
+            subprocess.CalledProcessError(1, 'ffmpeg', stderr=b'mjpeg encoder error'),
+        ]
+        with patch('shared.keyframes.subprocess.run', side_effect=outputs):
+            assert build_contact_sheet('/tmp/v.mp4', duration=6, count=4, tile_width=10) is None
@@ -0,0 +1,165 @@
+"""
+Unit tests for shared/long_document.py map-reduce summarization helpers.
+"""
+
+import random
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from shared.ai_memo import MemoCache
+from shared.cache_store import MemoryStore
+from shared.long_document import chunk_text, estimate_tokens, map_chunks, split_sentences
+
+WORDS = 'alpha beta gamma delta epsilon zeta eta theta iota kappa lambda'.split()
+
+
+def make_sentences(count, seed=1):
+    rng = random.Random(seed)
+    return [
+        ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))).capitalize() + '.'
+        for _ in range(count)
+    ]
+
+
+class TestChunkText:
+    """Tests for split_sentences() and chunk_text()"""
+
+    def test_short_text_is_one_chunk(self):
+        assert chunk_text("One sentence. Two sentences.", max_tokens=100) == ["One sentence. Two sentences."]
+        assert chunk_text("   ") == []
+
+    def test_split_sentences(self):
+        assert split_sentences("First one. Second? Third!") == ["First one.", "Second?", "Third!"]
+
+    def test_chunks_respect_budget_and_keep_all_text(self):
+        sentences = make_sentences(600)
+        chunks = chunk_text(' '.join(sentences), max_tokens=500)
+
+        assert len(chunks) > 5
+        assert all(estimate_tokens(chunk) <= 500 for chunk in chunks)
+        assert ' '.join(chunks) == ' '.join(sentences)
+
+    def test_run_on_text_is_cut_at_words(self):
+        chunks = chunk_text('word ' * 2000, max_tokens=200)
+        assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+        assert all(not chunk.endswith('wor') for chunk in chunks)
+
+    def test_edit_changes_only_nearby_chunks(self):
+        """Content-defined boundaries: one edited sentence leaves other chunks intact."""
+        sentences = make_sentences(2000)
+        before = chunk_text(' '.join(sentences), max_tokens=1000)
+        sentences[1000] = 'A completely rewritten sentence appears here.'
+        after = chunk_text(' '.join(sentences), max_tokens=1000)
+
+        assert len(set(after) - set(before)) <= 2
+        assert len(set(before) & set(after)) >= len(before) - 2
+
+
+class TestMapChunks:
+    """Tests for map_chunks() concurrency and chunk memoization."""
+
+    def test_summaries_in_order_and_concurrent(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(3, timeout=2)
+
+        def summarize(chunk):
+            with lock:
+                active.append(chunk)
+                peak.append(len(active))
+            barrier.wait()
+            with lock:
+                active.remove(chunk)
+            return chunk.upper()
+
+        assert map_chunks(['a', 'b', 'c'], summarize, max_workers=3) == ['A', 'B', 'C']
+        assert max(peak) == 3
+
+    def test_memoized_chunks_are_not_resummarized(self):
+        memo = MemoCache(store=MemoryStore())
+        calls = []
+
+        def summarize(chunk):
+            calls.append(chunk)
+            return f"summary of {chunk}"
+
+        map_chunks(['one', 'two', 'three'], summarize, memo=memo, key_parts=('v1',))
+        result = map_chunks(['one', 'TWO edited', 'three'], summarize, memo=memo, key_parts=('v1',))
+
+        assert calls == ['one', 'two', 'three', 'TWO edited']
+        assert result == ['summary of one', 'summary of TWO edited', 'summary of three']
+
+    def test_failure_raises_but_keeps_successful_chunks(self):
+        memo = MemoCache(store=MemoryStore())
+
+        def summarize(chunk):
+            if chunk == 'bad':
+                raise RuntimeError('quota')
+            return chunk
+
+        with pytest.raises(RuntimeError):
+            map_chunks(['good', 'bad'], summarize, memo=memo, max_workers=1)
+        assert map_chunks(['good'], lambda c: pytest.fail('resummarized'), memo=memo) == ['good']
+
+
+class TestGenerateAiAnalysisMapReduce:
+    """generate_ai_analysis() summarizes long articles chunk by chunk."""
+
+    def run(self, generate_ai_analysis, content, **kwargs):
+        from tests.conftest import _webpage_enricher_module
+
+        model = MagicMock()
+
+        def respond(prompt):
+            if prompt.startswith('Summarize this section'):
+                return MagicMock(text='Chunk summary.')
+            return MagicMock(text='{"title": "T", "summary": "S", "analysis": "A"}')
+
+        model.generate_content.side_effect = respond
+        with patch.object(_webpage_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_webpage_enricher_module.genai, 'configure'), \
+                patch.object(_webpage_enricher_module.genai, 'GenerativeModel', return_value=model):
+            result = generate_ai_analysis("https://a.com/long", "Long", content, 'article', **kwargs)
+        return result, [c.args[0] for c in model.generate_content.call_args_list]
+
+    def test_long_article_uses_map_then_one_reduce(self, generate_ai_analysis):
+        content = ' '.join(make_sentences(800))
+        result, prompts = self.run(generate_ai_analysis, content)
+
+        chunk_prompts = [p for p in prompts if p.startswith('Summarize this section')]
+        reduce_prompts = [p for p in prompts if p.startswith('Analyze this webpage')]
+        assert len(chunk_prompts) == len(chunk_text(content))
+        assert len(reduce_prompts) == 1
+        assert 'Part 1: Chunk summary.' in reduce_prompts[0]
+        # The end of the article reaches a chunk prompt, not just the first 10k chars
+        assert any(content[-200:] in p for p in chunk_prompts)
+        assert result['summary'] == 'S'
+
+    def test_short_article_single_call(self, generate_ai_analysis):
+        _, prompts = self.run(generate_ai_analysis, ' '.join(make_sentences(20)))
+        assert len(prompts) == 1
+
+    def test_long_document_option_off_single_call(self, generate_ai_analysis):
+        content = ' '.join(make_sentences(800))
+        _, prompts = self.run(generate_ai_analysis, content, long_document=False)
+        assert len(prompts) == 1
+        assert len(prompts[0]) < len(content) // 4
+
+    def test_over_budget_single_chunk_article_uses_select_content(self, generate_ai_analysis):
+        from tests.conftest import _webpage_enricher_module
+
+        sentences = iter(make_sentences(400))
+        content = ''
+        while estimate_tokens(content) < 2700:
+            content = f"{content} {next(sentences)}".strip()
+        assert estimate_tokens(content) > _webpage_enricher_module.CONTENT_TOKEN_BUDGET
+        assert len(chunk_text(content)) == 1
+
+        _, prompts = self.run(generate_ai_analysis, content)
+
+        assert len(prompts) == 1
+        assert prompts[0].startswith('Analyze this webpage')
+        assert content not in prompts[0]  # reduced to the budget by select_content
@@ -0,0 +1,74 @@
+"""
+Unit tests for shared/process_pool.py warm process pool.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+
+from shared.process_pool import LATE_START_METHOD, WarmProcessPool
+
+
+def worker_pid(_=None):
+    return os.getpid()
+
+
+def square(x):
+    return x * x
+
+
+class TestWarmProcessPool:
+    """Tests for WarmProcessPool."""
+
+    def test_single_worker_runs_inline(self):
+        pool = WarmProcessPool(1)
+        assert not pool.enabled
+        assert pool.run(worker_pid) == os.getpid()
+
+    def test_jobs_run_in_worker_processes(self):
+        pool = WarmProcessPool(2)
+        try:
+            pool.warm()
+            if not pool.enabled:
+                pytest.skip('fork start method unavailable')
+            assert pool.run(square, 7) == 49
+            assert pool.run(worker_pid) != os.getpid()
+        finally:
+            pool.shutdown()
+
+    def test_lazy_pool_does_not_fork(self):
+        pool = WarmProcessPool(2)
+        try:
+            with patch('shared.process_pool.multiprocessing.get_context',
+                       wraps=multiprocessing.get_context) as get_context:
+                assert pool.run(square, 3) == 9
+            # Created after threads may have started: forkserver/spawn, never fork
+            assert get_context.call_args.args == (LATE_START_METHOD,)
+            assert LATE_START_METHOD != 'fork'
+        finally:
+            pool.shutdown()
+
+    def test_broken_pool_falls_back_inline_and_restarts(self):
+        pool = WarmProcessPool(2)
+        try:
+            executor = pool._get_executor()
+            if executor is None:
+                pytest.skip('fork start method unavailable')
+
+            class Broken:
+                def submit(self, *args):
+                    raise BrokenProcessPool('worker died')
+
+                def shutdown(self, **kwargs):
+                    pass
+
+            executor.shutdown()
+            pool._executor = Broken()
+            assert pool.run(worker_pid) == os.getpid()
+            # The next job gets a fresh pool
+            assert pool.run(worker_pid) != os.getpid()
+        finally:
+            pool.shutdown()
@@ -0,0 +1,143 @@
+"""
+Unit tests for shared/redirect_cache.py and shared/cache_store.py.
+"""
+
+
+import pytest
+import requests
+import responses
+
+from shared.cache_store import FileStore, MemoryStore, StoreConflict, update_entry
+from shared.redirect_cache import RedirectCache
+
+
+class TestCacheStores:
+    """Tests for the persistent store backends."""
+
+    @pytest.mark.parametrize('make_store', [
+        lambda tmp_path: MemoryStore(),
+        lambda tmp_path: FileStore(str(tmp_path)),
+    ])
+    def test_roundtrip_and_delete(self, tmp_path, make_store):
+        store = make_store(tmp_path)
+        store.set('https://t.co/abc', {'final_url': 'https://example.com'})
+        assert store.get('https://t.co/abc') == {'final_url': 'https://example.com'}
+        store.delete('https://t.co/abc')
+        assert store.get('https://t.co/abc') is None
+
+    def test_expired_entries_read_as_missing(self, tmp_path):
+        store = FileStore(str(tmp_path))
+        store.set('k', 'v', ttl=-1)
+        assert store.get('k') is None
+
+    def test_file_store_survives_new_instance(self, tmp_path):
+        FileStore(str(tmp_path)).set('k', [1, 2, 3])
+        assert FileStore(str(tmp_path)).get('k') == [1, 2, 3]
+
+    @pytest.mark.parametrize('make_store', [
+        lambda tmp_path: MemoryStore(),
+        lambda tmp_path: FileStore(str(tmp_path)),
+    ])
+    def test_conditional_write_rejects_stale_version(self, tmp_path, make_store):
+        store = make_store(tmp_path)
+        assert store.get_versioned('k') == (None, 0)
+        store.set_if_version('k', [1], 0)
+        value, version = store.get_versioned('k')
+        assert value == [1]
+
+        store.set_if_version('k', [1, 2], version)
+        with pytest.raises(StoreConflict):
+            store.set_if_version('k', [1, 3], version)
+        with pytest.raises(StoreConflict):
+            store.set_if_version('k', [9], 0)
+        assert store.get('k') == [1, 2]
+
+    @pytest.mark.parametrize('make_store', [
+        lambda tmp_path: MemoryStore(),
+        lambda tmp_path: FileStore(str(tmp_path)),
+    ])
+    def test_child_entries_scanned_and_deleted_by_version(self, tmp_path, make_store):
+        parent = make_store(tmp_path)
+        parent.set('jobs', ['j1'])
+        store = parent.child('pending')
+        store.set_if_version('a', {'key': 'a'}, 0)
+        store.set_if_version('b', {'key': 'b'}, 0)
+        store.set('gone', {'key': 'gone'}, ttl=-1)
+
+        entries = dict((value['key'], version) for value, version in store.scan())
+        assert sorted(entries) == ['a', 'b']
+        assert len(store.scan(limit=1)) == 1
+        assert [value for value, _ in parent.scan()] == [['j1']]
+
+        update_entry(store, 'a', lambda current: {'key': 'a', 'requeued': True})
+        with pytest.raises(StoreConflict):
+            store.delete_if_version('a', entries['a'])  # changed since scanned
+        store.delete_if_version('b', entries['b'])
+        with pytest.raises(StoreConflict):
+            store.delete_if_version('b', entries['b'])
+        assert [value for value, _ in store.scan()] == [{'key': 'a', 'requeued': True}]
+
+    def test_update_entry_retries_after_conflict(self):
+        store = MemoryStore()
+        calls = []
+
+        def update(current):
+            calls.append(current)
+            if len(calls) == 1:
+                store.set('k', ['other writer'])  # lands between read and write
+            return (current or []) + ['mine']
+
+        assert update_entry(store, 'k', update) == ['other writer', 'mine']
+        assert calls == [None, ['other writer']]
+
+
+class TestRedirectCache:
+    """Tests for RedirectCache.resolve()"""
+
+    @responses.activate
+    def test_resolves_with_head_and_caches(self):
+        responses.add(responses.HEAD, 'https://bit.ly/abc', status=301,
+                      headers={'Location': 'https://example.com/article'})
+        responses.add(responses.HEAD, 'https://example.com/article', status=200)
+
+        cache = RedirectCache(store=MemoryStore())
+        assert cache.resolve('https://bit.ly/abc') == 'https://example.com/article'
+        assert cache.resolve('https://bit.ly/abc') == 'https://example.com/article'
+        # Second lookup served from cache: one HEAD per hop, no repeats
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_persistent_tier_shared_between_instances(self):
+        store = MemoryStore()
+        RedirectCache(store=store).record('https://t.co/x', 'https://example.com/x')
+
+        cache = RedirectCache(store=store)
+        assert cache.resolve('https://t.co/x') == 'https://example.com/x'
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_failures_are_negatively_cached(self):
+        responses.add(responses.HEAD, 'https://bit.ly/dead',
+                      body=requests.exceptions.ConnectionError())
+
+        cache = RedirectCache(store=MemoryStore())
+        assert cache.resolve('https://bit.ly/dead') == 'https://bit.ly/dead'
+        assert cache.resolve('https://bit.ly/dead') == 'https://bit.ly/dead'
+        assert len(responses.calls) == 1
+        assert cache.lookup('https://bit.ly/dead')['final_url'] is None
+
+    @responses.activate
+    def test_negative_entries_expire(self):
+        cache = RedirectCache(store=MemoryStore(), negative_ttl=-1)
+        cache.record('https://bit.ly/dead', None)
+        assert cache.lookup('https://bit.ly/dead') is None
+
+    @responses.activate
+    def test_falls_back_to_get_when_head_rejected(self):
+        responses.add(responses.HEAD, 'https://lnkd.in/abc', status=405)
+        responses.add(responses.GET, 'https://lnkd.in/abc', status=302,
+                      headers={'Location': 'https://example.com/post'})
+        responses.add(responses.GET, 'https://example.com/post', status=200)
+
+        cache = RedirectCache(store=MemoryStore())
+        assert cache.resolve('https://lnkd.in/abc') == 'https://example.com/post'
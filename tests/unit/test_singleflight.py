@@ -0,0 +1,170 @@
+"""
+Unit tests for shared/singleflight.py request coalescing.
+"""
+
+import threading
+import time
+
+import pytest
+
+from shared.singleflight import SingleFlight, coalesce_key, credential_tag
+
+
+class FakeLease:
+    """In-memory stand-in for GCSLease."""
+
+    def __init__(self, held=False, published=None):
+        self.held = held
+        self.published = published
+        self.released = []
+
+    def acquire(self, key):
+        return not self.held
+
+    def publish(self, key, result):
+        self.published = result
+
+    def release(self, key):
+        self.released.append(key)
+
+    def wait(self, key):
+        if self.published is None:
+            return False, None
+        return True, self.published
+
+
+class TestCoalesceKey:
+    """Tests for coalesce_key()"""
+
+    def test_same_parts_same_key(self):
+        assert coalesce_key('a', 'https://x.com') == coalesce_key('a', 'https://x.com')
+
+    def test_option_order_does_not_matter(self):
+        assert coalesce_key('a', {'x': 1, 'y': 2}) == coalesce_key('a', {'y': 2, 'x': 1})
+
+    def test_different_options_different_key(self):
+        assert coalesce_key('a', {'skip_ai': True}) != coalesce_key('a', {'skip_ai': False})
+
+    def test_credential_tag_hides_and_separates_keys(self):
+        assert credential_tag(None) == credential_tag('') == ''
+        assert credential_tag('secret-a') == credential_tag('secret-a')
+        assert credential_tag('secret-a') != credential_tag('secret-b')
+        assert 'secret' not in credential_tag('secret-a') and len(credential_tag('secret-a')) == 16
+
+
+class TestSingleFlight:
+    """Tests for SingleFlight.do()"""
+
+    def test_single_call_runs_function(self):
+        flight = SingleFlight()
+        result, shared = flight.do('k', lambda: 42)
+        assert result == 42
+        assert shared is False
+
+    def test_concurrent_calls_share_one_computation(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+
+        def worker():
+            results.append(flight.do('k', slow))
+
+        leader = threading.Thread(target=worker)
+        leader.start()
+        started.wait(5)
+
+        followers = [threading.Thread(target=worker) for _ in range(3)]
+        for t in followers:
+            t.start()
+        while flight._calls['k'].waiters < 3:
+            time.sleep(0.01)
+        release.set()
+
+        for t in [leader] + followers:
+            t.join(5)
+
+        assert len(calls) == 1
+        assert [r[0] for r in results] == ['result'] * 4
+        assert sorted(r[1] for r in results) == [False, True, True, True]
+
+    def test_followers_receive_leader_exception(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise ValueError('boom')
+
+        errors = []
+
+        def worker():
+            try:
+                flight.do('k', failing)
+            except ValueError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=worker)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=worker)
+        follower.start()
+        while flight._calls['k'].waiters < 1:
+            time.sleep(0.01)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        assert errors == ['boom', 'boom']
+
+    def test_completed_calls_are_not_cached(self):
+        flight = SingleFlight()
+        counter = iter(range(10))
+        assert flight.do('k', lambda: next(counter))[0] == 0
+        assert flight.do('k', lambda: next(counter))[0] == 1
+        assert not flight.in_flight('k')
+
+
+class TestSingleFlightLease:
+    """Tests for cross-instance coalescing through a lease."""
+
+    def test_leader_publishes_and_releases(self):
+        lease = FakeLease()
+        flight = SingleFlight(lease=lease)
+        result, shared = flight.do('k', lambda: {'ok': True})
+        assert result == {'ok': True}
+        assert shared is False
+        assert lease.published == {'ok': True}
+        assert lease.released == ['k']
+
+    def test_follower_uses_published_result(self):
+        lease = FakeLease(held=True, published={'from': 'other-instance'})
+        flight = SingleFlight(lease=lease)
+        result, shared = flight.do('k', lambda: pytest.fail('should not run'))
+        assert result == {'from': 'other-instance'}
+        assert shared is True
+
+    def test_follower_computes_when_leader_fails(self):
+        lease = FakeLease(held=True, published=None)
+        flight = SingleFlight(lease=lease)
+        result, shared = flight.do('k', lambda: 'local')
+        assert result == 'local'
+        assert shared is False
+
+    def test_lease_errors_fall_back_to_local(self):
+        class BrokenLease(FakeLease):
+            def acquire(self, key):
+                raise RuntimeError('GCS unavailable')
+
+        flight = SingleFlight(lease=BrokenLease())
+        assert flight.do('k', lambda: 'local') == ('local', False)
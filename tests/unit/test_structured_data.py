@@ -0,0 +1,144 @@
+"""
+Unit tests for shared/structured_data.py JSON-LD, microdata and OpenGraph extraction.
+"""
+
+import pytest
+from bs4 import BeautifulSoup
+
+from shared.html_index import PageIndex
+from shared.structured_data import detect_currency, extract_structured_data, parse_price
+
+
+def structured(head='', body=''):
+    soup = BeautifulSoup(f"<html><head>{head}</head><body>{body}</body></html>", 'html.parser')
+    return extract_structured_data(PageIndex(soup))
+
+
+def json_ld(payload):
+    return f'<script type="application/ld+json">{payload}</script>'
+
+
+class TestParsePrice:
+    """Tests for parse_price() separator handling."""
+
+    @pytest.mark.parametrize('text,expected', [
+        ('$29.99', 29.99),
+        ('$1,299.99', 1299.99),
+        ('1.299,99 €', 1299.99),
+        ('1 299', 1299.0),
+        ('29,99', 29.99),
+        ('1,299', 1299.0),
+        ('USD 1,000,000', 1000000.0),
+        ('0.999', 0.999),
+        ('$29.99 2 for $50', 29.99),
+        (12, 12.0),
+    ])
+    def test_prices(self, text, expected):
+        assert parse_price(text) == expected
+
+    def test_no_number(self):
+        assert parse_price('Free') is None
+        assert parse_price(None) is None
+
+
+class TestDetectCurrency:
+    """Tests for detect_currency()"""
+
+    def test_symbols_and_codes(self):
+        assert detect_currency('$10') == 'USD'
+        assert detect_currency('£10') == 'GBP'
+        assert detect_currency('10 EUR') == 'EUR'
+        assert detect_currency('10') is None
+
+
+class TestExtractStructuredData:
+    """Tests for extract_structured_data()"""
+
+    def test_json_ld_article(self):
+        result = structured(json_ld('''{
+            "@context": "https://schema.org", "@type": "NewsArticle",
+            "headline": "Structured Headline",
+            "author": [{"@type": "Person", "name": "Ada"}, {"@type": "Person", "name": "Grace"}],
+            "datePublished": "2024-03-01T08:00:00Z",
+            "image": {"@type": "ImageObject", "url": "https://example.com/a.jpg"},
+            "description": "About things"
+        }'''))
+        assert result['title'] == 'Structured Headline'
+        assert result['author'] == 'Ada, Grace'
+        assert result['published_date'] == '2024-03-01'
+        assert result['main_image'] == 'https://example.com/a.jpg'
+        assert result['description'] == 'About things'
+        assert result['price'] is None
+
+    def test_graph_references_resolved_not_used_as_urls(self):
+        result = structured(json_ld('''{"@graph": [
+            {"@type": "Article", "headline": "Graph Post",
+             "image": {"@id": "https://example.com/post#primaryimage"},
+             "author": {"@id": "https://example.com/#/schema/person/1"}},
+            {"@type": "ImageObject", "@id": "https://example.com/post#primaryimage",
+             "contentUrl": "https://example.com/hero.jpg"},
+            {"@type": "Person", "@id": "https://example.com/#/schema/person/1", "name": "Ada"}
+        ]}'''))
+        assert result['main_image'] == 'https://example.com/hero.jpg'
+        assert result['author'] == 'Ada'
+
+    def test_unresolved_image_reference_is_no_image(self):
+        result = structured(json_ld('''{"@type": "Article", "headline": "Post",
+            "image": {"@id": "https://example.com/post#primaryimage"}}'''))
+        assert result['main_image'] is None
+
+    def test_json_ld_product_in_graph(self):
+        result = structured(json_ld('''{"@graph": [
+            {"@type": "Organization", "name": "Shop Inc"},
+            {"@type": "Product", "name": "Big TV",
+             "offers": {"@type": "Offer", "price": "1,299.00", "priceCurrency": "usd"}}
+        ]}'''))
+        assert result['title'] == 'Big TV'
+        assert result['price'] == 1299.0
+        assert result['currency'] == 'USD'
+
+    def test_site_only_json_ld_gives_no_title(self):
+        result = structured(json_ld('{"@type": "WebSite", "name": "Example"}'))
+        assert result['title'] is None
+
+    def test_invalid_json_ld_is_ignored(self):
+        result = structured(json_ld('{"@type": "Product", '))
+        assert result == dict.fromkeys(result)
+
+    def test_microdata_product(self):
+        result = structured(body='''
+            <div itemscope itemtype="https://schema.org/Product">
+              <span itemprop="price" content="2499.50">2.499,50 €</span>
+              <meta itemprop="priceCurrency" content="EUR">
+            </div>''')
+        assert result['price'] == 2499.5
+        assert result['currency'] == 'EUR'
+
+    def test_opengraph_price_and_priority(self):
+        head = (
+            '<meta property="og:title" content="OG Title">'
+            '<meta property="product:price:amount" content="15.00">'
+            '<meta property="product:price:currency" content="GBP">'
+            + json_ld('{"@type": "Article", "headline": "LD Headline"}')
+        )
+        result = structured(head)
+        assert result['title'] == 'OG Title'
+        assert result['price'] == 15.0
+        assert result['currency'] == 'GBP'
+
+
+class TestEnricherUsesStructuredData:
+    """extract_metadata/extract_price fill from structured data, heuristics fill the gaps."""
+
+    def test_heuristics_only_fill_empty_fields(self, extract_metadata):
+        soup = BeautifulSoup(
+            '<html><head><title>Tag Title</title><meta name="author" content="Meta Author">'
+            + json_ld('{"@type": "BlogPosting", "author": {"name": "LD Author"}}')
+            + '</head><body></body></html>', 'html.parser')
+        metadata = extract_metadata('https://example.com', soup)
+        assert metadata['author'] == 'LD Author'
+        assert metadata['title'] == 'Tag Title'
+
+    def test_heuristic_price_keeps_thousands(self, extract_price):
+        soup = BeautifulSoup('<div class="price">$1,299.99</div>', 'html.parser')
+        assert extract_price(soup) == {'price': 1299.99, 'currency': 'USD'}
@@ -0,0 +1,98 @@
+"""
+Unit tests for shared/url_rules.py compiled URL classification.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from shared.url_rules import (
+    UrlRuleEngine,
+    classify_url,
+    extract_workflow_js,
+    load_rules,
+    render_workflow_js,
+)
+
+WORKFLOW_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'workflows', 'Bookmark_Processor.json')
+
+SAMPLE_URLS = [
+    'https://www.youtube.com/watch?v=abc',
+    'https://vm.tiktok.com/ZMabc/',
+    'https://box.com/files',
+    'https://x.com/user/status/1',
+    'https://open.spotify.com/episode/abc',
+    'https://open.spotify.com/track/abc',
+    'https://www.linkedin.com/posts/someone_activity',
+    'https://www.linkedin.com/in/someone',
+    'https://www.amazon.co.uk/dp/B00123',
+    'https://store.myshopify.com/products/x',
+    'https://github.com/user/repo',
+    'https://example.com/article',
+    '',
+]
+
+
+class TestUrlRuleEngine:
+    """Tests for UrlRuleEngine matching semantics."""
+
+    def test_suffix_matches_subdomains_only_on_label_boundary(self):
+        assert classify_url('https://vm.tiktok.com/ZMabc/') == 'video'
+        assert classify_url('https://x.com/user/status/1') == 'social'
+        assert classify_url('https://box.com/files') is None
+        assert classify_url('https://notgithub.com/repo') is None
+
+    def test_path_rules(self):
+        assert classify_url('https://open.spotify.com/episode/abc') == 'podcast'
+        assert classify_url('https://open.spotify.com/track/abc') is None
+        assert classify_url('https://www.linkedin.com/posts/someone') == 'social'
+        assert classify_url('https://www.linkedin.com/postsomething') is None
+
+    def test_brand_wildcard(self):
+        assert classify_url('https://www.amazon.co.uk/dp/B00123') == 'product'
+        assert classify_url('https://ebay.de/itm/1') == 'product'
+        assert classify_url('https://amazon-deals.com/') is None
+
+    def test_priority_breaks_ties(self):
+        engine = UrlRuleEngine({
+            'priority': ['video', 'social'],
+            'rules': {'social': ['example.com'], 'video': ['video.example.com']},
+        })
+        assert engine.classify('https://video.example.com/x') == 'video'
+        assert engine.classify('https://www.example.com/x') == 'social'
+
+    def test_bare_host_and_empty(self):
+        assert classify_url('github.com/user/repo') == 'code'
+        assert classify_url('') is None
+        assert classify_url(None) is None
+
+
+class TestWorkflowRules:
+    """The n8n Detect URL Type node must carry the same rules as shared/url_rules.json."""
+
+    def _detect_nodes(self):
+        with open(WORKFLOW_PATH, encoding='utf-8') as f:
+            workflow = json.load(f)
+        nodes = workflow['nodes'] + (workflow.get('activeVersion') or {}).get('nodes', [])
+        return [node for node in nodes if node['name'] == 'Detect URL Type']
+
+    def test_workflow_block_in_sync(self):
+        expected = render_workflow_js(load_rules())
+        nodes = self._detect_nodes()
+        assert nodes
+        for node in nodes:
+            assert extract_workflow_js(node['parameters']['jsCode']) == expected, \
+                "Run: python -m shared.url_rules --sync workflows/Bookmark_Processor.json"
+
+    @pytest.mark.skipif(shutil.which('node') is None, reason="node not installed")
+    def test_javascript_matcher_agrees_with_python(self):
+        script = (
+            render_workflow_js()
+            + "\nconst compiled = compileUrlRules(URL_RULES);\n"
+            + f"console.log(JSON.stringify({json.dumps(SAMPLE_URLS)}.map(u => classifyUrl(u, compiled))));\n"
+        )
+        output = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout
+        assert json.loads(output) == [classify_url(url) for url in SAMPLE_URLS]
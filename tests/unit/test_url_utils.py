@@ -0,0 +1,108 @@
+"""
+Unit tests for shared/url_utils.py URL canonicalization.
+"""
+
+import pytest
+
+from shared.url_utils import (
+    canonical_key,
+    canonicalize_url,
+    is_short_link,
+    parse_canonical,
+)
+
+
+class TestPlatformCanonicalization:
+    """Platform URLs collapse to one canonical form and key."""
+
+    @pytest.mark.parametrize('url', [
+        'https://youtu.be/dQw4w9WgXcQ?si=abc123',
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share',
+        'https://youtube.com/shorts/dQw4w9WgXcQ',
+        'https://www.youtube.com/embed/dQw4w9WgXcQ',
+    ])
+    def test_youtube_variants(self, url):
+        result = parse_canonical(url)
+        assert result['url'] == 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+        assert result['key'] == 'youtube:dQw4w9WgXcQ'
+
+    def test_tiktok_strips_share_params(self):
+        url = 'https://www.tiktok.com/@user/video/7301234567890?is_from_webapp=1&sender_device=pc'
+        assert canonicalize_url(url) == 'https://www.tiktok.com/@user/video/7301234567890'
+        assert canonical_key(url) == 'tiktok:7301234567890'
+
+    def test_tiktok_photo_keeps_path_type(self):
+        url = 'https://www.tiktok.com/@user/photo/7301234567890?is_from_webapp=1'
+        assert canonicalize_url(url) == 'https://www.tiktok.com/@user/photo/7301234567890'
+        assert canonical_key(url) == 'tiktok:7301234567890'
+
+    @pytest.mark.parametrize('url', [
+        'https://vimeo.com/123456/abcdef0123',
+        'https://player.vimeo.com/video/123456?h=abcdef0123&badge=0',
+    ])
+    def test_vimeo_unlisted_hash_kept(self, url):
+        result = parse_canonical(url)
+        assert result['url'] == 'https://vimeo.com/123456/abcdef0123'
+        assert result['key'] == 'vimeo:123456'
+
+    def test_spotify_si_removed(self):
+        url = 'https://open.spotify.com/episode/abc123XYZ?si=xyz789'
+        assert canonicalize_url(url) == 'https://open.spotify.com/episode/abc123XYZ'
+
+    def test_spotify_intl_path(self):
+        url = 'https://open.spotify.com/intl-de/episode/abc123XYZ'
+        assert canonical_key(url) == 'spotify:episode/abc123XYZ'
+
+    def test_twitter_and_x_share_key(self):
+        assert canonical_key('https://mobile.twitter.com/jack/status/20') == \
+            canonical_key('https://x.com/jack/status/20?s=20')
+
+
+class TestGenericCanonicalization:
+    """Generic URLs are normalized conservatively."""
+
+    def test_tracking_params_removed_and_sorted(self):
+        url = 'https://Example.com/post/?utm_source=news&b=2&a=1&fbclid=xyz#comments'
+        assert canonicalize_url(url) == 'https://example.com/post?a=1&b=2'
+
+    def test_www_and_scheme_do_not_change_key(self):
+        assert canonical_key('http://www.example.com/a') == canonical_key('https://example.com/a')
+
+    def test_default_port_dropped(self):
+        assert canonicalize_url('https://example.com:443/a') == 'https://example.com/a'
+
+    def test_meaningful_params_kept(self):
+        assert canonicalize_url('https://example.com/search?q=python') == 'https://example.com/search?q=python'
+
+    def test_invalid_url_passes_through(self):
+        assert canonicalize_url('not-a-valid-url') == 'not-a-valid-url'
+
+    def test_empty_url(self):
+        assert canonicalize_url('') == ''
+
+
+class TestShortLinks:
+    """Short links are only resolved on request."""
+
+    def test_detects_short_hosts(self):
+        assert is_short_link('https://vm.tiktok.com/ZMabc/')
+        assert is_short_link('https://www.tiktok.com/t/ZTabc/')
+        assert is_short_link('https://t.co/abc')
+        assert not is_short_link('https://www.tiktok.com/@user/video/1')
+
+    def test_not_resolved_by_default(self):
+        def resolver(url):
+            pytest.fail('resolver should not be called')
+
+        result = parse_canonical('https://vm.tiktok.com/ZMabc/', resolver=resolver)
+        assert result['resolved'] is False
+
+    def test_resolved_url_is_canonicalized(self):
+        def resolver(url):
+            return 'https://www.tiktok.com/@user/video/123?_r=1&u_code=x'
+
+        result = parse_canonical('https://vm.tiktok.com/ZMabc/', resolve=True, resolver=resolver)
+        assert result['resolved'] is True
+        assert result['key'] == 'tiktok:123'
+        assert result['url'] == 'https://www.tiktok.com/@user/video/123'
@@ -4,8 +4,21 @@ Unit tests for video-enricher Cloud Function.
 Tests pure functions that don't require external API calls.
 """
 
+import json
+from unittest.mock import MagicMock, patch
+
 import pytest
 
+from shared.analysis_utils import (
+    REQUIRED_ANALYSIS_SECTIONS,
+    SECTION_FIELDS,
+    analysis_response_schema,
+    format_analysis_sections,
+    incomplete_sections,
+    parse_structured_analysis,
+    validate_analysis_sections,
+)
+
 
 class TestIsSpotifyPodcast:
     """Tests for is_spotify_podcast()"""
@@ -50,6 +63,48 @@ class TestIsSpotifyPodcast:
         assert is_spotify_podcast(url) is False
 
 
+class TestDownloadVideo:
+    """download_video() fetches the saved URL and reports the canonical one."""
+
+    def test_unlisted_vimeo_downloaded_with_hash(self, download_video):
+        from tests.conftest import _video_enricher_module
+
+        url = 'https://player.vimeo.com/video/123456?h=abcdef0123'
+        with patch.object(_video_enricher_module, 'download_with_ytdlp', return_value={}) as ytdlp:
+            result = download_video(url, '/tmp')
+
+        ytdlp.assert_called_once_with(url, '/tmp')
+        assert result['canonical_url'] == 'https://vimeo.com/123456/abcdef0123'
+
+    def test_tiktok_photo_not_rewritten_to_video(self, download_video):
+        from tests.conftest import _video_enricher_module
+
+        url = 'https://www.tiktok.com/@user/photo/7301234567890?is_from_webapp=1'
+        with patch.object(_video_enricher_module, 'download_tiktok_video', return_value={}) as tiktok:
+            download_video(url, '/tmp')
+
+        tiktok.assert_called_once_with(url, '/tmp')
+
+
+class TestDownloadAndStoreCoalescing:
+    """Requests only share a flight when they would be billed to the same API keys."""
+
+    def test_flight_key_includes_api_keys(self, mock_flask_request):
+        from tests.conftest import _video_enricher_module
+
+        flight = MagicMock()
+        flight.do.return_value = ({}, False)
+        with patch.object(_video_enricher_module, '_singleflight', flight):
+            for gemini_key in ('key-a', 'key-a', 'key-b', None):
+                _video_enricher_module.download_and_store(mock_flask_request(json_data={
+                    'video_url': 'https://www.tiktok.com/@u/video/1', 'gemini_api_key': gemini_key,
+                }))
+
+        keys = [c.args[0] for c in flight.do.call_args_list]
+        assert keys[0] == keys[1]
+        assert len({keys[0], keys[2], keys[3]}) == 3
+
+
 class TestGenerateSmartFilename:
     """Tests for generate_smart_filename()"""
 
@@ -119,3 +174,189 @@ class TestGenerateSmartFilename:
         result = generate_smart_filename("Title", "", "mp4")
         assert "Title" in result
         assert result.endswith(".mp4")
+
+
+def structured_answer(sections, **overrides):
+    data = {SECTION_FIELDS[name]: f"{name} details." for name in sections}
+    data.update(overrides)
+    return MagicMock(text=json.dumps(data))
+
+
+class TestStructuredAnalysis:
+    """Tests for the structured-output analysis helpers."""
+
+    def test_schema_requires_every_section(self):
+        schema = analysis_response_schema()
+        assert schema['required'] == [SECTION_FIELDS[name] for name in REQUIRED_ANALYSIS_SECTIONS]
+        assert analysis_response_schema(['Mood & Tone'])['required'] == ['mood_and_tone']
+
+    def test_parse_json_and_find_gaps(self):
+        text = '```json\n' + json.dumps({'visual_content': 'A kitchen.', 'key_messages': ['Salt early', 'Rest meat'],
+                                           'mood_and_tone': '  '}) + '\n```'
+        sections = parse_structured_analysis(text)
+
+        assert sections['Visual Content'] == 'A kitchen.'
+        assert sections['Key Messages'] == '- Salt early\n- Rest meat'
+        assert incomplete_sections(sections) == ['Audio Content', 'Style & Production', 'Mood & Tone',
+                                                 'Content Category']
+
+    def test_markdown_answer_falls_back(self):
+        text = '1. **👁️ Visual Content**\nA kitchen.\n\n2. **🔊 Audio Content**\nNarration.'
+        assert parse_structured_analysis(text) == {'Visual Content': 'A kitchen.', 'Audio Content': 'Narration.'}
+
+    def test_formatted_sections_pass_validation(self):
+        sections = {name: f"{name} details." for name in REQUIRED_ANALYSIS_SECTIONS}
+        result = validate_analysis_sections(format_analysis_sections(sections))
+        assert result['valid'] is True
+        assert result['sections'] == sections
+
+
+class TestAnalyzeVideoWithGemini:
+    """analyze_video_with_gemini() structured output and targeted re-ask."""
+
+    def run(self, analyze_video_with_gemini, tmp_path, *answers):
+        from tests.conftest import _video_enricher_module
+
+        video = tmp_path / 'v.mp4'
+        video.write_bytes(b'video bytes')
+
+        uploaded = MagicMock()
+        uploaded.name = 'files/abc'
+        uploaded.state.name = 'ACTIVE'
+        model = MagicMock()
+        model.generate_content.side_effect = list(answers)
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_video_enricher_module.genai, 'configure'), \
+                patch.object(_video_enricher_module.genai, 'upload_file', return_value=uploaded) as upload, \
+                patch.object(_video_enricher_module.genai, 'delete_file') as delete_file, \
+                patch.object(_video_enricher_module.genai, 'GenerativeModel', return_value=model):
+            result = analyze_video_with_gemini(str(video))
+        return result, model.generate_content.call_args_list, upload, delete_file
+
+    def test_complete_answer_single_call(self, analyze_video_with_gemini, tmp_path):
+        result, calls, _, delete_file = self.run(analyze_video_with_gemini, tmp_path,
+                                                 structured_answer(REQUIRED_ANALYSIS_SECTIONS))
+
+        assert len(calls) == 1
+        config = calls[0].kwargs['generation_config']
+        assert config['response_mime_type'] == 'application/json'
+        assert validate_analysis_sections(result['analysis'])['valid'] is True
+        assert result['reasked_sections'] == []
+        delete_file.assert_not_called()  # kept in the file registry for reuse
+
+    def test_missing_sections_reasked_on_same_upload(self, analyze_video_with_gemini, tmp_path):
+        first = structured_answer(REQUIRED_ANALYSIS_SECTIONS, mood_and_tone='', content_category='')
+        second = structured_answer(['Mood & Tone', 'Content Category'])
+        result, calls, upload, delete_file = self.run(analyze_video_with_gemini, tmp_path, first, second)
+
+        assert upload.call_count == 1
+        assert len(calls) == 2
+        video_file, prompt = calls[1].args[0]
+        assert video_file.name == 'files/abc'
+        assert 'mood_and_tone' in prompt and 'content_category' in prompt
+        assert 'visual_content' not in prompt
+        assert calls[1].kwargs['generation_config']['response_schema']['required'] == ['mood_and_tone',
+                                                                                       'content_category']
+        assert result['reasked_sections'] == ['Mood & Tone', 'Content Category']
+        assert validate_analysis_sections(result['analysis'])['valid'] is True
+
+    def test_failed_reask_keeps_partial_analysis(self, analyze_video_with_gemini, tmp_path):
+        first = structured_answer(REQUIRED_ANALYSIS_SECTIONS, content_category='')
+        result, calls, _, delete_file = self.run(analyze_video_with_gemini, tmp_path, first,
+                                                 RuntimeError('quota'))
+
+        assert len(calls) == 2
+        assert result['error'] is None
+        assert validate_analysis_sections(result['analysis'])['empty'] + \
+            validate_analysis_sections(result['analysis'])['missing'] == ['Content Category']
+
+
+class TestTranscriptFirstAnalysis:
+    """analyze_transcript_with_gemini() and transcript mode selection."""
+
+    def test_sends_transcript_and_frames_not_the_video(self, analyze_transcript_with_gemini):
+        from tests.conftest import _video_enricher_module
+
+        frames = [{'time': 600.0, 'mime_type': 'image/jpeg', 'data': b'jpeg1'},
+                  {'time': 1800.0, 'mime_type': 'image/jpeg', 'data': b'jpeg2'}]
+        model = MagicMock()
+        model.generate_content.side_effect = [
+            structured_answer(REQUIRED_ANALYSIS_SECTIONS, visual_content=''),
+            structured_answer(['Visual Content']),
+        ]
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_video_enricher_module, 'sample_keyframes', return_value=frames), \
+                patch.object(_video_enricher_module.genai, 'configure'), \
+                patch.object(_video_enricher_module.genai, 'upload_file') as upload, \
+                patch.object(_video_enricher_module.genai, 'GenerativeModel', return_value=model):
+            result = analyze_transcript_with_gemini("We talk about sourdough starters.", '/tmp/v.mp4',
+                                                    duration=3600, title='Bread podcast')
+
+        upload.assert_not_called()
+        parts = model.generate_content.call_args_list[0].args[0]
+        assert 'We talk about sourdough starters.' in parts[0] and '1:00:00' in parts[0]
+        assert parts[1:5] == ['[10:00]', {'mime_type': 'image/jpeg', 'data': b'jpeg1'},
+                              '[30:00]', {'mime_type': 'image/jpeg', 'data': b'jpeg2'}]
+        # The re-ask carries the same transcript and frames
+        assert model.generate_content.call_args_list[1].args[0][:5] == parts[:5]
+        assert result['frame_count'] == 2
+        assert validate_analysis_sections(result['analysis'])['valid'] is True
+
+    def test_empty_transcript_is_an_error(self, analyze_transcript_with_gemini):
+        from tests.conftest import _video_enricher_module
+
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'):
+            assert analyze_transcript_with_gemini('  ')['error'] == 'Transcript is empty'
+
+    def test_mode_selection(self, choose_analysis_mode):
+        podcast = {'duration': 900, 'source': 'spotify_via_youtube'}
+        lecture = {'duration': 3600, 'source': 'youtube'}
+
+        assert choose_analysis_mode({}, podcast, has_transcript=True) == 'transcript'
+        assert choose_analysis_mode({}, lecture, has_transcript=True) == 'transcript'
+        assert choose_analysis_mode({}, lecture, has_transcript=False) == 'segmented'
+        assert choose_analysis_mode({}, {'duration': 60, 'source': 'tiktok'}, has_transcript=True) == 'full'
+        assert choose_analysis_mode({'analysis_mode': 'transcript'}, {'duration': 60}) == 'full'
+
+
+class TestKeyframeAnalysis:
+    """analyze_keyframes_with_gemini() sends one contact sheet instead of the video."""
+
+    def test_contact_sheet_replaces_upload(self, analyze_keyframes_with_gemini, choose_analysis_mode):
+        from tests.conftest import _video_enricher_module
+
+        sheet = {'data': b'jpeg-sheet', 'mime_type': 'image/jpeg', 'times': [0.0, 4.5, 9.0], 'columns': 3, 'rows': 1}
+        model = MagicMock()
+        model.generate_content.return_value = structured_answer(REQUIRED_ANALYSIS_SECTIONS)
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_video_enricher_module, 'build_contact_sheet', return_value=sheet), \
+                patch.object(_video_enricher_module.genai, 'configure'), \
+                patch.object(_video_enricher_module.genai, 'upload_file') as upload, \
+                patch.object(_video_enricher_module.genai, 'GenerativeModel', return_value=model):
+            result = analyze_keyframes_with_gemini('/tmp/v.mp4', 12)
+
+        upload.assert_not_called()
+        intro, image = model.generate_content.call_args.args[0][:2]
+        assert '0:00, 0:04, 0:09' in intro and 'no speech' in intro
+        assert image == {'mime_type': 'image/jpeg', 'data': b'jpeg-sheet'}
+        assert result['bytes_sent'] == len(b'jpeg-sheet')
+        assert validate_analysis_sections(result['analysis'])['valid'] is True
+
+    def test_missing_contact_sheet_falls_back_to_full_video(self, analyze_keyframes_with_gemini):
+        from tests.conftest import _video_enricher_module
+
+        full = {'analysis': 'full-video analysis', 'sections': {}, 'error': None}
+        with patch.object(_video_enricher_module, 'GEMINI_API_KEY', 'key'), \
+                patch.object(_video_enricher_module, 'build_contact_sheet', return_value=None), \
+                patch.object(_video_enricher_module, 'analyze_video_with_gemini', return_value=full) as analyze:
+            result = analyze_keyframes_with_gemini('/tmp/v.mp4', 12, api_key='key')
+
+        analyze.assert_called_once_with('/tmp/v.mp4', api_key='key')
+        assert result['analysis'] == 'full-video analysis'
+        assert result['mode'] == 'full' and result['fallback_from'] == 'keyframes'
+
+    def test_mode_selection(self, choose_analysis_mode):
+        clip = {'duration': 20, 'source': 'tiktok'}
+        assert choose_analysis_mode({}, clip, has_speech=False) == 'keyframes'
+        assert choose_analysis_mode({}, clip, has_speech=None) == 'full'
+        assert choose_analysis_mode({}, {'duration': 600}, has_speech=False) == 'segmented'
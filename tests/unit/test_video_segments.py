@@ -0,0 +1,164 @@
+"""
+Unit tests for shared/video_segments.py segmented long-video analysis.
+"""
+
+import subprocess
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from shared.analysis_utils import REQUIRED_ANALYSIS_SECTIONS, validate_analysis_sections
+from shared.video_segments import (
+    analyze_segments,
+    chapter_starts,
+    detect_scene_changes,
+    format_timestamp,
+    merge_segment_sections,
+    plan_segments,
+)
+
+
+def all_sections(text):
+    return {name: f"{name}: {text}" for name in REQUIRED_ANALYSIS_SECTIONS}
+
+
+class TestPlanSegments:
+    """Tests for plan_segments() and chapter_starts()"""
+
+    def test_short_video_is_one_segment(self):
+        assert plan_segments(200, target_seconds=180) == [(0.0, 200.0)]
+        assert plan_segments(0) == []
+
+    def test_fixed_intervals_without_cut_points(self):
+        segments = plan_segments(600, target_seconds=180)
+        assert segments == [(0.0, 180.0), (180.0, 360.0), (360.0, 600.0)]
+
+    def test_snaps_to_nearest_cut_point(self):
+        segments = plan_segments(600, cut_points=[50, 170, 200, 400, 590], target_seconds=180)
+        assert [end for _, end in segments] == [170, 400, 600]
+
+    def test_segments_cover_whole_video(self):
+        segments = plan_segments(3600, cut_points=[i * 37.5 for i in range(1, 96)], target_seconds=180)
+        assert segments[0][0] == 0 and segments[-1][1] == 3600
+        assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
+
+    def test_max_segments_raises_target(self):
+        assert len(plan_segments(7200, target_seconds=180, max_segments=12)) <= 12
+
+    def test_chapter_starts(self):
+        chapters = [{'start_time': 0, 'title': 'Intro'}, {'start_time': 95.5}, {'start_time': 300}]
+        assert chapter_starts(chapters) == [95.5, 300.0]
+        assert chapter_starts(None) == []
+
+
+class TestDetectSceneChanges:
+    """Tests for detect_scene_changes() (ffmpeg mocked)."""
+
+    def test_parses_showinfo_times(self):
+        stderr = ("[Parsed_showinfo_3 @ 0x1] n:0 pts:24 pts_time:12.5 duration:1\n"
+                  "[Parsed_showinfo_3 @ 0x1] n:1 pts:90 pts_time:45 duration:1\n")
+        with patch('shared.video_segments.subprocess.run', return_value=MagicMock(stderr=stderr)) as run:
+            assert detect_scene_changes('/tmp/v.mp4') == [12.5, 45.0]
+        assert "select='gt(scene,0.3)'" in ' '.join(run.call_args.args[0])
+
+    def test_ffmpeg_failure_returns_empty(self):
+        error = subprocess.CalledProcessError(1, 'ffmpeg')
+        with patch('shared.video_segments.subprocess.run', side_effect=error):
+            assert detect_scene_changes('/tmp/v.mp4') == []
+
+
+class TestMergeSegments:
+    """Tests for analyze_segments() and merge_segment_sections()"""
+
+    def test_bounded_concurrency_in_order(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def analyze(index, start, end):
+            with lock:
+                active.append(index)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(index)
+            return (index, start, end)
+
+        segments = [(i * 10.0, (i + 1) * 10.0) for i in range(6)]
+        results = analyze_segments(segments, analyze, max_workers=2)
+
+        assert results == [(i, s, e) for i, (s, e) in enumerate(segments)]
+        assert max(peak) == 2
+
+    def test_merge_labels_timeline_and_dedupes_category(self):
+        first = all_sections('opening')
+        second = all_sections('ending')
+        first['Content Category'] = second['Content Category'] = 'Tutorial'
+        merged = merge_segment_sections([
+            {'start': 0, 'end': 185, 'sections': first},
+            {'start': 185, 'end': 3700, 'sections': second},
+            {'start': 3700, 'end': 3720, 'sections': None},
+        ])
+
+        assert merged['Visual Content'] == ("[0:00-3:05] Visual Content: opening\n\n"
+                                            "[3:05-1:01:40] Visual Content: ending")
+        assert merged['Content Category'] == 'Tutorial'
+        assert format_timestamp(59.6) == '1:00'
+
+
+class TestAnalyzeVideoSegmented:
+    """analyze_video_segmented() and analysis mode selection in video-enricher."""
+
+    def test_segments_analyzed_and_merged(self, analyze_video_segmented, tmp_path):
+        from tests.conftest import _video_enricher_module
+
+        def analyze(path, api_key=None, register=True):
+            assert register is False  # segment uploads are throwaway
+            if path.endswith('segment_001.mp4'):
+                return {'analysis': None, 'error': 'quota'}
+            return {'analysis': '...', 'sections': all_sections(path.rsplit('_', 1)[-1]), 'error': None}
+
+        chapters = [{'start_time': 0}, {'start_time': 200}, {'start_time': 410}]
+        with patch.object(_video_enricher_module, 'cut_segment') as cut, \
+                patch.object(_video_enricher_module, 'detect_scene_changes') as scenes, \
+                patch.object(_video_enricher_module, 'analyze_video_with_gemini', side_effect=analyze):
+            result = analyze_video_segmented(str(tmp_path / 'v.mp4'), 600, chapters=chapters,
+                                             tmpdir=str(tmp_path))
+
+        scenes.assert_not_called()  # chapters take precedence
+        assert cut.call_count == 3
+        assert [s['error'] for s in result['segments']] == [None, 'quota', None]
+        assert result['error'] is None
+        assert validate_analysis_sections(result['analysis'])['valid'] is True
+        assert '[0:00-3:20]' in result['sections']['Key Messages']
+        assert '[6:50-10:00]' in result['sections']['Key Messages']
+
+    def test_unusable_chapters_fall_back_to_scene_changes(self, analyze_video_segmented, tmp_path, capsys):
+        from tests.conftest import _video_enricher_module
+
+        analysis = {'analysis': '...', 'sections': all_sections('x'), 'error': None}
+        with patch.object(_video_enricher_module, 'cut_segment'), \
+                patch.object(_video_enricher_module, 'chapter_starts', return_value=[]), \
+                patch.object(_video_enricher_module, 'detect_scene_changes', return_value=[300.0]) as scenes, \
+                patch.object(_video_enricher_module, 'analyze_video_with_gemini', return_value=analysis):
+            analyze_video_segmented(str(tmp_path / 'v.mp4'), 600, chapters=[{'start_time': 0}],
+                                    tmpdir=str(tmp_path))
+
+        scenes.assert_called_once()
+        assert '(scene changes)' in capsys.readouterr().out
+
+    def test_all_segments_failing_is_an_error(self, analyze_video_segmented, tmp_path):
+        from tests.conftest import _video_enricher_module
+
+        with patch.object(_video_enricher_module, 'cut_segment', side_effect=RuntimeError('ffmpeg missing')), \
+                patch.object(_video_enricher_module, 'detect_scene_changes', return_value=[]):
+            result = analyze_video_segmented(str(tmp_path / 'v.mp4'), 900, tmpdir=str(tmp_path))
+
+        assert result['analysis'] is None
+        assert 'All 5 segments failed' in result['error']
+
+    def test_choose_analysis_mode(self, choose_analysis_mode):
+        assert choose_analysis_mode({}, {'duration': 45}) == 'full'
+        assert choose_analysis_mode({}, {'duration': 1800}) == 'segmented'
+        assert choose_analysis_mode({'defer_analysis': True}, {'duration': 1800}) == 'full'
+        assert choose_analysis_mode({'analysis_mode': 'segmented'}, {'duration': 45}) == 'segmented'
@@ -111,6 +111,9 @@ class TestDetectContentType:
     def test_x_url(self, detect_content_type):
         assert detect_content_type("https://x.com/user/status/123", None) == "social"
 
+    def test_x_rule_does_not_match_box_com(self, detect_content_type):
+        assert detect_content_type("https://www.box.com/pricing", None) == "article"
+
     def test_article_default(self, detect_content_type, sample_article_html):
         result = detect_content_type("https://blog.example.com/post", sample_article_html)
         assert result == "article"
@@ -204,3 +207,26 @@ class TestExtractCodeSnippets:
     def test_no_code_blocks(self, extract_code_snippets, sample_article_html):
         snippets = extract_code_snippets(sample_article_html)
         assert snippets == []
+
+
+class TestExtractPageJob:
+    """Tests for extract_page_job() - the parse pool's unit of work."""
+
+    def test_decodes_bytes_with_header_charset(self, extract_page_job):
+        """Raw bytes are decoded with the Content-Type charset before parsing."""
+        html = '<html><head><title>Café</title></head><body><p>Ünïcode</p></body></html>'
+        page = extract_page_job(html.encode('latin-1'), 'text/html; charset=iso-8859-1',
+                                'https://example.com/page')
+
+        assert page['metadata']['title'] == 'Café'
+        assert 'Ünïcode' in page['main_content']
+        # Browsers (and decode_html) read latin-1 labels as its superset cp1252
+        assert page['encoding'] == 'cp1252'
+
+    def test_result_is_plain_data(self, extract_page_job, sample_article_html):
+        """The result pickles cheaply: no soup or index objects leak out."""
+        import pickle
+
+        page = extract_page_job(sample_article_html.encode('utf-8'), 'text/html',
+                                'https://example.com/article')
+        assert pickle.loads(pickle.dumps(page)) == page
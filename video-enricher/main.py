@@ -10,19 +10,98 @@ import os
 import sys
 import json
 import traceback
-import time
 from datetime import timedelta
 
 # Add shared module to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from shared.title_utils import truncate_title, validate_title, sanitize_title, MAX_TITLE_LENGTH
-from shared.analysis_utils import validate_video_enrichment, REQUIRED_ANALYSIS_SECTIONS, SECTION_ICONS
+from shared.analysis_utils import (
+    validate_video_enrichment, REQUIRED_ANALYSIS_SECTIONS, SECTION_ICONS, SECTION_FIELDS, get_section_icon,
+    analysis_response_schema, parse_structured_analysis, incomplete_sections, format_analysis_sections,
+)
+from shared.singleflight import SingleFlight, GCSLease, coalesce_key, credential_tag
+from shared.url_utils import parse_canonical, canonical_key, is_short_link, resolve_short_link
+from shared.gemini_batch import get_gemini_batch_queue, file_part, text_part, BatchQueueUnavailable
+from shared.cache_store import shared_store_configured
+from shared.gemini_files import get_gemini_file_registry, GeminiFileError, GEMINI_FILE_DEFERRED_MIN_TTL
+from shared.video_segments import (
+    chapter_starts, detect_scene_changes, plan_segments, cut_segment, analyze_segments, merge_segment_sections,
+    format_timestamp,
+)
+from shared.keyframes import sample_keyframes, build_contact_sheet
+from shared.audio_utils import (
+    SAMPLE_RATE, decode_audio, detect_speech as find_speech_spans, speech_summary,
+    pack_speech_audio, remap_words
+)
+from shared.chunked_transcription import CHUNKED_TRANSCRIPTION_MIN_SECONDS, transcribe_in_chunks
+from shared.content_selector import select_content
 
 # Configuration
 BUCKET_NAME = os.environ.get('GCS_BUCKET', 'video-processor-temp-rhe')
 SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')  # Required: set via Cloud Function environment variable
 ASSEMBLYAI_API_KEY = os.environ.get('ASSEMBLYAI_API_KEY')  # Required for transcription
+SINGLEFLIGHT_BUCKET = os.environ.get('SINGLEFLIGHT_BUCKET')  # Optional: enables cross-instance coalescing
+GEMINI_VIDEO_MODEL = 'gemini-2.0-flash'
+
+VIDEO_ANALYSIS_REASK_ATTEMPTS = int(os.environ.get('VIDEO_ANALYSIS_REASK_ATTEMPTS', 1))  # Follow-up calls for missing sections
+SEGMENTED_ANALYSIS_MIN_SECONDS = int(os.environ.get('SEGMENTED_ANALYSIS_MIN_SECONDS', 300))  # Longer videos are analyzed in segments
+TRANSCRIPT_FIRST_MIN_SECONDS = int(os.environ.get('TRANSCRIPT_FIRST_MIN_SECONDS', 1200))  # Longer videos are analyzed from the transcript
+TRANSCRIPT_FIRST_SOURCES = ('spotify_via_youtube',)  # Podcasts: always analyzed from the transcript
+TRANSCRIPT_TOKEN_BUDGET = int(os.environ.get('TRANSCRIPT_TOKEN_BUDGET', 200000))  # Transcript tokens per prompt
+KEYFRAME_MODE_MAX_SECONDS = int(os.environ.get('KEYFRAME_MODE_MAX_SECONDS', 90))  # Shorter clips without speech get a contact sheet
+
+ANALYSIS_MODES = ('auto', 'full', 'segmented', 'transcript', 'keyframes')
+
+# One instruction per REQUIRED_ANALYSIS_SECTIONS entry; answers come back as
+# the JSON fields in SECTION_FIELDS (see analysis_response_schema)
+VIDEO_SECTION_INSTRUCTIONS = {
+    'Visual Content': 'Describe what you see throughout the video - people, objects, settings, actions, transitions, visual effects, text overlays, and any on-screen graphics.',
+    'Audio Content': 'Describe the audio - speech (summarize what is said), music, sound effects, and overall audio quality.',
+    'Style & Production': 'Comment on the video style, editing techniques, pacing, and production quality.',
+    'Mood & Tone': 'Describe the overall mood, emotional tone, and atmosphere of the video.',
+    'Key Messages': 'What are the main points, messages, or takeaways from this video?',
+    'Content Category': 'What type of content is this? (e.g., tutorial, entertainment, educational, promotional, personal vlog, etc.)',
+}
+
+
+def video_analysis_prompt(sections=None):
+    """Prompt asking for the given analysis sections as JSON fields (default: all)."""
+    sections = sections or REQUIRED_ANALYSIS_SECTIONS
+    if list(sections) == REQUIRED_ANALYSIS_SECTIONS:
+        intro = "Analyze this video in detail. Provide a comprehensive analysis with one field per section:"
+    else:
+        intro = "Analyze this video. Answer only these sections, one field per section:"
+    lines = [
+        f"- {SECTION_FIELDS[name]} ({get_section_icon(name)} {name}): {VIDEO_SECTION_INSTRUCTIONS[name]}"
+        for name in sections
+    ]
+    return intro + "\n\n" + "\n".join(lines) + "\n\nBe specific and detailed. Every field must contain plain text."
+
+
+def analysis_generation_config(sections=None):
+    """Generation config constraining the answer to the sections' JSON schema."""
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': analysis_response_schema(sections),
+    }
+
+
+VIDEO_ANALYSIS_PROMPT = video_analysis_prompt()
+
+TRANSCRIPT_ANALYSIS_INTRO = """Below are the transcript of a video and {frame_count} still frames sampled evenly across it (each preceded by its timestamp). The video itself is not attached: base the analysis on the transcript, and describe visuals only as far as the frames show them.
+
+Title: {title}
+Duration: {duration}
+
+Transcript:
+{transcript}"""
+
+KEYFRAME_ANALYSIS_INTRO = """Below is a contact sheet of {frame_count} frames from a {duration} video, in reading order (left to right, top to bottom, {columns} per row), taken at {times}. The frames were picked where the picture changes most. The video itself is not attached.
+
+{audio_note}"""
+
+KEYFRAME_NO_SPEECH_NOTE = "The clip has no speech (music, ambient sound or silence only). For Audio Content, say so and describe what the visuals suggest about its sound, if anything."
 
 
 def get_storage_client():
@@ -40,6 +119,12 @@ def get_storage_client():
         return storage.Client()
 
 
+# Coalesces concurrent requests for the same video (e.g. Notion firing twice)
+_singleflight = SingleFlight(
+    lease=GCSLease(SINGLEFLIGHT_BUCKET, get_storage_client) if SINGLEFLIGHT_BUCKET else None
+)
+
+
 def is_spotify_podcast(url):
     """Check if URL is a Spotify podcast episode."""
     return 'spotify.com/episode' in url.lower()
@@ -232,16 +317,28 @@ def download_spotify_podcast(url, tmpdir):
 
 
 def download_video(url, tmpdir):
-    """Download video - handles TikTok, Spotify podcasts, and other sources."""
-    import requests
+    """Download video - handles TikTok, Spotify podcasts, and other sources.
+
+    Short links (vm.tiktok.com, youtu.be, ...) are resolved, then the saved
+    URL itself is downloaded: the canonical form drops tokens some videos
+    need (e.g. an unlisted Vimeo hash) and is only reported as canonical_url
+    for cache and dedup keys.
+    """
+    canonical = parse_canonical(url, resolve=True)
+    fetch_url = url.strip()
+    if is_short_link(fetch_url):
+        fetch_url = resolve_short_link(fetch_url)
 
     # Detect source
-    if is_spotify_podcast(url):
-        return download_spotify_podcast(url, tmpdir)
-    elif 'tiktok' in url.lower():
-        return download_tiktok_video(url, tmpdir)
+    if is_spotify_podcast(fetch_url):
+        result = download_spotify_podcast(fetch_url, tmpdir)
+    elif canonical['platform'] == 'tiktok' or 'tiktok' in fetch_url.lower():
+        result = download_tiktok_video(fetch_url, tmpdir)
     else:
-        return download_with_ytdlp(url, tmpdir)
+        result = download_with_ytdlp(fetch_url, tmpdir)
+
+    result['canonical_url'] = canonical['url']
+    return result
 
 
 def download_tiktok_video(url, tmpdir):
@@ -422,6 +519,7 @@ def download_with_ytdlp(url, tmpdir):
             'video_id': video_id,
             'source': source,
             'thumbnail': info.get('thumbnail'),
+            'chapters': info.get('chapters') or [],
         }
 
 
@@ -442,55 +540,151 @@ def extract_audio(video_path, tmpdir):
         return None
 
 
-def transcribe_audio(audio_path, api_key=None):
+def assemblyai_transcribe(audio_path, api_key):
+    """Run one AssemblyAI job on a local file.
+
+    Returns:
+        dict with text, words (text, start and end in ms), confidence,
+        language and duration_seconds, or error
+    """
+    aai.settings.api_key = api_key
+
+    # Create transcriber with auto language detection
+    config = aai.TranscriptionConfig(
+        language_detection=True,
+        punctuate=True,
+        format_text=True,
+    )
+    transcriber = aai.Transcriber(config=config)
+
+    print(f"Uploading and transcribing audio: {audio_path}")
+    transcript = transcriber.transcribe(audio_path)
+
+    if transcript.status == aai.TranscriptStatus.error:
+        return {
+            'error': transcript.error,
+            'text': None
+        }
+
+    return {
+        'text': transcript.text,
+        'words': [
+            {'text': w.text, 'start': w.start, 'end': w.end}
+            for w in (getattr(transcript, 'words', None) or [])
+        ],
+        'confidence': getattr(transcript, 'confidence', None),
+        'language': getattr(transcript, 'language_code', None) or getattr(transcript, 'language', None),
+        'duration_seconds': getattr(transcript, 'audio_duration', None),
+        'error': None
+    }
+
+
+def transcribe_audio(audio_path, api_key=None, detect_speech=True, trim_silence=True, chunked=True,
+                     include_words=False):
     """Transcribe audio using AssemblyAI.
 
+    Speech is detected locally first (shared/audio_utils.py): a clip with
+    no speech, e.g. music only, is not uploaded and comes back with empty
+    text and skipped='no_speech'. Audio longer than
+    CHUNKED_TRANSCRIPTION_MIN_SECONDS is split at pauses and transcribed as
+    parallel chunks (shared/chunked_transcription.py). Otherwise, when
+    enough of the clip is silence or music, only the speech spans are
+    packed into a smaller file and sent; word timestamps are mapped back to
+    the original audio.
+
     Args:
         audio_path: Path to the audio file (MP3)
         api_key: AssemblyAI API key (optional, uses env var if not provided)
+        detect_speech: Run local speech detection before uploading
+        trim_silence: Send only the speech spans when that saves enough audio
+        chunked: Transcribe long audio as parallel chunks
+        include_words: Also return the word list; it is used internally for
+            timestamp remapping and stitching, and left out by default
 
     Returns:
-        dict with transcript text, confidence, language, or error
+        dict with transcript text, confidence, language, word_count, words
+        (text, start and end in ms of the original audio; only with
+        include_words), speech (has_speech,
+        speech_seconds and spans, when detected), trimmed (original_seconds,
+        packed_seconds, when packed), chunks (when chunked), or error
     """
     api_key = api_key or ASSEMBLYAI_API_KEY
     if not api_key:
         return {'error': 'No AssemblyAI API key provided', 'text': None}
 
-    try:
-        print(f"Starting audio transcription for: {audio_path}")
+    samples = decode_audio(audio_path) if detect_speech else None
+    speech = None
+    spans = []
+    if samples is not None:
+        spans = find_speech_spans(samples)
+        speech = speech_summary(spans, len(samples) / SAMPLE_RATE)
+        if not speech['has_speech']:
+            print(f"No speech detected ({speech['speech_seconds']}s); skipping transcription")
+            return {
+                'text': '',
+                'skipped': 'no_speech',
+                'speech': speech,
+                'word_count': 0,
+                'error': None
+            }
 
-        # Configure AssemblyAI
-        aai.settings.api_key = api_key
+    if chunked and samples is not None and speech['duration_seconds'] >= CHUNKED_TRANSCRIPTION_MIN_SECONDS:
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                result = transcribe_in_chunks(samples, spans, lambda path: assemblyai_transcribe(path, api_key),
+                                              workdir)
+            print(f"Transcription complete. Length: {len(result['text'])} chars")
+            transcription = {
+                **result,
+                'duration_seconds': speech['duration_seconds'],
+                'word_count': len(result['words']),
+                'speech': speech,
+                'error': None
+            }
+            if not include_words:
+                del transcription['words']
+            return transcription
+        except Exception as e:
+            error_msg = str(e)
+            print(f"Chunked transcription error: {error_msg}")
+            return {
+                'error': error_msg,
+                'text': None
+            }
 
-        # Create transcriber with auto language detection
-        config = aai.TranscriptionConfig(
-            language_detection=True,
-            punctuate=True,
-            format_text=True,
-        )
+    packed = None
+    if samples is not None and trim_silence:
+        try:
+            packed = pack_speech_audio(samples, spans, os.path.splitext(audio_path)[0] + '_speech.flac')
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"Speech packing failed, sending full audio: {e}")
 
-        transcriber = aai.Transcriber(config=config)
+    try:
+        if packed:
+            print(f"Sending {packed['packed_seconds']}s of speech out of {packed['original_seconds']}s")
+        print(f"Starting audio transcription for: {audio_path}")
 
-        # Transcribe the audio file
-        print("Uploading and transcribing audio...")
-        transcript = transcriber.transcribe(audio_path)
+        result = assemblyai_transcribe(packed['path'] if packed else audio_path, api_key)
+        if result.get('error'):
+            return result
 
-        if transcript.status == aai.TranscriptStatus.error:
-            return {
-                'error': transcript.error,
-                'text': None
-            }
+        print(f"Transcription complete. Length: {len(result['text'] or '')} chars")
 
-        print(f"Transcription complete. Length: {len(transcript.text or '')} chars")
+        trimmed = None
+        if packed:
+            result['words'] = remap_words(result['words'], packed['offset_map'])
+            result['duration_seconds'] = packed['original_seconds']
+            trimmed = {k: packed[k] for k in ('original_seconds', 'packed_seconds')}
 
-        return {
-            'text': transcript.text,
-            'confidence': getattr(transcript, 'confidence', None),
-            'language': getattr(transcript, 'language_code', None) or getattr(transcript, 'language', None),
-            'duration_seconds': getattr(transcript, 'audio_duration', None),
-            'word_count': len(transcript.words) if hasattr(transcript, 'words') and transcript.words else 0,
-            'error': None
+        transcription = {
+            **result,
+            'word_count': len(result['words']),
+            'speech': speech,
+            'trimmed': trimmed,
         }
+        if not include_words:
+            del transcription['words']
+        return transcription
 
     except Exception as e:
         error_msg = str(e)
@@ -499,6 +693,9 @@ def transcribe_audio(audio_path, api_key=None):
             'error': error_msg,
             'text': None
         }
+    finally:
+        if packed and os.path.exists(packed['path']):
+            os.remove(packed['path'])
 
 
 def upload_to_gcs(client, filepath, filename):
@@ -547,98 +744,533 @@ def generate_smart_filename(title, uploader, ext='mp4'):
     return f"{sanitized_title} - {capitalized_uploader}.{ext}"
 
 
-def analyze_video_with_gemini(video_path, api_key=None):
-    """Analyze video content using Gemini 1.5 Pro.
+def reask_missing_sections(model, media, sections):
+    """Ask again, on the same media, for sections that came back missing or empty.
+
+    Each follow-up call uses a schema restricted to the missing sections, so
+    the sections already answered are neither re-generated nor re-billed.
+    A failed follow-up keeps the partial analysis (validation reports the gaps).
+
+    Args:
+        model: GenerativeModel used for the first answer
+        media: Content parts the first prompt was about (e.g. [video_file]
+            for an ACTIVE Gemini File API file)
+        sections: Section name -> content parsed from the first answer
+
+    Returns:
+        Tuple of (sections, reasked section names)
+    """
+    sections = dict(sections)
+    reasked = []
+    for attempt in range(VIDEO_ANALYSIS_REASK_ATTEMPTS):
+        missing = incomplete_sections(sections)
+        if not missing:
+            break
+        print(f"Re-asking {len(missing)} missing section(s) (attempt {attempt + 1}): {', '.join(missing)}")
+        reasked.extend(name for name in missing if name not in reasked)
+        try:
+            response = model.generate_content(
+                [*media, video_analysis_prompt(missing)],
+                generation_config=analysis_generation_config(missing),
+            )
+        except Exception as e:
+            print(f"Warning: Re-ask failed: {e}")
+            break
+        for name, content in parse_structured_analysis(response.text).items():
+            if name in missing and content:
+                sections[name] = content
+    return sections, reasked
+
+
+def analyze_video_with_gemini(video_path, api_key=None, defer=False, batch_key=None, register=True):
+    """Analyze video content using Gemini.
 
     Uses the File API for reliable video upload and processing.
-    Returns detailed analysis of video content.
+    The answer is requested as JSON matching the required sections and
+    rendered back into the numbered markdown analysis; sections that come
+    back missing or empty are re-asked on the same uploaded file.
+
+    Uploads go through the Gemini file registry: a still-valid upload of
+    the same bytes is reused, and files are deleted when the registry
+    evicts them rather than after each request. A deferred request pins
+    its file until finalize_video_analysis has run. With register=False
+    (one-off files such as segments) the upload bypasses the registry and
+    is deleted once the analysis is done.
+
+    With defer=True the prompt is queued for the next Gemini batch job
+    (see video_ai_batch) under batch_key; the result then has deferred=True
+    and no analysis. Deferred requests use
+    GEMINI_API_KEY, since the batch job must see the uploaded file.
     """
-    api_key = api_key or GEMINI_API_KEY
+    api_key = GEMINI_API_KEY if defer else (api_key or GEMINI_API_KEY)
     if not api_key:
         return {'error': 'No Gemini API key provided', 'analysis': None}
 
+    throwaway = None
     try:
         print(f"Starting Gemini video analysis for: {video_path}")
 
         # Configure the Gemini API
         genai.configure(api_key=api_key)
 
-        # Upload video to Gemini File API
-        print("Uploading video to Gemini File API...")
-        video_file = genai.upload_file(path=video_path)
-        print(f"Upload complete. File name: {video_file.name}")
+        # Reuse a still-valid upload of the same bytes, else upload and wait for processing.
+        # A deferred request pins its file (released in finalize_video_analysis) and
+        # needs one that outlives the batch job.
+        registry = get_gemini_file_registry(genai)
+        try:
+            if defer:
+                video_file, reused = registry.acquire(video_path, owner=api_key, pin=batch_key,
+                                                      min_ttl=GEMINI_FILE_DEFERRED_MIN_TTL)
+            elif register:
+                video_file, reused = registry.acquire(video_path, owner=api_key)
+            else:
+                video_file, reused = registry.upload(video_path), False
+                throwaway = video_file.name
+        except GeminiFileError as e:
+            return {'error': str(e), 'analysis': None}
+
+        print(f"Video ready{' (reused upload)' if reused else ''}. State: {video_file.state.name}")
+
+        if defer:
+            try:
+                queued = get_gemini_batch_queue('gemini_batch_video').enqueue(
+                    batch_key,
+                    [file_part(video_file.uri, video_file.mime_type), text_part(VIDEO_ANALYSIS_PROMPT)],
+                    context={'file_name': video_file.name},
+                    config=analysis_generation_config(),
+                )
+            except Exception:
+                registry.release(batch_key, video_file.name)
+                raise
+            print(f"Video analysis deferred to batch: {batch_key}")
+            return {
+                'analysis': None,
+                'model': GEMINI_VIDEO_MODEL,
+                'deferred': True,
+                'batch_key': queued['batch_key'],
+                'error': None
+            }
 
-        # Wait for file to be processed
-        print("Waiting for video processing...")
-        max_wait = 120  # Maximum wait time in seconds
-        wait_time = 0
-        while video_file.state.name == "PROCESSING" and wait_time < max_wait:
-            time.sleep(5)
-            wait_time += 5
-            video_file = genai.get_file(video_file.name)
-            print(f"Processing... ({wait_time}s)")
+        # Create the model and generate analysis
+        model = genai.GenerativeModel(GEMINI_VIDEO_MODEL)
 
-        if video_file.state.name == "FAILED":
-            return {'error': f'Gemini file processing failed: {video_file.state.name}', 'analysis': None}
+        print("Generating video analysis...")
+        response = model.generate_content(
+            [video_file, VIDEO_ANALYSIS_PROMPT],
+            generation_config=analysis_generation_config(),
+        )
+        sections = parse_structured_analysis(response.text)
+        # The upload is still live: re-ask only what is missing, not the whole pipeline
+        sections, reasked = reask_missing_sections(model, [video_file], sections)
+        # A registered file stays for reuse; the registry deletes it on eviction
 
-        if video_file.state.name != "ACTIVE":
-            return {'error': f'Gemini file not ready after {max_wait}s: {video_file.state.name}', 'analysis': None}
+        analysis_text = format_analysis_sections(sections) or response.text
+        print(f"Analysis complete. Length: {len(analysis_text)} chars")
 
-        print(f"Video ready. State: {video_file.state.name}")
+        return {
+            'analysis': analysis_text,
+            'sections': sections,
+            'reasked_sections': reasked,
+            'file_reused': reused,
+            'model': GEMINI_VIDEO_MODEL,
+            'error': None
+        }
 
-        # Create the model and generate analysis
-        model = genai.GenerativeModel('gemini-2.0-flash')
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Gemini analysis error: {error_msg}")
+        return {
+            'error': error_msg,
+            'analysis': None
+        }
+    finally:
+        if throwaway:
+            get_gemini_file_registry(genai).delete(throwaway)
 
-        prompt = """Analyze this video in detail. Provide a comprehensive analysis covering:
 
-1. **👁️ Visual Content**
-Describe what you see throughout the video - people, objects, settings, actions, transitions, visual effects, text overlays, and any on-screen graphics.
+def analyze_transcript_with_gemini(transcript_text, video_path=None, duration=0, title='', api_key=None):
+    """Analyze a video from its transcript and a few sampled frames.
 
-2. **🔊 Audio Content**
-Describe the audio - speech (summarize what is said), music, sound effects, and overall audio quality.
+    The full video is never uploaded: Gemini gets the transcript as text and
+    KEYFRAME_COUNT small JPEG frames inline, so there is no upload or file
+    processing wait. Used for speech-heavy long media (see
+    choose_analysis_mode).
 
-3. **🎬 Style & Production**
-Comment on the video style, editing techniques, pacing, and production quality.
+    Args:
+        transcript_text: Transcript of the video's audio
+        video_path: Local video file to sample frames from (optional)
+        duration: Duration in seconds
+        title: Video title, for context
+        api_key: Gemini API key (optional, uses env var if not provided)
 
-4. **🎭 Mood & Tone**
-Describe the overall mood, emotional tone, and atmosphere of the video.
+    Returns:
+        Same shape as analyze_video_with_gemini, plus frame_count and
+        bytes_sent (transcript and frames)
+    """
+    api_key = api_key or GEMINI_API_KEY
+    if not api_key:
+        return {'error': 'No Gemini API key provided', 'analysis': None}
+    if not (transcript_text or '').strip():
+        return {'error': 'Transcript is empty', 'analysis': None}
 
-5. **💡 Key Messages**
-What are the main points, messages, or takeaways from this video?
+    try:
+        genai.configure(api_key=api_key)
 
-6. **📁 Content Category**
-What type of content is this? (e.g., tutorial, entertainment, educational, promotional, personal vlog, etc.)
+        frames = sample_keyframes(video_path, duration) if video_path and duration else []
+        transcript = select_content(transcript_text, TRANSCRIPT_TOKEN_BUDGET)
+        media = [TRANSCRIPT_ANALYSIS_INTRO.format(
+            frame_count=len(frames),
+            title=title or 'Untitled',
+            duration=format_timestamp(duration) if duration else 'unknown',
+            transcript=transcript,
+        )]
+        for frame in frames:
+            media.append(f"[{format_timestamp(frame['time'])}]")
+            media.append({'mime_type': frame['mime_type'], 'data': frame['data']})
+        bytes_sent = len(transcript.encode('utf-8')) + sum(len(frame['data']) for frame in frames)
+        print(f"Transcript-first analysis: {len(transcript)} chars, {len(frames)} frames, {bytes_sent} bytes")
+
+        model = genai.GenerativeModel(GEMINI_VIDEO_MODEL)
+        response = model.generate_content(
+            [*media, VIDEO_ANALYSIS_PROMPT],
+            generation_config=analysis_generation_config(),
+        )
+        sections = parse_structured_analysis(response.text)
+        sections, reasked = reask_missing_sections(model, media, sections)
 
-Be specific and detailed in your analysis."""
+        return {
+            'analysis': format_analysis_sections(sections) or response.text,
+            'sections': sections,
+            'reasked_sections': reasked,
+            'frame_count': len(frames),
+            'bytes_sent': bytes_sent,
+            'model': GEMINI_VIDEO_MODEL,
+            'error': None
+        }
 
-        print("Generating video analysis...")
-        response = model.generate_content([video_file, prompt])
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Gemini transcript analysis error: {error_msg}")
+        return {
+            'error': error_msg,
+            'analysis': None
+        }
 
-        # Clean up - delete the uploaded file
-        try:
-            genai.delete_file(video_file.name)
-            print("Cleaned up uploaded file")
-        except Exception as cleanup_error:
-            print(f"Warning: Failed to delete uploaded file: {cleanup_error}")
 
-        analysis_text = response.text
-        print(f"Analysis complete. Length: {len(analysis_text)} chars")
+def analyze_keyframes_with_gemini(video_path, duration, transcript_text=None, api_key=None):
+    """Analyze a short clip from one contact-sheet image of its keyframes.
+
+    Frames are picked where the picture changes most (see
+    shared/keyframes.py) and tiled into a single JPEG sent inline, so there
+    is no video upload and no File API processing wait. Meant for short
+    silent or visual-only clips (see choose_analysis_mode). If the contact
+    sheet cannot be built, the clip gets the full-video analysis instead.
+
+    Args:
+        video_path: Local video file
+        duration: Duration in seconds
+        transcript_text: Transcript, if the clip has speech (optional)
+        api_key: Gemini API key (optional, uses env var if not provided)
+
+    Returns:
+        Same shape as analyze_video_with_gemini, plus frame_count and
+        bytes_sent; after a fallback, analyze_video_with_gemini's result
+        with mode 'full' and fallback_from 'keyframes'
+    """
+    api_key = api_key or GEMINI_API_KEY
+    if not api_key:
+        return {'error': 'No Gemini API key provided', 'analysis': None}
+
+    try:
+        sheet = build_contact_sheet(video_path, duration)
+        if not sheet:
+            print("Could not build a contact sheet, falling back to full-video analysis")
+            return {**analyze_video_with_gemini(video_path, api_key=api_key),
+                    'mode': 'full', 'fallback_from': 'keyframes'}
+
+        genai.configure(api_key=api_key)
+        if (transcript_text or '').strip():
+            audio_note = f"Transcript of the audio:\n{transcript_text}"
+        else:
+            audio_note = KEYFRAME_NO_SPEECH_NOTE
+        media = [
+            KEYFRAME_ANALYSIS_INTRO.format(
+                frame_count=len(sheet['times']),
+                duration=format_timestamp(duration) if duration else 'short',
+                columns=sheet['columns'],
+                times=', '.join(format_timestamp(t) for t in sheet['times']),
+                audio_note=audio_note,
+            ),
+            {'mime_type': sheet['mime_type'], 'data': sheet['data']},
+        ]
+        print(f"Contact-sheet analysis: {len(sheet['times'])} frames, {len(sheet['data'])} bytes")
+
+        model = genai.GenerativeModel(GEMINI_VIDEO_MODEL)
+        response = model.generate_content(
+            [*media, VIDEO_ANALYSIS_PROMPT],
+            generation_config=analysis_generation_config(),
+        )
+        sections = parse_structured_analysis(response.text)
+        sections, reasked = reask_missing_sections(model, media, sections)
 
         return {
-            'analysis': analysis_text,
-            'model': 'gemini-2.0-flash',
+            'analysis': format_analysis_sections(sections) or response.text,
+            'sections': sections,
+            'reasked_sections': reasked,
+            'frame_count': len(sheet['times']),
+            'bytes_sent': len(sheet['data']),
+            'model': GEMINI_VIDEO_MODEL,
             'error': None
         }
 
     except Exception as e:
         error_msg = str(e)
-        print(f"Gemini analysis error: {error_msg}")
+        print(f"Gemini contact-sheet analysis error: {error_msg}")
         return {
             'error': error_msg,
             'analysis': None
         }
 
 
+def analyze_video_segmented(video_path, duration, chapters=None, api_key=None, tmpdir=None):
+    """Analyze a long video segment by segment and merge the sections.
+
+    Segments follow the video's chapters when it has them, otherwise ffmpeg
+    scene changes (see shared/video_segments.py). Every segment goes through
+    analyze_video_with_gemini, SEGMENT_CONCURRENCY at a time; a failed
+    segment is reported but does not fail the whole analysis. Segment
+    uploads are never reused, so they bypass the file registry and are
+    deleted after their analysis.
+
+    Args:
+        video_path: Local video file
+        duration: Duration in seconds
+        chapters: yt-dlp chapters (dicts with start_time), if any
+        api_key: Gemini API key (optional, uses env var if not provided)
+        tmpdir: Directory for segment files (default: the video's directory)
+
+    Returns:
+        Same shape as analyze_video_with_gemini, plus segments (start, end
+        and error per segment)
+    """
+    cut_points = chapter_starts(chapters)
+    source = 'chapters'
+    if not cut_points:
+        cut_points, source = detect_scene_changes(video_path), 'scene changes'
+    segments = plan_segments(duration, cut_points)
+    if len(segments) < 2:
+        return analyze_video_with_gemini(video_path, api_key=api_key)
+
+    tmpdir = tmpdir or os.path.dirname(video_path)
+    ext = os.path.splitext(video_path)[1] or '.mp4'
+    print(f"Analyzing {len(segments)} segments ({source})")
+
+    def analyze(index, start, end):
+        segment_path = os.path.join(tmpdir, f"segment_{index:03d}{ext}")
+        try:
+            cut_segment(video_path, start, end, segment_path)
+            result = analyze_video_with_gemini(segment_path, api_key=api_key, register=False)
+        except Exception as e:
+            result = {'error': str(e), 'analysis': None}
+        if result.get('error'):
+            print(f"Segment {index} failed: {result['error']}")
+        return {'start': start, 'end': end, 'sections': result.get('sections'), 'error': result.get('error')}
+
+    results = analyze_segments(segments, analyze)
+    summary = [{'start': r['start'], 'end': r['end'], 'error': r['error']} for r in results]
+    if all(r['error'] for r in results):
+        return {'error': f"All {len(results)} segments failed: {results[0]['error']}", 'analysis': None,
+                'segments': summary}
+
+    sections = merge_segment_sections(results)
+    return {
+        'analysis': format_analysis_sections(sections),
+        'sections': sections,
+        'segments': summary,
+        'model': GEMINI_VIDEO_MODEL,
+        'error': None
+    }
+
+
+def choose_analysis_mode(options, video_info, has_transcript=False, has_speech=None):
+    """Pick the Gemini analysis mode for a video.
+
+    options['analysis_mode'] forces a mode. 'auto' (the default) picks:
+    - transcript: podcasts (TRANSCRIPT_FIRST_SOURCES) and videos longer than
+      TRANSCRIPT_FIRST_MIN_SECONDS, when a transcript is available
+    - keyframes: clips up to KEYFRAME_MODE_MAX_SECONDS known to have no
+      speech (has_speech False; None means unknown)
+    - segmented: videos longer than SEGMENTED_ANALYSIS_MIN_SECONDS
+    - full: everything else
+    Deferred analyses always send the full video (one batch request per
+    bookmark). A transcript mode without a transcript falls back to the
+    video-based choice.
+    """
+    mode = options.get('analysis_mode') or 'auto'
+    if mode == 'transcript' and not has_transcript:
+        print("No transcript available; analyzing the video instead")
+        mode = 'auto'
+    if mode != 'auto':
+        return mode
+    if options.get('defer_analysis'):
+        return 'full'
+    duration = video_info.get('duration') or 0
+    if has_transcript and (video_info.get('source') in TRANSCRIPT_FIRST_SOURCES
+                           or duration > TRANSCRIPT_FIRST_MIN_SECONDS):
+        return 'transcript'
+    if has_speech is False and 0 < duration <= KEYFRAME_MODE_MAX_SECONDS:
+        return 'keyframes'
+    if duration > SEGMENTED_ANALYSIS_MIN_SECONDS:
+        return 'segmented'
+    return 'full'
+
+
+def process_video(video_url, options, gemini_api_key=None, assemblyai_api_key=None):
+    """Download, store, transcribe and analyze one video.
+
+    Args:
+        video_url: Video URL to process
+        options: Dict with filename, extract_audio, transcribe_audio, analyze_video,
+            defer_analysis, analysis_mode (see choose_analysis_mode), include_words
+        gemini_api_key: Gemini API key (optional, uses env var if not provided)
+        assemblyai_api_key: AssemblyAI API key (optional, uses env var if not provided)
+
+    Returns:
+        Response dict for the download_and_store endpoint
+    """
+    custom_filename = options.get('filename')
+    extract_audio_flag = options.get('extract_audio', True)
+    transcribe_audio_flag = options.get('transcribe_audio', True)
+    analyze_video_flag = options.get('analyze_video', True)
+    defer_analysis_flag = options.get('defer_analysis', False)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Download video
+        video_info = download_video(video_url, tmpdir)
+
+        # Generate filename
+        filename = custom_filename or generate_smart_filename(
+            video_info['title'],
+            video_info['uploader'],
+            video_info['ext']
+        )
+
+        # Upload video to Cloud Storage
+        storage_client = get_storage_client()
+        video_file = upload_to_gcs(
+            storage_client,
+            video_info['filepath'],
+            filename
+        )
+
+        response = {
+            'success': True,
+            'video': {
+                'file_name': filename,
+                'public_url': video_file['public_url'],
+                'size_bytes': video_file['size_bytes'],
+                'blob_name': video_file['blob_name'],
+            },
+            'metadata': {
+                'title': video_info['title'],
+                'duration': video_info['duration'],
+                'uploader': video_info['uploader'],
+                'video_id': video_info['video_id'],
+                'source': video_info['source'],
+                'thumbnail': video_info['thumbnail'],
+                'canonical_url': video_info.get('canonical_url'),
+            }
+        }
+
+        # Whether the clip has speech: None until audio or transcription tells
+        has_speech = None
+
+        # Extract and upload audio if requested
+        if extract_audio_flag:
+            audio_path = extract_audio(video_info['filepath'], tmpdir)
+            if audio_path is None:
+                has_speech = False  # no audio track to extract
+            if audio_path:
+                audio_filename = filename.rsplit('.', 1)[0] + '.mp3'
+                audio_file = upload_to_gcs(
+                    storage_client,
+                    audio_path,
+                    audio_filename
+                )
+                response['audio'] = {
+                    'file_name': audio_filename,
+                    'public_url': audio_file['public_url'],
+                    'size_bytes': audio_file['size_bytes'],
+                    'blob_name': audio_file['blob_name'],
+                }
+
+                # Transcribe audio if requested
+                if transcribe_audio_flag:
+                    transcription_result = transcribe_audio(
+                        audio_path,
+                        api_key=assemblyai_api_key,
+                        include_words=bool(options.get('include_words')),
+                    )
+                    response['transcription'] = transcription_result
+                    if not transcription_result.get('error'):
+                        has_speech = bool((transcription_result.get('text') or '').strip())
+
+        # Analyze video with Gemini if requested
+        if analyze_video_flag:
+            transcript_text = (response.get('transcription') or {}).get('text')
+            analysis_mode = choose_analysis_mode(options, video_info, has_transcript=bool(transcript_text),
+                                                 has_speech=has_speech)
+            if analysis_mode == 'keyframes':
+                gemini_result = analyze_keyframes_with_gemini(
+                    video_info['filepath'],
+                    video_info.get('duration') or 0,
+                    transcript_text=transcript_text,
+                    api_key=gemini_api_key,
+                )
+            elif analysis_mode == 'transcript':
+                gemini_result = analyze_transcript_with_gemini(
+                    transcript_text,
+                    video_path=video_info['filepath'],
+                    duration=video_info.get('duration') or 0,
+                    title=video_info['title'],
+                    api_key=gemini_api_key,
+                )
+            elif analysis_mode == 'segmented':
+                gemini_result = analyze_video_segmented(
+                    video_info['filepath'],
+                    video_info.get('duration') or 0,
+                    chapters=video_info.get('chapters'),
+                    api_key=gemini_api_key,
+                    tmpdir=tmpdir,
+                )
+            else:
+                gemini_result = analyze_video_with_gemini(
+                    video_info['filepath'],
+                    api_key=gemini_api_key,
+                    defer=defer_analysis_flag,
+                    batch_key=canonical_key(video_url, resolve=True),
+                )
+            gemini_result.setdefault('mode', analysis_mode)
+            response['gemini_analysis'] = gemini_result
+
+        # Validate that all required fields are present and non-empty
+        validation_result = validate_video_enrichment(response)
+        response['validation'] = {
+            'valid': validation_result['valid'],
+            'errors': validation_result['errors'],
+            'required_sections': REQUIRED_ANALYSIS_SECTIONS
+        }
+
+        # If validation failed, add to errors array for n8n handling
+        if not validation_result['valid']:
+            if 'errors' not in response:
+                response['errors'] = []
+            response['errors'].extend(validation_result['errors'])
+            print(f"Validation errors: {validation_result['errors']}")
+
+        return response
+
+
 @functions_framework.http
 def download_and_store(request):
     """Main Cloud Function entry point."""
@@ -668,100 +1300,151 @@ def download_and_store(request):
         extract_audio_flag = request_json.get('extract_audio', True)
         transcribe_audio_flag = request_json.get('transcribe_audio', True)
         analyze_video_flag = request_json.get('analyze_video', True)
+        defer_analysis_flag = request_json.get('defer_analysis', False)
+        analysis_mode = request_json.get('analysis_mode', 'auto')
+        include_words_flag = request_json.get('include_words', False)
         gemini_api_key = request_json.get('gemini_api_key')
         assemblyai_api_key = request_json.get('assemblyai_api_key')
 
         if not video_url:
             return ({'error': 'video_url is required'}, 400, headers)
+        if analysis_mode not in ANALYSIS_MODES:
+            return ({'error': f"analysis_mode must be one of: {', '.join(ANALYSIS_MODES)}"}, 400, headers)
+        if defer_analysis_flag and not shared_store_configured():
+            return ({'error': 'defer_analysis requires CACHE_BUCKET (a store shared by all instances)'}, 400, headers)
+
+        options = {
+            'filename': custom_filename,
+            'extract_audio': extract_audio_flag,
+            'transcribe_audio': transcribe_audio_flag,
+            'analyze_video': analyze_video_flag,
+            'defer_analysis': defer_analysis_flag,
+            'analysis_mode': analysis_mode,
+            'include_words': include_words_flag,
+        }
+        # Callers on different API keys are billed separately, so they never share a flight
+        key = coalesce_key('download_and_store', canonical_key(video_url, resolve=True), options,
+                           credential_tag(gemini_api_key), credential_tag(assemblyai_api_key))
+        response, shared = _singleflight.do(key, lambda: process_video(
+            video_url,
+            options,
+            gemini_api_key=gemini_api_key,
+            assemblyai_api_key=assemblyai_api_key,
+        ))
+
+        if shared:
+            print(f"Coalesced with in-flight request for: {video_url}")
+            headers = {**headers, 'X-Coalesced': 'true'}
+
+        return (response, 200, headers)
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Download video
-            video_info = download_video(video_url, tmpdir)
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        print(f"Error: {str(e)}\n{error_trace}")
+        return ({'error': str(e), 'traceback': error_trace, 'success': False}, 500, headers)
 
-            # Generate filename
-            filename = custom_filename or generate_smart_filename(
-                video_info['title'],
-                video_info['uploader'],
-                video_info['ext']
-            )
 
-            # Upload video to Cloud Storage
-            storage_client = get_storage_client()
-            video_file = upload_to_gcs(
-                storage_client,
-                video_info['filepath'],
-                filename
-            )
+def finalize_video_analysis(response, request):
+    """Turn a batch response into a bookmark's gemini_analysis and validation.
 
-            response = {
-                'success': True,
-                'video': {
-                    'file_name': filename,
-                    'public_url': video_file['public_url'],
-                    'size_bytes': video_file['size_bytes'],
-                    'blob_name': video_file['blob_name'],
-                },
-                'metadata': {
-                    'title': video_info['title'],
-                    'duration': video_info['duration'],
-                    'uploader': video_info['uploader'],
-                    'video_id': video_info['video_id'],
-                    'source': video_info['source'],
-                    'thumbnail': video_info['thumbnail'],
-                }
-            }
+    Missing sections are re-asked on the uploaded file, which stays in the
+    Gemini file registry; the request's pin on it is then released.
+
+    Args:
+        response: {'text', 'error'} from the batch job
+        request: {'key', 'context'} as queued by analyze_video_with_gemini
+
+    Returns:
+        Dict with video_key, gemini_analysis and validation (same shapes as
+        in the download_and_store response)
+    """
+    file_name = request['context'].get('file_name')
+    if response.get('error'):
+        gemini_result = {'analysis': None, 'model': GEMINI_VIDEO_MODEL, 'error': response['error']}
+    else:
+        sections = parse_structured_analysis(response.get('text'))
+        reasked = []
+        if incomplete_sections(sections) and file_name:
+            try:
+                genai.configure(api_key=GEMINI_API_KEY)
+                video_file = genai.get_file(file_name)
+                sections, reasked = reask_missing_sections(
+                    genai.GenerativeModel(GEMINI_VIDEO_MODEL), [video_file], sections)
+            except Exception as e:
+                print(f"Warning: Could not re-ask missing sections: {e}")
+        gemini_result = {
+            'analysis': format_analysis_sections(sections) or response.get('text'),
+            'sections': sections,
+            'reasked_sections': reasked,
+            'model': GEMINI_VIDEO_MODEL,
+            'error': None
+        }
+
+    if file_name:
+        # The batch job (and any re-ask) is done with the file
+        get_gemini_file_registry(genai).release(request['key'], file_name)
+
+    validation_result = validate_video_enrichment({'gemini_analysis': gemini_result})
+    return {
+        'video_key': request['key'],
+        'gemini_analysis': gemini_result,
+        'validation': {
+            'valid': validation_result['valid'],
+            'errors': validation_result['errors'],
+            'required_sections': REQUIRED_ANALYSIS_SECTIONS
+        },
+    }
 
-            # Extract and upload audio if requested
-            if extract_audio_flag:
-                audio_path = extract_audio(video_info['filepath'], tmpdir)
-                if audio_path:
-                    audio_filename = filename.rsplit('.', 1)[0] + '.mp3'
-                    audio_file = upload_to_gcs(
-                        storage_client,
-                        audio_path,
-                        audio_filename
-                    )
-                    response['audio'] = {
-                        'file_name': audio_filename,
-                        'public_url': audio_file['public_url'],
-                        'size_bytes': audio_file['size_bytes'],
-                        'blob_name': audio_file['blob_name'],
-                    }
-
-                    # Transcribe audio if requested
-                    if transcribe_audio_flag:
-                        transcription_result = transcribe_audio(
-                            audio_path,
-                            api_key=assemblyai_api_key
-                        )
-                        response['transcription'] = transcription_result
-
-            # Analyze video with Gemini if requested
-            if analyze_video_flag:
-                gemini_result = analyze_video_with_gemini(
-                    video_info['filepath'],
-                    api_key=gemini_api_key
-                )
-                response['gemini_analysis'] = gemini_result
-
-            # Validate that all required fields are present and non-empty
-            validation_result = validate_video_enrichment(response)
-            response['validation'] = {
-                'valid': validation_result['valid'],
-                'errors': validation_result['errors'],
-                'required_sections': REQUIRED_ANALYSIS_SECTIONS
-            }
 
-            # If validation failed, add to errors array for n8n handling
-            if not validation_result['valid']:
-                if 'errors' not in response:
-                    response['errors'] = []
-                response['errors'].extend(validation_result['errors'])
-                print(f"Validation errors: {validation_result['errors']}")
+@functions_framework.http
+def video_ai_batch(request):
+    """Gemini batch entry point for video analyses queued with defer_analysis.
 
-            return (response, 200, headers)
+    Expected JSON input:
+    {"action": "submit"}   - send everything queued as one batch job
+    {"action": "collect"}  - fetch finished jobs; returns every new result
+    {"action": "result", "video_url": "https://..."}  - one stored result
+    {"action": "status"}
+
+    Every response includes pending (queued, not submitted) and open_jobs.
+    """
+    # Handle CORS preflight
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST',
+            'Access-Control-Allow-Headers': 'Content-Type',
+        }
+        return ('', 204, headers)
+
+    headers = {'Access-Control-Allow-Origin': '*'}
+
+    request_json = request.get_json(force=True, silent=True) or {}
+    action = request_json.get('action', 'status')
+    try:
+        queue = get_gemini_batch_queue('gemini_batch_video')
+    except BatchQueueUnavailable as e:
+        return ({'error': str(e)}, 400, headers)
+
+    try:
+        if action == 'submit':
+            body = {'submitted_jobs': queue.submit()}
+        elif action == 'collect':
+            body = queue.collect(finalize_video_analysis)
+        elif action == 'result':
+            if not request_json.get('video_url'):
+                return ({'error': 'video_url is required'}, 400, headers)
+            key = canonical_key(request_json['video_url'], resolve=True)
+            body = {'key': key, 'result': queue.result(key)}
+        elif action == 'status':
+            body = {}
+        else:
+            return ({'error': f'Unknown action: {action}'}, 400, headers)
+
+        body.update(pending=len(queue.pending()), open_jobs=queue.open_jobs())
+        return (body, 200, headers)
 
     except Exception as e:
         error_trace = traceback.format_exc()
         print(f"Error: {str(e)}\n{error_trace}")
-        return ({'error': str(e), 'traceback': error_trace, 'success': False}, 500, headers)
+        return ({'error': str(e), 'success': False}, 500, headers)
@@ -24,26 +24,89 @@ from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 import re
 import json
+import multiprocessing
 import os
+import sys
+import tempfile
+import time
 import google.generativeai as genai
 from datetime import datetime
+from flask import Response
+
+# Add shared module to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from shared.singleflight import SingleFlight, GCSLease, coalesce_key
+from shared.url_utils import (
+    parse_canonical, canonicalize_url, canonical_key, is_short_link, resolve_short_link
+)
+from shared.redirect_cache import get_redirect_cache
+from shared.html_utils import decode_html, parse_html
+from shared.html_index import PageIndex
+from shared.url_rules import classify_url
+from shared.structured_data import extract_structured_data, parse_price, detect_currency
+from shared.http_cache import HttpCache, get_http_cache
+from shared.ai_memo import content_fingerprint, get_ai_memo
+from shared.batch import run_per_host
+from shared.process_pool import WarmProcessPool
+from shared.long_document import chunk_text, estimate_tokens, map_chunks
+from shared.content_selector import CONTENT_TOKEN_BUDGET, select_content
+from shared.gemini_batch import get_gemini_batch_queue, text_part, BatchQueueUnavailable
+from shared.cache_store import shared_store_configured
+from shared.audio_utils import SAMPLE_RATE, decode_audio, detect_speech, probe_duration
+from shared.chunked_transcription import CHUNKED_TRANSCRIPTION_MIN_SECONDS, transcribe_in_chunks
 
 # Configuration
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
 ASSEMBLYAI_API_KEY = os.environ.get('ASSEMBLYAI_API_KEY')
+SINGLEFLIGHT_BUCKET = os.environ.get('SINGLEFLIGHT_BUCKET')  # Optional: enables cross-instance coalescing
 USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 
+# Fetch limits - extract_main_content keeps ~15k chars of text, so bytes
+# beyond a couple of MB are never used
+MAX_FETCH_BYTES = int(os.environ.get('MAX_FETCH_BYTES', 2 * 1024 * 1024))
+FETCH_CHUNK_SIZE = 64 * 1024
+HEAD_BODY_BYTES = 256 * 1024  # body kept after </head> in stop_after_head mode
+MAX_DECOMPRESSION_RATIO = 100  # HTML rarely compresses beyond ~20x
+BOMB_CHECK_MIN_BYTES = 1024 * 1024
+
+# Content limits - a single Gemini call gets CONTENT_TOKEN_BUDGET tokens of
+# page text (picked by select_content); longer articles are summarized chunk
+# by chunk (map-reduce) up to LONG_DOCUMENT_MAX_CHARS
+MAX_CONTENT_CHARS = 15000
+LONG_DOCUMENT_MAX_CHARS = int(os.environ.get('LONG_DOCUMENT_MAX_CHARS', 200000))
+
+# Batch enrichment limits
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 100))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))  # URLs in flight
+BATCH_PER_HOST = int(os.environ.get('BATCH_PER_HOST', 2))  # URLs in flight per host
+BATCH_HOST_INTERVAL = float(os.environ.get('BATCH_HOST_INTERVAL', 1.0))  # Seconds between starts on one host
+
+# Parse/extract worker processes for enrich_webpages_batch (0 or 1 parses on the
+# request thread). Set it to the instance's vCPU allocation; os.cpu_count() reports the host's.
+PARSE_POOL_WORKERS = int(os.environ.get('PARSE_POOL_WORKERS', 0))
+
+# Gemini model and analysis prompt version are part of the memo key -
+# bump the version whenever the prompt changes
+GEMINI_MODEL = 'gemini-2.0-flash'
+ANALYSIS_PROMPT_VERSION = 'webpage-analysis-v1'
+CHUNK_SUMMARY_PROMPT_VERSION = 'webpage-chunk-summary-v1'
+
 # Spotify API token cache
 _spotify_token_cache = {'token': None, 'expires_at': 0}
 
-# URL patterns for type detection
-VIDEO_PATTERNS = ['youtube.com', 'youtu.be', 'vimeo.com', 'tiktok.com', 'twitch.tv']
-SOCIAL_PATTERNS = ['twitter.com', 'x.com', 'instagram.com', 'linkedin.com/posts', 'facebook.com', 'threads.net']
-CODE_PATTERNS = ['github.com', 'gitlab.com', 'stackoverflow.com', 'codepen.io', 'jsfiddle.net', 'replit.com']
-PRODUCT_PATTERNS = ['amazon.', 'ebay.', 'etsy.com', 'shopify.', 'aliexpress.', 'walmart.com', 'target.com']
-PODCAST_PATTERNS = ['spotify.com/episode', 'podcasts.apple.com', 'overcast.fm', 'pocketcasts.com']
+
+def _get_storage_client():
+    """Initialize Cloud Storage client (only needed for cross-instance features)."""
+    from google.cloud import storage
+    return storage.Client()
+
+
+# Coalesces concurrent requests for the same URL (e.g. Notion firing twice)
+_singleflight = SingleFlight(
+    lease=GCSLease(SINGLEFLIGHT_BUCKET, _get_storage_client) if SINGLEFLIGHT_BUCKET else None
+)
 
 
 def get_spotify_access_token() -> str:
@@ -289,83 +352,119 @@ def find_episode_in_rss(rss_url: str, episode_title: str, duration_minutes: int
         return {'success': False, 'error': str(e)}
 
 
-def transcribe_audio_url(audio_url: str) -> dict:
-    """Transcribe audio from URL using AssemblyAI."""
-    if not ASSEMBLYAI_API_KEY:
-        return {'success': False, 'error': 'ASSEMBLYAI_API_KEY not configured'}
+def assemblyai_transcribe(audio: str) -> dict:
+    """Run one AssemblyAI job on an audio URL or local file."""
+    import assemblyai as aai
 
-    try:
-        import assemblyai as aai
+    aai.settings.api_key = ASSEMBLYAI_API_KEY
 
-        aai.settings.api_key = ASSEMBLYAI_API_KEY
+    # Configure transcription
+    config = aai.TranscriptionConfig(
+        speech_model=aai.SpeechModel.best,
+        punctuate=True,
+        format_text=True,
+    )
 
-        # Configure transcription
-        config = aai.TranscriptionConfig(
-            speech_model=aai.SpeechModel.best,
-            punctuate=True,
-            format_text=True,
-        )
+    # Create transcriber and transcribe
+    transcriber = aai.Transcriber(config=config)
+    transcript = transcriber.transcribe(audio)
 
-        # Create transcriber and transcribe
-        transcriber = aai.Transcriber(config=config)
-        transcript = transcriber.transcribe(audio_url)
+    if transcript.status == aai.TranscriptStatus.error:
+        return {'error': transcript.error}
 
-        if transcript.status == aai.TranscriptStatus.error:
-            return {'success': False, 'error': transcript.error}
+    return {
+        'text': transcript.text,
+        'words': [{'text': w.text, 'start': w.start, 'end': w.end} for w in (transcript.words or [])],
+        'confidence': transcript.confidence,
+        'audio_duration_seconds': transcript.audio_duration,
+        'error': None
+    }
 
-        return {
-            'success': True,
-            'text': transcript.text,
-            'confidence': transcript.confidence,
-            'audio_duration_seconds': transcript.audio_duration
-        }
+
+def transcribe_audio_url(audio_url: str, duration_seconds: float = None, chunked: bool = True,
+                         include_words: bool = False) -> dict:
+    """
+    Transcribe audio from URL using AssemblyAI.
+
+    Episodes of CHUNKED_TRANSCRIPTION_MIN_SECONDS or more are decoded
+    locally, split at pauses and transcribed as parallel chunks
+    (shared/chunked_transcription.py); shorter ones are one job on the URL.
+    When the length is not given it is probed first (ffprobe reads only the
+    headers), so short episodes are never decoded; episodes whose length
+    cannot be probed also go as one job.
+
+    Args:
+        audio_url: Audio file URL (podcast enclosure)
+        duration_seconds: Episode length if known, to skip decoding short ones
+        chunked: Allow chunked transcription
+        include_words: Also return the word list (used internally for
+            stitching, left out by default)
+
+    Returns:
+        Dict with success, text, word_count, words (start/end in ms; only
+        with include_words), confidence, audio_duration_seconds and chunks
+        (when chunked), or error
+    """
+    if not ASSEMBLYAI_API_KEY:
+        return {'success': False, 'error': 'ASSEMBLYAI_API_KEY not configured'}
+
+    try:
+        result = None
+        if chunked and duration_seconds is None:
+            duration_seconds = probe_duration(audio_url)
+        if chunked and duration_seconds and duration_seconds >= CHUNKED_TRANSCRIPTION_MIN_SECONDS:
+            samples = decode_audio(audio_url, duration=duration_seconds)
+            if samples is not None and len(samples) / SAMPLE_RATE >= CHUNKED_TRANSCRIPTION_MIN_SECONDS:
+                with tempfile.TemporaryDirectory() as workdir:
+                    result = transcribe_in_chunks(samples, detect_speech(samples), assemblyai_transcribe, workdir)
+                result['audio_duration_seconds'] = round(len(samples) / SAMPLE_RATE, 2)
+
+        if result is None:
+            result = assemblyai_transcribe(audio_url)
+            if result['error']:
+                return {'success': False, 'error': result['error']}
+            del result['error']
+        result['word_count'] = len(result['words'])
+        if not include_words:
+            del result['words']
+        return {'success': True, **result}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
 
-def detect_content_type(url: str, soup: BeautifulSoup) -> str:
+def detect_content_type(url: str, soup: BeautifulSoup, index: PageIndex = None) -> str:
     """Detect the type of content based on URL and page content."""
-    domain = urlparse(url).netloc.lower()
-
-    # Check URL patterns first
-    for pattern in VIDEO_PATTERNS:
-        if pattern in domain:
-            return 'video'
-
-    for pattern in PODCAST_PATTERNS:
-        if pattern in url.lower():
-            return 'podcast'
+    url = canonicalize_url(url)
 
-    for pattern in SOCIAL_PATTERNS:
-        if pattern in domain:
-            return 'social'
-
-    for pattern in CODE_PATTERNS:
-        if pattern in domain:
-            return 'code'
-
-    for pattern in PRODUCT_PATTERNS:
-        if pattern in domain:
-            return 'product'
+    # Check URL rules first (shared/url_rules.json)
+    url_type = classify_url(url)
+    if url_type:
+        return url_type
 
     # Check page content for product indicators
     if soup:
-        # Look for price indicators
-        price_patterns = soup.find_all(attrs={'class': re.compile(r'price|cost|amount', re.I)})
-        add_to_cart = soup.find_all(text=re.compile(r'add to cart|buy now|purchase', re.I))
-        if price_patterns or add_to_cart:
+        index = index or PageIndex(soup)
+
+        # Product signals: structured data, price elements, purchase buttons
+        if index.product_signal():
             return 'product'
 
         # Look for code blocks
-        code_blocks = soup.find_all(['pre', 'code'])
-        if len(code_blocks) > 3:
+        if index.has_code_blocks(4):
             return 'code'
 
     return 'article'
 
 
-def extract_metadata(url: str, soup: BeautifulSoup) -> dict:
-    """Extract metadata from the webpage."""
+def extract_metadata(url: str, soup: BeautifulSoup, index: PageIndex = None,
+                     structured: dict = None) -> dict:
+    """
+    Extract metadata from the webpage.
+
+    Fields come from JSON-LD, microdata and OpenGraph first (pass the result
+    of extract_structured_data to avoid parsing it twice); the DOM
+    heuristics below only run for fields structured data leaves empty.
+    """
     metadata = {
         'title': None,
         'author': None,
@@ -377,13 +476,19 @@ def extract_metadata(url: str, soup: BeautifulSoup) -> dict:
     if not soup:
         return metadata
 
+    index = index or PageIndex(soup)
+    if structured is None:
+        structured = extract_structured_data(index)
+    for field in metadata:
+        metadata[field] = structured.get(field)
+
     # Title - try multiple sources
-    og_title = soup.find('meta', property='og:title')
-    twitter_title = soup.find('meta', attrs={'name': 'twitter:title'})
-    title_tag = soup.find('title')
-    h1_tag = soup.find('h1')
+    og_title = index.meta_property('og:title')
+    twitter_title = index.meta_name('twitter:title')
+    title_tag = index.first('title')
+    h1_tag = index.first('h1')
 
-    metadata['title'] = (
+    metadata['title'] = metadata['title'] or (
         og_title.get('content') if og_title else
         twitter_title.get('content') if twitter_title else
         title_tag.get_text(strip=True) if title_tag else
@@ -392,12 +497,12 @@ def extract_metadata(url: str, soup: BeautifulSoup) -> dict:
     )
 
     # Author
-    author_meta = soup.find('meta', attrs={'name': 'author'})
-    author_prop = soup.find('meta', property='article:author')
-    author_rel = soup.find('a', rel='author')
-    author_class = soup.find(attrs={'class': re.compile(r'author|byline', re.I)})
+    author_meta = index.meta_name('author')
+    author_prop = index.meta_property('article:author')
+    author_rel = index.first_rel_author()
+    author_class = index.first_class('author')
 
-    metadata['author'] = (
+    metadata['author'] = metadata['author'] or (
         author_meta.get('content') if author_meta else
         author_prop.get('content') if author_prop else
         author_rel.get_text(strip=True) if author_rel else
@@ -410,8 +515,8 @@ def extract_metadata(url: str, soup: BeautifulSoup) -> dict:
         metadata['author'] = re.sub(r'^by\s+', '', metadata['author'], flags=re.I).strip()
 
     # Published date
-    date_meta = soup.find('meta', property='article:published_time')
-    date_time = soup.find('time', attrs={'datetime': True})
+    date_meta = index.meta_property('article:published_time')
+    date_time = index.first('time', with_attr='datetime')
 
     date_str = (
         date_meta.get('content') if date_meta else
@@ -419,7 +524,7 @@ def extract_metadata(url: str, soup: BeautifulSoup) -> dict:
         None
     )
 
-    if date_str:
+    if date_str and not metadata['published_date']:
         try:
             # Parse ISO format
             metadata['published_date'] = date_str[:10]  # Just YYYY-MM-DD
@@ -427,20 +532,20 @@ def extract_metadata(url: str, soup: BeautifulSoup) -> dict:
             pass
 
     # Main image
-    og_image = soup.find('meta', property='og:image')
-    twitter_image = soup.find('meta', attrs={'name': 'twitter:image'})
+    og_image = index.meta_property('og:image')
+    twitter_image = index.meta_name('twitter:image')
 
-    metadata['main_image'] = (
+    metadata['main_image'] = metadata['main_image'] or (
         og_image.get('content') if og_image else
         twitter_image.get('content') if twitter_image else
         None
     )
 
     # Description
-    og_desc = soup.find('meta', property='og:description')
-    meta_desc = soup.find('meta', attrs={'name': 'description'})
+    og_desc = index.meta_property('og:description')
+    meta_desc = index.meta_name('description')
 
-    metadata['description'] = (
+    metadata['description'] = metadata['description'] or (
         og_desc.get('content') if og_desc else
         meta_desc.get('content') if meta_desc else
         None
@@ -449,28 +554,31 @@ def extract_metadata(url: str, soup: BeautifulSoup) -> dict:
     return metadata
 
 
-def extract_main_content(soup: BeautifulSoup) -> str:
-    """Extract the main text content from the page."""
+def extract_main_content(soup: BeautifulSoup, index: PageIndex = None, max_chars: int = MAX_CONTENT_CHARS) -> str:
+    """Extract the main text content from the page (at most max_chars)."""
     if not soup:
         return ""
 
+    index = index or PageIndex(soup)
+
     # Remove script, style, nav, footer, header elements
-    for element in soup.find_all(['script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript']):
-        element.decompose()
+    for tag_name in ['script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript']:
+        for element in index.all(tag_name):
+            element.decompose()
 
     # Try to find main content area
     main_content = (
-        soup.find('article') or
-        soup.find('main') or
-        soup.find(attrs={'class': re.compile(r'content|post|article|entry', re.I)}) or
-        soup.find('body')
+        index.first('article') or
+        index.first('main') or
+        index.first_class('content') or
+        index.first('body')
     )
 
     if main_content:
         text = main_content.get_text(separator=' ', strip=True)
         # Clean up whitespace
         text = re.sub(r'\s+', ' ', text)
-        return text[:15000]  # Limit to ~15k chars for AI processing
+        return text[:max_chars]
 
     return ""
 
@@ -486,55 +594,56 @@ def calculate_reading_time(text: str) -> int:
     return reading_time
 
 
-def extract_price(soup: BeautifulSoup) -> dict:
-    """Extract price information from product pages."""
+def extract_price(soup: BeautifulSoup, index: PageIndex = None, structured: dict = None) -> dict:
+    """
+    Extract price information from product pages.
+
+    Uses the structured-data offer (JSON-LD, microdata, OpenGraph) when the
+    page has one and falls back to price-like elements otherwise.
+    """
     result = {'price': None, 'currency': None}
 
     if not soup:
         return result
 
+    index = index or PageIndex(soup)
+    if structured is None:
+        structured = extract_structured_data(index)
+    if structured.get('price') is not None:
+        result['price'] = structured['price']
+        result['currency'] = structured.get('currency')
+        return result
+
     # Common price patterns
-    price_selectors = [
-        {'class': re.compile(r'price', re.I)},
-        {'itemprop': 'price'},
-        {'data-price': True},
+    price_candidates = [
+        index.first_class('price'),
+        index.first_itemprop('price'),
+        index.first_data_price(),
     ]
 
-    for selector in price_selectors:
-        element = soup.find(attrs=selector)
+    for element in price_candidates:
         if element:
             text = element.get_text(strip=True)
-            # Extract price with regex
-            match = re.search(r'[\$\£\€]?\s*(\d+(?:[.,]\d{2})?)', text)
-            if match:
-                price_str = match.group(1).replace(',', '.')
-                try:
-                    result['price'] = float(price_str)
-                except:
-                    pass
-
-                # Detect currency
-                if '$' in text:
-                    result['currency'] = 'USD'
-                elif '£' in text:
-                    result['currency'] = 'GBP'
-                elif '€' in text:
-                    result['currency'] = 'EUR'
-
+            price = parse_price(text)
+            if price is not None:
+                result['price'] = price
+                result['currency'] = detect_currency(text)
                 break
 
     return result
 
 
-def extract_code_snippets(soup: BeautifulSoup) -> list:
+def extract_code_snippets(soup: BeautifulSoup, index: PageIndex = None) -> list:
     """Extract code snippets from the page."""
     snippets = []
 
     if not soup:
         return snippets
 
+    index = index or PageIndex(soup)
+
     # Find code blocks
-    code_blocks = soup.find_all(['pre', 'code'])
+    code_blocks = index.live_code_blocks()
 
     for block in code_blocks:
         code = block.get_text(strip=True)
@@ -555,28 +664,9 @@ def extract_code_snippets(soup: BeautifulSoup) -> list:
     return snippets[:5]  # Max 5 snippets
 
 
-def generate_ai_analysis(url: str, title: str, content: str, content_type: str) -> dict:
-    """Generate AI-cleaned title, summary and analysis using Gemini."""
-    result = {
-        'title': title,  # Fallback to original
-        'summary': None,
-        'analysis': None,
-        'error': None
-    }
-
-    if not GEMINI_API_KEY:
-        result['error'] = 'GEMINI_API_KEY not configured'
-        return result
-
-    if not content or len(content) < 100:
-        result['error'] = 'Insufficient content for analysis'
-        return result
-
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-
-        prompt = f"""Analyze this webpage and provide:
+def _analysis_prompt(url: str, title: str, content_type: str, content_label: str, content: str) -> str:
+    """Prompt for the title/summary/analysis call over content (page text or section summaries)."""
+    return f"""Analyze this webpage and provide:
 
 1. **Title**: Clean up the raw title. Keep it as close to the original as possible but:
    - Remove site names, separators like " | " or " - Site Name" at the end
@@ -592,8 +682,8 @@ URL: {url}
 Raw Title: {title}
 Content Type: {content_type}
 
-Page Content:
-{content[:10000]}
+{content_label}:
+{content}
 
 Respond in this exact JSON format:
 {{
@@ -603,19 +693,138 @@ Respond in this exact JSON format:
 }}
 """
 
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-
-        # Extract JSON from response
-        json_match = re.search(r'\{[\s\S]*\}', response_text)
-        if json_match:
-            parsed = json.loads(json_match.group())
-            result['title'] = parsed.get('title') or title
-            result['summary'] = parsed.get('summary')
-            result['analysis'] = parsed.get('analysis')
+
+def summarize_chunk(model, chunk: str) -> str:
+    """
+    Map step of long-document summarization: summarize one chunk.
+
+    The prompt holds only the chunk text (no title or position), so the
+    summary depends on nothing but the chunk and can be memoized by its hash.
+    """
+    prompt = f"""Summarize this section of a longer article in 3-5 sentences.
+Keep the key facts, arguments, names and numbers. Do not add commentary.
+
+Section:
+{chunk}
+"""
+    response = model.generate_content(prompt)
+    summary = response.text.strip()
+    if not summary:
+        raise ValueError('Empty chunk summary')
+    return summary
+
+
+def _parse_analysis_response(response_text: str, title: str) -> dict:
+    """Title, summary and analysis from a Gemini answer to _analysis_prompt."""
+    response_text = (response_text or '').strip()
+    json_match = re.search(r'\{[\s\S]*\}', response_text)
+    if json_match:
+        parsed = json.loads(json_match.group())
+        return {
+            'title': parsed.get('title') or title,
+            'summary': parsed.get('summary'),
+            'analysis': parsed.get('analysis'),
+        }
+    # Fallback: use whole response as analysis
+    return {'title': title, 'summary': None, 'analysis': response_text}
+
+
+def generate_ai_analysis(url: str, title: str, content: str, content_type: str,
+                         long_document: bool = True, defer: bool = False) -> dict:
+    """
+    Generate AI-cleaned title, summary and analysis using Gemini.
+
+    Articles over CONTENT_TOKEN_BUDGET that chunk_text splits into more than
+    one chunk are summarized map-reduce style (unless long_document is
+    False): the chunks are summarized concurrently and one final call
+    analyzes the chunk summaries. Other content is sent in one call, reduced to the
+    budget by select_content (highest-value spans, not the first N chars).
+
+    Results are memoized on a hash of the content sent to the model, the
+    content type, ANALYSIS_PROMPT_VERSION and GEMINI_MODEL, so the same
+    article under another URL or an unchanged page costs no second call.
+    Chunk summaries are memoized by chunk hash, so an edited article only
+    re-summarizes the chunks that changed.
+
+    With defer=True the prompt is queued for the next Gemini batch job
+    instead of being sent (always single-call; see webpage_ai_batch), and
+    the result has deferred=True and batch_key set.
+    """
+    result = {
+        'title': title,  # Fallback to original
+        'summary': None,
+        'analysis': None,
+        'error': None
+    }
+
+    if not GEMINI_API_KEY:
+        result['error'] = 'GEMINI_API_KEY not configured'
+        return result
+
+    if not content or len(content) < 100:
+        result['error'] = 'Insufficient content for analysis'
+        return result
+
+    # Map-reduce needs the chunk answers before the final prompt, so it cannot be deferred.
+    # A text over the budget that still fits one chunk would cost two calls for
+    # nothing; it goes through select_content like shorter content.
+    chunks = []
+    if (long_document and not defer and content_type == 'article'
+            and estimate_tokens(content) > CONTENT_TOKEN_BUDGET):
+        chunks = chunk_text(content)
+    map_reduce = len(chunks) > 1
+    page_content = content if map_reduce else select_content(content, CONTENT_TOKEN_BUDGET)
+    key_parts = [content_type, ANALYSIS_PROMPT_VERSION, GEMINI_MODEL]
+    if map_reduce:
+        key_parts += ['map-reduce', CHUNK_SUMMARY_PROMPT_VERSION]
+
+    memo = get_ai_memo()
+    memo_key = content_fingerprint(page_content, *key_parts)
+    cached = memo.get(memo_key)
+    if cached:
+        print(f"AI analysis memo hit: {url}")
+        return dict(cached)
+
+    if defer:
+        prompt = _analysis_prompt(url, title, content_type, 'Page Content', page_content)
+        try:
+            queued = get_gemini_batch_queue('gemini_batch_webpage').enqueue(
+                url,
+                [text_part(prompt)],
+                context={'url': url, 'title': title, 'memo_key': memo_key},
+            )
+        except Exception as e:
+            # The page itself was fetched fine; report the failed deferral like a failed call
+            result['error'] = f"Could not queue AI analysis: {e}"
+            return result
+        print(f"AI analysis deferred to batch: {url}")
+        result.update(deferred=True, batch_key=queued['batch_key'])
+        return result
+
+    try:
+        genai.configure(api_key=GEMINI_API_KEY)
+        model = genai.GenerativeModel(GEMINI_MODEL)
+
+        if map_reduce:
+            summaries = map_chunks(
+                chunks,
+                lambda chunk: summarize_chunk(model, chunk),
+                memo=memo,
+                key_parts=(CHUNK_SUMMARY_PROMPT_VERSION, GEMINI_MODEL),
+            )
+            print(f"Long document: {len(chunks)} chunks summarized for {url}")
+            sections = '\n\n'.join(f"Part {i}: {summary}" for i, summary in enumerate(summaries, 1))
+            prompt = _analysis_prompt(
+                url, title, content_type,
+                f"Page Content (summaries of the article's {len(chunks)} parts, in order)", sections,
+            )
         else:
-            # Fallback: use whole response as analysis
-            result['analysis'] = response_text
+            prompt = _analysis_prompt(url, title, content_type, 'Page Content', page_content)
+
+        response = model.generate_content(prompt)
+        result.update(_parse_analysis_response(response.text, title))
+
+        memo.set(memo_key, dict(result))
 
     except Exception as e:
         result['error'] = str(e)
@@ -623,26 +832,555 @@ Respond in this exact JSON format:
     return result
 
 
-def fetch_webpage(url: str) -> tuple:
-    """Fetch webpage content. Returns (html, error)."""
+def fetch_webpage_stream(url: str, max_bytes: int = None, stop_after_head: bool = False,
+                         body_bytes: int = HEAD_BODY_BYTES, extra_headers: dict = None,
+                         decode: bool = True) -> dict:
+    """
+    Fetch a webpage incrementally, stopping early when enough has arrived.
+
+    Reads the (decompressed) body in chunks instead of buffering it all, so
+    multi-megabyte pages cost only the bytes we actually use.
+
+    Args:
+        url: URL to fetch
+        max_bytes: Maximum decompressed bytes to read (default MAX_FETCH_BYTES)
+        stop_after_head: If True, stop once </head> plus body_bytes of body
+            have arrived
+        body_bytes: Body bytes to keep after </head> when stop_after_head is set
+        extra_headers: Additional request headers (e.g. If-None-Match)
+        decode: If False, skip decoding and return only the raw bytes
+            (decoding then happens wherever the page is parsed)
+
+    Returns:
+        Dict with:
+            html: str or None (None when decode is False)
+            content: bytes or None - Raw (decompressed) body
+            content_type: str or None - Content-Type response header
+            error: str or None
+            truncated: bool - True if the body was cut short
+            bytes_read: int - Decompressed bytes read
+            final_url: str - URL after redirects
+            encoding: str or None - Charset used to decode the body
+            not_modified: bool - True on a 304 (html is None)
+            etag: str or None - ETag response header
+            last_modified: str or None - Last-Modified response header
+    """
+    max_bytes = max_bytes or MAX_FETCH_BYTES
+    result = {
+        'html': None,
+        'content': None,
+        'content_type': None,
+        'error': None,
+        'truncated': False,
+        'bytes_read': 0,
+        'final_url': url,
+        'encoding': None,
+        'not_modified': False,
+        'etag': None,
+        'last_modified': None,
+    }
+
     try:
         headers = {
             'User-Agent': USER_AGENT,
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
         }
+        headers.update(extra_headers or {})
 
-        response = requests.get(url, headers=headers, timeout=30, allow_redirects=True)
-        response.raise_for_status()
-
-        return response.text, None
+        response = requests.get(url, headers=headers, timeout=30, allow_redirects=True, stream=True)
+        try:
+            response.raise_for_status()
+            result['final_url'] = response.url
+
+            if response.status_code == 304:
+                # Conditional request: the caller's cached copy is still current
+                result['not_modified'] = True
+                return result
+
+            result['content_type'] = response.headers.get('Content-Type')
+            result['etag'] = response.headers.get('ETag')
+            result['last_modified'] = response.headers.get('Last-Modified')
+
+            # Remember where short links lead so the next request skips the hops
+            if response.history and is_short_link(url):
+                get_redirect_cache().record(url, response.url)
+
+            chunks = []
+            total = 0
+            head_end = None
+            carry = b''
+            complete = True
+
+            for chunk in response.iter_content(chunk_size=FETCH_CHUNK_SIZE):
+                if not chunk:
+                    continue
+                chunks.append(chunk)
+                total += len(chunk)
+
+                # Decompression-bomb guard: compare decoded size to wire size
+                wire_bytes = response.raw.tell() if hasattr(response.raw, 'tell') else 0
+                if total > BOMB_CHECK_MIN_BYTES and wire_bytes and total > wire_bytes * MAX_DECOMPRESSION_RATIO:
+                    result['error'] = (
+                        f'Response rejected: decompressed {total} bytes from {wire_bytes} '
+                        f'(ratio over {MAX_DECOMPRESSION_RATIO}x)'
+                    )
+                    return result
+
+                if stop_after_head and head_end is None:
+                    # Search the new chunk plus the previous tail, in case the tag is split
+                    probe = carry + chunk
+                    pos = probe.lower().find(b'</head>')
+                    if pos != -1:
+                        head_end = total - len(probe) + pos + len(b'</head>')
+                    carry = chunk[-6:]
+
+                if total >= max_bytes or (head_end is not None and total >= head_end + body_bytes):
+                    complete = False
+                    break
+        finally:
+            response.close()
+
+        content = b''.join(chunks)
+        limit = max_bytes
+        if head_end is not None:
+            limit = min(limit, head_end + body_bytes)
+        if len(content) > limit:
+            content = content[:limit]
+
+        result['content'] = content
+        if decode:
+            result['html'], result['encoding'] = decode_html(content, result['content_type'])
+        result['truncated'] = not complete
+        result['bytes_read'] = len(content)
 
     except requests.exceptions.Timeout:
-        return None, 'Request timed out'
+        result['error'] = 'Request timed out'
     except requests.exceptions.HTTPError as e:
-        return None, f'HTTP error: {e.response.status_code}'
+        result['error'] = f'HTTP error: {e.response.status_code}'
     except requests.exceptions.RequestException as e:
-        return None, f'Request failed: {str(e)}'
+        result['error'] = f'Request failed: {str(e)}'
+
+    return result
+
+
+def fetch_webpage(url: str, max_bytes: int = None) -> tuple:
+    """Fetch webpage content. Returns (html, error)."""
+    result = fetch_webpage_stream(url, max_bytes=max_bytes)
+    return result['html'], result['error']
+
+
+def extract_page(html: str, canonical_url: str, metadata_only: bool = False, extract_code: bool = True) -> dict:
+    """
+    Parse a fetched page and run every extractor.
+
+    This is the CPU-bound stage of process_webpage. It is a module-level
+    function of plain arguments so it can run in a process pool.
+
+    Args:
+        html: Decoded page HTML
+        canonical_url: Canonical URL of the page
+        metadata_only: Parse head-level tags only and skip body extraction
+        extract_code: Extract code snippets from code pages
+
+    Returns:
+        Dict with:
+            content_type: str
+            metadata: dict - title, author, published_date, main_image, description
+            main_content: str - Main text ('' in metadata-only mode)
+            reading_time: int or None
+            price_info: dict - price, currency
+            code_snippets: list
+    """
+    # Parse HTML - the full body tree is only built when content is needed
+    soup = parse_html(html, mode='metadata' if metadata_only else 'full')
+
+    # Index the tree once; every extractor queries the index
+    index = PageIndex(soup)
+
+    # Detect content type
+    content_type = detect_content_type(canonical_url, soup, index)
+
+    # Structured data (JSON-LD, microdata, OpenGraph) is parsed once for all extractors
+    structured = extract_structured_data(index)
+
+    # Extract metadata
+    metadata = extract_metadata(canonical_url, soup, index, structured)
+
+    page = {
+        'content_type': content_type,
+        'metadata': metadata,
+        'main_content': '',
+        'reading_time': None,
+        'price_info': {'price': None, 'currency': None},
+        'code_snippets': [],
+    }
+
+    if not metadata_only:
+        # Extract main content - articles keep their full text for map-reduce summarization
+        max_chars = LONG_DOCUMENT_MAX_CHARS if content_type == 'article' else MAX_CONTENT_CHARS
+        page['main_content'] = extract_main_content(soup, index, max_chars)
+
+        # Calculate reading time
+        if content_type == 'article':
+            page['reading_time'] = calculate_reading_time(page['main_content'])
+
+        # Extract price if product
+        if content_type == 'product':
+            page['price_info'] = extract_price(soup, index, structured)
+
+        # Extract code snippets if code resource
+        if content_type == 'code' and extract_code:
+            page['code_snippets'] = extract_code_snippets(soup, index)
+
+    return page
+
+
+def extract_page_job(content: bytes, content_type_header: str, canonical_url: str,
+                     metadata_only: bool = False, extract_code: bool = True) -> dict:
+    """
+    Decode raw page bytes and run extract_page - the unit of work sent to
+    the parse pool.
+
+    Takes bytes rather than decoded HTML so charset sniffing also runs in
+    the worker, and returns only the extracted fields (never the tree).
+
+    Args:
+        content: Raw (decompressed) response body
+        content_type_header: Content-Type response header, for the charset
+        canonical_url: Canonical URL of the page
+        metadata_only: See extract_page
+        extract_code: See extract_page
+
+    Returns:
+        extract_page's dict plus encoding (charset used to decode the body)
+    """
+    html, encoding = decode_html(content, content_type_header)
+    page = extract_page(html, canonical_url, metadata_only, extract_code)
+    page['encoding'] = encoding
+    return page
+
+
+# Only the batch entry point parses in worker processes; enrich_webpage serves one
+# URL per request and parses inline. Deployed as the batch function, the workers
+# fork from this module with bs4/lxml loaded, at import (before any client thread
+# starts) so the first request does not pay for it. Worker processes that import
+# this module (forkserver/spawn restarts) must not start a pool of their own.
+_parse_pool = WarmProcessPool(PARSE_POOL_WORKERS)
+if (os.environ.get('FUNCTION_TARGET') == 'enrich_webpages_batch'
+        and multiprocessing.parent_process() is None):
+    _parse_pool.warm()
+
+
+def _run_inline(fn, *args):
+    return fn(*args)
+
+
+def process_webpage(url: str, options: dict, parse_pool: WarmProcessPool = None) -> tuple:
+    """
+    Enrich a single URL.
+
+    Args:
+        url: URL to enrich
+        options: Request options (skip_ai, extract_code, metadata_only,
+            max_bytes, stop_after_head, use_cache, long_document, defer_ai)
+        parse_pool: Pool to decode/parse/extract in (default: inline)
+
+    Returns:
+        Tuple of (json_body, status_code)
+    """
+    if options.get('defer_ai') and not shared_store_configured():
+        return (json.dumps({
+            'url': url,
+            'error': 'defer_ai requires CACHE_BUCKET (a store shared by all instances)'
+        }), 400)
+
+    skip_ai = options.get('skip_ai', False)
+    extract_code = options.get('extract_code', True)
+    # Metadata-only: head-level fields only, no body tree, content or AI
+    metadata_only = options.get('metadata_only', False)
+
+    # Resolve short links and strip tracking params; the response keeps the
+    # original url so n8n can match it back to the Notion page
+    canonical_url = parse_canonical(url, resolve=True)['url']
+    # The page itself is fetched as saved (short links followed): stripped
+    # params like ref= or a trailing slash can select different content.
+    # The canonical form only keys the caches.
+    fetch_url = url.strip()
+    if is_short_link(fetch_url):
+        fetch_url = resolve_short_link(fetch_url)
+
+    # Extract domain
+    parsed_url = urlparse(canonical_url)
+    domain = parsed_url.netloc.replace('www.', '')
+
+    # Special handling for Spotify podcast episodes - use Web API (with oEmbed fallback)
+    if 'spotify.com/episode' in canonical_url.lower():
+        spotify_data = fetch_spotify_episode(canonical_url)
+        if spotify_data.get('success'):
+            # Build content for AI analysis - much richer with Web API data
+            content_parts = []
+            if spotify_data.get('title'):
+                content_parts.append(f"Episode: {spotify_data['title']}")
+            if spotify_data.get('show_name'):
+                content_parts.append(f"Show: {spotify_data['show_name']}")
+            if spotify_data.get('publisher'):
+                content_parts.append(f"Publisher: {spotify_data['publisher']}")
+            if spotify_data.get('description'):
+                content_parts.append(f"Description: {spotify_data['description']}")
+            if spotify_data.get('show_description'):
+                content_parts.append(f"Show Description: {spotify_data['show_description']}")
+            if spotify_data.get('duration_minutes'):
+                content_parts.append(f"Duration: {spotify_data['duration_minutes']} minutes")
+
+            content_for_ai = '\n'.join(content_parts)
+
+            # Generate AI analysis with rich content
+            ai_result = {'title': spotify_data['title'], 'summary': None, 'analysis': None}
+            if not options.get('skip_ai', False) and GEMINI_API_KEY and content_for_ai:
+                try:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                    model = genai.GenerativeModel(GEMINI_MODEL)
+                    prompt = f"""Analyze this podcast episode:
+
+{content_for_ai}
+
+Platform: Spotify
+
+Provide:
+1. A 2-3 sentence summary of what this episode covers
+2. Key topics and who would find this useful
+
+Respond in this exact JSON format (both values must be plain text strings, not arrays or objects):
+{{"summary": "Your 2-3 sentence summary here", "analysis": "Key topics: topic1, topic2, topic3. Target audience: description of who would find this useful."}}"""
+                    response = model.generate_content(prompt)
+                    json_match = re.search(r'\{[\s\S]*\}', response.text.strip())
+                    if json_match:
+                        parsed = json.loads(json_match.group())
+                        ai_result['summary'] = parsed.get('summary')
+                        # Ensure analysis is a string
+                        analysis = parsed.get('analysis')
+                        if isinstance(analysis, dict):
+                            parts = []
+                            if 'key_topics' in analysis:
+                                parts.append(f"Key topics: {', '.join(analysis['key_topics']) if isinstance(analysis['key_topics'], list) else analysis['key_topics']}")
+                            if 'target_audience' in analysis:
+                                parts.append(f"Target audience: {', '.join(analysis['target_audience']) if isinstance(analysis['target_audience'], list) else analysis['target_audience']}")
+                            analysis = '. '.join(parts) if parts else str(analysis)
+                        ai_result['analysis'] = analysis
+                except Exception as e:
+                    ai_result['error'] = str(e)
+
+            # Use show name + publisher as author if available
+            author = spotify_data.get('publisher') or spotify_data.get('show_name') or spotify_data.get('provider_name', 'Spotify')
+
+            # Try to get transcription via RSS feed
+            transcription = None
+            transcription_error = None
+
+            if spotify_data.get('show_name') and spotify_data.get('title'):
+                # Step 1: Find RSS feed via iTunes
+                rss_result = search_podcast_itunes(spotify_data['show_name'])
+
+                if rss_result.get('success') and rss_result.get('rss_url'):
+                    # Step 2: Find episode in RSS
+                    episode_result = find_episode_in_rss(
+                        rss_result['rss_url'],
+                        spotify_data['title'],
+                        spotify_data.get('duration_minutes')
+                    )
+
+                    if episode_result.get('success') and episode_result.get('audio_url'):
+                        # Step 3: Transcribe audio
+                        duration_minutes = spotify_data.get('duration_minutes')
+                        transcription_result = transcribe_audio_url(
+                            episode_result['audio_url'],
+                            duration_seconds=duration_minutes * 60 if duration_minutes else None
+                        )
+
+                        if transcription_result.get('success'):
+                            transcription = transcription_result.get('text')
+                        else:
+                            transcription_error = f"Transcription failed: {transcription_result.get('error')}"
+                    else:
+                        transcription_error = f"Episode not found in RSS: {episode_result.get('error')}"
+                else:
+                    transcription_error = f"RSS feed not found: {rss_result.get('error')}"
+
+            response_data = {
+                'url': url,
+                'canonical_url': canonical_url,
+                'domain': domain,
+                'type': 'podcast',
+                'title': spotify_data['title'],
+                'author': author,
+                'published_date': spotify_data.get('release_date'),
+                'main_image': spotify_data.get('thumbnail_url'),
+                'description': spotify_data.get('description'),
+                'reading_time': spotify_data.get('duration_minutes'),  # Use duration as "reading time" for podcasts
+                'price': None,
+                'currency': None,
+                'code_snippets': [],
+                'ai_summary': ai_result.get('summary'),
+                'ai_analysis': ai_result.get('analysis'),
+                'processed_at': datetime.utcnow().isoformat() + 'Z',
+                # Extra Spotify-specific fields
+                'show_name': spotify_data.get('show_name'),
+                'show_description': spotify_data.get('show_description'),
+                'episode_duration_minutes': spotify_data.get('duration_minutes'),
+                # Transcription
+                'transcription': transcription,
+            }
+
+            # Collect errors
+            errors = []
+            if ai_result.get('error'):
+                errors.append({'stage': 'ai_analysis', 'message': ai_result['error'], 'recoverable': True})
+            if transcription_error:
+                errors.append({'stage': 'transcription', 'message': transcription_error, 'recoverable': True})
+
+            if errors:
+                response_data['errors'] = errors
+
+            return (json.dumps(response_data), 200)
+
+    # Fetch the webpage, revalidating any cached copy with a conditional GET
+    http_cache = get_http_cache() if options.get('use_cache', True) else None
+    cache_entry = http_cache.lookup(canonical_url) if http_cache else None
+    result_variant = coalesce_key({k: v for k, v in options.items() if k != 'use_cache'})
+    fetch_kwargs = {
+        'max_bytes': options.get('max_bytes'),
+        'stop_after_head': options.get('stop_after_head', metadata_only),
+        # Bytes go to the parse pool as-is; decoding happens in the worker
+        'decode': False,
+    }
+    fetch_result = fetch_webpage_stream(
+        fetch_url,
+        extra_headers=HttpCache.conditional_headers(cache_entry),
+        **fetch_kwargs,
+    )
+
+    if fetch_result['not_modified']:
+        cached = HttpCache.cached_result(cache_entry, result_variant)
+        if cached:
+            # Unchanged page: reuse the previous extraction and AI result
+            print(f"Not modified, reusing cached result: {canonical_url}")
+            return (json.dumps(dict(
+                cached,
+                url=url,
+                processed_at=datetime.utcnow().isoformat() + 'Z',
+                from_cache=True,
+            )), 200)
+
+        cached_body = HttpCache.cached_body(cache_entry, allow_truncated=metadata_only)
+        if cached_body is not None:
+            fetch_result.update(
+                content=cached_body,
+                content_type=cache_entry.get('content_type'),
+                truncated=cache_entry.get('truncated', False),
+            )
+        else:
+            # The cached body cannot serve this request (cut short); fetch it again
+            fetch_result = fetch_webpage_stream(fetch_url, **fetch_kwargs)
+            cache_entry = None
+
+    if http_cache and fetch_result['content'] is not None and not fetch_result['not_modified']:
+        cache_entry = http_cache.store_page(
+            canonical_url,
+            fetch_result['content'],
+            etag=fetch_result['etag'],
+            last_modified=fetch_result['last_modified'],
+            content_type=fetch_result['content_type'],
+            final_url=fetch_result['final_url'],
+            truncated=fetch_result['truncated'],
+        )
+
+    fetch_error = fetch_result['error']
+
+    if fetch_error:
+        return (json.dumps({
+            'url': url,
+            'domain': domain,
+            'error': {
+                'stage': 'fetch',
+                'message': fetch_error,
+                'recoverable': True
+            }
+        }), 200)  # Return 200 with error in body per ARCHITECTURE.md
+
+    # Decode, parse and extract; in a batch, in a worker process (CPU-bound: on
+    # request threads, concurrent URLs would share one core under the GIL)
+    page = (parse_pool.run if parse_pool else _run_inline)(
+        extract_page_job,
+        fetch_result['content'],
+        fetch_result['content_type'],
+        canonical_url,
+        metadata_only,
+        extract_code,
+    )
+
+    content_type = page['content_type']
+    metadata = page['metadata']
+    reading_time = page['reading_time']
+    price_info = page['price_info']
+    code_snippets = page['code_snippets']
+
+    ai_result = {'title': metadata['title'], 'summary': None, 'analysis': None, 'error': None}
+
+    # Generate AI analysis (includes cleaned title)
+    if not metadata_only and not skip_ai:
+        ai_result = generate_ai_analysis(
+            canonical_url, metadata['title'], page['main_content'], content_type,
+            long_document=options.get('long_document', True),
+            defer=options.get('defer_ai', False),
+        )
+
+    # Build response - use AI-cleaned title
+    response = {
+        'url': url,
+        'canonical_url': canonical_url,
+        'domain': domain,
+        'type': content_type,
+        'title': ai_result.get('title') or metadata['title'],
+        'author': metadata['author'],
+        'published_date': metadata['published_date'],
+        'main_image': metadata['main_image'],
+        'description': metadata['description'],
+        'reading_time': reading_time,
+        'price': price_info['price'],
+        'currency': price_info['currency'],
+        'code_snippets': code_snippets,
+        'ai_summary': ai_result['summary'],
+        'ai_analysis': ai_result['analysis'],
+        'processed_at': datetime.utcnow().isoformat() + 'Z',
+        'truncated': fetch_result['truncated'],
+    }
+
+    if ai_result.get('deferred'):
+        # Not an error: the analysis arrives through webpage_ai_batch
+        response['ai_status'] = 'deferred'
+        response['ai_batch_key'] = ai_result['batch_key']
+
+    # Include errors if any (partial success per ARCHITECTURE.md)
+    if ai_result.get('error'):
+        response['error'] = {
+            'stage': 'ai_analysis',
+            'message': ai_result['error'],
+            'recoverable': True
+        }
+    elif cache_entry and not ai_result.get('deferred'):
+        # Keep the result so a 304 on the next run skips parsing and Gemini
+        http_cache.store_result(canonical_url, result_variant, {
+            k: v for k, v in response.items() if k not in ('url', 'processed_at')
+        })
+
+    return (json.dumps(response), 200)
+
+
+def _enrich_coalesced(url: str, options: dict, parse_pool: WarmProcessPool = None) -> tuple:
+    """Run process_webpage, sharing the result with identical in-flight requests."""
+    key = coalesce_key('enrich_webpage', canonical_key(url, resolve=True), options)
+    return _singleflight.do(key, lambda: process_webpage(url, options, parse_pool))
 
 
 @functions_framework.http
@@ -655,7 +1393,13 @@ def enrich_webpage(request):
         "url": "https://example.com/article",
         "options": {
             "skip_ai": false,
-            "extract_code": true
+            "extract_code": true,
+            "metadata_only": false,
+            "max_bytes": 2097152,
+            "stop_after_head": false,
+            "use_cache": true,
+            "long_document": true,
+            "defer_ai": false
         }
     }
     """
@@ -681,212 +1425,219 @@ def enrich_webpage(request):
 
         url = request_json['url']
         options = request_json.get('options', {})
-        skip_ai = options.get('skip_ai', False)
-        extract_code = options.get('extract_code', True)
-
-        # Extract domain
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc.replace('www.', '')
-
-        # Special handling for Spotify podcast episodes - use Web API (with oEmbed fallback)
-        if 'spotify.com/episode' in url.lower():
-            spotify_data = fetch_spotify_episode(url)
-            if spotify_data.get('success'):
-                # Build content for AI analysis - much richer with Web API data
-                content_parts = []
-                if spotify_data.get('title'):
-                    content_parts.append(f"Episode: {spotify_data['title']}")
-                if spotify_data.get('show_name'):
-                    content_parts.append(f"Show: {spotify_data['show_name']}")
-                if spotify_data.get('publisher'):
-                    content_parts.append(f"Publisher: {spotify_data['publisher']}")
-                if spotify_data.get('description'):
-                    content_parts.append(f"Description: {spotify_data['description']}")
-                if spotify_data.get('show_description'):
-                    content_parts.append(f"Show Description: {spotify_data['show_description']}")
-                if spotify_data.get('duration_minutes'):
-                    content_parts.append(f"Duration: {spotify_data['duration_minutes']} minutes")
-
-                content_for_ai = '\n'.join(content_parts)
-
-                # Generate AI analysis with rich content
-                ai_result = {'title': spotify_data['title'], 'summary': None, 'analysis': None}
-                if not options.get('skip_ai', False) and GEMINI_API_KEY and content_for_ai:
-                    try:
-                        genai.configure(api_key=GEMINI_API_KEY)
-                        model = genai.GenerativeModel('gemini-2.0-flash')
-                        prompt = f"""Analyze this podcast episode:
 
-{content_for_ai}
+        (body, status), shared = _enrich_coalesced(url, options)
 
-Platform: Spotify
+        if shared:
+            print(f"Coalesced with in-flight request for: {url}")
+            headers = {**headers, 'X-Coalesced': 'true'}
 
-Provide:
-1. A 2-3 sentence summary of what this episode covers
-2. Key topics and who would find this useful
+        return (body, status, headers)
 
-Respond in this exact JSON format (both values must be plain text strings, not arrays or objects):
-{{"summary": "Your 2-3 sentence summary here", "analysis": "Key topics: topic1, topic2, topic3. Target audience: description of who would find this useful."}}"""
-                        response = model.generate_content(prompt)
-                        json_match = re.search(r'\{[\s\S]*\}', response.text.strip())
-                        if json_match:
-                            parsed = json.loads(json_match.group())
-                            ai_result['summary'] = parsed.get('summary')
-                            # Ensure analysis is a string
-                            analysis = parsed.get('analysis')
-                            if isinstance(analysis, dict):
-                                parts = []
-                                if 'key_topics' in analysis:
-                                    parts.append(f"Key topics: {', '.join(analysis['key_topics']) if isinstance(analysis['key_topics'], list) else analysis['key_topics']}")
-                                if 'target_audience' in analysis:
-                                    parts.append(f"Target audience: {', '.join(analysis['target_audience']) if isinstance(analysis['target_audience'], list) else analysis['target_audience']}")
-                                analysis = '. '.join(parts) if parts else str(analysis)
-                            ai_result['analysis'] = analysis
-                    except Exception as e:
-                        ai_result['error'] = str(e)
-
-                # Use show name + publisher as author if available
-                author = spotify_data.get('publisher') or spotify_data.get('show_name') or spotify_data.get('provider_name', 'Spotify')
-
-                # Try to get transcription via RSS feed
-                transcription = None
-                transcription_error = None
-
-                if spotify_data.get('show_name') and spotify_data.get('title'):
-                    # Step 1: Find RSS feed via iTunes
-                    rss_result = search_podcast_itunes(spotify_data['show_name'])
-
-                    if rss_result.get('success') and rss_result.get('rss_url'):
-                        # Step 2: Find episode in RSS
-                        episode_result = find_episode_in_rss(
-                            rss_result['rss_url'],
-                            spotify_data['title'],
-                            spotify_data.get('duration_minutes')
-                        )
+    except Exception as e:
+        return (json.dumps({
+            'error': {
+                'stage': 'processing',
+                'message': str(e),
+                'recoverable': False
+            }
+        }), 500, headers)
 
-                        if episode_result.get('success') and episode_result.get('audio_url'):
-                            # Step 3: Transcribe audio
-                            transcription_result = transcribe_audio_url(episode_result['audio_url'])
 
-                            if transcription_result.get('success'):
-                                transcription = transcription_result.get('text')
-                            else:
-                                transcription_error = f"Transcription failed: {transcription_result.get('error')}"
-                        else:
-                            transcription_error = f"Episode not found in RSS: {episode_result.get('error')}"
-                    else:
-                        transcription_error = f"RSS feed not found: {rss_result.get('error')}"
-
-                response_data = {
-                    'url': url,
-                    'domain': domain,
-                    'type': 'podcast',
-                    'title': spotify_data['title'],
-                    'author': author,
-                    'published_date': spotify_data.get('release_date'),
-                    'main_image': spotify_data.get('thumbnail_url'),
-                    'description': spotify_data.get('description'),
-                    'reading_time': spotify_data.get('duration_minutes'),  # Use duration as "reading time" for podcasts
-                    'price': None,
-                    'currency': None,
-                    'code_snippets': [],
-                    'ai_summary': ai_result.get('summary'),
-                    'ai_analysis': ai_result.get('analysis'),
-                    'processed_at': datetime.utcnow().isoformat() + 'Z',
-                    # Extra Spotify-specific fields
-                    'show_name': spotify_data.get('show_name'),
-                    'show_description': spotify_data.get('show_description'),
-                    'episode_duration_minutes': spotify_data.get('duration_minutes'),
-                    # Transcription
-                    'transcription': transcription,
-                }
-
-                # Collect errors
-                errors = []
-                if ai_result.get('error'):
-                    errors.append({'stage': 'ai_analysis', 'message': ai_result['error'], 'recoverable': True})
-                if transcription_error:
-                    errors.append({'stage': 'transcription', 'message': transcription_error, 'recoverable': True})
-
-                if errors:
-                    response_data['errors'] = errors
-
-                return (json.dumps(response_data), 200, headers)
-
-        # Fetch the webpage
-        html, fetch_error = fetch_webpage(url)
-
-        if fetch_error:
-            return (json.dumps({
-                'url': url,
-                'domain': domain,
-                'error': {
-                    'stage': 'fetch',
-                    'message': fetch_error,
-                    'recoverable': True
-                }
-            }), 200, headers)  # Return 200 with error in body per ARCHITECTURE.md
+def _batch_host(url: str) -> str:
+    """Host key for per-host batch limits (no network: short links group by shortener)."""
+    return urlparse(canonicalize_url(url)).hostname or url
 
-        # Parse HTML
-        soup = BeautifulSoup(html, 'html.parser')
 
-        # Detect content type
-        content_type = detect_content_type(url, soup)
+@functions_framework.http
+def enrich_webpages_batch(request):
+    """
+    Batch entry point: enrich many URLs concurrently, streaming results.
 
-        # Extract metadata
-        metadata = extract_metadata(url, soup)
+    Expected JSON input:
+    {
+        "urls": ["https://example.com/a", "https://other.org/b"],
+        "options": { ...same as enrich_webpage... },
+        "concurrency": 8,
+        "per_host": 2
+    }
 
-        # Extract main content
-        main_content = extract_main_content(soup)
+    Returns newline-delimited JSON (application/x-ndjson), one line per URL
+    in completion order:
+        {"index": 0, "url": "...", "status": 200, "coalesced": false, "result": {...}}
+    followed by a summary line:
+        {"done": true, "count": 2, "elapsed_seconds": 3.1}
 
-        # Calculate reading time
-        reading_time = calculate_reading_time(main_content) if content_type == 'article' else None
+    Fetches run on a thread pool under global and per-host limits; parsing
+    runs in the shared parse pool so it does not hold up the fetch threads.
+    """
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
 
-        # Extract price if product
-        price_info = extract_price(soup) if content_type == 'product' else {'price': None, 'currency': None}
+    headers = {'Access-Control-Allow-Origin': '*'}
 
-        # Extract code snippets if code resource
-        code_snippets = extract_code_snippets(soup) if (content_type == 'code' and extract_code) else []
+    request_json = request.get_json(silent=True)
+    urls = (request_json or {}).get('urls')
+    if not isinstance(urls, list) or not urls or not all(isinstance(u, str) and u.strip() for u in urls):
+        return (json.dumps({
+            'error': 'Missing required field: urls (non-empty list of URLs)'
+        }), 400, headers)
 
-        # Generate AI analysis (includes cleaned title)
-        ai_result = {'title': metadata['title'], 'summary': None, 'analysis': None, 'error': None}
-        if not skip_ai:
-            ai_result = generate_ai_analysis(url, metadata['title'], main_content, content_type)
+    if len(urls) > BATCH_MAX_URLS:
+        return (json.dumps({
+            'error': f'Too many URLs: {len(urls)} (max {BATCH_MAX_URLS})'
+        }), 400, headers)
 
-        # Build response - use AI-cleaned title
-        response = {
-            'url': url,
-            'domain': domain,
-            'type': content_type,
-            'title': ai_result.get('title') or metadata['title'],
-            'author': metadata['author'],
-            'published_date': metadata['published_date'],
-            'main_image': metadata['main_image'],
-            'description': metadata['description'],
-            'reading_time': reading_time,
-            'price': price_info['price'],
-            'currency': price_info['currency'],
-            'code_snippets': code_snippets,
-            'ai_summary': ai_result['summary'],
-            'ai_analysis': ai_result['analysis'],
-            'processed_at': datetime.utcnow().isoformat() + 'Z',
+    options = request_json.get('options', {})
+    limits = {}
+    for field, default in (('concurrency', BATCH_CONCURRENCY), ('per_host', BATCH_PER_HOST)):
+        value = request_json.get(field, default)
+        try:
+            if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+                raise ValueError(value)
+            limits[field] = int(value)
+            if limits[field] < 1:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            return (json.dumps({
+                'error': f'Invalid {field}: {value!r} (expected a positive integer)'
+            }), 400, headers)
+    # Requests may lower the limits, never raise them
+    concurrency = min(limits['concurrency'], BATCH_CONCURRENCY)
+    per_host = min(limits['per_host'], BATCH_PER_HOST)
+
+    def stream():
+        started = time.monotonic()
+        results = run_per_host(
+            urls,
+            lambda u: _enrich_coalesced(u, options, _parse_pool),
+            _batch_host,
+            max_workers=concurrency,
+            per_host=per_host,
+            min_interval=BATCH_HOST_INTERVAL,
+        )
+        for index, outcome, error in results:
+            line = {'index': index, 'url': urls[index]}
+            if error:
+                line.update({
+                    'status': 500,
+                    'coalesced': False,
+                    'result': {
+                        'error': {
+                            'stage': 'processing',
+                            'message': str(error),
+                            'recoverable': False
+                        }
+                    },
+                })
+            else:
+                (body, status), shared = outcome
+                line.update({'status': status, 'coalesced': shared, 'result': json.loads(body)})
+            yield json.dumps(line) + '\n'
+
+        yield json.dumps({
+            'done': True,
+            'count': len(urls),
+            'elapsed_seconds': round(time.monotonic() - started, 2),
+        }) + '\n'
+
+    return Response(stream(), status=200, headers=headers, mimetype='application/x-ndjson')
+
+
+def finalize_ai_analysis(response: dict, request: dict) -> dict:
+    """
+    Turn a batch response into the record generate_ai_analysis would have
+    returned, memoizing successes so a later synchronous call reuses them.
+
+    Args:
+        response: {'text', 'error'} from the batch job
+        request: {'key', 'context'} as queued by generate_ai_analysis
+
+    Returns:
+        Dict with url, title, summary, analysis, error
+    """
+    context = request['context']
+    result = {'url': context.get('url'), 'title': context.get('title'), 'summary': None, 'analysis': None, 'error': None}
+    if response.get('error'):
+        result['error'] = response['error']
+        return result
+
+    try:
+        parsed = _parse_analysis_response(response.get('text'), context.get('title'))
+    except ValueError as e:
+        result['error'] = f'Unparseable batch response: {e}'
+        return result
+
+    result.update(parsed)
+    if context.get('memo_key'):
+        get_ai_memo().set(context['memo_key'], {k: result[k] for k in ('title', 'summary', 'analysis', 'error')})
+    return result
+
+
+@functions_framework.http
+def webpage_ai_batch(request):
+    """
+    Gemini batch entry point for analyses queued with options.defer_ai.
+
+    Expected JSON input:
+    {"action": "submit"}   - send everything queued as one batch job
+    {"action": "collect"}  - fetch finished jobs; returns every new result
+    {"action": "result", "url": "https://example.com/a"}  - one stored result
+    {"action": "status"}
+
+    Every response includes pending (queued, not submitted) and open_jobs.
+    collect returns {"jobs": {name: state}, "results": [{"key": url, "result":
+    {url, title, summary, analysis, error}}]} so n8n can update each bookmark.
+    """
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
         }
+        return ('', 204, headers)
 
-        # Include errors if any (partial success per ARCHITECTURE.md)
-        if ai_result.get('error'):
-            response['error'] = {
-                'stage': 'ai_analysis',
-                'message': ai_result['error'],
-                'recoverable': True
-            }
+    headers = {'Access-Control-Allow-Origin': '*'}
 
-        return (json.dumps(response), 200, headers)
+    request_json = request.get_json(silent=True) or {}
+    action = request_json.get('action', 'status')
+    try:
+        queue = get_gemini_batch_queue('gemini_batch_webpage')
+    except BatchQueueUnavailable as e:
+        return (json.dumps({'error': str(e)}), 400, headers)
+
+    try:
+        if action == 'submit':
+            body = {'submitted_jobs': queue.submit()}
+        elif action == 'collect':
+            body = queue.collect(finalize_ai_analysis)
+        elif action == 'result':
+            if not request_json.get('url'):
+                return (json.dumps({'error': 'Missing required field: url'}), 400, headers)
+            key = parse_canonical(request_json['url'], resolve=True)['url']
+            body = {'key': key, 'result': queue.result(key)}
+        elif action == 'status':
+            body = {}
+        else:
+            return (json.dumps({'error': f'Unknown action: {action}'}), 400, headers)
+
+        body.update(pending=len(queue.pending()), open_jobs=queue.open_jobs())
+        return (json.dumps(body), 200, headers)
 
     except Exception as e:
         return (json.dumps({
             'error': {
-                'stage': 'processing',
+                'stage': 'ai_batch',
                 'message': str(e),
-                'recoverable': False
+                'recoverable': True
             }
         }), 500, headers)